@@ -0,0 +1,236 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+import sqlite3
+import time
+from typing import List, Dict, Any, Optional
+from pydantic import BaseModel
+
+import sharding
+from complete_schema import ANALYTICS_REBUILD_SQL
+from http_cache import table_etag
+from includes import select_in
+
+# Создаем свою функцию для получения соединения с БД
+def get_db():
+    """Предоставляет соединение с базой данных."""
+    DB_PATH = "full_api_new.db"
+    if sharding.is_enabled():
+        # Строки всех холдингов: каталог с подключенными шардами
+        conn = sharding.connect_federated(DB_PATH)
+    else:
+        # Соединение создается и используется в разных потоках пула FastAPI
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+router = APIRouter(
+    prefix="/analytics",
+    tags=["analytics"],
+)
+
+# Измерения численности: имя в group_by -> столбец headcount_cube и таблица названий
+HEADCOUNT_DIMENSIONS = {
+    "organization": ("organization_id", "organizations"),
+    "division": ("division_id", "divisions"),
+    "position": ("position_id", "positions"),
+    "location": ("location_id", "organizations"),
+    "function": ("function_id", "functions"),
+}
+
+# Группировки охвата управления
+SPAN_GROUPS = ["manager", "organization", "relation_type"]
+
+# Таблицы, из которых строятся счетчики и названия отчетов (для ETag)
+HEADCOUNT_TABLES = ("staff", "staff_positions", "positions", "organizations", "divisions", "functions")
+SPAN_TABLES = ("functional_relations", "staff")
+
+class HeadcountReport(BaseModel):
+    group_by: List[str]
+    headcount: int  # сотрудники по основной должности
+    assignments: int  # все активные назначения
+    groups: List[Dict[str, Any]]  # значения измерений (<имя>_id, <имя>_name) и счетчики группы
+
+class SpanOfControlReport(BaseModel):
+    group_by: str
+    managers: int
+    direct_reports: int
+    avg_span: float
+    max_span: int
+    groups: List[Dict[str, Any]]
+
+def rebuild_analytics(db: sqlite3.Connection):
+    """Полностью пересчитывает счетчики численности и охвата управления."""
+    db.executescript("BEGIN IMMEDIATE;" + ANALYTICS_REBUILD_SQL + "COMMIT;")
+
+def parse_group_by(group_by: Optional[str]) -> List[str]:
+    names = list(dict.fromkeys(name.strip() for name in (group_by or "").split(",") if name.strip()))
+    unknown = [name for name in names if name not in HEADCOUNT_DIMENSIONS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неизвестные измерения в group_by: {', '.join(unknown)}. Допустимые: {', '.join(HEADCOUNT_DIMENSIONS)}",
+        )
+    return names
+
+def load_names(db: sqlite3.Connection, table: str, ids) -> Dict[int, str]:
+    """Названия записей справочника одним запросом на пачку id."""
+    return {row["id"]: row["name"] for row in select_in(db, table, "id", [i for i in ids if i])}
+
+@router.get("/headcount", response_model=HeadcountReport,
+            dependencies=[table_etag(get_db, *HEADCOUNT_TABLES)])
+def headcount(
+    group_by: Optional[str] = Query(None, description="Измерения через запятую: organization, division, position, location, function"),
+    organization_id: Optional[int] = None,
+    division_id: Optional[int] = None,
+    position_id: Optional[int] = None,
+    location_id: Optional[int] = None,
+    function_id: Optional[int] = None,
+    db: sqlite3.Connection = Depends(get_db)
+):
+    """
+    Численность с группировкой по любому набору измерений. Читаются только
+    счетчики headcount_cube; отсутствующее значение измерения возвращается как null.
+    """
+    dimensions = parse_group_by(group_by)
+    columns = [HEADCOUNT_DIMENSIONS[name][0] for name in dimensions]
+
+    conditions = ["assignments > 0"]
+    params: List[Any] = []
+    filters = {
+        "organization_id": organization_id,
+        "division_id": division_id,
+        "position_id": position_id,
+        "location_id": location_id,
+        "function_id": function_id,
+    }
+    for column, value in filters.items():
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+
+    select = ", ".join(columns + ["SUM(headcount) AS headcount", "SUM(assignments) AS assignments"])
+    query = f"SELECT {select} FROM headcount_cube WHERE {' AND '.join(conditions)}"
+    if columns:
+        query += f" GROUP BY {', '.join(columns)} ORDER BY headcount DESC"
+    rows = [dict(row) for row in db.execute(query, params).fetchall()]
+
+    # Пустой куб без группировки дает одну строку с NULL - это нулевая численность
+    if not columns:
+        rows = [row for row in rows if row["assignments"] is not None]
+
+    # Названия значений измерений: по одному запросу на измерение
+    for name, column in zip(dimensions, columns):
+        names = load_names(db, HEADCOUNT_DIMENSIONS[name][1], {row[column] for row in rows})
+        for row in rows:
+            row[column] = row[column] or None
+            row[f"{name}_name"] = names.get(row[column])
+
+    return {
+        "group_by": dimensions,
+        "headcount": sum(row["headcount"] for row in rows),
+        "assignments": sum(row["assignments"] for row in rows),
+        "groups": rows if columns else [],
+    }
+
+@router.get("/span-of-control", response_model=SpanOfControlReport,
+            dependencies=[table_etag(get_db, *SPAN_TABLES)])
+def span_of_control(
+    group_by: str = Query("manager", description="manager, organization или relation_type"),
+    relation_type: Optional[str] = None,
+    manager_id: Optional[int] = None,
+    min_reports: int = Query(1, ge=1),
+    limit: int = Query(100, ge=1, le=10000),
+    db: sqlite3.Connection = Depends(get_db)
+):
+    """
+    Охват управления: число прямых подчиненных (активных функциональных связей)
+    по руководителям, с группировкой по юрлицу руководителя или типу связи.
+    """
+    if group_by not in SPAN_GROUPS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неизвестная группировка: {group_by}. Допустимые: {', '.join(SPAN_GROUPS)}",
+        )
+
+    conditions = ["direct_reports > 0"]
+    params: List[Any] = []
+    if relation_type:
+        conditions.append("relation_type = ?")
+        params.append(relation_type)
+    if manager_id is not None:
+        conditions.append("manager_id = ?")
+        params.append(manager_id)
+
+    # Охват руководителя (по типу связи, если группируем по нему)
+    span_key = "manager_id, relation_type" if group_by == "relation_type" else "manager_id"
+    spans = (
+        f"SELECT {span_key}, SUM(direct_reports) AS reports FROM span_of_control "
+        f"WHERE {' AND '.join(conditions)} GROUP BY {span_key} HAVING reports >= ?"
+    )
+    params.append(min_reports)
+
+    summary = db.execute(
+        f"SELECT COUNT(DISTINCT manager_id), SUM(reports), AVG(reports), MAX(reports) FROM ({spans})", params
+    ).fetchone()
+
+    if group_by == "manager":
+        rows = [dict(row) for row in db.execute(
+            f"SELECT manager_id, reports AS direct_reports FROM ({spans}) "
+            f"ORDER BY reports DESC, manager_id LIMIT ?", params + [limit]
+        ).fetchall()]
+        staff = {row["id"]: row for row in select_in(db, "staff", "id", [row["manager_id"] for row in rows])}
+        for row in rows:
+            manager = staff.get(row["manager_id"])
+            row["manager_name"] = f"{manager['last_name']} {manager['first_name']}" if manager else None
+            row["organization_id"] = manager["organization_id"] if manager else None
+    else:
+        # Юрлицо руководителя или тип связи
+        group_column, alias = (
+            ("s.organization_id", "organization_id") if group_by == "organization" else ("spans.relation_type", "relation_type")
+        )
+        rows = [dict(row) for row in db.execute(
+            f"SELECT {group_column} AS {alias}, "
+            f"COUNT(DISTINCT spans.manager_id) AS managers, SUM(reports) AS direct_reports, "
+            f"ROUND(AVG(reports), 2) AS avg_span, MAX(reports) AS max_span "
+            f"FROM ({spans}) spans LEFT JOIN staff s ON s.id = spans.manager_id "
+            f"GROUP BY 1 ORDER BY direct_reports DESC LIMIT ?", params + [limit]
+        ).fetchall()]
+        if group_by == "organization":
+            names = load_names(db, "organizations", {row["organization_id"] for row in rows})
+            for row in rows:
+                row["organization_name"] = names.get(row["organization_id"])
+
+    return {
+        "group_by": group_by,
+        "managers": summary[0] or 0,
+        "direct_reports": summary[1] or 0,
+        "avg_span": round(summary[2] or 0, 2),
+        "max_span": summary[3] or 0,
+        "groups": rows,
+    }
+
+@router.post("/rebuild")
+def rebuild(db: sqlite3.Connection = Depends(get_db)):
+    """Полный пересчет счетчиков аналитики по исходным таблицам (set-based SQL)."""
+    started = time.perf_counter()
+    schemas = sharding.federated_schemas(db)
+    if len(schemas) == 1:
+        rebuild_analytics(db)
+    else:
+        # Счетчики ведутся в каждой базе по ее строкам: пересчитываются каталог и все шарды
+        paths = {row[1]: row[2] for row in db.execute("PRAGMA database_list")}
+        for schema in schemas:
+            conn = sqlite3.connect(paths[schema])
+            try:
+                rebuild_analytics(conn)
+            finally:
+                conn.close()
+    cells = db.execute("SELECT COUNT(*) FROM headcount_cube").fetchone()[0]
+    managers = db.execute("SELECT COUNT(DISTINCT manager_id) FROM span_of_control").fetchone()[0]
+    return {
+        "headcount_cells": cells,
+        "managers": managers,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
@@ -37,15 +37,16 @@ async def get_divisions(
     
     return divisions
 
-@router.get("/tree", response_model=List[schemas.Division])
+@router.get("/tree", response_model=List[schemas.DivisionWithChildren])
 async def get_division_tree(
     db: AsyncSession = Depends(deps.get_db),
+    organization_id: Optional[int] = Query(None, description="ID организации"),
     current_user: User = Depends(deps.get_current_active_user),
 ) -> Any:
     """
     Получить дерево подразделений.
     """
-    divisions = await crud.division.get_tree(db)
+    divisions = await crud.division.get_tree(db, organization_id=organization_id)
     return divisions
 
 @router.post("/", response_model=schemas.Division)
@@ -1,5 +1,6 @@
 from typing import Any, List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -80,6 +81,116 @@ async def create_organization(
     organization = await crud.organization.create(db, obj_in=organization_in)
     return organization
 
+async def _missing_organization_ids(db: AsyncSession, ids) -> List[int]:
+    """id из списка, которых нет в базе (один запрос)."""
+    ids = set(ids)
+    if not ids:
+        return []
+    result = await db.execute(select(models.Organization.id).where(models.Organization.id.in_(ids)))
+    return sorted(ids - set(result.scalars().all()))
+
+async def _run_bulk(db: AsyncSession, operation):
+    """Выполнить пакетную операцию; нарушение ограничений отклоняет весь пакет."""
+    try:
+        return await operation
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail="Пакет отклонен: нарушено ограничение уникальности или ссылочной целостности"
+        )
+
+# Пакетные маршруты объявлены до /{organization_id}, иначе "bulk" примется за id
+
+@router.post("/bulk", response_model=List[schemas.Organization])
+async def create_organizations_bulk(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    organizations_in: List[schemas.OrganizationCreate],
+    current_user: Optional[models.User] = Depends(deps.get_optional_current_active_user),
+) -> Any:
+    """
+    Создать несколько организаций одной транзакцией.
+    """
+    missing = await _missing_organization_ids(
+        db, [org.parent_id for org in organizations_in if org.parent_id]
+    )
+    if missing:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Родительские организации не найдены: {missing}"
+        )
+    return await _run_bulk(db, crud.organization.create_many(db, objs_in=organizations_in))
+
+@router.patch("/bulk", response_model=List[schemas.Organization])
+async def update_organizations_bulk(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    organizations_in: List[schemas.OrganizationBulkUpdate],
+    current_user: Optional[models.User] = Depends(deps.get_optional_current_active_user),
+) -> Any:
+    """
+    Обновить несколько организаций одной транзакцией (изменяются только переданные поля).
+    """
+    missing = await _missing_organization_ids(db, [org.id for org in organizations_in])
+    if missing:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Организации не найдены: {missing}"
+        )
+    return await _run_bulk(db, crud.organization.update_many(db, objs_in=organizations_in))
+
+@router.put("/bulk", response_model=List[schemas.Organization])
+async def upsert_organizations_bulk(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    organizations_in: List[schemas.OrganizationCreate],
+    current_user: Optional[models.User] = Depends(deps.get_optional_current_active_user),
+) -> Any:
+    """
+    Создать или обновить организации по коду (code) одной транзакцией.
+    """
+    missing = await _missing_organization_ids(
+        db, [org.parent_id for org in organizations_in if org.parent_id]
+    )
+    if missing:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Родительские организации не найдены: {missing}"
+        )
+    return await _run_bulk(db, crud.organization.upsert_many(db, objs_in=organizations_in))
+
+@router.delete("/bulk", response_model=List[schemas.Organization])
+async def delete_organizations_bulk(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    ids: List[int] = Query(..., description="ID удаляемых организаций"),
+    current_user: Optional[models.User] = Depends(deps.get_optional_current_active_user),
+) -> Any:
+    """
+    Удалить несколько организаций одной транзакцией.
+    """
+    missing = await _missing_organization_ids(db, ids)
+    if missing:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Организации не найдены: {missing}"
+        )
+
+    # Дочерние организации, которые не удаляются вместе с родителем
+    result = await db.execute(
+        select(models.Organization.parent_id)
+        .where(models.Organization.parent_id.in_(ids), models.Organization.id.not_in(ids))
+        .distinct()
+    )
+    with_children = sorted(result.scalars().all())
+    if with_children:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Нельзя удалить организации, имеющие дочерние организации: {with_children}"
+        )
+    return await _run_bulk(db, crud.organization.remove_many(db, ids=ids))
+
 @router.get("/{organization_id}", response_model=schemas.Organization)
 async def read_organization(
     *,
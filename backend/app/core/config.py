@@ -78,6 +78,10 @@ class Settings(BaseSettings):
     # Директория для загрузки файлов
     UPLOAD_DIR: str = os.path.join(os.getcwd(), "uploads")
 
+    # Сжатие ответов: минимальный размер тела и объем кэша сжатых копий
+    COMPRESSION_MINIMUM_SIZE: int = 1024
+    COMPRESSION_CACHE_BYTES: int = 32 * 1024 * 1024
+
     # SQLAlchemy settings
     SQLALCHEMY_ECHO: bool = False  # Enable SQL query logging for debugging
     
@@ -1,36 +1,60 @@
 # -*- coding: utf-8 -*-
 
-from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, Union
+from typing import Any, Dict, Generic, List, Optional, Sequence, Tuple, Type, TypeVar, Union
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import update, delete
+from sqlalchemy import update, delete, insert, func, inspect as sa_inspect
+from sqlalchemy.dialects import postgresql, sqlite
 
 from app.db.base_class import Base
+from app.crud.loading import loading_options
 
 ModelType = TypeVar("ModelType", bound=Base)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
+# Строк в одном многострочном INSERT ... ON CONFLICT (лимит параметров запроса)
+BULK_CHUNK_SIZE = 1000
+
+# INSERT с ON CONFLICT DO UPDATE по диалектам
+UPSERT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
 
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
+    # Естественный ключ для upsert_many: столбцы с ограничением уникальности
+    natural_key: Tuple[str, ...] = ()
+
     def __init__(self, model: Type[ModelType]):
         """
         CRUD объект с базовыми асинхронными операциями базы данных
         """
         self.model = model
+        self.columns = frozenset(attr.key for attr in sa_inspect(model).column_attrs)
 
-    async def get(self, db: AsyncSession, id: Any) -> Optional[ModelType]:
-        """Получить запись по id."""
-        result = await db.execute(select(self.model).filter(self.model.id == id))
+    def _values(self, obj_in: Union[BaseModel, Dict[str, Any]], *, exclude_unset: bool = False) -> Dict[str, Any]:
+        """Значения столбцов модели из схемы или словаря (лишние поля отбрасываются)."""
+        data = obj_in if isinstance(obj_in, dict) else obj_in.model_dump(exclude_unset=exclude_unset)
+        return {key: value for key, value in data.items() if key in self.columns}
+
+    async def get(self, db: AsyncSession, id: Any, *, profile: Optional[str] = None) -> Optional[ModelType]:
+        """Получить запись по id (profile - профиль загрузки связей, см. app/crud/loading.py)."""
+        result = await db.execute(
+            select(self.model).options(*loading_options(profile)).filter(self.model.id == id)
+        )
         return result.scalar_one_or_none()
 
     async def get_multi(
-        self, db: AsyncSession, *, skip: int = 0, limit: int = 100
+        self, db: AsyncSession, *, skip: int = 0, limit: int = 100, profile: Optional[str] = None
     ) -> List[ModelType]:
         """Получить несколько записей с пагинацией."""
-        result = await db.execute(select(self.model).offset(skip).limit(limit))
+        result = await db.execute(
+            select(self.model).options(*loading_options(profile)).offset(skip).limit(limit)
+        )
         return result.scalars().all()
 
     async def create(self, db: AsyncSession, *, obj_in: CreateSchemaType) -> ModelType:
@@ -50,14 +74,11 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         obj_in: Union[UpdateSchemaType, Dict[str, Any]]
     ) -> ModelType:
         """Обновить запись."""
-        obj_data = jsonable_encoder(db_obj)
-        if isinstance(obj_in, dict):
-            update_data = obj_in
-        else:
-            update_data = obj_in.dict(exclude_unset=True)
-        for field in obj_data:
-            if field in update_data:
-                setattr(db_obj, field, update_data[field])
+        # Поля берутся из столбцов модели, а не из jsonable_encoder(db_obj):
+        # тот обходит и связи, которые загружать нельзя (lazy="raise_on_sql")
+        update_data = self._values(obj_in, exclude_unset=True)
+        for field, value in update_data.items():
+            setattr(db_obj, field, value)
         db.add(db_obj)
         await db.commit()
         await db.refresh(db_obj)
@@ -68,4 +89,97 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         obj = await self.get(db, id=id)
         await db.delete(obj)
         await db.commit()
-        return obj 
\ No newline at end of file
+        return obj 
+
+    # Пакетные операции: один оператор на пакет вместо запроса на строку,
+    # все строки пакета - в одной транзакции (при ошибке не применяется ни одна)
+
+    async def create_many(self, db: AsyncSession, *, objs_in: Sequence[CreateSchemaType]) -> List[ModelType]:
+        """Создать записи пакетом: INSERT ... RETURNING, результат в порядке objs_in."""
+        if not objs_in:
+            return []
+        rows = [self._values(obj_in) for obj_in in objs_in]
+        result = await db.scalars(
+            insert(self.model).returning(self.model, sort_by_parameter_order=True), rows
+        )
+        created = result.all()
+        await db.commit()
+        return created
+
+    async def update_many(
+        self, db: AsyncSession, *, objs_in: Sequence[Union[UpdateSchemaType, Dict[str, Any]]]
+    ) -> List[ModelType]:
+        """
+        Обновить записи пакетом. Каждый элемент содержит id и изменяемые поля
+        (у схем - только явно переданные). UPDATE по первичному ключу выполняется
+        одним executemany, обновленные строки перечитываются одним SELECT.
+        """
+        rows = [self._values(obj_in, exclude_unset=True) for obj_in in objs_in]
+        if not rows:
+            return []
+        if any(row.get("id") is None for row in rows):
+            raise ValueError("Для пакетного обновления у каждой записи должен быть указан id")
+        await db.execute(update(self.model), rows)
+        ids = [row["id"] for row in rows]
+        result = await db.scalars(
+            select(self.model)
+            .where(self.model.id.in_(ids))
+            .order_by(self.model.id)
+            .execution_options(populate_existing=True)
+        )
+        updated = result.all()
+        await db.commit()
+        return updated
+
+    async def upsert_many(
+        self,
+        db: AsyncSession,
+        *,
+        objs_in: Sequence[CreateSchemaType],
+        index_elements: Optional[Sequence[str]] = None,
+    ) -> List[ModelType]:
+        """
+        Создать или обновить записи по естественному ключу (natural_key или
+        index_elements): INSERT ... ON CONFLICT DO UPDATE ... RETURNING.
+        При повторе ключа в пакете применяется последняя запись.
+        """
+        key = tuple(index_elements or self.natural_key)
+        if not key:
+            raise ValueError(f"Для {self.model.__name__} не задан естественный ключ upsert")
+        dialect = db.get_bind().dialect.name
+        if dialect not in UPSERT_INSERTS:
+            raise ValueError(f"upsert не поддерживается для диалекта {dialect}")
+        dialect_insert = UPSERT_INSERTS[dialect]
+
+        rows_by_key = {}
+        for obj_in in objs_in:
+            row = self._values(obj_in)
+            row.pop("id", None)
+            rows_by_key[tuple(row[column] for column in key)] = row
+        rows = list(rows_by_key.values())
+
+        upserted: List[ModelType] = []
+        for start in range(0, len(rows), BULK_CHUNK_SIZE):
+            chunk = rows[start:start + BULK_CHUNK_SIZE]
+            stmt = dialect_insert(self.model).values(chunk)
+            set_ = {column: stmt.excluded[column] for column in chunk[0] if column not in key}
+            if "updated_at" in self.columns:
+                set_["updated_at"] = func.now()
+            if not set_:
+                set_ = {key[0]: stmt.excluded[key[0]]}
+            stmt = stmt.on_conflict_do_update(index_elements=list(key), set_=set_).returning(self.model)
+            result = await db.scalars(stmt, execution_options={"populate_existing": True})
+            upserted.extend(result.all())
+        await db.commit()
+        return upserted
+
+    async def remove_many(self, db: AsyncSession, *, ids: Sequence[int]) -> List[ModelType]:
+        """Удалить записи пакетом: DELETE ... WHERE id IN (...) RETURNING."""
+        if not ids:
+            return []
+        result = await db.scalars(
+            delete(self.model).where(self.model.id.in_(list(ids))).returning(self.model)
+        )
+        removed = result.all()
+        await db.commit()
+        return removed
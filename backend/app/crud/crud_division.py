@@ -1,6 +1,8 @@
+from collections import defaultdict
 from typing import List, Dict, Any, Optional, Union, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, select, func
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import and_, or_, select, func, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql.expression import true
 
@@ -135,24 +137,56 @@ class CRUDDivision(CRUDBase[Division, DivisionCreate, DivisionUpdate]):
             Division.parent_id == None
         ).all()
     
+    def _descendants_cte(self, division_id: int, include_inactive: bool = False):
+        """Рекурсивный CTE с id всех потомков отдела (неактивный отдел скрывает и свое поддерево)."""
+        active = [] if include_inactive else [Division.is_active == True]
+        descendants = (
+            select(Division.id)
+            .where(Division.parent_id == division_id, *active)
+            .cte(name="descendants", recursive=True)
+        )
+        return descendants.union_all(
+            select(Division.id).where(Division.parent_id == descendants.c.id, *active)
+        )
+
     async def get_all_descendants(
         self, db: AsyncSession, *, division_id: int, include_inactive: bool = False
     ) -> List[Division]:
         """
         Получить все дочерние отделы и их потомков для указанного отдела.
+        Одним запросом (рекурсивный CTE), а не запросом на каждый отдел.
         """
-        descendants = []
-        children = await self.get_children(db, division_id=division_id, include_inactive=include_inactive)
-        
-        descendants.extend(children)
-        
-        for child in children:
-            child_descendants = await self.get_all_descendants(
-                db, division_id=child.id, include_inactive=include_inactive
-            )
-            descendants.extend(child_descendants)
-            
-        return descendants
+        descendants = self._descendants_cte(division_id, include_inactive)
+        result = await db.execute(
+            select(Division).join(descendants, Division.id == descendants.c.id).order_by(Division.id)
+        )
+        return result.scalars().all()
+
+    async def get_tree(
+        self, db: AsyncSession, *, organization_id: Optional[int] = None
+    ) -> List[Division]:
+        """
+        Получить корневые отделы со всеми потомками на любой глубине.
+        Поддерево загружается одним запросом (рекурсивный CTE от корней), связи
+        children заполняются в Python без ленивой догрузки.
+        """
+        roots = [Division.parent_id.is_(None)]
+        if organization_id is not None:
+            roots.append(Division.organization_id == organization_id)
+        tree = select(Division.id).where(*roots).cte(name="tree", recursive=True)
+        tree = tree.union_all(select(Division.id).where(Division.parent_id == tree.c.id))
+        result = await db.execute(
+            select(Division).join(tree, Division.id == tree.c.id).order_by(Division.id)
+        )
+        nodes = result.scalars().all()
+
+        children = defaultdict(list)
+        for node in nodes:
+            if node.parent_id is not None:
+                children[node.parent_id].append(node)
+        for node in nodes:
+            set_committed_value(node, "children", children[node.id])
+        return [node for node in nodes if node.parent_id is None]
     
     async def get_division_tree(
         self, db: AsyncSession, *, organization_id: int, include_inactive: bool = False
@@ -269,19 +303,14 @@ class CRUDDivision(CRUDBase[Division, DivisionCreate, DivisionUpdate]):
         is_active: bool
     ) -> None:
         """
-        Рекурсивное обновление активности дочерних отделов
+        Обновление активности всех дочерних отделов одним запросом
         """
-        # Получаем все дочерние отделы
-        children = await self.get_children(db, division_id=parent_id, include_inactive=True)
-        
-        for child in children:
-            # Обновляем активность
-            child.is_active = is_active
-            db.add(child)
-            
-            # Рекурсивно обновляем потомков
-            await self._update_children_activity(db, parent_id=child.id, is_active=is_active)
-        
+        descendants = self._descendants_cte(parent_id, include_inactive=True)
+        await db.execute(
+            update(Division)
+            .where(Division.id.in_(select(descendants.c.id)))
+            .values(is_active=is_active)
+        )
         await db.commit()
 
     async def move_division(
@@ -5,11 +5,14 @@ from sqlalchemy.orm import Session
 from sqlalchemy import select, func, and_
 
 from app.crud.base import CRUDBase
+from app.crud.loading import loading_options
 from app.models.organization import Organization
 from app.schemas.organization import OrganizationCreate, OrganizationUpdate, OrgType
 
 
 class CRUDOrganization(CRUDBase[Organization, OrganizationCreate, OrganizationUpdate]):
+    natural_key = ("code",)
+
     async def get_multi_filtered(
         self, db: AsyncSession, *, skip: int = 0, limit: int = 100, filters: Dict = None
     ) -> List[Organization]:
@@ -59,39 +62,17 @@ class CRUDOrganization(CRUDBase[Organization, OrganizationCreate, OrganizationUp
         self, db: AsyncSession
     ) -> List[Organization]:
         """
-        Получить корневые организации (без родителя) с их дочерними элементами
-        """
-        # Сначала получаем все корневые организации (parent_id IS NULL)
-        query = select(self.model).filter(Organization.parent_id.is_(None))
-        result = await db.execute(query)
-        root_orgs = result.scalars().all()
-        
-        # Для каждой корневой организации загружаем дочерние элементы
-        for org in root_orgs:
-            await self._load_children_recursive(db, org)
-            
-        return root_orgs
-
-    async def _load_children_recursive(
-        self, db: AsyncSession, parent_org: Organization, depth: int = 5
-    ) -> None:
-        """
-        Рекурсивно загрузить дочерние организации для данной родительской организации
+        Получить корневые организации (без родителя) с их дочерними элементами.
+        Потомки загружаются профилем organization.tree - по запросу на уровень дерева.
         """
-        if depth <= 0:
-            return  # Предотвращение бесконечной рекурсии
-            
-        # Получаем дочерние организации для текущего родителя
-        query = select(self.model).filter(Organization.parent_id == parent_org.id)
+        query = (
+            select(self.model)
+            .options(*loading_options("organization.tree"))
+            .filter(Organization.parent_id.is_(None))
+            .order_by(Organization.id)
+        )
         result = await db.execute(query)
-        children = result.scalars().all()
-        
-        # Устанавливаем дочерние организации для родителя
-        parent_org.children = children
-        
-        # Рекурсивно загружаем дочерние элементы для каждой дочерней организации
-        for child in children:
-            await self._load_children_recursive(db, child, depth - 1)
+        return result.scalars().all()
 
     async def count_children(
         self, db: AsyncSession, *, parent_id: int
@@ -178,33 +159,13 @@ class CRUDOrganization(CRUDBase[Organization, OrganizationCreate, OrganizationUp
         """
         Получить корневые организации (без родителя) с их дочерними элементами (синхронная версия)
         """
-        # Сначала получаем все корневые организации (parent_id IS NULL)
-        root_orgs = db.query(self.model).filter(Organization.parent_id.is_(None)).all()
-        
-        # Для каждой корневой организации загружаем дочерние элементы
-        for org in root_orgs:
-            self._load_children_recursive_sync(db, org)
-            
-        return root_orgs
-
-    def _load_children_recursive_sync(
-        self, db: Session, parent_org: Organization, depth: int = 5
-    ) -> None:
-        """
-        Рекурсивно загрузить дочерние организации для данной родительской организации (синхронная версия)
-        """
-        if depth <= 0:
-            return  # Предотвращение бесконечной рекурсии
-            
-        # Получаем дочерние организации для текущего родителя
-        children = db.query(self.model).filter(Organization.parent_id == parent_org.id).all()
-        
-        # Устанавливаем дочерние организации для родителя
-        parent_org.children = children
-        
-        # Рекурсивно загружаем дочерние элементы для каждой дочерней организации
-        for child in children:
-            self._load_children_recursive_sync(db, child, depth - 1)
+        return (
+            db.query(self.model)
+            .options(*loading_options("organization.tree"))
+            .filter(Organization.parent_id.is_(None))
+            .order_by(Organization.id)
+            .all()
+        )
 
     def count_children_sync(
         self, db: Session, *, parent_id: int
@@ -12,6 +12,7 @@ class CRUDPosition(CRUDBase[Position, PositionCreate, PositionUpdate]):
     """
     CRUD операции с должностями.
     """
+    natural_key = ("name",)
     
     def get_by_name(self, db: Session, *, name: str) -> Optional[Position]:
         """
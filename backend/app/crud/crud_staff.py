@@ -9,6 +9,8 @@ from app.schemas.staff import StaffCreate, StaffUpdate
 
 
 class CRUDStaff(CRUDBase[Staff, StaffCreate, StaffUpdate]):
+    natural_key = ("email",)
+
     async def get_multi_filtered(
         self, db: AsyncSession, *, skip: int = 0, limit: int = 100, filters: Dict = None
     ) -> List[Staff]:
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+"""
+Именованные профили загрузки связей для эндпоинтов.
+
+Связи моделей объявлены с lazy="raise_on_sql": ленивая загрузка при сериализации
+ответа (по запросу на каждую строку и связь) запрещена. Эндпоинт выбирает профиль,
+и CRUD добавляет к запросу его опции загрузки (selectinload и др.) - число запросов
+не зависит от числа строк в ответе.
+
+Бюджеты запросов (QUERY_BUDGETS) проверяются тестами (app/tests/query_counter.py).
+"""
+
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.interfaces import LoaderOption
+
+from app.models.organization import Organization
+
+# Глубина дерева организаций в ответе /organizations/tree
+# (совет -> холдинг -> юрлицо -> локация, с запасом)
+ORG_TREE_DEPTH = 5
+
+
+def tree_loader(relationship, depth: int) -> LoaderOption:
+    """
+    Загрузка поддерева на depth уровней: по одному запросу selectin на уровень.
+    Дочерние элементы узлов глубже depth считаются пустыми (noload), а не
+    догружаются построчно.
+    """
+    option = selectinload(relationship)
+    for _ in range(depth - 1):
+        option = option.selectinload(relationship)
+    return option.noload(relationship)
+
+
+LOADING_PROFILES: Dict[str, Tuple[LoaderOption, ...]] = {
+    # Дерево организаций: корни и потомки
+    "organization.tree": (tree_loader(Organization.children, ORG_TREE_DEPTH),),
+}
+
+# Максимум SQL-запросов на эндпоинт при любом объеме данных
+QUERY_BUDGETS: Dict[str, int] = {
+    "GET /organizations/tree": 1 + ORG_TREE_DEPTH,
+    # Глубина дерева подразделений не ограничена: все поддерево одним рекурсивным запросом
+    "GET /divisions/tree": 1,
+}
+
+
+def loading_options(profile: Optional[str]) -> Tuple[LoaderOption, ...]:
+    """Опции загрузки профиля; None - без связей."""
+    if profile is None:
+        return ()
+    try:
+        return LOADING_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Неизвестный профиль загрузки: {profile}")
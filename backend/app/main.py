@@ -9,6 +9,7 @@ import os
 
 from app.api.api_v1.api import api_router
 from app.core.config import settings
+from compression import CompressionMiddleware  # общий с full_api.py модуль backend/compression.py
 
 app = FastAPI(
     title=settings.PROJECT_NAME, openapi_url=f"{settings.API_V1_STR}/openapi.json"
@@ -47,6 +48,13 @@ app.add_middleware(
 # Добавляем middleware для кодировки
 app.add_middleware(CharsetMiddleware)
 
+# Сжатие ответов (brotli/gzip); добавляется последним, чтобы сжимать уже готовые ответы
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    cache_bytes=settings.COMPRESSION_CACHE_BYTES,
+)
+
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
 @app.on_event("startup")
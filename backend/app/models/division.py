@@ -35,7 +35,14 @@ class Division(Base):
     created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
     updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
     
-    # Отношения - УДАЛЕНЫ
+    # Связи иерархии загружаются только явно, профилями загрузки (app/crud/loading.py)
+    parent = relationship(
+        "Division", remote_side="Division.id", back_populates="children", lazy="raise_on_sql"
+    )
+    children = relationship(
+        "Division", back_populates="parent", order_by="Division.id",
+        lazy="raise_on_sql", passive_deletes=True
+    )
     
     def __repr__(self):
         return f"<Division {self.name}>" 
\ No newline at end of file
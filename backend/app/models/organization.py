@@ -3,6 +3,7 @@
 from typing import List
 from enum import Enum
 from sqlalchemy import Column, Integer, String, Text, Boolean, ForeignKey, Enum as SQLAlchemyEnum
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from sqlalchemy.sql.sqltypes import TIMESTAMP
 
@@ -76,6 +77,16 @@ class Organization(Base):
         comment="ID родительской организации"
     )
     
+    # Связи иерархии загружаются только явно, профилями загрузки (app/crud/loading.py):
+    # обращение к незагруженной связи - ошибка, а не скрытый запрос на каждую строку
+    parent = relationship(
+        "Organization", remote_side="Organization.id", back_populates="children", lazy="raise_on_sql"
+    )
+    children = relationship(
+        "Organization", back_populates="parent", order_by="Organization.id",
+        lazy="raise_on_sql", passive_deletes=True
+    )
+    
     # Аудит
     created_at = Column(
         TIMESTAMP(timezone=True), 
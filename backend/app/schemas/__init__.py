@@ -5,8 +5,8 @@ from .token import Token, TokenPayload
 from .user import User, UserCreate, UserInDB, UserUpdate
 
 # Основные схемы
-from .organization import Organization, OrganizationCreate, OrganizationInDB, OrganizationUpdate, OrgType, OrganizationWithChildren
-from .division import Division, DivisionCreate, DivisionInDB, DivisionUpdate
+from .organization import Organization, OrganizationCreate, OrganizationInDB, OrganizationUpdate, OrgType, OrganizationWithChildren, OrganizationBulkUpdate
+from .division import Division, DivisionCreate, DivisionInDB, DivisionUpdate, DivisionWithChildren
 from .staff import Staff, StaffCreate, StaffInDB, StaffUpdate
 from .position import Position, PositionCreate, PositionInDB, PositionUpdate
 from .functional_relation import FunctionalRelation, FunctionalRelationCreate, FunctionalRelationInDB, FunctionalRelationUpdate, RelationType
\ No newline at end of file
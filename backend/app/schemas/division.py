@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from pydantic import BaseModel, Field, ConfigDict
 
@@ -47,6 +47,11 @@ class Division(DivisionBase):
     updated_at: datetime
 
 
+# Подразделение с дочерними подразделениями (дерево)
+class DivisionWithChildren(Division):
+    children: List["DivisionWithChildren"] = []
+
+
 # Полная схема подразделения в БД
 class DivisionInDB(Division):
     """
@@ -48,6 +48,11 @@ class OrganizationUpdate(BaseModel):
     is_active: Optional[bool] = None
 
 
+# Элемент пакетного обновления: id и изменяемые поля
+class OrganizationBulkUpdate(OrganizationUpdate):
+    id: int
+
+
 # Схема для отображения в API
 class Organization(OrganizationBase):
     id: int
@@ -1,4 +1,5 @@
 import asyncio
+import functools
 import pytest
 import pytest_asyncio
 from typing import AsyncGenerator
@@ -6,6 +7,7 @@ from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from app.db.base import Base
 from app.core.config import settings
+from app.tests.query_counter import assert_max_queries
 
 # Создаем тестовый движок базы данных
 test_engine = create_async_engine(
@@ -59,4 +61,9 @@ async def db() -> AsyncGenerator[AsyncSession, None]:
     
     # Удаляем таблицы после теста
     async with test_engine.begin() as conn:
-        await conn.run_sync(Base.metadata.drop_all) 
\ No newline at end of file
+        await conn.run_sync(Base.metadata.drop_all) 
+
+@pytest.fixture
+def max_queries():
+    """Проверка бюджета запросов на тестовой базе: with max_queries(6): ..."""
+    return functools.partial(assert_max_queries, test_engine)
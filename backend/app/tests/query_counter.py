@@ -0,0 +1,37 @@
+"""
+Подсчет SQL-запросов в тестах: защита эндпоинтов от N+1.
+
+    with assert_max_queries(engine, QUERY_BUDGETS["GET /organizations/tree"]):
+        await crud.organization.get_root_organizations(db)
+"""
+
+from contextlib import contextmanager
+from typing import Iterator, List
+
+from sqlalchemy import event
+
+
+@contextmanager
+def count_queries(engine) -> Iterator[List[str]]:
+    """Собирает SQL-запросы, выполненные движком (синхронным или асинхронным) внутри блока."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    statements: List[str] = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+@contextmanager
+def assert_max_queries(engine, max_queries: int) -> Iterator[List[str]]:
+    """Проверяет, что внутри блока выполнено не больше max_queries запросов."""
+    with count_queries(engine) as statements:
+        yield statements
+    assert len(statements) <= max_queries, (
+        f"Выполнено запросов: {len(statements)}, допустимо: {max_queries}\n" + "\n\n".join(statements)
+    )
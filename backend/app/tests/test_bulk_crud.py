@@ -0,0 +1,64 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.crud.crud_organization import organization
+from app.models.organization import Organization
+from app.schemas.organization import OrganizationBulkUpdate, OrganizationCreate, OrgType
+
+
+def make_organizations(count: int, suffix: str = "") -> list:
+    return [
+        OrganizationCreate(name=f"Юрлицо {i}{suffix}", code=f"E{i}", org_type=OrgType.LEGAL_ENTITY)
+        for i in range(count)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_create_many_single_statement(db: AsyncSession, max_queries):
+    with max_queries(1):
+        created = await organization.create_many(db, objs_in=make_organizations(50))
+
+    assert [org.code for org in created] == [f"E{i}" for i in range(50)]
+    assert all(org.id for org in created)
+
+
+@pytest.mark.asyncio
+async def test_update_many_changes_only_passed_fields(db: AsyncSession, max_queries):
+    created = await organization.create_many(db, objs_in=make_organizations(10))
+
+    with max_queries(2):
+        updated = await organization.update_many(db, objs_in=[
+            OrganizationBulkUpdate(id=org.id, name=f"Новое имя {org.id}") for org in created[:5]
+        ])
+
+    assert {org.name for org in updated} == {f"Новое имя {org.id}" for org in created[:5]}
+    assert all(org.code.startswith("E") for org in updated)
+
+
+@pytest.mark.asyncio
+async def test_upsert_many_by_code(db: AsyncSession, max_queries):
+    await organization.create_many(db, objs_in=make_organizations(4))
+
+    # E2, E3 уже есть - обновляются; E4, E5 создаются
+    with max_queries(1):
+        upserted = await organization.upsert_many(db, objs_in=make_organizations(6, " (изм.)")[2:])
+
+    assert sorted(org.code for org in upserted) == ["E2", "E3", "E4", "E5"]
+    result = await db.execute(select(Organization).order_by(Organization.code))
+    names = {org.code: org.name for org in result.scalars().all()}
+    assert names["E0"] == "Юрлицо 0"
+    assert names["E3"] == "Юрлицо 3 (изм.)"
+    assert len(names) == 6
+
+
+@pytest.mark.asyncio
+async def test_remove_many(db: AsyncSession, max_queries):
+    created = await organization.create_many(db, objs_in=make_organizations(5))
+
+    with max_queries(1):
+        removed = await organization.remove_many(db, ids=[org.id for org in created[:3]])
+
+    assert len(removed) == 3
+    result = await db.execute(select(Organization.code))
+    assert sorted(result.scalars().all()) == ["E3", "E4"]
@@ -0,0 +1,101 @@
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.crud.crud_organization import organization
+from app.crud.crud_division import division
+from app.crud.loading import QUERY_BUDGETS
+from app.models.organization import OrgType, Organization
+from app.models.division import Division
+from app.schemas.organization import OrganizationWithChildren
+from app.schemas.division import DivisionWithChildren
+
+
+def count_nodes(node: dict) -> int:
+    return 1 + sum(count_nodes(child) for child in node["children"])
+
+
+@pytest.mark.asyncio
+async def test_organization_tree_query_budget(db: AsyncSession, max_queries):
+    # Совет -> 3 холдинга -> по 4 юрлица -> по 3 локации
+    board = Organization(name="Совет", code="BOARD", org_type=OrgType.BOARD, is_active=True)
+    db.add(board)
+    await db.flush()
+    for h in range(3):
+        holding = Organization(name=f"Холдинг {h}", code=f"H{h}", org_type=OrgType.HOLDING, parent_id=board.id)
+        db.add(holding)
+        await db.flush()
+        for e in range(4):
+            entity = Organization(
+                name=f"Юрлицо {h}.{e}", code=f"E{h}{e}", org_type=OrgType.LEGAL_ENTITY, parent_id=holding.id
+            )
+            db.add(entity)
+            await db.flush()
+            for l in range(3):
+                db.add(Organization(
+                    name=f"Локация {h}.{e}.{l}", code=f"L{h}{e}{l}", org_type=OrgType.LOCATION, parent_id=entity.id
+                ))
+    await db.flush()
+    db.expunge_all()
+
+    # Сериализация ответа внутри блока: ленивая догрузка связей тоже была бы посчитана
+    with max_queries(QUERY_BUDGETS["GET /organizations/tree"]):
+        roots = await organization.get_root_organizations(db)
+        tree = [OrganizationWithChildren.model_validate(root).model_dump() for root in roots]
+
+    assert len(tree) == 1
+    assert count_nodes(tree[0]) == 1 + 3 + 12 + 36
+
+
+@pytest.mark.asyncio
+async def test_division_tree_and_descendants_query_budget(db: AsyncSession, max_queries):
+    org = Organization(name="Организация", code="ORG", org_type=OrgType.LEGAL_ENTITY, is_active=True)
+    db.add(org)
+    await db.flush()
+
+    root = Division(name="Дирекция", code="D", level=0, organization_id=org.id, is_active=True)
+    db.add(root)
+    await db.flush()
+    for a in range(4):
+        child = Division(name=f"Отдел {a}", code=f"D{a}", level=1, organization_id=org.id, parent_id=root.id)
+        db.add(child)
+        await db.flush()
+        for b in range(5):
+            db.add(Division(
+                name=f"Группа {a}.{b}", code=f"D{a}{b}", level=2, organization_id=org.id, parent_id=child.id
+            ))
+    await db.flush()
+    root_id = root.id
+    db.expunge_all()
+
+    with max_queries(QUERY_BUDGETS["GET /divisions/tree"]):
+        roots = await division.get_tree(db, organization_id=org.id)
+        tree = [DivisionWithChildren.model_validate(node).model_dump() for node in roots]
+    assert count_nodes(tree[0]) == 1 + 4 + 20
+
+    with max_queries(1):
+        descendants = await division.get_all_descendants(db, division_id=root_id, include_inactive=True)
+    assert len(descendants) == 4 + 20
+
+
+@pytest.mark.asyncio
+async def test_division_tree_is_not_truncated_by_depth(db: AsyncSession, max_queries):
+    org = Organization(name="Организация", code="DEEP", org_type=OrgType.LEGAL_ENTITY, is_active=True)
+    db.add(org)
+    await db.flush()
+
+    # Цепочка глубже любого фиксированного числа уровней selectin
+    parent_id = None
+    for level in range(25):
+        node = Division(
+            name=f"Уровень {level}", code=f"LV{level}", level=level, organization_id=org.id, parent_id=parent_id
+        )
+        db.add(node)
+        await db.flush()
+        parent_id = node.id
+    db.expunge_all()
+
+    with max_queries(QUERY_BUDGETS["GET /divisions/tree"]):
+        roots = await division.get_tree(db, organization_id=org.id)
+        tree = [DivisionWithChildren.model_validate(node).model_dump() for node in roots]
+    assert len(tree) == 1
+    assert count_nodes(tree[0]) == 25
@@ -0,0 +1 @@
+"""Нагрузочное тестирование и бенчмарки API (см. run_benchmark.py)."""
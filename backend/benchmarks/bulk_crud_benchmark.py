@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+"""
+Бенчмарк пакетных операций CRUDBase против цикла по одной записи.
+
+Для каждого размера пакета на организациях сравниваются:
+  - create - create() в цикле против create_many();
+  - update - get() + update() в цикле против update_many();
+  - upsert - поиск по коду + create()/update() в цикле против upsert_many();
+  - remove - remove() в цикле против remove_many().
+
+Считаются время, строк в секунду и число SQL-запросов. Записи создаются с
+уникальным префиксом кода и удаляются в конце. По умолчанию используется
+тестовая база ({POSTGRES_DB}_test, как в app/tests/conftest.py).
+
+Пример (из каталога backend):
+    python -m benchmarks.bulk_crud_benchmark --sizes 100,1000,10000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.crud.crud_organization import organization as crud_organization
+from app.db.base import Base
+from app.models.organization import Organization
+from app.schemas.organization import OrganizationBulkUpdate, OrganizationCreate, OrgType
+from app.tests.query_counter import count_queries
+from benchmarks.run_benchmark import BENCHMARKS_DIR, git_commit, _round
+
+
+def make_organizations(prefix: str, size: int, suffix: str = "") -> List[OrganizationCreate]:
+    return [
+        OrganizationCreate(
+            name=f"Организация {i}{suffix}",
+            code=f"{prefix}-{i}",
+            org_type=OrgType.LEGAL_ENTITY,
+            inn=f"{7700000000 + i}",
+        )
+        for i in range(size)
+    ]
+
+
+async def timed(engine, operation) -> Dict[str, Any]:
+    """Время и число SQL-запросов одной операции."""
+    with count_queries(engine) as statements:
+        started = time.perf_counter()
+        await operation()
+        elapsed = time.perf_counter() - started
+    return {"seconds": elapsed, "statements": len(statements)}
+
+
+async def run_loop(engine, session_factory, prefix: str, size: int) -> Dict[str, Dict[str, Any]]:
+    """Цикл по одной записи, как при вызове одиночных эндпоинтов."""
+    results = {}
+    async with session_factory() as db:
+        created: List[Organization] = []
+
+        async def create():
+            for obj_in in make_organizations(prefix, size):
+                created.append(await crud_organization.create(db, obj_in=obj_in))
+        results["create"] = await timed(engine, create)
+
+        async def update():
+            for org in created:
+                db_obj = await crud_organization.get(db, id=org.id)
+                await crud_organization.update(db, db_obj=db_obj, obj_in={"name": org.name + " (изм.)"})
+        results["update"] = await timed(engine, update)
+
+        async def upsert():
+            # Половина пакета - существующие коды, половина - новые
+            for obj_in in make_organizations(prefix, size + size // 2, " (upsert)")[size // 2:]:
+                result = await db.execute(select(Organization).where(Organization.code == obj_in.code))
+                db_obj = result.scalar_one_or_none()
+                if db_obj:
+                    await crud_organization.update(db, db_obj=db_obj, obj_in=obj_in)
+                else:
+                    await crud_organization.create(db, obj_in=obj_in)
+        results["upsert"] = await timed(engine, upsert)
+
+        async def remove():
+            result = await db.execute(select(Organization.id).where(Organization.code.like(f"{prefix}-%")))
+            for org_id in result.scalars().all():
+                await crud_organization.remove(db, id=org_id)
+        results["remove"] = await timed(engine, remove)
+    return results
+
+
+async def run_bulk(engine, session_factory, prefix: str, size: int) -> Dict[str, Dict[str, Any]]:
+    """Те же операции пакетными методами CRUDBase."""
+    results = {}
+    async with session_factory() as db:
+        created: List[Organization] = []
+
+        async def create():
+            created.extend(await crud_organization.create_many(db, objs_in=make_organizations(prefix, size)))
+        results["create"] = await timed(engine, create)
+
+        async def update():
+            await crud_organization.update_many(db, objs_in=[
+                OrganizationBulkUpdate(id=org.id, name=org.name + " (изм.)") for org in created
+            ])
+        results["update"] = await timed(engine, update)
+
+        async def upsert():
+            await crud_organization.upsert_many(
+                db, objs_in=make_organizations(prefix, size + size // 2, " (upsert)")[size // 2:]
+            )
+        results["upsert"] = await timed(engine, upsert)
+
+        async def remove():
+            result = await db.execute(select(Organization.id).where(Organization.code.like(f"{prefix}-%")))
+            await crud_organization.remove_many(db, ids=result.scalars().all())
+        results["remove"] = await timed(engine, remove)
+    return results
+
+
+def summarize(size: int, loop: Dict[str, Dict[str, Any]], bulk: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    result = {}
+    for operation in loop:
+        result[operation] = {}
+        for mode, data in (("loop", loop[operation]), ("bulk", bulk[operation])):
+            result[operation][mode] = {
+                "seconds": _round(data["seconds"]),
+                "rows_per_second": _round(size / data["seconds"]) if data["seconds"] else None,
+                "statements": data["statements"],
+            }
+        bulk_seconds = bulk[operation]["seconds"]
+        result[operation]["speedup"] = _round(loop[operation]["seconds"] / bulk_seconds) if bulk_seconds else None
+    return result
+
+
+def print_size(size: int, result: Dict[str, Any]):
+    print(f"\n=== {size} записей ===")
+    print(f"{'операция':<8} {'цикл, с':>10} {'запросов':>9} {'пакет, с':>10} {'запросов':>9} {'ускорение':>10}")
+    for operation, data in result.items():
+        print(f"{operation:<8} {data['loop']['seconds']:>10} {data['loop']['statements']:>9} "
+              f"{data['bulk']['seconds']:>10} {data['bulk']['statements']:>9} {data['speedup']:>10}")
+
+
+async def run(args) -> Dict[str, Any]:
+    engine = create_async_engine(args.database_url, future=True)
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    report: Dict[str, Any] = {
+        "commit": git_commit(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "parameters": {"sizes": args.sizes},
+        "sizes": {},
+    }
+    prefix = f"BENCH-{uuid.uuid4().hex[:8]}"
+    try:
+        for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+            loop = await run_loop(engine, session_factory, f"{prefix}-L{size}", size)
+            bulk = await run_bulk(engine, session_factory, f"{prefix}-B{size}", size)
+            result = summarize(size, loop, bulk)
+            report["sizes"][str(size)] = result
+            print_size(size, result)
+    finally:
+        # Остатки прерванного прогона
+        async with engine.begin() as conn:
+            await conn.execute(delete(Organization).where(Organization.code.like(f"{prefix}-%")))
+        await engine.dispose()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетные операции CRUDBase против цикла по одной записи")
+    parser.add_argument("--sizes", default="100,1000,10000", help="Размеры пакета через запятую")
+    parser.add_argument(
+        "--database-url",
+        default=settings.SQLALCHEMY_DATABASE_URI.replace(settings.POSTGRES_DB, f"{settings.POSTGRES_DB}_test"),
+        help="Асинхронный URL базы (по умолчанию тестовая база)",
+    )
+    parser.add_argument("--output-dir", default=os.path.join(BENCHMARKS_DIR, "results"))
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    report = asyncio.run(run(args))
+
+    output_path = os.path.join(
+        args.output_dir,
+        f"bulk_crud_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{report['commit'] or 'nogit'}.json",
+    )
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты сохранены в {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,538 @@
+#!/usr/bin/env python
+"""
+Генератор больших синтетических наборов данных оргструктуры.
+
+Данные строятся детерминированно по числу сотрудников и seed: одинаковые параметры
+всегда дают одинаковые данные, поэтому результаты разных прогонов сопоставимы.
+Генерируются: совет и холдинг, юридические лица с локациями, глубокие деревья
+подразделений, отделы, функции, должности, сотрудники с историей назначений
+(пересекающиеся периоды должностей, функций и локаций), административные и
+матричные functional_relations (часть - завершенные) и ЦКП.
+
+Запись идет напрямую в базу пачками:
+  - SQLite: executemany в одной транзакции; индексы на триггерах (поиск, журнал
+    изменений, периоды действия) создаются после загрузки и заполняются одним запросом;
+  - PostgreSQL: COPY через psycopg2 в таблицы той же схемы (complete_schema.py),
+    триггеры SQLite при этом не переносятся.
+
+Примеры (из каталога backend):
+    python -m benchmarks.dataset --staff 1000000 --sqlite data/staff_1m.db
+    python -m benchmarks.dataset --staff 100000 --postgres "dbname=ofs user=postgres" --division-branching 2
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import re
+import sqlite3
+import time
+from datetime import date
+from typing import Dict, Any, List, Iterable, Optional
+
+from complete_schema import (
+    ORGANIZATION_SCHEMA, DIVISION_SCHEMA, SECTION_SCHEMA, DIVISION_SECTION_SCHEMA,
+    FUNCTION_SCHEMA, SECTION_FUNCTION_SCHEMA, POSITION_SCHEMA, STAFF_SCHEMA,
+    STAFF_POSITION_SCHEMA, STAFF_LOCATION_SCHEMA, STAFF_FUNCTION_SCHEMA,
+    FUNCTIONAL_RELATION_SCHEMA, VFP_SCHEMA, ALL_SCHEMAS,
+    SEARCH_REBUILD_SQL, CHANGE_LOG_SEED_SQL, TEMPORAL_REBUILD_SQL, VFP_ROLLUP_REBUILD_SQL,
+    ANALYTICS_REBUILD_SQL,
+)
+
+# Таблицы с данными: создаются до загрузки
+BASE_SCHEMAS = [
+    ORGANIZATION_SCHEMA, DIVISION_SCHEMA, SECTION_SCHEMA, DIVISION_SECTION_SCHEMA,
+    FUNCTION_SCHEMA, SECTION_FUNCTION_SCHEMA, POSITION_SCHEMA, STAFF_SCHEMA,
+    STAFF_POSITION_SCHEMA, STAFF_LOCATION_SCHEMA, STAFF_FUNCTION_SCHEMA,
+    FUNCTIONAL_RELATION_SCHEMA, VFP_SCHEMA,
+]
+
+# Заполнение индексов, которые в рабочем режиме поддерживаются триггерами (только SQLite)
+DERIVED_REBUILD_SQL = [SEARCH_REBUILD_SQL, CHANGE_LOG_SEED_SQL, TEMPORAL_REBUILD_SQL, VFP_ROLLUP_REBUILD_SQL,
+                       ANALYTICS_REBUILD_SQL]
+
+# Размер пачки для executemany / COPY
+BATCH_SIZE = 20000
+
+# Ветвление дерева подразделений внутри юридического лица по умолчанию.
+# Чем меньше ветвление, тем глубже дерево (2 - бинарное дерево глубиной log2(N)).
+DIVISION_BRANCHING = 5
+
+# Доля сотрудников с историей основных должностей (1-3 закрытых назначения)
+HISTORY_SHARE = 0.3
+
+# Доля сотрудников с совмещением: дополнительная должность, период которой пересекается с основной
+OVERLAP_SHARE = 0.1
+
+# Доля сотрудников, сменивших локацию
+RELOCATION_SHARE = 0.2
+
+# Число матричных (не административных) отношений на одного сотрудника и доля завершенных
+MATRIX_RELATIONS_PER_STAFF = 0.3
+ENDED_MATRIX_SHARE = 0.25
+
+# Доля отделов и функций, у которых есть ЦКП (у подразделений и юрлиц - у всех)
+VFP_SECTION_SHARE = 0.5
+VFP_FUNCTION_SHARE = 0.5
+
+# Дата "сегодня" для генерации периодов: фиксирована ради воспроизводимости
+REFERENCE_DATE = date(2024, 1, 1)
+HISTORY_START = date(2012, 1, 1)
+
+MATRIX_RELATION_TYPES = [
+    "functional", "project", "territorial", "mentoring",
+    "strategic", "governance", "advisory", "supervisory",
+]
+
+VFP_STATUSES = ["not_started", "in_progress", "completed", "blocked", "delayed"]
+VFP_KPIS = [
+    ("Выручка", "руб."), ("Маржинальность", "%"), ("Выполнение плана", "%"),
+    ("Количество клиентов", "шт."), ("Срок выполнения заказа", "дн."), ("Доля рынка", "%"),
+]
+
+LAST_NAMES = [
+    "Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов",
+    "Новиков", "Федоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семенов", "Егоров",
+    "Павлов", "Козлов", "Степанов", "Николаев", "Орлов", "Андреев", "Макаров", "Никитин",
+    "Захаров", "Зайцев", "Соловьев", "Борисов", "Яковлев", "Григорьев", "Романов", "Воробьев",
+]
+FIRST_NAMES = [
+    "Александр", "Дмитрий", "Максим", "Сергей", "Андрей", "Алексей", "Артем", "Илья",
+    "Кирилл", "Михаил", "Никита", "Матвей", "Роман", "Егор", "Арсений", "Иван",
+    "Денис", "Евгений", "Даниил", "Тимофей", "Владислав", "Игорь", "Павел", "Олег",
+]
+MIDDLE_NAMES = [
+    "Александрович", "Дмитриевич", "Сергеевич", "Андреевич", "Алексеевич",
+    "Михайлович", "Иванович", "Петрович", "Николаевич", "Владимирович",
+]
+
+
+def plan_counts(staff_count: int) -> Dict[str, int]:
+    """Размеры справочников в зависимости от числа сотрудников."""
+    return {
+        "staff": staff_count,
+        "legal_entities": max(2, staff_count // 5000),
+        "locations": max(2, staff_count // 10000),
+        "divisions": max(5, staff_count // 25),
+        "sections": max(5, staff_count // 100),
+        "functions": max(5, staff_count // 200),
+        "positions": max(10, staff_count // 100),
+    }
+
+
+class SQLiteWriter:
+    """Пишет данные в файл SQLite пачками executemany в одной транзакции."""
+
+    def __init__(self, path: str):
+        if os.path.exists(path):
+            os.remove(path)
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode = OFF")
+        self.db.execute("PRAGMA synchronous = OFF")
+        self.db.execute("PRAGMA cache_size = -200000")
+
+    def create_tables(self):
+        for schema in BASE_SCHEMAS:
+            self.db.executescript(schema)
+        self.db.execute("BEGIN")
+
+    def insert(self, table: str, columns: List[str], rows: Iterable[tuple]) -> int:
+        query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+        count = 0
+        for batch in batched(rows):
+            self.db.executemany(query, batch)
+            count += len(batch)
+        return count
+
+    def finish(self):
+        """Создает остальные схемы (поиск, журнал изменений, периоды действия) и заполняет их."""
+        self.db.execute("COMMIT")
+        for schema in ALL_SCHEMAS:
+            if schema not in BASE_SCHEMAS:
+                self.db.executescript(schema)
+        for rebuild_sql in DERIVED_REBUILD_SQL:
+            self.db.executescript(rebuild_sql)
+        self.db.execute("PRAGMA journal_mode = DELETE")
+        self.db.execute("ANALYZE")
+        self.db.close()
+
+
+class PostgresWriter:
+    """
+    Пишет данные в PostgreSQL через COPY. Таблицы создаются по схеме complete_schema.py
+    (CREATE TABLE и CREATE INDEX; триггеры SQLite пропускаются).
+    Требует psycopg2.
+    """
+
+    def __init__(self, dsn: str):
+        try:
+            import psycopg2
+        except ImportError:
+            raise SystemExit("Для записи в PostgreSQL установите psycopg2: pip install psycopg2-binary")
+        self.conn = psycopg2.connect(dsn)
+        self.cursor = self.conn.cursor()
+        self.tables: List[str] = []
+
+    @staticmethod
+    def translate_schema(schema: str) -> List[str]:
+        """Переводит DDL SQLite в PostgreSQL: таблицы и индексы без триггеров."""
+        statements = re.findall(r"CREATE TABLE IF NOT EXISTS .*?\n\);", schema, re.S)
+        statements += re.findall(r"CREATE INDEX IF NOT EXISTS [^;]*;", schema)
+        return [s.replace("INTEGER PRIMARY KEY AUTOINCREMENT", "BIGSERIAL PRIMARY KEY") for s in statements]
+
+    def create_tables(self):
+        for schema in BASE_SCHEMAS:
+            for statement in self.translate_schema(schema):
+                self.cursor.execute(statement)
+        self.conn.commit()
+
+    def insert(self, table: str, columns: List[str], rows: Iterable[tuple]) -> int:
+        count = 0
+        for batch in batched(rows):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(batch)
+            buffer.seek(0)
+            self.cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+            count += len(batch)
+        if table not in self.tables:
+            self.tables.append(table)
+        return count
+
+    def finish(self):
+        # Идентификаторы вставлялись явно - сдвигаем последовательности за максимальный id
+        for table in self.tables:
+            self.cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1)) FROM {table}"
+            )
+        self.conn.commit()
+        self.conn.autocommit = True
+        self.cursor.execute("ANALYZE")
+        self.conn.close()
+
+
+def batched(rows: Iterable[tuple], size: int = BATCH_SIZE) -> Iterable[List[tuple]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate(writer, staff_count: int, seed: int = 42, division_branching: int = DIVISION_BRANCHING,
+             log=None) -> Dict[str, Any]:
+    """
+    Генерирует набор данных и записывает его через writer.
+    Возвращает описание набора с диапазонами идентификаторов (для генерации запросов).
+    """
+    rng = random.Random(seed)
+    counts = plan_counts(staff_count)
+    today = REFERENCE_DATE.toordinal()
+    history_start = HISTORY_START.toordinal()
+    iso = date.fromordinal
+    log = log or (lambda message: None)
+    rows_written: Dict[str, int] = {}
+
+    def write(table, columns, rows):
+        started = time.perf_counter()
+        rows_written[table] = rows_written.get(table, 0) + writer.insert(table, columns, rows)
+        log(f"{table}: {rows_written[table]} строк, {time.perf_counter() - started:.1f} с")
+
+    writer.create_tables()
+
+    # Организации: совет -> холдинг -> юридические лица -> локации
+    board_id, holding_id = 1, 2
+    legal_entity_ids = list(range(3, 3 + counts["legal_entities"]))
+    location_ids = list(range(legal_entity_ids[-1] + 1, legal_entity_ids[-1] + 1 + counts["locations"]))
+    location_parent = {org_id: legal_entity_ids[i % len(legal_entity_ids)] for i, org_id in enumerate(location_ids)}
+    organizations = [
+        (board_id, "Совет учредителей", "BENCH-BOARD", "board", None, None),
+        (holding_id, "Холдинг", "BENCH-HOLDING", "holding", board_id, None),
+    ]
+    organizations += [
+        (org_id, f"Юридическое лицо {org_id}", f"BENCH-LE-{org_id}", "legal_entity", holding_id, f"77{org_id:08d}")
+        for org_id in legal_entity_ids
+    ]
+    organizations += [
+        (org_id, f"Локация {org_id}", f"BENCH-LOC-{org_id}", "location", location_parent[org_id], None)
+        for org_id in location_ids
+    ]
+    write("organizations", ["id", "name", "code", "org_type", "parent_id", "inn"], organizations)
+
+    # Подразделения: у каждого юридического лица свое дерево с заданным ветвлением
+    division_count = counts["divisions"]
+    division_org = [0] * (division_count + 1)
+    division_parent: List[Optional[int]] = [None] * (division_count + 1)
+    by_entity: Dict[int, List[int]] = {org_id: [] for org_id in legal_entity_ids}
+    for division_id in range(1, division_count + 1):
+        org_id = legal_entity_ids[(division_id - 1) % len(legal_entity_ids)]
+        siblings = by_entity[org_id]
+        division_parent[division_id] = siblings[(len(siblings) - 1) // division_branching] if siblings else None
+        division_org[division_id] = org_id
+        siblings.append(division_id)
+    write(
+        "divisions", ["id", "name", "code", "organization_id", "parent_id"],
+        (
+            (d, f"Подразделение {d}", f"BENCH-DIV-{d}", division_org[d], division_parent[d])
+            for d in range(1, division_count + 1)
+        )
+    )
+
+    section_count = counts["sections"]
+    function_count = counts["functions"]
+    position_count = counts["positions"]
+    write(
+        "sections", ["id", "name", "code"],
+        ((s, f"Отдел {s}", f"BENCH-SEC-{s}") for s in range(1, section_count + 1))
+    )
+    write(
+        "division_sections", ["division_id", "section_id", "is_primary"],
+        ((d, rng.randint(1, section_count), 1) for d in range(1, division_count + 1))
+    )
+    write(
+        "functions", ["id", "name", "code"],
+        ((f, f"Функция {f}", f"BENCH-FUN-{f}") for f in range(1, function_count + 1))
+    )
+    write(
+        "section_functions", ["section_id", "function_id", "is_primary"],
+        ((1 + (f - 1) % section_count, f, 1) for f in range(1, function_count + 1))
+    )
+    position_function = [0] + [rng.randint(1, function_count) for _ in range(position_count)]
+    write(
+        "positions", ["id", "name", "code", "function_id"],
+        ((p, f"Должность {p}", f"BENCH-POS-{p}", position_function[p]) for p in range(1, position_count + 1))
+    )
+
+    # Сотрудники: первые division_count человек - руководители своих подразделений
+    staff_division = array_of(staff_count)
+    for staff_id in range(1, staff_count + 1):
+        staff_division[staff_id] = staff_id if staff_id <= division_count else rng.randint(1, division_count)
+
+    write(
+        "staff",
+        ["id", "email", "first_name", "last_name", "middle_name", "phone", "organization_id", "primary_organization_id"],
+        (
+            (
+                staff_id,
+                f"staff{staff_id}@bench.example.com",
+                rng.choice(FIRST_NAMES),
+                rng.choice(LAST_NAMES),
+                rng.choice(MIDDLE_NAMES),
+                f"+7 (9{staff_id % 100:02d}) {staff_id % 1000:03d}-{(staff_id // 1000) % 100:02d}-{staff_id % 97:02d}",
+                division_org[staff_division[staff_id]],
+                division_org[staff_division[staff_id]],
+            )
+            for staff_id in range(1, staff_count + 1)
+        )
+    )
+
+    # Назначения на должности: текущая основная, у части - цепочка закрытых основных
+    # и совмещение, период которого пересекается с основной должностью
+    staff_position = array_of(staff_count)
+    staff_start = array_of(staff_count)
+    staff_location = array_of(staff_count)
+
+    def staff_position_rows():
+        for staff_id in range(1, staff_count + 1):
+            position_id = rng.randint(1, position_count)
+            start = rng.randint(history_start + 1500, today)
+            location_id = rng.choice(location_ids)
+            staff_position[staff_id] = position_id
+            staff_start[staff_id] = start
+            staff_location[staff_id] = location_id
+            yield (staff_id, position_id, staff_division[staff_id], location_id, 1, 1, iso(start).isoformat(), None)
+
+            if rng.random() < HISTORY_SHARE:
+                end = start - 1
+                for _ in range(rng.randint(1, 3)):
+                    previous_start = max(history_start, end - rng.randint(180, 1200))
+                    yield (
+                        staff_id, rng.randint(1, position_count), rng.randint(1, division_count), location_id,
+                        1, 0, iso(previous_start).isoformat(), iso(end).isoformat(),
+                    )
+                    end = previous_start - 1
+                    if end <= history_start:
+                        break
+
+            if rng.random() < OVERLAP_SHARE:
+                extra_start = rng.randint(start, today)
+                extra_end = extra_start + rng.randint(90, 720) if rng.random() < 0.5 else None
+                yield (
+                    staff_id, rng.randint(1, position_count), rng.randint(1, division_count), location_id,
+                    0, int(extra_end is None or extra_end >= today), iso(extra_start).isoformat(),
+                    iso(extra_end).isoformat() if extra_end else None,
+                )
+
+    write(
+        "staff_positions",
+        ["staff_id", "position_id", "division_id", "location_id", "is_primary", "is_active", "start_date", "end_date"],
+        staff_position_rows()
+    )
+
+    def staff_location_rows():
+        for staff_id in range(1, staff_count + 1):
+            start = staff_start[staff_id]
+            if rng.random() < RELOCATION_SHARE:
+                moved = rng.randint(start, today)
+                yield (staff_id, rng.choice(location_ids), 0, iso(start).isoformat(), iso(moved - 1).isoformat())
+                start = moved
+            yield (staff_id, staff_location[staff_id], 1, iso(start).isoformat(), None)
+
+    write("staff_locations", ["staff_id", "location_id", "is_current", "date_from", "date_to"], staff_location_rows())
+
+    # Функции: основная функция должности, у совместителей - вторая функция с частичной занятостью
+    def staff_function_rows():
+        for staff_id in range(1, staff_count + 1):
+            start = iso(staff_start[staff_id]).isoformat()
+            function_id = position_function[staff_position[staff_id]]
+            if rng.random() < OVERLAP_SHARE:
+                share = rng.choice([50, 60, 70, 80])
+                yield (staff_id, function_id, share, 1, start, None)
+                yield (staff_id, 1 + function_id % function_count, 100 - share, 0, start, None)
+            else:
+                yield (staff_id, function_id, 100, 1, start, None)
+
+    write(
+        "staff_functions", ["staff_id", "function_id", "commitment_percent", "is_primary", "date_from", "date_to"],
+        staff_function_rows()
+    )
+
+    # Административное подчинение: сотрудник -> руководитель подразделения,
+    # руководитель -> руководитель родительского подразделения (у части - с закрытым
+    # предыдущим руководителем). Плюс матричные связи, часть из них завершена.
+    def relation_rows():
+        for staff_id in range(1, staff_count + 1):
+            manager_id = division_parent[staff_id] if staff_id <= division_count else staff_division[staff_id]
+            if not manager_id:
+                continue
+            start = staff_start[staff_id]
+            if rng.random() < HISTORY_SHARE:
+                previous_manager = rng.randint(1, division_count)
+                if previous_manager not in (staff_id, manager_id):
+                    previous_start = max(history_start, start - rng.randint(180, 1200))
+                    yield (
+                        previous_manager, staff_id, "administrative", 0,
+                        iso(previous_start).isoformat(), iso(start - 1).isoformat(),
+                    )
+            yield (manager_id, staff_id, "administrative", 1, iso(start).isoformat(), None)
+
+        for _ in range(int(staff_count * MATRIX_RELATIONS_PER_STAFF)):
+            manager_id = rng.randint(1, division_count)
+            subordinate_id = rng.randint(1, staff_count)
+            if manager_id == subordinate_id:
+                continue
+            start = rng.randint(history_start, today)
+            end = rng.randint(start, today) if rng.random() < ENDED_MATRIX_SHARE else None
+            yield (
+                manager_id, subordinate_id, rng.choice(MATRIX_RELATION_TYPES), int(end is None),
+                iso(start).isoformat(), iso(end).isoformat() if end else None,
+            )
+
+    write(
+        "functional_relations",
+        ["manager_id", "subordinate_id", "relation_type", "is_active", "start_date", "end_date"],
+        relation_rows()
+    )
+
+    # ЦКП: у всех юрлиц и подразделений, у части отделов и функций
+    def vfp_rows():
+        entities = [("organization", org_id) for org_id in legal_entity_ids]
+        entities += [("division", d) for d in range(1, division_count + 1)]
+        entities += [("section", s) for s in range(1, section_count + 1) if rng.random() < VFP_SECTION_SHARE]
+        entities += [("function", f) for f in range(1, function_count + 1) if rng.random() < VFP_FUNCTION_SHARE]
+        for entity_type, entity_id in entities:
+            kpi, unit = rng.choice(VFP_KPIS)
+            target = rng.randint(10, 1000) * 10
+            status = rng.choice(VFP_STATUSES)
+            progress = {"not_started": 0, "completed": 100}.get(status, rng.randint(1, 99))
+            start = rng.randint(today - 730, today)
+            metrics = {"kpi": kpi, "unit": unit, "target": target, "actual": target * progress // 100}
+            yield (
+                entity_type, entity_id, f"ЦКП: {kpi} ({entity_type} {entity_id})",
+                json.dumps(metrics, ensure_ascii=False), status, progress,
+                iso(start).isoformat(), iso(start + rng.randint(90, 730)).isoformat(),
+            )
+
+    write(
+        "valuable_final_products",
+        ["entity_type", "entity_id", "name", "metrics", "status", "progress", "start_date", "target_date"],
+        vfp_rows()
+    )
+
+    started = time.perf_counter()
+    writer.finish()
+    log(f"индексы и статистика: {time.perf_counter() - started:.1f} с")
+
+    return {
+        "seed": seed,
+        "division_branching": division_branching,
+        "counts": counts,
+        "rows": rows_written,
+        "board_id": board_id,
+        "holding_id": holding_id,
+        "legal_entity_ids": legal_entity_ids,
+        "location_ids": location_ids,
+        "manager_ids": [1, division_count],  # руководители подразделений: диапазон id
+        "staff_ids": [1, staff_count],
+        "division_ids": [1, division_count],
+        "last_names": LAST_NAMES,
+    }
+
+
+def array_of(staff_count: int) -> List[int]:
+    """Список значений по id сотрудника (индекс 0 не используется)."""
+    return [0] * (staff_count + 1)
+
+
+def build_dataset(db_path: str, staff_count: int, seed: int = 42,
+                  division_branching: int = DIVISION_BRANCHING, log=None) -> Dict[str, Any]:
+    """
+    Создает базу SQLite db_path и сохраняет рядом описание (db_path + ".json").
+    Возвращает это описание.
+    """
+    manifest = generate(SQLiteWriter(db_path), staff_count, seed, division_branching, log)
+    with open(db_path + ".json", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def load_or_build_dataset(db_path: str, staff_count: int, seed: int = 42) -> Dict[str, Any]:
+    """Возвращает описание готовой базы или строит ее, если базы с такими параметрами нет."""
+    manifest_path = db_path + ".json"
+    if os.path.exists(db_path) and os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if (manifest.get("seed") == seed and manifest.get("counts", {}).get("staff") == staff_count
+                and manifest.get("division_branching") == DIVISION_BRANCHING):
+            return manifest
+    return build_dataset(db_path, staff_count, seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генератор синтетических данных оргструктуры")
+    parser.add_argument("--staff", type=int, required=True, help="Число сотрудников")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--division-branching", type=int, default=DIVISION_BRANCHING,
+                        help="Ветвление дерева подразделений (меньше - глубже)")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--sqlite", help="Путь к создаваемому файлу SQLite (существующий будет удален)")
+    target.add_argument("--postgres", help="DSN PostgreSQL, например \"dbname=ofs user=postgres\"")
+    args = parser.parse_args()
+    if args.division_branching < 1:
+        parser.error("--division-branching должно быть не меньше 1")
+
+    started = time.perf_counter()
+    log = lambda message: print(f"[{time.perf_counter() - started:7.1f} с] {message}", flush=True)
+    if args.sqlite:
+        manifest = build_dataset(args.sqlite, args.staff, args.seed, args.division_branching, log)
+    else:
+        manifest = generate(PostgresWriter(args.postgres), args.staff, args.seed, args.division_branching, log)
+    print(f"Готово за {time.perf_counter() - started:.1f} с: {json.dumps(manifest['rows'], ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""
+Бенчмарк первой отрисовки оргструктуры: полное дерево против ленивой загрузки.
+
+Для каждого масштаба сравниваются:
+  - full        - GET /org-structure/hierarchy (все дерево целиком);
+  - first_paint - GET /org-structure/hierarchy?depth=N (первые N уровней);
+  - expand      - GET /org-structure/hierarchy?root_type=division&root_id=...&depth=1
+                  (раскрытие одного узла по клику).
+
+Для каждого запроса считаются задержка (p50/p95), размер ответа без сжатия и
+со сжатием gzip и число SQL-запросов. Результаты сохраняются в JSON.
+
+Пример (из каталога backend):
+    python -m benchmarks.hierarchy_benchmark --scales 1000,10000 --repeat 20
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+import requests
+
+from benchmarks.dataset import load_or_build_dataset
+from benchmarks.run_benchmark import BENCHMARKS_DIR, git_commit, percentile, start_server, stop_server, _round
+from benchmarks.server import STATEMENTS_HEADER
+
+
+def measure(url: str, repeat: int, timeout: float) -> Dict[str, Any]:
+    """Замеряет repeat последовательных запросов к url."""
+    latencies = []
+    statements = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = requests.get(url, headers={"Accept-Encoding": "identity"}, timeout=timeout)
+        latencies.append((time.perf_counter() - started) * 1000)
+        response.raise_for_status()
+        statements = response.headers.get(STATEMENTS_HEADER)
+    raw_size = len(response.content)
+
+    # Размер сжатого ответа (как его получит браузер)
+    compressed = requests.get(url, headers={"Accept-Encoding": "gzip"}, timeout=timeout, stream=True)
+    compressed_size = len(compressed.raw.read(decode_content=False))
+
+    latencies.sort()
+    return {
+        "latency_ms": {
+            "p50": _round(percentile(latencies, 50)),
+            "p95": _round(percentile(latencies, 95)),
+            "mean": _round(sum(latencies) / len(latencies)),
+        },
+        "payload_bytes": raw_size,
+        "payload_gzip_bytes": compressed_size,
+        "db_statements": int(statements) if statements is not None else None,
+    }
+
+
+def pick_division(db_path: str, seed: int) -> int:
+    """Случайное подразделение, у которого есть дочерние подразделения."""
+    conn = sqlite3.connect(db_path)
+    try:
+        ids = [row[0] for row in conn.execute(
+            "SELECT DISTINCT parent_id FROM divisions WHERE parent_id IS NOT NULL ORDER BY parent_id")]
+    finally:
+        conn.close()
+    return random.Random(seed).choice(ids) if ids else 1
+
+
+def run_scale(base_url: str, division_id: int, depth: int, repeat: int, timeout: float) -> Dict[str, Any]:
+    urls = {
+        "full": f"{base_url}/org-structure/hierarchy",
+        "first_paint": f"{base_url}/org-structure/hierarchy?depth={depth}",
+        "expand": f"{base_url}/org-structure/hierarchy?root_type=division&root_id={division_id}&depth=1",
+    }
+    return {name: measure(url, repeat, timeout) for name, url in urls.items()}
+
+
+def print_scale(scale: int, result: Dict[str, Any]):
+    print(f"\n=== {scale} сотрудников ===")
+    print(f"{'запрос':<12} {'p50, мс':>9} {'p95, мс':>9} {'байт':>12} {'gzip, байт':>12} {'SQL':>6}")
+    for name, stats in result.items():
+        print(f"{name:<12} {stats['latency_ms']['p50']:>9} {stats['latency_ms']['p95']:>9} "
+              f"{stats['payload_bytes']:>12} {stats['payload_gzip_bytes']:>12} {str(stats['db_statements']):>6}")
+    full, first = result["full"], result["first_paint"]
+    if first["payload_bytes"] and first["latency_ms"]["p50"]:
+        print(f"первая отрисовка: в {full['payload_bytes'] / first['payload_bytes']:.1f} раз меньше данных, "
+              f"в {full['latency_ms']['p50'] / first['latency_ms']['p50']:.1f} раз быстрее (p50)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Полное дерево оргструктуры против ленивой загрузки")
+    parser.add_argument("--scales", default="1000,10000,100000", help="Число сотрудников через запятую")
+    parser.add_argument("--depth", type=int, default=2, help="Глубина дерева при первой отрисовке")
+    parser.add_argument("--repeat", type=int, default=20, help="Число запросов каждого вида")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=300, help="Таймаут одного запроса, секунд")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--data-dir", default=os.path.join(BENCHMARKS_DIR, "data"))
+    parser.add_argument("--output-dir", default=os.path.join(BENCHMARKS_DIR, "results"))
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    report: Dict[str, Any] = {
+        "commit": git_commit(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "parameters": {"depth": args.depth, "repeat": args.repeat, "seed": args.seed},
+        "scales": {},
+    }
+
+    scales: List[int] = [int(s) for s in args.scales.split(",") if s.strip()]
+    for scale in scales:
+        dataset_path = os.path.join(args.data_dir, f"staff_{scale}_seed_{args.seed}.db")
+        print(f"Подготовка базы на {scale} сотрудников...")
+        load_or_build_dataset(dataset_path, scale, args.seed)
+        division_id = pick_division(dataset_path, args.seed)
+
+        run_dir = tempfile.mkdtemp(prefix=f"ofs_hierarchy_{scale}_")
+        try:
+            shutil.copy(dataset_path, os.path.join(run_dir, "full_api_new.db"))
+            process = start_server(run_dir, args.port, 1)
+            try:
+                result = run_scale(f"http://127.0.0.1:{args.port}", division_id, args.depth,
+                                   args.repeat, args.timeout)
+            finally:
+                stop_server(process)
+        finally:
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+        report["scales"][str(scale)] = result
+        print_scale(scale, result)
+
+    output_path = os.path.join(
+        args.output_dir,
+        f"hierarchy_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{report['commit'] or 'nogit'}.json",
+    )
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты сохранены в {output_path}")
+
+
+if __name__ == "__main__":
+    main()
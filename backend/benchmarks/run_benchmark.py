@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+"""
+Нагрузочный тест REST API (full_api.py и /org-structure/*).
+
+Для каждого масштаба (число сотрудников) скрипт:
+  1. строит базу (или берет готовую из --data-dir) - см. dataset.py;
+  2. копирует ее во временный каталог и запускает сервер (benchmarks/server.py);
+  3. гоняет смешанную нагрузку чтение/запись в --concurrency потоков
+     в течение --duration секунд (первые --warmup секунд не учитываются);
+  4. считает p50/p95/p99 задержки, пропускную способность и среднее число
+     SQL-запросов на HTTP-запрос - общие и по каждой операции.
+
+Результаты сохраняются в JSON (results/<время>_<коммит>.json), их можно сравнить
+с предыдущим прогоном через --baseline.
+
+Пример (из каталога backend):
+    python -m benchmarks.run_benchmark --scales 1000,10000 --concurrency 8 --duration 30
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Callable, Optional, Tuple
+
+import requests
+
+from benchmarks.dataset import load_or_build_dataset
+from benchmarks.server import STATEMENTS_HEADER
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS_DIR = os.path.join(BACKEND_DIR, "benchmarks")
+
+# Сколько ждать запуска сервера (при 100k сотрудников init_db проверяет индексы)
+SERVER_START_TIMEOUT = 120
+
+
+class Operation:
+    """Один тип запроса в нагрузке: вес и функция, которая строит запрос."""
+
+    def __init__(self, name: str, weight: float, is_write: bool, build: Callable):
+        self.name = name
+        self.weight = weight
+        self.is_write = is_write
+        self.build = build  # (rng, manifest, worker_state) -> (method, path, params, json)
+
+
+def _staff_id(rng, m):
+    return rng.randint(*m["staff_ids"])
+
+
+def _manager_id(rng, m):
+    return rng.randint(*m["manager_ids"])
+
+
+def _staff_payload(rng, m, email):
+    org_id = rng.choice(m["legal_entity_ids"])
+    return {
+        "email": email,
+        "first_name": "Бенчмарк",
+        "last_name": rng.choice(m["last_names"]),
+        "is_active": True,
+        "organization_id": org_id,
+        "primary_organization_id": org_id,
+    }
+
+
+def _create_staff(rng, m, state):
+    state["created"] += 1
+    email = f"bench-{state['worker']}-{state['created']}-{rng.randrange(10 ** 9)}@bench.example.com"
+    return "POST", "/staff/", None, _staff_payload(rng, m, email)
+
+
+def _update_staff(rng, m, state):
+    staff_id = _staff_id(rng, m)
+    return "PUT", f"/staff/{staff_id}", None, _staff_payload(rng, m, f"staff{staff_id}@bench.example.com")
+
+
+def _create_relation(rng, m, state):
+    return "POST", "/functional-relations/", None, {
+        "manager_id": _manager_id(rng, m),
+        "subordinate_id": _staff_id(rng, m),
+        "relation_type": rng.choice(["project", "functional", "mentoring"]),
+    }
+
+
+# Смесь запросов: горячие эндпоинты клиента оргструктуры.
+# Веса чтения и записи отдельно нормируются долей записи (--write-ratio).
+OPERATIONS = [
+    Operation("staff_get", 20, False, lambda rng, m, s: ("GET", f"/staff/{_staff_id(rng, m)}", None, None)),
+    Operation("staff_search", 10, False,
+              lambda rng, m, s: ("GET", "/staff/", {"search": rng.choice(m["last_names"])[:4]}, None)),
+    Operation("staff_positions_by_staff", 5, False,
+              lambda rng, m, s: ("GET", "/staff-positions/", {"staff_id": _staff_id(rng, m)}, None)),
+    Operation("relations_by_manager", 10, False,
+              lambda rng, m, s: ("GET", "/functional-relations/", {"manager_id": _manager_id(rng, m)}, None)),
+    Operation("divisions_by_org", 3, False,
+              lambda rng, m, s: ("GET", "/divisions/", {"organization_id": rng.choice(m["legal_entity_ids"])}, None)),
+    Operation("search", 5, False,
+              lambda rng, m, s: ("GET", "/search", {"q": rng.choice(m["last_names"])[:3]}, None)),
+    Operation("org_staff_info", 10, False,
+              lambda rng, m, s: ("GET", f"/org-structure/staff-info/{_staff_id(rng, m)}", None, None)),
+    Operation("org_hierarchy", 2, False, lambda rng, m, s: ("GET", "/org-structure/hierarchy", None, None)),
+    Operation("org_matrix_relations", 2, False,
+              lambda rng, m, s: ("GET", "/org-structure/matrix-relations", {"relation_type": "strategic"}, None)),
+    Operation("org_staff_tree", 1, False, lambda rng, m, s: ("GET", "/org-structure/staff-tree", None, None)),
+    Operation("staff_create", 3, True, _create_staff),
+    Operation("staff_update", 4, True, _update_staff),
+    Operation("relation_create", 3, True, _create_relation),
+]
+
+
+def select_operations(names: Optional[List[str]], write_ratio: float) -> Tuple[List[Operation], List[float]]:
+    """Возвращает операции и их итоговые веса с учетом доли записи."""
+    operations = [op for op in OPERATIONS if not names or op.name in names]
+    read_total = sum(op.weight for op in operations if not op.is_write)
+    write_total = sum(op.weight for op in operations if op.is_write)
+    weights = []
+    for op in operations:
+        if op.is_write:
+            weights.append(op.weight / write_total * write_ratio if write_total else 0)
+        else:
+            weights.append(op.weight / read_total * (1 - write_ratio) if read_total else 0)
+    return operations, weights
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Перцентиль методом ближайшего ранга."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(samples: List[Tuple[float, int, Optional[int]]], elapsed: float) -> Dict[str, Any]:
+    """Сводка по замерам (задержка в секундах, HTTP-статус, число SQL-запросов)."""
+    latencies = sorted(sample[0] * 1000 for sample in samples)
+    statements = [sample[2] for sample in samples if sample[2] is not None]
+    errors = sum(1 for sample in samples if sample[1] >= 400 or sample[1] == 0)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0,
+        "latency_ms": {
+            "p50": _round(percentile(latencies, 50)),
+            "p95": _round(percentile(latencies, 95)),
+            "p99": _round(percentile(latencies, 99)),
+            "max": _round(latencies[-1] if latencies else None),
+            "mean": _round(sum(latencies) / len(latencies) if latencies else None),
+        },
+        "db_statements_per_request": _round(sum(statements) / len(statements) if statements else None),
+    }
+
+
+def _round(value):
+    return round(value, 3) if value is not None else None
+
+
+def run_workload(
+    base_url: str,
+    manifest: Dict[str, Any],
+    operations: List[Operation],
+    weights: List[float],
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    seed: int,
+    timeout: float,
+) -> Dict[str, Any]:
+    """Гоняет нагрузку из concurrency потоков и возвращает сводку."""
+    samples: Dict[str, List[Tuple[float, int, Optional[int]]]] = {op.name: [] for op in operations}
+    lock = threading.Lock()
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    def worker(index: int):
+        rng = random.Random(seed * 1000 + index)
+        state = {"worker": index, "created": 0}
+        session = requests.Session()
+        local: List[Tuple[str, Tuple[float, int, Optional[int]]]] = []
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                break
+            op = rng.choices(operations, weights)[0]
+            method, path, params, body = op.build(rng, manifest, state)
+            request_start = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path, params=params, json=body, timeout=timeout)
+                status = response.status_code
+                header = response.headers.get(STATEMENTS_HEADER)
+                statements = int(header) if header is not None else None
+            except requests.RequestException:
+                status, statements = 0, None
+            request_end = time.perf_counter()
+            if request_start >= measure_from and request_end <= stop_at:
+                local.append((op.name, (request_end - request_start, status, statements)))
+        with lock:
+            for name, sample in local:
+                samples[name].append(sample)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    all_samples = [sample for op_samples in samples.values() for sample in op_samples]
+    return {
+        "overall": summarize(all_samples, duration),
+        "operations": {name: summarize(op_samples, duration) for name, op_samples in samples.items()},
+    }
+
+
+def start_server(run_dir: str, port: int, workers: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = BACKEND_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    log = open(os.path.join(run_dir, "server.log"), "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.server", "--port", str(port), "--workers", str(workers)],
+        cwd=run_dir, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    deadline = time.time() + SERVER_START_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Сервер завершился при запуске, см. {log.name}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Сервер не запустился за отведенное время")
+
+
+def stop_server(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_summary(scale: int, result: Dict[str, Any]):
+    print(f"\n=== {scale} сотрудников ===")
+    print(f"{'операция':<28}{'запросов':>9}{'ошибок':>8}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'SQL/запр':>10}")
+    rows = [("ИТОГО", result["overall"])] + sorted(result["operations"].items())
+    for name, stats in rows:
+        latency = stats["latency_ms"]
+        print(
+            f"{name:<28}{stats['requests']:>9}{stats['errors']:>8}{stats['throughput_rps']:>9}"
+            f"{_fmt(latency['p50'])}{_fmt(latency['p95'])}{_fmt(latency['p99'])}"
+            f"{_fmt(stats['db_statements_per_request'], 10)}"
+        )
+
+
+def _fmt(value, width=9):
+    return f"{'-':>{width}}" if value is None else f"{value:>{width}.1f}"
+
+
+def print_comparison(baseline: Dict[str, Any], current: Dict[str, Any]):
+    """Печатает изменение p95 и пропускной способности относительно базового прогона."""
+    print(f"\n=== Сравнение с {baseline.get('commit')} ({baseline.get('started_at')}) ===")
+    for scale, result in current["scales"].items():
+        base = baseline.get("scales", {}).get(scale)
+        if not base:
+            continue
+        print(f"\n{scale} сотрудников")
+        print(f"{'операция':<28}{'p95 было':>10}{'p95 стало':>11}{'rps было':>10}{'rps стало':>11}")
+        for name, stats in [("ИТОГО", result["overall"])] + sorted(result["operations"].items()):
+            base_stats = base["overall"] if name == "ИТОГО" else base["operations"].get(name)
+            if not base_stats:
+                continue
+            print(
+                f"{name:<28}"
+                f"{_fmt(base_stats['latency_ms']['p95'], 10)}{_fmt(stats['latency_ms']['p95'], 11)}"
+                f"{_fmt(base_stats['throughput_rps'], 10)}{_fmt(stats['throughput_rps'], 11)}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API OFS Global")
+    parser.add_argument("--scales", default="1000,10000,100000", help="Число сотрудников через запятую")
+    parser.add_argument("--concurrency", type=int, default=8, help="Число параллельных клиентов")
+    parser.add_argument("--duration", type=float, default=30, help="Длительность замера, секунд")
+    parser.add_argument("--warmup", type=float, default=5, help="Прогрев без учета результатов, секунд")
+    parser.add_argument("--write-ratio", type=float, default=0.1, help="Доля запросов на запись (0..1)")
+    parser.add_argument("--operations", default=None, help="Только эти операции, через запятую")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=120, help="Таймаут одного запроса, секунд")
+    parser.add_argument("--server-workers", type=int, default=1, help="Число процессов uvicorn")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--data-dir", default=os.path.join(BENCHMARKS_DIR, "data"),
+                        help="Каталог для готовых баз (переиспользуются между прогонами)")
+    parser.add_argument("--output-dir", default=os.path.join(BENCHMARKS_DIR, "results"))
+    parser.add_argument("--baseline", default=None, help="JSON предыдущего прогона для сравнения")
+    args = parser.parse_args()
+
+    scales = [int(s) for s in args.scales.split(",") if s.strip()]
+    names = [n.strip() for n in args.operations.split(",")] if args.operations else None
+    operations, weights = select_operations(names, args.write_ratio)
+    if not operations:
+        parser.error("Не выбрано ни одной операции")
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    report = {
+        "commit": git_commit(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "parameters": {
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "write_ratio": args.write_ratio,
+            "seed": args.seed,
+            "server_workers": args.server_workers,
+            "operations": {op.name: round(w, 4) for op, w in zip(operations, weights)},
+        },
+        "scales": {},
+    }
+
+    for scale in scales:
+        dataset_path = os.path.join(args.data_dir, f"staff_{scale}_seed_{args.seed}.db")
+        print(f"Подготовка базы на {scale} сотрудников...")
+        manifest = load_or_build_dataset(dataset_path, scale, args.seed)
+
+        # Каждый прогон работает с чистой копией: записи предыдущего прогона не влияют на результат
+        run_dir = tempfile.mkdtemp(prefix=f"ofs_bench_{scale}_")
+        try:
+            shutil.copy(dataset_path, os.path.join(run_dir, "full_api_new.db"))
+            process = start_server(run_dir, args.port, args.server_workers)
+            try:
+                print(f"Нагрузка: {args.concurrency} клиентов, {args.duration} с...")
+                result = run_workload(
+                    f"http://127.0.0.1:{args.port}", manifest, operations, weights,
+                    args.concurrency, args.duration, args.warmup, args.seed, args.timeout,
+                )
+            finally:
+                stop_server(process)
+        finally:
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+        report["scales"][str(scale)] = result
+        print_summary(scale, result)
+
+    output_path = os.path.join(
+        args.output_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{report['commit'] or 'nogit'}.json"
+    )
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты сохранены в {output_path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            print_comparison(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
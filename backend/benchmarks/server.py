@@ -0,0 +1,93 @@
+"""
+Запуск full_api для бенчмарка с подсчетом SQL-запросов.
+
+Каждое соединение sqlite3 получает trace callback, который считает выполненные
+запросы текущего HTTP-запроса; число возвращается в заголовке X-DB-Statements.
+Запускается из run_benchmark.py в каталоге с базой full_api_new.db:
+
+    python -m benchmarks.server --port 8765
+"""
+
+import argparse
+import contextvars
+import os
+import sqlite3
+
+import uvicorn
+
+STATEMENTS_HEADER = "x-db-statements"
+
+# Счетчик запросов к БД текущего HTTP-запроса (список из одного числа, чтобы
+# изменения из потоков пула, куда контекст копируется, были видны middleware)
+_request_statements = contextvars.ContextVar("request_statements", default=None)
+
+_sqlite_connect = sqlite3.connect
+
+
+def _count_statement(sql: str):
+    counter = _request_statements.get()
+    # Строки "-- TRIGGER ..." - это запросы внутри триггеров, их не считаем
+    if counter is not None and not sql.startswith("--"):
+        counter[0] += 1
+
+
+def _counting_connect(*args, **kwargs):
+    conn = _sqlite_connect(*args, **kwargs)
+    conn.set_trace_callback(_count_statement)
+    return conn
+
+
+class StatementCounterMiddleware:
+    """ASGI middleware: добавляет в ответ число SQL-запросов, выполненных при обработке."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        counter = [0]
+        token = _request_statements.set(counter)
+
+        async def send_with_counter(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((STATEMENTS_HEADER.encode(), str(counter[0]).encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_counter)
+        finally:
+            _request_statements.reset(token)
+
+
+def create_app():
+    """Импортирует full_api с подсчетом запросов и без отладочного логирования."""
+    sqlite3.connect = _counting_connect
+    # Журнал доступа на каждый запрос искажает замеры; уровни можно переопределить
+    os.environ.setdefault("OFS_LOG_LEVELS", "ofs_api=WARNING")
+    import full_api
+
+    full_api.app.add_middleware(StatementCounterMiddleware)
+    return full_api.app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="full_api с подсчетом SQL-запросов для бенчмарка")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        uvicorn.run("benchmarks.server:create_app", factory=True, host=args.host, port=args.port,
+                    workers=args.workers, access_log=False, log_level="warning")
+    else:
+        uvicorn.run(create_app(), host=args.host, port=args.port, access_log=False, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
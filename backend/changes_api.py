@@ -0,0 +1,290 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+import heapq
+import itertools
+import re
+import sqlite3
+from collections import defaultdict
+from typing import List, Dict, Any, Optional
+from pydantic import BaseModel
+
+import sharding
+from complete_schema import (
+    CHANGE_LOG_SCHEMA, CHANGE_LOG_TABLES, ROW_UPDATE_CONDITION, TABLE_VERSION_SCHEMA, TIMESTAMP_TRIGGER_CONDITION,
+)
+
+# Создаем свою функцию для получения соединения с БД
+def get_db():
+    """Предоставляет соединение с базой данных."""
+    DB_PATH = "full_api_new.db"
+    if sharding.is_enabled():
+        # Журналы и строки всех холдингов: каталог с подключенными шардами
+        conn = sharding.connect_federated(DB_PATH)
+    else:
+        # Соединение создается и используется в разных потоках пула FastAPI
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+router = APIRouter(
+    prefix="/changes",
+    tags=["changes"],
+)
+
+# Сколько дней хранить записи об удалениях, по умолчанию
+DEFAULT_TOMBSTONE_RETENTION_DAYS = 30
+
+class ChangeEntry(BaseModel):
+    version: int
+    table: str
+    id: int
+    operation: str  # insert, update, delete
+    changed_at: Optional[str] = None
+    data: Optional[Dict[str, Any]] = None  # текущее состояние строки, None для delete
+
+class ChangesPage(BaseModel):
+    changes: List[ChangeEntry]
+    last_version: int  # версия, которую клиент передает в since в следующем запросе
+    current_version: int  # последняя версия в журнале на момент запроса
+    has_more: bool
+    # В режиме шардирования у каждой базы свой журнал: last_version и current_version
+    # относятся к каталогу, а позиции во всех журналах клиент передает в cursor
+    cursor: Optional[str] = None
+
+def get_current_version(db: sqlite3.Connection, schema: str = "main") -> int:
+    """Возвращает последнюю выданную версию журнала изменений."""
+    row = db.execute(f"SELECT seq FROM {schema}.sqlite_sequence WHERE name = 'change_log'").fetchone()
+    return row[0] if row else 0
+
+def get_purged_version(db: sqlite3.Connection, schema: str = "main") -> int:
+    """Возвращает максимальную версию, удаленную из журнала при сжатии."""
+    row = db.execute(f"SELECT purged_version FROM {schema}.change_log_state WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+def parse_cursor(cursor: Optional[str], since: int) -> Dict[str, int]:
+    """
+    Позиции клиента в журналах баз из cursor вида "main:120,shard_5:48".
+    Без cursor since - позиция в журнале каталога, журналы шардов читаются с начала.
+    """
+    if not cursor:
+        return {"main": since}
+    positions = {}
+    try:
+        for item in cursor.split(","):
+            schema, version = item.split(":")
+            positions[schema] = int(version)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Некорректный cursor: {cursor}")
+    return positions
+
+def format_cursor(positions: Dict[str, int]) -> str:
+    return ",".join(f"{schema}:{version}" for schema, version in positions.items())
+
+def load_rows(db: sqlite3.Connection, table: str, ids: List[int]) -> Dict[int, dict]:
+    """Загружает строки таблицы одним запросом по списку id."""
+    placeholders = ", ".join("?" for _ in ids)
+    rows = db.execute(f"SELECT * FROM {table} WHERE id IN ({placeholders})", ids).fetchall()
+    return {row["id"]: dict(row) for row in rows}
+
+def change_log_outdated(db: sqlite3.Connection) -> bool:
+    """Журнал создан прежней схемой: без организаций надгробий или не для всех таблиц."""
+    columns = {row[1] for row in db.execute("PRAGMA table_info(change_log)")}
+    triggers = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+    return "organization_id" not in columns or any(
+        f"{table}_change_log_insert" not in triggers for table in CHANGE_LOG_TABLES
+    )
+
+def upgrade_change_log(db: sqlite3.Connection):
+    """
+    Доводит журнал до текущей схемы: добавляет столбец организации, пересоздает
+    триггеры удаления и заносит в журнал строки таблиц, которые в него не попадали.
+    """
+    columns = {row[1] for row in db.execute("PRAGMA table_info(change_log)")}
+    triggers = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+    if "organization_id" not in columns:
+        db.execute("ALTER TABLE change_log ADD COLUMN organization_id INTEGER")
+    for table in CHANGE_LOG_TABLES:
+        db.execute(f"DROP TRIGGER IF EXISTS {table}_change_log_delete")
+        if f"{table}_change_log_insert" not in triggers:
+            db.execute(
+                f"INSERT OR IGNORE INTO change_log (table_name, row_id, operation) "
+                f"SELECT '{table}', id, 'insert' FROM {table} ORDER BY id"
+            )
+    db.commit()
+    db.executescript(CHANGE_LOG_SCHEMA)
+
+def _timestamp_triggers(db: sqlite3.Connection) -> List[sqlite3.Row]:
+    return db.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'update\\_%\\_timestamp' ESCAPE '\\'"
+    ).fetchall()
+
+def update_triggers_outdated(db: sqlite3.Connection) -> bool:
+    """Триггеры UPDATE созданы прежней схемой: вложенный UPDATE отметки времени давал вторую версию."""
+    triggers = dict(db.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' "
+        "AND name IN ('organizations_change_log_update', 'organizations_version_update')"
+    ).fetchall())
+    return (
+        any(ROW_UPDATE_CONDITION not in sql for sql in triggers.values())
+        or any(TIMESTAMP_TRIGGER_CONDITION not in row[1] for row in _timestamp_triggers(db))
+    )
+
+def upgrade_update_triggers(db: sqlite3.Connection):
+    """Пересоздает триггеры отметки времени, журнала и версий на UPDATE по текущей схеме."""
+    for name, sql in _timestamp_triggers(db):
+        if TIMESTAMP_TRIGGER_CONDITION not in sql:
+            db.execute(f"DROP TRIGGER {name}")
+            db.execute(re.sub(r"\bBEGIN\b", f"{TIMESTAMP_TRIGGER_CONDITION}\nBEGIN", sql, count=1))
+    for table in CHANGE_LOG_TABLES:
+        db.execute(f"DROP TRIGGER IF EXISTS {table}_change_log_update")
+        db.execute(f"DROP TRIGGER IF EXISTS {table}_version_update")
+    db.commit()
+    db.executescript(CHANGE_LOG_SCHEMA)
+    db.executescript(TABLE_VERSION_SCHEMA)
+
+def compact_change_log(
+    db: sqlite3.Connection, retention_days: int = DEFAULT_TOMBSTONE_RETENTION_DAYS, schema: str = "main"
+) -> int:
+    """
+    Сжимает журнал изменений: удаляет записи об удалениях старше retention_days дней.
+    Записи о вставках и обновлениях не удаляются - в журнале и так хранится
+    только последняя операция для каждой строки.
+    Возвращает количество удаленных записей.
+    """
+    cutoff = f"-{retention_days} days"
+    # Соединение может быть без row_factory (init_db), поэтому распаковываем по позиции
+    max_version, count = db.execute(
+        f"SELECT MAX(version), COUNT(*) FROM {schema}.change_log "
+        "WHERE operation = 'delete' AND changed_at < datetime('now', ?)",
+        (cutoff,)
+    ).fetchone()
+    if not count:
+        return 0
+
+    db.execute(
+        f"DELETE FROM {schema}.change_log WHERE operation = 'delete' AND version <= ? AND changed_at < datetime('now', ?)",
+        (max_version, cutoff)
+    )
+    db.execute(
+        f"UPDATE {schema}.change_log_state SET purged_version = MAX(purged_version, ?) WHERE id = 1",
+        (max_version,)
+    )
+    db.commit()
+    return count
+
+@router.get("", response_model=ChangesPage)
+def read_changes(
+    since: int = Query(0, ge=0, description="Последняя версия, которую клиент уже применил"),
+    cursor: Optional[str] = Query(None, description="Позиции в журналах всех баз (режим шардирования), вместо since"),
+    limit: int = Query(500, ge=1, le=5000),
+    tables: Optional[str] = Query(None, description="Таблицы через запятую, по умолчанию все"),
+    db: sqlite3.Connection = Depends(get_db)
+):
+    """
+    Возвращает изменения после версии since в порядке возрастания версий.
+    Для insert и update в data передается текущее состояние строки,
+    клиент применяет их как upsert; для delete удаляет строку у себя.
+    Если нужные клиенту записи уже удалены сжатием журнала, возвращается 410
+    и клиент должен выполнить полную синхронизацию с since=0.
+    В режиме шардирования журналы каталога и шардов читаются вместе, позиции
+    в каждом из них клиент передает в cursor из предыдущего ответа.
+    """
+    table_filter = None
+    if tables:
+        table_filter = [t.strip() for t in tables.split(",") if t.strip()]
+        unknown = [t for t in table_filter if t not in CHANGE_LOG_TABLES]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Неизвестные таблицы: {', '.join(unknown)}")
+
+    schemas = sharding.federated_schemas(db)
+    positions = parse_cursor(cursor, since)
+
+    # Читаем журнал и строки в одной транзакции, чтобы данные соответствовали версиям
+    db.execute("BEGIN")
+    try:
+        current_versions = {}
+        fetched = {}
+        for schema in schemas:
+            position = positions.get(schema, 0)
+            if position and position < get_purged_version(db, schema):
+                raise HTTPException(
+                    status_code=410,
+                    detail="Часть изменений уже удалена из журнала, выполните полную синхронизацию (since=0)"
+                )
+            current_versions[schema] = get_current_version(db, schema)
+
+            # Шард хранит копии справочников каталога: их изменения выдает журнал каталога
+            log_tables = table_filter
+            if schema != "main":
+                log_tables = [t for t in table_filter or CHANGE_LOG_TABLES if t in sharding.SHARDED_TABLES]
+                if not log_tables:
+                    fetched[schema] = []
+                    continue
+            query = f"SELECT version, table_name, row_id, operation, changed_at FROM {schema}.change_log WHERE version > ?"
+            params: List[Any] = [position]
+            if log_tables:
+                query += f" AND table_name IN ({', '.join('?' for _ in log_tables)})"
+                params.extend(log_tables)
+            query += " ORDER BY version LIMIT ?"
+            params.append(limit + 1)
+            fetched[schema] = db.execute(query, params).fetchall()
+
+        # Журналы баз сливаются по времени изменения, порядок версий каждого журнала сохраняется
+        merged = heapq.merge(
+            *([(schema, entry) for entry in fetched[schema]] for schema in schemas),
+            key=lambda item: item[1]["changed_at"] or "",
+        )
+        entries = list(itertools.islice(merged, limit))
+        has_more = sum(len(rows) for rows in fetched.values()) > len(entries)
+
+        # Подгружаем данные измененных строк пачками по таблицам
+        ids_by_table = defaultdict(list)
+        for _, entry in entries:
+            if entry["operation"] != "delete":
+                ids_by_table[entry["table_name"]].append(entry["row_id"])
+        rows_by_table = {table: load_rows(db, table, ids) for table, ids in ids_by_table.items()}
+    finally:
+        db.rollback()
+
+    changes = []
+    for _, entry in entries:
+        data = None
+        if entry["operation"] != "delete":
+            data = rows_by_table[entry["table_name"]].get(entry["row_id"])
+        changes.append({
+            "version": entry["version"],
+            "table": entry["table_name"],
+            "id": entry["row_id"],
+            "operation": entry["operation"],
+            "changed_at": entry["changed_at"],
+            "data": data
+        })
+
+    last_versions = {}
+    for schema in schemas:
+        position = positions.get(schema, 0)
+        taken = [entry["version"] for entry_schema, entry in entries if entry_schema == schema]
+        if len(taken) == len(fetched[schema]):
+            # Журнал базы выдан весь: клиент может сразу перейти к текущей версии (актуально при фильтре по таблицам)
+            last_versions[schema] = max(position, current_versions[schema])
+        else:
+            last_versions[schema] = taken[-1] if taken else position
+
+    return {
+        "changes": changes,
+        "last_version": last_versions["main"],
+        "current_version": current_versions["main"],
+        "has_more": has_more,
+        "cursor": format_cursor(last_versions) if len(schemas) > 1 else None,
+    }
+
+@router.post("/compact", response_model=Dict[str, int])
+def compact_changes(
+    retention_days: int = Query(DEFAULT_TOMBSTONE_RETENTION_DAYS, ge=0),
+    db: sqlite3.Connection = Depends(get_db)
+):
+    """Удаляет из журнала записи об удалениях старше retention_days дней (в каждой базе)."""
+    removed = sum(compact_change_log(db, retention_days, schema) for schema in sharding.federated_schemas(db))
+    return {"removed": removed, "purged_version": get_purged_version(db)}
@@ -34,6 +34,7 @@ CREATE TABLE IF NOT EXISTS organizations (
 CREATE TRIGGER IF NOT EXISTS update_organization_timestamp 
 AFTER UPDATE ON organizations
 FOR EACH ROW
+WHEN NEW.updated_at IS NOT CURRENT_TIMESTAMP
 BEGIN
     UPDATE organizations SET updated_at = CURRENT_TIMESTAMP WHERE id = OLD.id;
 END;
@@ -70,6 +71,7 @@ CREATE TABLE IF NOT EXISTS divisions (
 CREATE TRIGGER IF NOT EXISTS update_division_timestamp 
 AFTER UPDATE ON divisions
 FOR EACH ROW
+WHEN NEW.updated_at IS NOT CURRENT_TIMESTAMP
 BEGIN
     UPDATE divisions SET updated_at = CURRENT_TIMESTAMP WHERE id = OLD.id;
 END;
@@ -102,6 +104,7 @@ CREATE TABLE IF NOT EXISTS sections (
 CREATE TRIGGER IF NOT EXISTS update_section_timestamp 
 AFTER UPDATE ON sections
 FOR EACH ROW
+WHEN NEW.updated_at IS NOT CURRENT_TIMESTAMP
 BEGIN
     UPDATE sections SET updated_at = CURRENT_TIMESTAMP WHERE id = OLD.id;
 END;
@@ -153,6 +156,7 @@ CREATE TABLE IF NOT EXISTS functions (
 CREATE TRIGGER IF NOT EXISTS update_function_timestamp 
 AFTER UPDATE ON functions
 FOR EACH ROW
+WHEN NEW.updated_at IS NOT CURRENT_TIMESTAMP
 BEGIN
     UPDATE functions SET updated_at = CURRENT_TIMESTAMP WHERE id = OLD.id;
 END;
@@ -206,6 +210,7 @@ CREATE TABLE IF NOT EXISTS positions (
 CREATE TRIGGER IF NOT EXISTS update_position_timestamp 
 AFTER UPDATE ON positions
 FOR EACH ROW
+WHEN NEW.updated_at IS NOT CURRENT_TIMESTAMP
 BEGIN
     UPDATE positions SET updated_at = CURRENT_TIMESTAMP WHERE id = OLD.id;
 END;
@@ -243,6 +248,7 @@ CREATE TABLE IF NOT EXISTS staff (
 CREATE TRIGGER IF NOT EXISTS update_staff_timestamp 
 AFTER UPDATE ON staff
 FOR EACH ROW
+WHEN NEW.updated_at IS NOT CURRENT_TIMESTAMP
 BEGIN
     UPDATE staff SET updated_at = CURRENT_TIMESTAMP WHERE id = OLD.id;
 END;
@@ -284,6 +290,7 @@ CREATE TABLE IF NOT EXISTS staff_positions (
 CREATE TRIGGER IF NOT EXISTS update_staff_position_timestamp 
 AFTER UPDATE ON staff_positions
 FOR EACH ROW
+WHEN NEW.updated_at IS NOT CURRENT_TIMESTAMP
 BEGIN
     UPDATE staff_positions SET updated_at = CURRENT_TIMESTAMP WHERE id = OLD.id;
 END;
@@ -323,6 +330,7 @@ CREATE TABLE IF NOT EXISTS staff_locations (
 CREATE TRIGGER IF NOT EXISTS update_staff_location_timestamp 
 AFTER UPDATE ON staff_locations
 FOR EACH ROW
+WHEN NEW.updated_at IS NOT CURRENT_TIMESTAMP
 BEGIN
     UPDATE staff_locations SET updated_at = CURRENT_TIMESTAMP WHERE id = OLD.id;
 END;
@@ -360,6 +368,7 @@ CREATE TABLE IF NOT EXISTS staff_functions (
 CREATE TRIGGER IF NOT EXISTS update_staff_function_timestamp 
 AFTER UPDATE ON staff_functions
 FOR EACH ROW
+WHEN NEW.updated_at IS NOT CURRENT_TIMESTAMP
 BEGIN
     UPDATE staff_functions SET updated_at = CURRENT_TIMESTAMP WHERE id = OLD.id;
 END;
@@ -398,6 +407,7 @@ CREATE TABLE IF NOT EXISTS functional_relations (
 CREATE TRIGGER IF NOT EXISTS update_functional_relation_timestamp 
 AFTER UPDATE ON functional_relations
 FOR EACH ROW
+WHEN NEW.updated_at IS NOT CURRENT_TIMESTAMP
 BEGIN
     UPDATE functional_relations SET updated_at = CURRENT_TIMESTAMP WHERE id = OLD.id;
 END;
@@ -409,6 +419,911 @@ CREATE INDEX IF NOT EXISTS idx_functional_relations_relation_type ON functional_
 CREATE INDEX IF NOT EXISTS idx_functional_relations_dates ON functional_relations(start_date, end_date);
 """
 
+# Схема для таблицы ЦКП (ценный конечный продукт)
+VFP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS valuable_final_products (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    entity_type TEXT NOT NULL CHECK(
+        entity_type IN ('board', 'director', 'division', 'section', 'function', 'organization')
+    ),
+    entity_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    description TEXT,
+    metrics TEXT,  -- JSON с метриками для измерения
+    status TEXT CHECK(
+        status IN ('not_started', 'in_progress', 'completed', 'blocked', 'delayed')
+    ),
+    progress INTEGER CHECK(progress BETWEEN 0 AND 100),
+    start_date DATE,
+    target_date DATE,
+    is_active INTEGER NOT NULL DEFAULT 1,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    -- Ограничение уникальности для комбинации тип+id
+    UNIQUE(entity_type, entity_id)
+);
+
+-- Триггер для автоматического обновления даты изменения
+CREATE TRIGGER IF NOT EXISTS update_vfp_timestamp 
+AFTER UPDATE ON valuable_final_products
+FOR EACH ROW
+WHEN NEW.updated_at IS NOT CURRENT_TIMESTAMP
+BEGIN
+    UPDATE valuable_final_products 
+    SET updated_at = CURRENT_TIMESTAMP 
+    WHERE id = OLD.id;
+END;
+
+-- Индексы для оптимизации запросов
+CREATE INDEX IF NOT EXISTS idx_vfp_entity ON valuable_final_products(entity_type, entity_id);
+CREATE INDEX IF NOT EXISTS idx_vfp_status ON valuable_final_products(status);
+"""
+
+# Полнотекстовый поиск (FTS5) по сотрудникам, должностям, функциям, отделам и организациям.
+# rowid каждой FTS-таблицы совпадает с id исходной записи, поэтому триггеры
+# обновляют индекс точечно, без сканирования.
+# unicode61 приводит кириллицу к нижнему регистру, "ё" заменяется на "е" при индексации;
+# prefix='2 3 4' ускоряет поиск по началу слова (typeahead).
+
+# Выражения для индексируемых значений сотрудника ({row} - NEW., OLD. или пусто)
+_STAFF_FTS_FULL_NAME = (
+    "REPLACE(REPLACE({row}last_name || ' ' || {row}first_name || ' ' || COALESCE({row}middle_name, ''), "
+    "'ё', 'е'), 'Ё', 'Е')"
+)
+# Телефон хранится как есть, только цифрами и последними 10 цифрами (без кода страны)
+_STAFF_FTS_PHONE_DIGITS = (
+    "REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(COALESCE({row}phone, ''), '+', ''), '(', ''), ')', ''), '-', ''), ' ', '')"
+)
+_STAFF_FTS_PHONE = (
+    "COALESCE({row}phone, '') || ' ' || " + _STAFF_FTS_PHONE_DIGITS + " || ' ' || SUBSTR(" + _STAFF_FTS_PHONE_DIGITS + ", -10)"
+)
+# Для остальных справочников
+_FTS_TEXT = "REPLACE(REPLACE(COALESCE({row}{column}, ''), 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _fts_text(row, column):
+    return _FTS_TEXT.format(row=row, column=column)
+
+
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS staff_fts USING fts5(
+    full_name, email, phone,
+    tokenize = 'unicode61',
+    prefix = '2 3 4'
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS positions_fts USING fts5(
+    name, code, description,
+    tokenize = 'unicode61',
+    prefix = '2 3 4'
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS functions_fts USING fts5(
+    name, code, description,
+    tokenize = 'unicode61',
+    prefix = '2 3 4'
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS sections_fts USING fts5(
+    name, code, description,
+    tokenize = 'unicode61',
+    prefix = '2 3 4'
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS organizations_fts USING fts5(
+    name, code, description, inn,
+    tokenize = 'unicode61',
+    prefix = '2 3 4'
+);
+
+-- Сотрудники
+CREATE TRIGGER IF NOT EXISTS staff_fts_insert
+AFTER INSERT ON staff
+FOR EACH ROW
+BEGIN
+    INSERT INTO staff_fts(rowid, full_name, email, phone)
+    VALUES (NEW.id, {new_full_name}, NEW.email, {new_phone});
+END;
+
+CREATE TRIGGER IF NOT EXISTS staff_fts_update
+AFTER UPDATE OF first_name, last_name, middle_name, email, phone ON staff
+FOR EACH ROW
+BEGIN
+    UPDATE staff_fts SET full_name = {new_full_name}, email = NEW.email, phone = {new_phone}
+    WHERE rowid = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS staff_fts_delete
+AFTER DELETE ON staff
+FOR EACH ROW
+BEGIN
+    DELETE FROM staff_fts WHERE rowid = OLD.id;
+END;
+""".format(
+    new_full_name=_STAFF_FTS_FULL_NAME.format(row="NEW."),
+    new_phone=_STAFF_FTS_PHONE.format(row="NEW."),
+)
+
+# Должности, функции и отделы индексируются одинаково: название, код, описание
+for _table in ("positions", "functions", "sections"):
+    SEARCH_SCHEMA += """
+CREATE TRIGGER IF NOT EXISTS {table}_fts_insert
+AFTER INSERT ON {table}
+FOR EACH ROW
+BEGIN
+    INSERT INTO {table}_fts(rowid, name, code, description)
+    VALUES (NEW.id, {name}, NEW.code, {description});
+END;
+
+CREATE TRIGGER IF NOT EXISTS {table}_fts_update
+AFTER UPDATE OF name, code, description ON {table}
+FOR EACH ROW
+BEGIN
+    UPDATE {table}_fts SET name = {name}, code = NEW.code, description = {description}
+    WHERE rowid = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS {table}_fts_delete
+AFTER DELETE ON {table}
+FOR EACH ROW
+BEGIN
+    DELETE FROM {table}_fts WHERE rowid = OLD.id;
+END;
+""".format(table=_table, name=_fts_text("NEW.", "name"), description=_fts_text("NEW.", "description"))
+
+SEARCH_SCHEMA += """
+CREATE TRIGGER IF NOT EXISTS organizations_fts_insert
+AFTER INSERT ON organizations
+FOR EACH ROW
+BEGIN
+    INSERT INTO organizations_fts(rowid, name, code, description, inn)
+    VALUES (NEW.id, {name}, NEW.code, {description}, COALESCE(NEW.inn, ''));
+END;
+
+CREATE TRIGGER IF NOT EXISTS organizations_fts_update
+AFTER UPDATE OF name, code, description, inn ON organizations
+FOR EACH ROW
+BEGIN
+    UPDATE organizations_fts SET name = {name}, code = NEW.code, description = {description}, inn = COALESCE(NEW.inn, '')
+    WHERE rowid = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS organizations_fts_delete
+AFTER DELETE ON organizations
+FOR EACH ROW
+BEGIN
+    DELETE FROM organizations_fts WHERE rowid = OLD.id;
+END;
+""".format(name=_fts_text("NEW.", "name"), description=_fts_text("NEW.", "description"))
+
+# Заполнение поисковых индексов по уже существующим данным
+# (для баз, созданных до появления SEARCH_SCHEMA)
+SEARCH_REBUILD_SQL = """
+DELETE FROM staff_fts;
+INSERT INTO staff_fts(rowid, full_name, email, phone)
+SELECT id, {full_name}, email, {phone} FROM staff;
+""".format(full_name=_STAFF_FTS_FULL_NAME.format(row=""), phone=_STAFF_FTS_PHONE.format(row=""))
+
+for _table in ("positions", "functions", "sections"):
+    SEARCH_REBUILD_SQL += """
+DELETE FROM {table}_fts;
+INSERT INTO {table}_fts(rowid, name, code, description)
+SELECT id, {name}, code, {description} FROM {table};
+""".format(table=_table, name=_fts_text("", "name"), description=_fts_text("", "description"))
+
+SEARCH_REBUILD_SQL += """
+DELETE FROM organizations_fts;
+INSERT INTO organizations_fts(rowid, name, code, description, inn)
+SELECT id, {name}, code, {description}, COALESCE(inn, '') FROM organizations;
+
+INSERT INTO staff_fts(staff_fts) VALUES ('optimize');
+INSERT INTO positions_fts(positions_fts) VALUES ('optimize');
+INSERT INTO functions_fts(functions_fts) VALUES ('optimize');
+INSERT INTO sections_fts(sections_fts) VALUES ('optimize');
+INSERT INTO organizations_fts(organizations_fts) VALUES ('optimize');
+""".format(name=_fts_text("", "name"), description=_fts_text("", "description"))
+
+# Журнал изменений для инкрементальной синхронизации клиентов (/changes).
+# Для каждой записи хранится только последняя операция: повторное изменение
+# той же строки заменяет запись журнала и получает новую версию.
+# Удаленные строки остаются в журнале как "надгробия" до сжатия журнала;
+# change_log_state.purged_version - максимальная удаленная при сжатии версия.
+# Журнал читает и шина инвалидации (invalidation.py) во всех процессах API. Для
+# надгробия сохраняется организация строки (organization_id): по базе ее уже не
+# определить, а она нужна событиям с фильтром по поддереву (events_api.py).
+CHANGE_LOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS change_log (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    operation TEXT NOT NULL CHECK(operation IN ('insert', 'update', 'delete')),
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    organization_id INTEGER,
+    UNIQUE(table_name, row_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_change_log_operation ON change_log(operation, changed_at);
+
+CREATE TABLE IF NOT EXISTS change_log_state (
+    id INTEGER PRIMARY KEY CHECK(id = 1),
+    purged_version INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO change_log_state (id, purged_version) VALUES (1, 0);
+"""
+
+# Таблицы, изменения которых попадают в журнал
+CHANGE_LOG_TABLES = [
+    "organizations",
+    "divisions",
+    "sections",
+    "division_sections",
+    "functions",
+    "section_functions",
+    "positions",
+    "staff",
+    "staff_positions",
+    "staff_locations",
+    "staff_functions",
+    "functional_relations",
+    "valuable_final_products",
+]
+
+# Организация удаленной строки OLD (как events_api.resolve_organization_id для
+# существующих строк). Для организации - ее родитель: сама она уже удалена.
+_STAFF_ORGANIZATION = "(SELECT COALESCE(organization_id, primary_organization_id) FROM staff WHERE id = OLD.{column})"
+_DIVISION_ORGANIZATION = "(SELECT organization_id FROM divisions WHERE id = OLD.{column})"
+CHANGE_LOG_DELETED_ORGANIZATION = {
+    "organizations": "OLD.parent_id",
+    "divisions": "OLD.organization_id",
+    "staff": "COALESCE(OLD.organization_id, OLD.primary_organization_id)",
+    "staff_positions": "COALESCE(OLD.location_id, {}, {})".format(
+        _DIVISION_ORGANIZATION.format(column="division_id"), _STAFF_ORGANIZATION.format(column="staff_id")),
+    "staff_locations": "COALESCE(OLD.location_id, {})".format(_STAFF_ORGANIZATION.format(column="staff_id")),
+    "staff_functions": _STAFF_ORGANIZATION.format(column="staff_id"),
+    "functional_relations": _STAFF_ORGANIZATION.format(column="subordinate_id"),
+    "valuable_final_products": "CASE OLD.entity_type WHEN 'organization' THEN OLD.entity_id WHEN 'division' THEN {} END".format(
+        _DIVISION_ORGANIZATION.format(column="entity_id")),
+}
+
+# Триггеры отметки времени (update_*_timestamp) обновляют updated_at вложенным UPDATE,
+# на который снова срабатывают триггеры AFTER UPDATE. Вложенный UPDATE не выполняется,
+# если отметка уже текущая, а триггеры журнала и версий пропускают его (он меняет только
+# updated_at на текущее время), чтобы одно изменение строки давало одну версию.
+# Поэтому updated_at ведут только триггеры: запросы не задают его текущим временем.
+TIMESTAMP_TRIGGER_CONDITION = "WHEN NEW.updated_at IS NOT CURRENT_TIMESTAMP"
+ROW_UPDATE_CONDITION = "WHEN OLD.updated_at IS NEW.updated_at OR NEW.updated_at IS NOT CURRENT_TIMESTAMP"
+
+# Таблицы связей без updated_at: вложенного UPDATE у них нет
+UNTIMESTAMPED_TABLES = ["division_sections", "section_functions"]
+
+
+def _row_update_condition(table: str) -> str:
+    return "" if table in UNTIMESTAMPED_TABLES else ROW_UPDATE_CONDITION
+
+
+for _table in CHANGE_LOG_TABLES:
+    CHANGE_LOG_SCHEMA += """
+CREATE TRIGGER IF NOT EXISTS {table}_change_log_insert
+AFTER INSERT ON {table}
+FOR EACH ROW
+BEGIN
+    INSERT OR REPLACE INTO change_log (table_name, row_id, operation) VALUES ('{table}', NEW.id, 'insert');
+END;
+
+CREATE TRIGGER IF NOT EXISTS {table}_change_log_update
+AFTER UPDATE ON {table}
+FOR EACH ROW
+{when}
+BEGIN
+    INSERT OR REPLACE INTO change_log (table_name, row_id, operation) VALUES ('{table}', NEW.id, 'update');
+END;
+
+CREATE TRIGGER IF NOT EXISTS {table}_change_log_delete
+AFTER DELETE ON {table}
+FOR EACH ROW
+BEGIN
+    INSERT OR REPLACE INTO change_log (table_name, row_id, operation, organization_id)
+    VALUES ('{table}', OLD.id, 'delete', {organization});
+END;
+""".format(table=_table, organization=CHANGE_LOG_DELETED_ORGANIZATION.get(_table, "NULL"),
+           when=_row_update_condition(_table))
+
+# Заполнение журнала существующими строками (для баз, созданных до появления журнала),
+# чтобы клиенты могли начать синхронизацию с since=0
+CHANGE_LOG_SEED_SQL = "".join(
+    "INSERT OR IGNORE INTO change_log (table_name, row_id, operation) "
+    "SELECT '{table}', id, 'insert' FROM {table} ORDER BY id;\n".format(table=_table)
+    for _table in CHANGE_LOG_TABLES
+)
+
+# Интервальные индексы (R-Tree) для запросов "на дату" (as_of).
+# Для каждой таблицы с периодом действия хранится отрезок [start_day, end_day]
+# в юлианских днях; открытый конец периода (NULL) хранится как максимальное значение,
+# конец раньше начала (ошибка в данных) приравнивается к началу.
+# R-Tree находит записи, действующие на дату, без перебора всей таблицы,
+# поэтому историческая выборка стоит столько же, сколько текущая.
+VALIDITY_COLUMNS = {
+    "staff_positions": ("start_date", "end_date"),
+    "staff_locations": ("date_from", "date_to"),
+    "staff_functions": ("date_from", "date_to"),
+    "functional_relations": ("start_date", "end_date"),
+}
+
+# Значение end_day для бессрочных записей (максимум для rtree_i32)
+VALIDITY_OPEN_END = 2147483647
+
+# Номер дня берется от полуночи даты (date() отбрасывает время): julianday() отсчитывает
+# сутки от полудня, и время после 12:00 иначе переносило бы запись на следующий день
+_VALIDITY_START = "COALESCE(CAST(julianday(date({row}{column})) AS INTEGER), 0)"
+_VALIDITY_END = "COALESCE(CAST(julianday(date({row}{column})) AS INTEGER), " + str(VALIDITY_OPEN_END) + ")"
+
+TEMPORAL_SCHEMA = ""
+TEMPORAL_REBUILD_SQL = ""
+
+for _table, (_start, _end) in VALIDITY_COLUMNS.items():
+    TEMPORAL_SCHEMA += """
+CREATE VIRTUAL TABLE IF NOT EXISTS {table}_validity USING rtree_i32(id, start_day, end_day);
+
+CREATE TRIGGER IF NOT EXISTS {table}_validity_insert
+AFTER INSERT ON {table}
+FOR EACH ROW
+BEGIN
+    INSERT INTO {table}_validity (id, start_day, end_day) VALUES (NEW.id, {new_start}, {new_end});
+END;
+
+CREATE TRIGGER IF NOT EXISTS {table}_validity_update
+AFTER UPDATE OF {start}, {end} ON {table}
+FOR EACH ROW
+BEGIN
+    INSERT OR REPLACE INTO {table}_validity (id, start_day, end_day) VALUES (NEW.id, {new_start}, {new_end});
+END;
+
+CREATE TRIGGER IF NOT EXISTS {table}_validity_delete
+AFTER DELETE ON {table}
+FOR EACH ROW
+BEGIN
+    DELETE FROM {table}_validity WHERE id = OLD.id;
+END;
+""".format(
+        table=_table,
+        start=_start,
+        end=_end,
+        new_start=_VALIDITY_START.format(row="NEW.", column=_start),
+        new_end="MAX({}, {})".format(
+            _VALIDITY_START.format(row="NEW.", column=_start), _VALIDITY_END.format(row="NEW.", column=_end)
+        ),
+    )
+    TEMPORAL_REBUILD_SQL += """
+DELETE FROM {table}_validity;
+INSERT INTO {table}_validity (id, start_day, end_day)
+SELECT id, {start}, {end} FROM {table};
+""".format(
+        table=_table,
+        start=_VALIDITY_START.format(row="", column=_start),
+        end="MAX({}, {})".format(
+            _VALIDITY_START.format(row="", column=_start), _VALIDITY_END.format(row="", column=_end)
+        ),
+    )
+
+# Схема для снимков оргструктуры.
+# Узлы дерева (организации, подразделения, отделы, назначения сотрудников) хранятся
+# по хешу содержимого: хеш узла включает хеши дочерних узлов, поэтому неизменившиеся
+# поддеревья разных снимков ссылаются на одни и те же строки snapshot_nodes.
+SNAPSHOT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshot_nodes (
+    hash TEXT PRIMARY KEY,
+    node_type TEXT NOT NULL,
+    node_id INTEGER NOT NULL,
+    payload TEXT NOT NULL,  -- JSON с полями записи
+    children TEXT NOT NULL  -- JSON-список [тип, id, хеш] дочерних узлов
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS org_snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    root_hash TEXT NOT NULL,
+    node_count INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (root_hash) REFERENCES snapshot_nodes(hash)
+);
+"""
+
+# Версии таблиц для HTTP-кэширования (ETag).
+# Любое изменение строки увеличивает версию ее таблицы; начальная версия - текущее
+# время в миллисекундах, чтобы версии пересозданной базы не совпали с прежними.
+VERSIONED_TABLES = CHANGE_LOG_TABLES
+
+TABLE_VERSION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS table_versions (
+    table_name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) WITHOUT ROWID;
+"""
+
+for _table in VERSIONED_TABLES:
+    TABLE_VERSION_SCHEMA += """
+INSERT OR IGNORE INTO table_versions (table_name, version)
+VALUES ('{table}', CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER));
+
+CREATE TRIGGER IF NOT EXISTS {table}_version_insert
+AFTER INSERT ON {table}
+FOR EACH ROW
+BEGIN
+    UPDATE table_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE table_name = '{table}';
+END;
+
+CREATE TRIGGER IF NOT EXISTS {table}_version_update
+AFTER UPDATE ON {table}
+FOR EACH ROW
+{when}
+BEGIN
+    UPDATE table_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE table_name = '{table}';
+END;
+
+CREATE TRIGGER IF NOT EXISTS {table}_version_delete
+AFTER DELETE ON {table}
+FOR EACH ROW
+BEGIN
+    UPDATE table_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE table_name = '{table}';
+END;
+""".format(table=_table, when=_row_update_condition(_table))
+
+# Часто запрашиваемые ключи JSON-метрик ЦКП как генерируемые (VIRTUAL) столбцы с индексами:
+# фильтры по метрикам идут по индексу, без разбора JSON каждой строки.
+# Добавляются через ALTER TABLE, чтобы таблица из VFP_SCHEMA не менялась.
+VFP_METRIC_COLUMNS = {
+    "metric_kpi": ("TEXT", "$.kpi"),
+    "metric_unit": ("TEXT", "$.unit"),
+    "metric_target": ("REAL", "$.target"),
+    "metric_actual": ("REAL", "$.actual"),
+}
+
+VFP_METRICS_SCHEMA = "".join(
+    "ALTER TABLE valuable_final_products ADD COLUMN {column} {type} GENERATED ALWAYS AS "
+    "(CASE WHEN json_valid(metrics) THEN json_extract(metrics, '{path}') END) VIRTUAL;\n".format(
+        column=_column, type=_type, path=_path)
+    for _column, (_type, _path) in VFP_METRIC_COLUMNS.items()
+) + """
+CREATE INDEX IF NOT EXISTS idx_vfp_metric_kpi_actual ON valuable_final_products(metric_kpi, metric_actual);
+CREATE INDEX IF NOT EXISTS idx_vfp_metric_kpi_target ON valuable_final_products(metric_kpi, metric_target);
+"""
+
+# Сводка прогресса и статусов ЦКП по узлам оргструктуры (с учетом всех потомков).
+# org_ancestors - замыкание дерева: для каждого узла все его предки и он сам
+# (функция -> отделы -> подразделения -> организации), paths - число путей от узла
+# до предка (отдел может входить в несколько подразделений). Триггеры на ЦКП по
+# замыканию прибавляют/вычитают вклад ЦКП у всех предков, а триггеры на связях
+# оргструктуры поддерживают само замыкание и переносят вклад ЦКП между предками,
+# поэтому сводка всегда актуальна и чтение ее ничего не пересчитывает.
+# Циклы в связях не поддерживаются (полный пересчет обрывает их на ORG_CLOSURE_MAX_DEPTH).
+VFP_STATUS_COLUMNS = ["not_started", "in_progress", "completed", "blocked", "delayed"]
+
+ORG_CLOSURE_MAX_DEPTH = 64
+
+VFP_ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS org_ancestors (
+    descendant_type TEXT NOT NULL,
+    descendant_id INTEGER NOT NULL,
+    ancestor_type TEXT NOT NULL,
+    ancestor_id INTEGER NOT NULL,
+    paths INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (descendant_type, descendant_id, ancestor_type, ancestor_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_org_ancestors_ancestor ON org_ancestors(ancestor_type, ancestor_id);
+
+CREATE TABLE IF NOT EXISTS vfp_rollup (
+    entity_type TEXT NOT NULL,
+    entity_id INTEGER NOT NULL,
+    vfp_count INTEGER NOT NULL DEFAULT 0,
+    progress_sum INTEGER NOT NULL DEFAULT 0,
+""" + "".join("    {} INTEGER NOT NULL DEFAULT 0,\n".format(_status) for _status in VFP_STATUS_COLUMNS) + """    PRIMARY KEY (entity_type, entity_id)
+) WITHOUT ROWID;
+"""
+
+# Вклад ЦКП ({row} - NEW. или OLD.) в сводку предков: столбцы и значения
+_ROLLUP_COLUMNS = "vfp_count, progress_sum, " + ", ".join(VFP_STATUS_COLUMNS)
+_ROLLUP_VALUES = "1, COALESCE({row}progress, 0), " + ", ".join(
+    "{{row}}status IS '{}'".format(_status) for _status in VFP_STATUS_COLUMNS)
+_ROLLUP_ADD = ", ".join("{0} = {0} + excluded.{0}".format(_c) for _c in ["vfp_count", "progress_sum"] + VFP_STATUS_COLUMNS)
+_ROLLUP_SUBTRACT = ", ".join(
+    ["vfp_count = vfp_count - 1", "progress_sum = progress_sum - COALESCE(OLD.progress, 0)"]
+    + ["{0} = {0} - (OLD.status IS '{0}')".format(_status) for _status in VFP_STATUS_COLUMNS])
+# Суммарный вклад ЦКП v ({sign} - знак) для группировки по предку
+_ROLLUP_SUMS = "{sign}COUNT(*), {sign}SUM(COALESCE(v.progress, 0)), " + ", ".join(
+    "{{sign}}SUM(v.status IS '{}')".format(_status) for _status in VFP_STATUS_COLUMNS)
+
+_ROLLUP_INSERT_NEW = """
+    -- Узел без связей тоже входит в замыкание (сам себе предок)
+    INSERT OR IGNORE INTO org_ancestors (descendant_type, descendant_id, ancestor_type, ancestor_id)
+    SELECT NEW.entity_type, NEW.entity_id, NEW.entity_type, NEW.entity_id WHERE NEW.is_active = 1;
+    INSERT INTO vfp_rollup (entity_type, entity_id, {columns})
+    SELECT ancestor_type, ancestor_id, {values}
+    FROM org_ancestors
+    WHERE descendant_type = NEW.entity_type AND descendant_id = NEW.entity_id AND NEW.is_active = 1
+    ON CONFLICT (entity_type, entity_id) DO UPDATE SET {add};""".format(
+    columns=_ROLLUP_COLUMNS, values=_ROLLUP_VALUES.format(row="NEW."), add=_ROLLUP_ADD)
+
+_ROLLUP_DELETE_OLD = """
+    UPDATE vfp_rollup SET {subtract}
+    WHERE OLD.is_active = 1 AND (entity_type, entity_id) IN (
+        SELECT ancestor_type, ancestor_id FROM org_ancestors
+        WHERE descendant_type = OLD.entity_type AND descendant_id = OLD.entity_id
+    );""".format(subtract=_ROLLUP_SUBTRACT)
+
+VFP_ROLLUP_SCHEMA += """
+CREATE TRIGGER IF NOT EXISTS vfp_rollup_insert
+AFTER INSERT ON valuable_final_products
+FOR EACH ROW
+BEGIN{insert_new}
+END;
+
+CREATE TRIGGER IF NOT EXISTS vfp_rollup_update
+AFTER UPDATE OF entity_type, entity_id, status, progress, is_active ON valuable_final_products
+FOR EACH ROW
+BEGIN{delete_old}{insert_new}
+END;
+
+CREATE TRIGGER IF NOT EXISTS vfp_rollup_delete
+AFTER DELETE ON valuable_final_products
+FOR EACH ROW
+BEGIN{delete_old}
+END;
+""".format(insert_new=_ROLLUP_INSERT_NEW, delete_old=_ROLLUP_DELETE_OLD)
+
+# Пары (потомок x, предок y), которые проходят через связь child -> parent:
+# x - потомки child (d), y - предки parent (a); число таких путей d.paths * a.paths
+_CLOSURE_PAIRS = """
+    FROM org_ancestors d
+    JOIN org_ancestors a ON a.descendant_type = '{parent_type}' AND a.descendant_id = {parent_id}"""
+_CLOSURE_CHILD = "d.ancestor_type = '{child_type}' AND d.ancestor_id = {child_id}"
+
+_CLOSURE_LINK = """
+    INSERT OR IGNORE INTO org_ancestors (descendant_type, descendant_id, ancestor_type, ancestor_id)
+    VALUES ('{child_type}', {child_id}, '{child_type}', {child_id}), ('{parent_type}', {parent_id}, '{parent_type}', {parent_id});
+    -- ЦКП потомков учитываются у предков, которых у них еще не было
+    INSERT INTO vfp_rollup (entity_type, entity_id, {columns})
+    SELECT a.ancestor_type, a.ancestor_id, {sums}{pairs}
+    JOIN valuable_final_products v ON v.entity_type = d.descendant_type AND v.entity_id = d.descendant_id AND v.is_active = 1
+    WHERE {child} AND NOT EXISTS (
+        SELECT 1 FROM org_ancestors z
+        WHERE z.descendant_type = d.descendant_type AND z.descendant_id = d.descendant_id
+          AND z.ancestor_type = a.ancestor_type AND z.ancestor_id = a.ancestor_id
+    )
+    GROUP BY a.ancestor_type, a.ancestor_id
+    ON CONFLICT (entity_type, entity_id) DO UPDATE SET {add};
+    INSERT INTO org_ancestors (descendant_type, descendant_id, ancestor_type, ancestor_id, paths)
+    SELECT d.descendant_type, d.descendant_id, a.ancestor_type, a.ancestor_id, d.paths * a.paths{pairs}
+    WHERE {child}
+    ON CONFLICT (descendant_type, descendant_id, ancestor_type, ancestor_id) DO UPDATE SET paths = paths + excluded.paths;"""
+
+_CLOSURE_UNLINK = """
+    -- ЦКП потомков вычитаются у предков, до которых других путей не останется
+    INSERT INTO vfp_rollup (entity_type, entity_id, {columns})
+    SELECT a.ancestor_type, a.ancestor_id, {sums}{pairs}
+    JOIN org_ancestors z ON z.descendant_type = d.descendant_type AND z.descendant_id = d.descendant_id
+        AND z.ancestor_type = a.ancestor_type AND z.ancestor_id = a.ancestor_id
+    JOIN valuable_final_products v ON v.entity_type = d.descendant_type AND v.entity_id = d.descendant_id AND v.is_active = 1
+    WHERE {child} AND z.paths = d.paths * a.paths
+    GROUP BY a.ancestor_type, a.ancestor_id
+    ON CONFLICT (entity_type, entity_id) DO UPDATE SET {add};
+    UPDATE org_ancestors SET paths = paths - (
+        SELECT d.paths * a.paths{pairs}
+        WHERE {child}
+          AND d.descendant_type = org_ancestors.descendant_type AND d.descendant_id = org_ancestors.descendant_id
+          AND a.ancestor_type = org_ancestors.ancestor_type AND a.ancestor_id = org_ancestors.ancestor_id
+    )
+    WHERE {affected};
+    DELETE FROM org_ancestors WHERE paths <= 0 AND {affected};"""
+
+_CLOSURE_AFFECTED = """(descendant_type, descendant_id) IN (
+        SELECT descendant_type, descendant_id FROM org_ancestors WHERE ancestor_type = '{child_type}' AND ancestor_id = {child_id}
+    ) AND (ancestor_type, ancestor_id) IN (
+        SELECT ancestor_type, ancestor_id FROM org_ancestors WHERE descendant_type = '{parent_type}' AND descendant_id = {parent_id}
+    )"""
+
+
+def _closure_link(template: str, sign: str, child_type: str, child_id: str, parent_type: str, parent_id: str) -> str:
+    """Тело триггера, добавляющего или удаляющего связь child -> parent в замыкании."""
+    names = dict(child_type=child_type, child_id=child_id, parent_type=parent_type, parent_id=parent_id)
+    return template.format(
+        columns=_ROLLUP_COLUMNS,
+        sums=_ROLLUP_SUMS.format(sign=sign),
+        add=_ROLLUP_ADD,
+        pairs=_CLOSURE_PAIRS.format(**names),
+        child=_CLOSURE_CHILD.format(**names),
+        affected=_CLOSURE_AFFECTED.format(**names),
+        **names,
+    )
+
+
+# Связи оргструктуры: таблица, столбцы связи и (тип потомка, столбец), (тип предка, столбец).
+# Изменение столбца связи - удаление старой связи и добавление новой.
+ORG_CLOSURE_EDGES = [
+    ("organizations", "parent_id", ("organization", "id"), ("organization", "parent_id")),
+    ("divisions", "parent_id", ("division", "id"), ("division", "parent_id")),
+    ("divisions", "organization_id", ("division", "id"), ("organization", "organization_id")),
+    ("division_sections", "division_id, section_id", ("section", "section_id"), ("division", "division_id")),
+    ("section_functions", "section_id, function_id", ("function", "function_id"), ("section", "section_id")),
+]
+
+for _table, _columns, (_child_type, _child_column), (_parent_type, _parent_column) in ORG_CLOSURE_EDGES:
+    _name = "{}_{}".format(_table, _parent_column)
+    _link = _closure_link(_CLOSURE_LINK, "", _child_type, "NEW." + _child_column, _parent_type, "NEW." + _parent_column)
+    _unlink = _closure_link(_CLOSURE_UNLINK, "-", _child_type, "OLD." + _child_column, _parent_type, "OLD." + _parent_column)
+    _changed = " OR ".join("OLD.{0} IS NOT NEW.{0}".format(_c.strip()) for _c in _columns.split(","))
+    VFP_ROLLUP_SCHEMA += """
+CREATE TRIGGER IF NOT EXISTS {name}_closure_insert
+AFTER INSERT ON {table}
+FOR EACH ROW WHEN NEW.{parent} IS NOT NULL
+BEGIN{link}
+END;
+
+CREATE TRIGGER IF NOT EXISTS {name}_closure_delete
+AFTER DELETE ON {table}
+FOR EACH ROW WHEN OLD.{parent} IS NOT NULL
+BEGIN{unlink}
+END;
+
+CREATE TRIGGER IF NOT EXISTS {name}_closure_unlink
+AFTER UPDATE OF {columns} ON {table}
+FOR EACH ROW WHEN OLD.{parent} IS NOT NULL AND ({changed})
+BEGIN{unlink}
+END;
+
+CREATE TRIGGER IF NOT EXISTS {name}_closure_link
+AFTER UPDATE OF {columns} ON {table}
+FOR EACH ROW WHEN NEW.{parent} IS NOT NULL AND ({changed})
+BEGIN{link}
+END;
+""".format(name=_name, table=_table, columns=_columns, parent=_parent_column, changed=_changed, link=_link, unlink=_unlink)
+
+# Пересчет замыкания и сводки с нуля (при создании сводки и миграции базы)
+VFP_ROLLUP_REBUILD_SQL = """
+DELETE FROM org_ancestors;
+
+INSERT INTO org_ancestors (descendant_type, descendant_id, ancestor_type, ancestor_id, paths)
+WITH RECURSIVE
+    edges(child_type, child_id, parent_type, parent_id) AS (
+        SELECT 'organization', id, 'organization', parent_id FROM organizations WHERE parent_id IS NOT NULL
+        UNION ALL
+        SELECT 'division', id, 'division', parent_id FROM divisions WHERE parent_id IS NOT NULL
+        UNION ALL
+        SELECT 'division', id, 'organization', organization_id FROM divisions WHERE organization_id IS NOT NULL
+        UNION ALL
+        SELECT 'section', section_id, 'division', division_id FROM division_sections
+        UNION ALL
+        SELECT 'function', function_id, 'section', section_id FROM section_functions
+    ),
+    nodes(node_type, node_id) AS (
+        SELECT 'organization', id FROM organizations
+        UNION SELECT 'division', id FROM divisions
+        UNION SELECT 'section', id FROM sections
+        UNION SELECT 'function', id FROM functions
+        UNION SELECT entity_type, entity_id FROM valuable_final_products
+    ),
+    closure(descendant_type, descendant_id, ancestor_type, ancestor_id, depth) AS (
+        SELECT node_type, node_id, node_type, node_id, 0 FROM nodes
+        UNION ALL
+        SELECT c.descendant_type, c.descendant_id, e.parent_type, e.parent_id, c.depth + 1
+        FROM closure c
+        JOIN edges e ON e.child_type = c.ancestor_type AND e.child_id = c.ancestor_id
+        WHERE c.depth < {max_depth}
+    )
+SELECT descendant_type, descendant_id, ancestor_type, ancestor_id, COUNT(*)
+FROM closure
+GROUP BY descendant_type, descendant_id, ancestor_type, ancestor_id;
+
+DELETE FROM vfp_rollup;
+
+INSERT INTO vfp_rollup (entity_type, entity_id, {columns})
+SELECT a.ancestor_type, a.ancestor_id, {sums}
+FROM valuable_final_products v
+JOIN org_ancestors a ON a.descendant_type = v.entity_type AND a.descendant_id = v.entity_id
+WHERE v.is_active = 1
+GROUP BY a.ancestor_type, a.ancestor_id;
+""".format(
+    max_depth=ORG_CLOSURE_MAX_DEPTH,
+    columns=_ROLLUP_COLUMNS,
+    sums=_ROLLUP_SUMS.format(sign=""),
+)
+
+# Аналитика численности: счетчики назначений по сочетанию измерений
+# (юрлицо сотрудника, подразделение, должность, локация, функция должности) и
+# число прямых подчиненных по руководителям. Счетчики обновляются триггерами при
+# каждой записи, поэтому любая группировка читает небольшие таблицы счетчиков,
+# а не все назначения. Отсутствующее значение измерения хранится как 0.
+# headcount - назначения по основной должности (каждый сотрудник один раз),
+# assignments - все активные назначения.
+HEADCOUNT_DIMENSIONS = ["organization_id", "division_id", "position_id", "location_id", "function_id"]
+
+ANALYTICS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS headcount_cube (
+    organization_id INTEGER NOT NULL,
+    division_id INTEGER NOT NULL,
+    position_id INTEGER NOT NULL,
+    location_id INTEGER NOT NULL,
+    function_id INTEGER NOT NULL,
+    assignments INTEGER NOT NULL DEFAULT 0,
+    headcount INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (organization_id, division_id, position_id, location_id, function_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_headcount_cube_division ON headcount_cube(division_id);
+CREATE INDEX IF NOT EXISTS idx_headcount_cube_position ON headcount_cube(position_id);
+CREATE INDEX IF NOT EXISTS idx_headcount_cube_location ON headcount_cube(location_id);
+CREATE INDEX IF NOT EXISTS idx_headcount_cube_function ON headcount_cube(function_id);
+
+CREATE TABLE IF NOT EXISTS span_of_control (
+    manager_id INTEGER NOT NULL,
+    relation_type TEXT NOT NULL,
+    direct_reports INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (manager_id, relation_type)
+) WITHOUT ROWID;
+"""
+
+# Вклад назначений ({row} - NEW., OLD. или sp.) в счетчики со знаком {sign}
+_HEADCOUNT_DELTA = """
+    INSERT INTO headcount_cube (organization_id, division_id, position_id, location_id, function_id, assignments, headcount)
+    SELECT IFNULL({organization}, 0), IFNULL({row}division_id, 0), {row}position_id,
+           IFNULL({row}location_id, 0), IFNULL({function}, 0), {sign}1, {sign}({row}is_primary = 1)
+    {source}
+    ON CONFLICT (organization_id, division_id, position_id, location_id, function_id) DO UPDATE SET
+        assignments = assignments + excluded.assignments, headcount = headcount + excluded.headcount;"""
+
+
+def _headcount_delta(sign: str, row: str, organization: str, function: str, source: str) -> str:
+    return _HEADCOUNT_DELTA.format(sign=sign, row=row, organization=organization, function=function, source=source)
+
+
+# Назначение {row} (строка staff_positions в триггере) и его сотрудник/должность
+def _assignment_delta(sign: str, row: str) -> str:
+    return _headcount_delta(
+        sign, row + ".", "s.organization_id", "p.function_id",
+        f"FROM staff s LEFT JOIN positions p ON p.id = {row}.position_id "
+        f"WHERE s.id = {row}.staff_id AND s.is_active = 1 AND {row}.is_active = 1",
+    )
+
+
+# Все активные назначения сотрудника {row} (строка staff в триггере)
+def _staff_delta(sign: str, row: str) -> str:
+    return _headcount_delta(
+        sign, "sp.", f"{row}.organization_id", "p.function_id",
+        f"FROM staff_positions sp LEFT JOIN positions p ON p.id = sp.position_id "
+        f"WHERE sp.staff_id = {row}.id AND sp.is_active = 1 AND {row}.is_active = 1",
+    )
+
+
+# Все активные назначения на должность {row} с функцией {function}
+def _position_delta(sign: str, row: str, function: str) -> str:
+    return _headcount_delta(
+        sign, "sp.", "s.organization_id", function,
+        f"FROM staff_positions sp JOIN staff s ON s.id = sp.staff_id "
+        f"WHERE sp.position_id = {row}.id AND sp.is_active = 1 AND s.is_active = 1",
+    )
+
+
+_SPAN_DELTA = """
+    INSERT INTO span_of_control (manager_id, relation_type, direct_reports)
+    SELECT {row}.manager_id, {row}.relation_type, {sign}1 WHERE {row}.is_active = 1
+    ON CONFLICT (manager_id, relation_type) DO UPDATE SET direct_reports = direct_reports + excluded.direct_reports;"""
+
+_ANALYTICS_TRIGGERS = [
+    ("staff_positions_headcount_insert", "INSERT ON staff_positions", "",
+     [_assignment_delta("+", "NEW")]),
+    ("staff_positions_headcount_update",
+     "UPDATE OF staff_id, position_id, division_id, location_id, is_primary, is_active ON staff_positions", "",
+     [_assignment_delta("-", "OLD"), _assignment_delta("+", "NEW")]),
+    ("staff_positions_headcount_delete", "DELETE ON staff_positions", "",
+     [_assignment_delta("-", "OLD")]),
+    ("staff_headcount_insert", "INSERT ON staff", "",
+     [_staff_delta("+", "NEW")]),
+    ("staff_headcount_update", "UPDATE OF organization_id, is_active ON staff",
+     "WHEN OLD.organization_id IS NOT NEW.organization_id OR OLD.is_active IS NOT NEW.is_active",
+     [_staff_delta("-", "OLD"), _staff_delta("+", "NEW")]),
+    ("staff_headcount_delete", "DELETE ON staff", "",
+     [_staff_delta("-", "OLD")]),
+    ("positions_headcount_update", "UPDATE OF function_id ON positions",
+     "WHEN OLD.function_id IS NOT NEW.function_id",
+     [_position_delta("-", "OLD", "OLD.function_id"), _position_delta("+", "NEW", "NEW.function_id")]),
+    # Назначения на удаленную должность учитываются без функции (id должностей не переиспользуются,
+    # AUTOINCREMENT, поэтому у новой должности назначений нет и триггер на INSERT не нужен)
+    ("positions_headcount_delete", "DELETE ON positions", "WHEN OLD.function_id IS NOT NULL",
+     [_position_delta("-", "OLD", "OLD.function_id"), _position_delta("+", "OLD", "NULL")]),
+    ("functional_relations_span_insert", "INSERT ON functional_relations", "",
+     [_SPAN_DELTA.format(sign="+", row="NEW")]),
+    ("functional_relations_span_update", "UPDATE OF manager_id, relation_type, is_active ON functional_relations", "",
+     [_SPAN_DELTA.format(sign="-", row="OLD"), _SPAN_DELTA.format(sign="+", row="NEW")]),
+    ("functional_relations_span_delete", "DELETE ON functional_relations", "",
+     [_SPAN_DELTA.format(sign="-", row="OLD")]),
+]
+
+for _name, _event, _when, _statements in _ANALYTICS_TRIGGERS:
+    ANALYTICS_SCHEMA += """
+CREATE TRIGGER IF NOT EXISTS {name}
+AFTER {event}
+FOR EACH ROW{when}
+BEGIN{statements}
+END;
+""".format(name=_name, event=_event, when="\n" + _when if _when else "", statements="".join(_statements))
+
+# Полный пересчет счетчиков одним проходом по назначениям и связям
+ANALYTICS_REBUILD_SQL = """
+DELETE FROM headcount_cube;
+
+INSERT INTO headcount_cube (organization_id, division_id, position_id, location_id, function_id, assignments, headcount)
+SELECT IFNULL(s.organization_id, 0), IFNULL(sp.division_id, 0), sp.position_id,
+       IFNULL(sp.location_id, 0), IFNULL(p.function_id, 0), COUNT(*), SUM(sp.is_primary = 1)
+FROM staff_positions sp
+JOIN staff s ON s.id = sp.staff_id
+LEFT JOIN positions p ON p.id = sp.position_id
+WHERE sp.is_active = 1 AND s.is_active = 1
+GROUP BY 1, 2, 3, 4, 5;
+
+DELETE FROM span_of_control;
+
+INSERT INTO span_of_control (manager_id, relation_type, direct_reports)
+SELECT manager_id, relation_type, COUNT(*)
+FROM functional_relations
+WHERE is_active = 1
+GROUP BY manager_id, relation_type;
+"""
+
+# Фоновые задания (выгрузки, отчеты): состояние общее для всех процессов API,
+# поэтому задания с одинаковыми параметрами объединяются между процессами
+JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,          -- канонический JSON параметров
+    params_hash TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued' CHECK(status IN ('queued', 'running', 'succeeded', 'failed')),
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    error TEXT,
+    artifact_path TEXT,
+    owner_pid INTEGER,             -- процесс API, в пуле которого выполняется задание
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    expires_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_kind_params ON jobs(kind, params_hash);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+CREATE INDEX IF NOT EXISTS idx_jobs_expires_at ON jobs(expires_at);
+"""
+
+# Каталог шардов (режим шардирования по холдингам, см. sharding.py): файл шарда
+# каждого холдинга и холдинг каждой организации для маршрутизации запросов.
+# Таблицы есть только в основной базе (каталоге), в файлах шардов их нет.
+SHARD_CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    holding_id INTEGER PRIMARY KEY,
+    shard_no INTEGER NOT NULL UNIQUE,  -- номер шарда: id новых строк шарда начинаются с shard_no << 40
+    path TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS shard_routes (
+    organization_id INTEGER PRIMARY KEY,
+    holding_id INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_shard_routes_holding_id ON shard_routes(holding_id);
+"""
+
+# Служебная таблица файла шарда: версии справочников каталога, скопированных в шард
+SHARD_LOCAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shard_sources (
+    table_name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
 # Список всех схем для инициализации базы данных
 ALL_SCHEMAS = [
     ORGANIZATION_SCHEMA,
@@ -422,5 +1337,16 @@ ALL_SCHEMAS = [
     STAFF_POSITION_SCHEMA,
     STAFF_LOCATION_SCHEMA,
     STAFF_FUNCTION_SCHEMA,
-    FUNCTIONAL_RELATION_SCHEMA
+    FUNCTIONAL_RELATION_SCHEMA,
+    VFP_SCHEMA,
+    SEARCH_SCHEMA,
+    CHANGE_LOG_SCHEMA,
+    TEMPORAL_SCHEMA,
+    SNAPSHOT_SCHEMA,
+    TABLE_VERSION_SCHEMA,
+    VFP_METRICS_SCHEMA,
+    VFP_ROLLUP_SCHEMA,
+    ANALYTICS_SCHEMA,
+    JOBS_SCHEMA,
+    SHARD_CATALOG_SCHEMA
 ] 
\ No newline at end of file
@@ -0,0 +1,263 @@
+"""
+Сжатие HTTP-ответов (brotli и gzip) для обоих FastAPI-приложений.
+
+- алгоритм выбирается по Accept-Encoding (brotli предпочтительнее, если установлен пакет brotli);
+- ответы меньше minimum_size и уже сжатые ответы отдаются как есть;
+- потоковые ответы (StreamingResponse) сжимаются по частям, каждая часть
+  сбрасывается клиенту сразу, без буферизации всего тела;
+- сжатые копии ответов с ETag хранятся в LRU-кэше: повторный ответ с тем же
+  ETag (те же данные, см. http_cache.py) не сжимается заново.
+
+У сжатого ответа к ETag добавляется суффикс кодировки ("...-br", "...-gzip"),
+чтобы разные представления имели разные сильные ETag; во входящем
+If-None-Match суффикс убирается, поэтому приложение сравнивает свой ETag.
+"""
+
+import gzip
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli - необязательная зависимость, без нее используется только gzip
+    brotli = None
+
+# Типы содержимого, которые имеет смысл сжимать. text/event-stream не сжимаем:
+# промежуточные прокси буферизуют сжатый поток и задерживают события
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/graphml+xml",
+    "image/svg+xml",
+    "text/html",
+    "text/plain",
+    "text/csv",
+    "text/css",
+    "text/vnd.graphviz",
+)
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Тела больше этого размера сжимаются в пуле потоков, чтобы не блокировать event loop
+THREADPOOL_THRESHOLD = 64 * 1024
+
+ETAG_SUFFIXES = {"br": "-br", "gzip": "-gzip"}
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Выбирает кодировку по заголовку Accept-Encoding с учетом q-значений."""
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_q = None, 0.0
+    for name in candidates:
+        q = weights.get(name, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Сжимает тело ответа целиком."""
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class StreamCompressor:
+    """Потоковое сжатие: каждая часть сжимается и сбрасывается (flush) отдельно."""
+
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        self.encoding = encoding
+
+    def compress(self, chunk: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(chunk) + self._compressor.flush()
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class CompressedCache:
+    """LRU-кэш сжатых тел по (ETag, кодировка) с ограничением суммарного размера."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+
+    def get(self, key: Tuple[str, str]) -> Optional[bytes]:
+        body = self._items.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return body
+
+    def put(self, key: Tuple[str, str], body: bytes):
+        if len(body) > self.max_bytes or key in self._items:
+            return
+        self._items[key] = body
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self.size -= len(evicted)
+
+
+def is_compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def strip_etag_suffixes(if_none_match: str) -> str:
+    """Убирает из If-None-Match суффиксы кодировок, добавленные к ETag при сжатии."""
+    for suffix in ETAG_SUFFIXES.values():
+        if_none_match = if_none_match.replace(suffix + '"', '"')
+    return if_none_match
+
+
+class CompressionMiddleware:
+    """ASGI middleware сжатия ответов."""
+
+    def __init__(self, app, minimum_size: int = 1024, cache_bytes: int = 32 * 1024 * 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache = CompressedCache(cache_bytes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        if "if-none-match" in headers:
+            scope = dict(scope)
+            scope["headers"] = [
+                (key, strip_etag_suffixes(value.decode("latin-1")).encode("latin-1")) if key == b"if-none-match" else (key, value)
+                for key, value in scope["headers"]
+            ]
+
+        encoding = choose_encoding(headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    """Состояние сжатия одного ответа."""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self._send = send
+        self.start_message = None
+        self.compressor: Optional[StreamCompressor] = None
+        self.passthrough = False
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            status = message["status"]
+            if status < 200 or status in (204, 304) or not is_compressible(headers):
+                self.passthrough = True
+                await self._send(message)
+            else:
+                # Решение о сжатии принимается по первой части тела; заголовки
+                # копируем, чтобы не менять список, принадлежащий объекту Response
+                self.start_message = dict(message, headers=list(message["headers"]))
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is not None:
+            await self._send_chunk(body, more_body)
+            return
+
+        if not more_body:
+            await self._send_complete(body)
+            return
+
+        # Потоковый ответ: сжимаем по частям
+        self.compressor = StreamCompressor(self.encoding)
+        self._prepare_headers(length=None)
+        await self._send(self.start_message)
+        await self._send_chunk(body, more_body)
+
+    async def _send_complete(self, body: bytes):
+        if len(body) < self.middleware.minimum_size:
+            await self._send(self.start_message)
+            await self._send({"type": "http.response.body", "body": body})
+            return
+
+        etag = Headers(raw=self.start_message["headers"]).get("etag")
+        key = (etag, self.encoding) if etag and not etag.startswith("W/") else None
+        compressed = self.middleware.cache.get(key) if key else None
+        if compressed is None:
+            if len(body) >= THREADPOOL_THRESHOLD:
+                compressed = await run_in_threadpool(compress, body, self.encoding)
+            else:
+                compressed = compress(body, self.encoding)
+            if key:
+                self.middleware.cache.put(key, compressed)
+
+        self._prepare_headers(length=len(compressed))
+        await self._send(self.start_message)
+        await self._send({"type": "http.response.body", "body": compressed})
+
+    async def _send_chunk(self, body: bytes, more_body: bool):
+        data = self.compressor.compress(body) if body else b""
+        if not more_body:
+            data += self.compressor.finish()
+        if data or not more_body:
+            await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    def _prepare_headers(self, length: Optional[int]):
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if length is None:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(length)
+        etag = headers.get("etag")
+        if etag and etag.endswith('"') and not etag.startswith("W/"):
+            headers["ETag"] = etag[:-1] + ETAG_SUFFIXES[self.encoding] + '"'
@@ -0,0 +1,318 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+from typing import Dict, Any, Optional, Set, List
+
+from invalidation import bus, Invalidation
+
+logger = logging.getLogger("ofs_api.events")
+
+router = APIRouter(
+    prefix="/events",
+    tags=["events"],
+)
+
+# Размер очереди событий одного подписчика. Если клиент не успевает читать,
+# накопленные события отбрасываются и ему отправляется одно событие resync.
+SUBSCRIBER_QUEUE_SIZE = 256
+
+# Интервал отправки комментариев-пингов, чтобы прокси не закрывали простаивающие соединения
+HEARTBEAT_SECONDS = 15
+
+# Типы сущностей, о которых рассылаются события
+EVENT_ENTITY_TYPES = [
+    "organizations",
+    "divisions",
+    "sections",
+    "division_sections",
+    "functions",
+    "section_functions",
+    "positions",
+    "staff",
+    "staff_positions",
+    "staff_locations",
+    "staff_functions",
+    "functional_relations",
+    "vfp",
+]
+
+RESYNC_EVENT = "event: resync\ndata: {}\n\n"
+
+# Таблицы сущностей, тип которых не совпадает с именем таблицы
+ENTITY_TABLES = {"vfp": "valuable_final_products"}
+TABLE_ENTITY_TYPES = {table: entity_type for entity_type, table in ENTITY_TABLES.items()}
+
+# Изменения всех сущностей приходят через шину инвалидации (журнал change_log),
+# поэтому события о них получают подписчики всех процессов API. Организация
+# удаленной строки хранится в самом журнале - ее видит любой процесс.
+BUS_ENTITY_TYPES = set(EVENT_ENTITY_TYPES)
+
+
+class Subscriber:
+    """Один подключенный клиент со своей очередью и фильтрами."""
+
+    def __init__(self, entity_types: Optional[Set[str]], root_org_id: Optional[int]):
+        self.entity_types = entity_types
+        self.root_org_id = root_org_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.dropped = 0
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        if self.entity_types is not None and event["entity_type"] not in self.entity_types:
+            return False
+        if self.root_org_id is not None and self.root_org_id not in event["organization_ids"]:
+            return False
+        return True
+
+    def offer(self, message: str):
+        """Кладет сообщение в очередь, не блокируясь. При переполнении очередь сбрасывается."""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped += self.queue.qsize()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC_EVENT)
+
+
+class EventBroker:
+    """
+    Рассылает события об изменениях подключенным клиентам.
+    publish() можно вызывать из любого потока (синхронные обработчики FastAPI
+    выполняются в пуле потоков), рассылка выполняется в цикле событий сервера.
+    """
+
+    def __init__(self):
+        self.subscribers: Set[Subscriber] = set()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.lock = threading.Lock()
+        self.published = 0
+
+    @property
+    def has_subscribers(self) -> bool:
+        return bool(self.subscribers)
+
+    @property
+    def needs_organization_ids(self) -> bool:
+        """Нужно ли вычислять цепочку организаций (есть подписчики с фильтром по поддереву)."""
+        return any(s.root_org_id is not None for s in list(self.subscribers))
+
+    def subscribe(self, entity_types: Optional[Set[str]], root_org_id: Optional[int]) -> Subscriber:
+        subscriber = Subscriber(entity_types, root_org_id)
+        with self.lock:
+            self.loop = asyncio.get_running_loop()
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, event: Dict[str, Any]):
+        """Отправляет событие всем подходящим подписчикам."""
+        if not self.subscribers or self.loop is None:
+            return
+        self.published += 1
+        # Сообщение сериализуется один раз для всех подписчиков
+        message = f"event: change\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        try:
+            self.loop.call_soon_threadsafe(self._dispatch, event, message)
+        except RuntimeError:
+            # Цикл событий уже закрыт (остановка сервера)
+            pass
+
+    def _dispatch(self, event: Dict[str, Any], message: str):
+        for subscriber in list(self.subscribers):
+            if subscriber.matches(event):
+                subscriber.offer(message)
+
+    def stats(self) -> Dict[str, int]:
+        subscribers = list(self.subscribers)
+        return {
+            "subscribers": len(subscribers),
+            "published": self.published,
+            "dropped": sum(s.dropped for s in subscribers),
+        }
+
+
+broker = EventBroker()
+
+
+def get_organization_ids(db: sqlite3.Connection, organization_id: Optional[int]) -> List[int]:
+    """Возвращает организацию и всех ее предков (для фильтрации по поддереву)."""
+    if organization_id is None:
+        return []
+    rows = db.execute("""
+        WITH RECURSIVE chain(id, parent_id) AS (
+            SELECT id, parent_id FROM organizations WHERE id = ?
+            UNION ALL
+            SELECT o.id, o.parent_id FROM organizations o JOIN chain c ON o.id = c.parent_id
+        )
+        SELECT id FROM chain
+    """, (organization_id,)).fetchall()
+    return [row[0] for row in rows]
+
+
+def get_staff_organization_id(db: sqlite3.Connection, staff_id: Optional[int]) -> Optional[int]:
+    if staff_id is None:
+        return None
+    row = db.execute(
+        "SELECT COALESCE(organization_id, primary_organization_id) FROM staff WHERE id = ?",
+        (staff_id,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def resolve_organization_id(db: sqlite3.Connection, entity_type: str, row: Dict[str, Any]) -> Optional[int]:
+    """Определяет организацию, к поддереву которой относится запись."""
+    if entity_type == "organizations":
+        return row.get("id")
+    if entity_type == "divisions":
+        return row.get("organization_id")
+    if entity_type == "staff":
+        return row.get("organization_id") or row.get("primary_organization_id")
+    if entity_type in ("staff_positions", "staff_locations") and row.get("location_id"):
+        return row["location_id"]
+    if entity_type == "staff_positions" and row.get("division_id"):
+        div = db.execute("SELECT organization_id FROM divisions WHERE id = ?", (row["division_id"],)).fetchone()
+        if div:
+            return div[0]
+    if entity_type == "vfp":
+        if row.get("entity_type") == "organization":
+            return row.get("entity_id")
+        if row.get("entity_type") == "division":
+            div = db.execute("SELECT organization_id FROM divisions WHERE id = ?", (row.get("entity_id"),)).fetchone()
+            return div[0] if div else None
+        return None
+    if entity_type == "functional_relations":
+        return get_staff_organization_id(db, row.get("subordinate_id"))
+    if "staff_id" in row:
+        return get_staff_organization_id(db, row.get("staff_id"))
+    return None
+
+
+def publish_change(
+    db: sqlite3.Connection,
+    entity_type: str,
+    entity_id: int,
+    operation: str,
+    row: Optional[Dict[str, Any]] = None
+):
+    """
+    Публикует событие об изменении записи. Вызывается обработчиками записи после commit.
+    Для delete нужно передать row - состояние записи до удаления.
+    Соединение должно возвращать строки как sqlite3.Row.
+    Если подписчиков нет, ничего не делает.
+    """
+    if not broker.has_subscribers:
+        return
+
+    if entity_type in BUS_ENTITY_TYPES and bus.running:
+        # Событие разошлет шина во всех процессах, здесь только будим ее
+        bus.poke()
+        return
+
+    organization_ids: List[int] = []
+    if broker.needs_organization_ids:
+        try:
+            if row is None:
+                table = ENTITY_TABLES.get(entity_type, entity_type)
+                found = db.execute(f"SELECT * FROM {table} WHERE id = ?", (entity_id,)).fetchone()
+                row = dict(found) if found else {}
+            organization_ids = get_organization_ids(db, resolve_organization_id(db, entity_type, row))
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось определить организацию для события {entity_type}/{entity_id}: {str(e)}")
+
+    broker.publish({
+        "entity_type": entity_type,
+        "id": entity_id,
+        "operation": operation,
+        "organization_ids": organization_ids,
+    })
+
+
+def deleted_organization_ids(db: sqlite3.Connection, item: Invalidation) -> List[int]:
+    """Цепочка организаций удаленной строки по организации, сохраненной в журнале."""
+    organization_ids = get_organization_ids(db, item.organization_id)
+    if item.table == "organizations":
+        # Для удаленной организации в журнале ее родитель
+        organization_ids.insert(0, item.row_id)
+    return organization_ids
+
+
+def forward_invalidations(db: sqlite3.Connection, invalidations: List[Invalidation]):
+    """Рассылает подписчикам процесса изменения строк из шины (в том числе сделанные другими процессами)."""
+    if not broker.has_subscribers:
+        return
+    for item in invalidations:
+        entity_type = TABLE_ENTITY_TYPES.get(item.table, item.table)
+        if item.row_id is None or entity_type not in BUS_ENTITY_TYPES:
+            continue
+        organization_ids: List[int] = []
+        if broker.needs_organization_ids:
+            try:
+                if item.operation == "delete":
+                    organization_ids = deleted_organization_ids(db, item)
+                else:
+                    found = db.execute(f"SELECT * FROM {item.table} WHERE id = ?", (item.row_id,)).fetchone()
+                    row = dict(found) if found else {}
+                    organization_ids = get_organization_ids(db, resolve_organization_id(db, entity_type, row))
+            except sqlite3.Error as e:
+                logger.warning(f"Не удалось определить организацию для события {entity_type}/{item.row_id}: {str(e)}")
+        broker.publish({
+            "entity_type": entity_type,
+            "id": item.row_id,
+            "operation": item.operation,
+            "organization_ids": organization_ids,
+        })
+
+
+bus.subscribe(forward_invalidations)
+
+
+@router.get("/stream")
+async def stream_events(
+    entity_types: Optional[str] = Query(None, description="Типы сущностей через запятую, по умолчанию все"),
+    root_org_id: Optional[int] = Query(None, description="Только изменения в поддереве этой организации"),
+):
+    """
+    Поток событий об изменениях оргструктуры (Server-Sent Events).
+    Каждое событие "change" содержит тип сущности, id, операцию и цепочку организаций.
+    Событие "resync" означает, что клиент не успевал читать и должен перезагрузить данные.
+    """
+    type_filter = None
+    if entity_types:
+        type_filter = {t.strip() for t in entity_types.split(",") if t.strip()}
+        unknown = type_filter - set(EVENT_ENTITY_TYPES)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Неизвестные типы сущностей: {', '.join(sorted(unknown))}")
+
+    subscriber = broker.subscribe(type_filter, root_org_id)
+
+    async def event_generator():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    message = ": ping\n\n"
+                yield message
+        finally:
+            broker.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/stats", response_model=Dict[str, int])
+def get_event_stats():
+    """Статистика рассылки: подписчики, опубликованные и отброшенные события, опросы шины."""
+    return {**broker.stats(), **{f"bus_{key}": value for key, value in bus.stats().items()}}
@@ -0,0 +1,464 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+import csv
+import io
+import re
+import sqlite3
+import tempfile
+from itertools import chain, zip_longest
+from typing import Callable, Iterator, List, Dict, Any, Optional, Tuple
+from urllib.parse import quote
+
+from http_cache import table_etag
+from replica import connect_for_read
+from graph_export import GRAPH_ROOTS, select_scope, graphml_lines, dot_lines, node_link_lines
+
+try:
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Font
+    from openpyxl.utils import get_column_letter
+except ImportError:  # openpyxl нужен только для экспорта в Excel, CSV работает без него
+    Workbook = None
+
+DB_PATH = "full_api_new.db"
+
+router = APIRouter(
+    prefix="/export",
+    tags=["export"],
+)
+
+# Таблицы, из которых собирается выгрузка (для ETag)
+EXPORT_TABLES = (
+    "organizations", "divisions", "division_sections", "sections", "section_functions",
+    "functions", "positions", "staff", "staff_positions", "valuable_final_products",
+)
+
+# Таблицы графа оргструктуры (для ETag)
+GRAPH_TABLES = (
+    "organizations", "divisions", "staff", "staff_positions", "positions", "functional_relations",
+)
+
+# Форматы выгрузки графа: построчный генератор, тип содержимого, имя файла
+GRAPH_FORMATS = {
+    "graphml": (graphml_lines, "application/graphml+xml", "ofs-graph.graphml"),
+    "dot": (dot_lines, "text/vnd.graphviz; charset=utf-8", "ofs-graph.dot"),
+    "json": (node_link_lines, "application/json", "ofs-graph.json"),
+}
+
+# Размер части потокового ответа
+CHUNK_SIZE = 64 * 1024
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Ширина столбца отдела на листе департамента (как в исходной книге ОФС)
+COLUMN_WIDTH = 45
+
+# Сотрудники, чья функция не относится ни к одному отделу департамента: отдельный
+# лист книги (в CSV - значение столбца section)
+UNASSIGNED_SECTION = "Без отдела"
+UNASSIGNED_HEADERS = ["Сотрудник", "Должность"]
+
+# Обратный вызов хода выгрузки: (готово департаментов, всего департаментов)
+Progress = Optional[Callable[[int, int], None]]
+
+CSV_COLUMNS = [
+    "department", "section", "function", "staff_id", "last_name", "first_name",
+    "middle_name", "email", "position",
+]
+
+# Символы, недопустимые в имени листа Excel
+_SHEET_NAME_FORBIDDEN = re.compile(r"[\[\]:*?/\\]")
+
+
+def open_db() -> Tuple[sqlite3.Connection, Dict[str, str]]:
+    """
+    Соединение для выгрузки (с репликой, если она включена и свежая, см. replica.py):
+    оно живет, пока отдается ответ. Все чтение идет в одной транзакции (см. connect_for_read) -
+    выгрузка согласована, даже если во время нее меняются данные. Возвращает и заголовки
+    с версией данных, из которых собрана выгрузка.
+    """
+    return connect_for_read(DB_PATH)
+
+
+def get_export_db(response: Response):
+    """
+    Соединение выгрузки (open_db) как зависимость: по нему же считается ETag, поэтому
+    ETag и тело ответа - из одного снимка данных (и одной базы: основной или реплики).
+    Соединение закрывает потоковая выдача; здесь оно закрывается, только если ответ
+    до нее не дошел (304, ошибка).
+    """
+    conn, headers = open_db()
+    response.headers.update(headers)
+    try:
+        yield conn
+    except BaseException:
+        conn.close()
+        raise
+
+
+def short_name(last_name: str, first_name: str, middle_name: Optional[str]) -> str:
+    """"Ланкин Д.А." - формат имен в книге ОФС."""
+    initials = "".join(f"{part[0]}." for part in (first_name, middle_name) if part)
+    return f"{last_name} {initials}".strip()
+
+
+def section_title(number: str, name: str) -> str:
+    """Заголовок отдела "1.2 Отдел ..." (его ищет import_from_excel.py)."""
+    name = re.sub(r"^Отдел\s+", "", name.strip(), flags=re.IGNORECASE)
+    return f"{number} Отдел {name}"
+
+
+def function_title(name: str) -> str:
+    name = name.strip()
+    return name if re.match(r"^Функция", name, re.IGNORECASE) else f"Функция {name}"
+
+
+def ckp_text(value: Optional[str]) -> str:
+    """Строка "ЦКП: ..." (префикс не дублируется, если он уже есть в тексте)."""
+    if not value:
+        return ""
+    return value if re.match(r"^ЦКП\b", value.strip()) else f"ЦКП: {value}"
+
+
+def sheet_title(number: int, name: str, used: set) -> str:
+    """Имя листа "1. ДЕПАРТАМЕНТ ..." не длиннее 31 символа и без повторов."""
+    base = _SHEET_NAME_FORBIDDEN.sub(" ", f"{number}. ДЕПАРТАМЕНТ {name}")[:31].strip()
+    title, suffix = base, 2
+    while title.lower() in used:
+        title = f"{base[:31 - len(str(suffix)) - 1]}~{suffix}"
+        suffix += 1
+    used.add(title.lower())
+    return title
+
+
+def iter_departments(db: sqlite3.Connection, organization_id: Optional[int]) -> List[sqlite3.Row]:
+    """Департаменты - активные подразделения верхнего уровня (вместе со всеми дочерними)."""
+    query = "SELECT id, name, ckp FROM divisions WHERE is_active = 1 AND parent_id IS NULL"
+    params: List[Any] = []
+    if organization_id is not None:
+        query += " AND organization_id = ?"
+        params.append(organization_id)
+    return db.execute(query + " ORDER BY id", params).fetchall()
+
+
+def select_department(db: sqlite3.Connection, division_id: int):
+    """Заполняет temp.export_divisions подразделениями департамента (поддерево division_id)."""
+    db.execute("CREATE TEMP TABLE IF NOT EXISTS export_divisions (id INTEGER PRIMARY KEY)")
+    db.execute("DELETE FROM temp.export_divisions")
+    db.execute("""
+        INSERT INTO temp.export_divisions (id)
+        WITH RECURSIVE subtree(id) AS (
+            SELECT ?
+            UNION
+            SELECT d.id FROM divisions d JOIN subtree ON d.parent_id = subtree.id WHERE d.is_active = 1
+        )
+        SELECT id FROM subtree
+    """, (division_id,))
+
+
+def load_sections(db: sqlite3.Connection) -> List[sqlite3.Row]:
+    """Отделы подразделений департамента, выбранного select_department."""
+    return db.execute("""
+        SELECT s.id, s.name, s.ckp FROM sections s
+        WHERE s.is_active = 1 AND s.id IN (
+            SELECT ds.section_id FROM division_sections ds JOIN temp.export_divisions t ON t.id = ds.division_id
+        )
+        ORDER BY s.id
+    """).fetchall()
+
+
+def function_vfp(db: sqlite3.Connection, function_id: int) -> Optional[str]:
+    row = db.execute(
+        "SELECT name FROM valuable_final_products WHERE entity_type = 'function' AND entity_id = ? AND is_active = 1",
+        (function_id,),
+    ).fetchone()
+    return row[0] if row else None
+
+
+# Активные назначения департамента вместе с сотрудником и должностью
+_STAFF_SELECT = """
+    SELECT st.id AS staff_id, st.last_name, st.first_name, st.middle_name, st.email, p.name AS position
+    FROM staff_positions sp
+    JOIN staff st ON st.id = sp.staff_id
+    JOIN positions p ON p.id = sp.position_id
+    WHERE sp.division_id IN (SELECT id FROM temp.export_divisions) AND sp.is_active = 1 AND st.is_active = 1
+"""
+
+# Функция должности не входит ни в один отдел департамента
+_UNASSIGNED_CONDITION = """
+    AND (p.function_id IS NULL OR p.function_id NOT IN (
+        SELECT sf.function_id FROM division_sections ds
+        JOIN temp.export_divisions t ON t.id = ds.division_id
+        JOIN section_functions sf ON sf.section_id = ds.section_id
+    ))
+"""
+
+
+def iter_section_staff(db: sqlite3.Connection, section_id: int) -> Iterator[Tuple[sqlite3.Row, Optional[sqlite3.Row]]]:
+    """
+    Функции отдела и сотрудники департамента на должностях этих функций:
+    (функция, сотрудник), для функции без сотрудников - (функция, None).
+    """
+    functions = db.execute("""
+        SELECT f.id, f.name FROM section_functions sf
+        JOIN functions f ON f.id = sf.function_id
+        WHERE sf.section_id = ? AND f.is_active = 1
+        ORDER BY sf.is_primary DESC, f.id
+    """, (section_id,)).fetchall()
+    for function in functions:
+        found = False
+        for staff in db.execute(_STAFF_SELECT + " AND p.function_id = ? ORDER BY st.last_name, st.first_name, st.id",
+                                (function["id"],)):
+            found = True
+            yield function, staff
+        if not found:
+            yield function, None
+
+
+def iter_unassigned_staff(db: sqlite3.Connection) -> Iterator[sqlite3.Row]:
+    """Сотрудники департамента, чья функция не входит ни в один его отдел."""
+    return db.execute(_STAFF_SELECT + _UNASSIGNED_CONDITION + " ORDER BY st.last_name, st.first_name, st.id")
+
+
+def section_column(db: sqlite3.Connection, section: sqlite3.Row) -> Iterator[Tuple[str, str]]:
+    """
+    Ячейки столбца отдела ниже заголовка, как в книге ОФС: для каждой функции
+    строка "Функция ...", сотрудники по одному в строке, "ЦКП: ..." и пустая строка.
+    Возвращает (стиль, текст).
+    """
+    yield "ckp", ckp_text(section["ckp"])
+    current = None
+    for function, staff in iter_section_staff(db, section["id"]):
+        if current is None or function["id"] != current["id"]:
+            if current is not None:
+                yield from function_footer(db, current)
+            current = function
+            yield "function", function_title(function["name"])
+        if staff is not None:
+            yield "staff", short_name(staff["last_name"], staff["first_name"], staff["middle_name"])
+    if current is not None:
+        yield from function_footer(db, current)
+
+
+def function_footer(db: sqlite3.Connection, function: sqlite3.Row) -> Iterator[Tuple[str, str]]:
+    vfp = function_vfp(db, function["id"])
+    if vfp:
+        yield "ckp", ckp_text(vfp)
+    yield "", ""
+
+
+def write_workbook(db: sqlite3.Connection, target, organization_id: Optional[int] = None, progress: Progress = None):
+    """
+    Пишет книгу в формате "ОФС стандартизированная": лист на департамент (подразделение
+    верхнего уровня вместе с дочерними), столбец на отдел, и лист сотрудников без
+    отдела. Книга write-only: строки сразу уходят во временные файлы openpyxl, а
+    столбцы отделов читаются параллельными курсорами - в памяти только текущая строка.
+    """
+    workbook = Workbook(write_only=True)
+    styles = {
+        "title": Font(bold=True, size=14),
+        "section": Font(bold=True),
+        "function": Font(bold=True),
+        "ckp": Font(italic=True),
+    }
+    wrap = Alignment(wrap_text=True, vertical="top")
+
+    def cell(sheet, style: str, value: str):
+        # Строки сотрудников пишутся без стиля - их большинство, а стиль ячейки дорог
+        if not value or style not in styles:
+            return value or None
+        result = WriteOnlyCell(sheet, value=value)
+        result.font = styles[style]
+        result.alignment = wrap
+        return result
+
+    used_titles: set = set()
+    departments = iter_departments(db, organization_id)
+    for number, department in enumerate(departments, start=1):
+        select_department(db, department["id"])
+        sections = load_sections(db)
+        sheet = workbook.create_sheet(sheet_title(number, department["name"], used_titles))
+
+        headers = [section_title(f"{number}.{index}", section["name"]) for index, section in enumerate(sections, start=1)]
+        columns = [section_column(db, section) for section in sections]
+
+        for index in range(max(len(headers), 1)):
+            sheet.column_dimensions[get_column_letter(index + 1)].width = COLUMN_WIDTH
+
+        sheet.append([cell(sheet, "title", f"{number}. ДЕПАРТАМЕНТ {department['name']}")])
+        sheet.append([])
+        sheet.append([cell(sheet, "ckp", ckp_text(department["ckp"]))])
+        sheet.append([cell(sheet, "section", header) for header in headers])
+        for row in zip_longest(*columns, fillvalue=("", "")):
+            sheet.append([cell(sheet, style, value) for style, value in row])
+        if progress:
+            progress(number, len(departments))
+
+    # Лист сотрудников без отдела: заголовок департамента и его сотрудники
+    sheet = workbook.create_sheet(UNASSIGNED_SECTION)
+    for index in range(len(UNASSIGNED_HEADERS)):
+        sheet.column_dimensions[get_column_letter(index + 1)].width = COLUMN_WIDTH
+    sheet.append([cell(sheet, "section", header) for header in UNASSIGNED_HEADERS])
+    for number, department in enumerate(departments, start=1):
+        select_department(db, department["id"])
+        staff_rows = iter_unassigned_staff(db)
+        first = next(staff_rows, None)
+        if first is None:
+            continue
+        sheet.append([cell(sheet, "function", f"{number}. ДЕПАРТАМЕНТ {department['name']}")])
+        for staff in chain([first], staff_rows):
+            sheet.append([short_name(staff["last_name"], staff["first_name"], staff["middle_name"]), staff["position"]])
+    workbook.save(target)
+
+
+def iter_csv_rows(db: sqlite3.Connection, organization_id: Optional[int] = None, progress: Progress = None) -> Iterator[List[Any]]:
+    """Плоские строки выгрузки: департамент, отдел, функция, сотрудник."""
+    departments = iter_departments(db, organization_id)
+    for number, department in enumerate(departments, start=1):
+        department_name = f"{number}. ДЕПАРТАМЕНТ {department['name']}"
+        select_department(db, department["id"])
+        for index, section in enumerate(load_sections(db), start=1):
+            section_name = section_title(f"{number}.{index}", section["name"])
+            for function, staff in iter_section_staff(db, section["id"]):
+                yield [department_name, section_name, function["name"]] + _staff_fields(staff)
+        for staff in iter_unassigned_staff(db):
+            yield [department_name, UNASSIGNED_SECTION, None] + _staff_fields(staff)
+        if progress:
+            progress(number, len(departments))
+
+
+def _staff_fields(staff: Optional[sqlite3.Row]) -> List[Any]:
+    if staff is None:
+        return [None] * 6
+    return [staff["staff_id"], staff["last_name"], staff["first_name"], staff["middle_name"], staff["email"], staff["position"]]
+
+
+def iter_csv_chunks(db: sqlite3.Connection, organization_id: Optional[int] = None, progress: Progress = None) -> Iterator[bytes]:
+    """CSV выгрузки частями по CHUNK_SIZE."""
+    buffer = io.StringIO()
+    # BOM, чтобы Excel открыл UTF-8 с кириллицей без мастера импорта
+    buffer.write("\ufeff")
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for row in iter_csv_rows(db, organization_id, progress):
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def stream_csv(db: sqlite3.Connection, organization_id: Optional[int]) -> Iterator[bytes]:
+    try:
+        yield from iter_csv_chunks(db, organization_id)
+    finally:
+        db.close()
+
+
+def stream_xlsx(db: sqlite3.Connection, organization_id: Optional[int]) -> Iterator[bytes]:
+    # zip-архив книги собирается во временном файле и отдается частями
+    with tempfile.TemporaryFile() as target:
+        try:
+            write_workbook(db, target, organization_id)
+        finally:
+            db.close()
+        target.seek(0)
+        while True:
+            chunk = target.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def stream_graph(db: sqlite3.Connection, format: str, root_type: Optional[str], root_id: Optional[int],
+                 relation_types: Optional[List[str]]) -> Iterator[bytes]:
+    lines = GRAPH_FORMATS[format][0]
+    try:
+        select_scope(db, root_type, root_id)
+        chunk: List[str] = []
+        size = 0
+        for line in lines(db, relation_types):
+            chunk.append(line)
+            size += len(line)
+            if size >= CHUNK_SIZE:
+                yield "".join(chunk).encode("utf-8")
+                chunk, size = [], 0
+        yield "".join(chunk).encode("utf-8")
+    finally:
+        db.close()
+
+
+def attachment(filename: str) -> Dict[str, str]:
+    return {"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"}
+
+
+@router.get("/org-structure.xlsx", dependencies=[table_etag(get_export_db, *EXPORT_TABLES)])
+def export_xlsx(
+    response: Response,
+    organization_id: Optional[int] = Query(None, description="Только подразделения этой организации"),
+    db: sqlite3.Connection = Depends(get_export_db),
+):
+    """Оргструктура в формате книги "ОФС стандартизированная" (лист на департамент)."""
+    if Workbook is None:
+        raise HTTPException(status_code=501, detail="Экспорт в Excel недоступен: не установлен пакет openpyxl")
+    return StreamingResponse(
+        stream_xlsx(db, organization_id),
+        media_type=XLSX_MEDIA_TYPE,
+        headers={**response.headers, **attachment("ОФС стандартизированная.xlsx")},
+    )
+
+
+@router.get("/org-structure.csv", dependencies=[table_etag(get_export_db, *EXPORT_TABLES)])
+def export_csv(
+    response: Response,
+    organization_id: Optional[int] = Query(None, description="Только подразделения этой организации"),
+    db: sqlite3.Connection = Depends(get_export_db),
+):
+    """Оргструктура плоским CSV: строка на сотрудника функции отдела департамента."""
+    return StreamingResponse(
+        stream_csv(db, organization_id),
+        media_type="text/csv; charset=utf-8",
+        headers={**response.headers, **attachment("ОФС стандартизированная.csv")},
+    )
+
+
+@router.get("/graph.{format}", dependencies=[table_etag(get_export_db, *GRAPH_TABLES)])
+def export_graph(
+    format: str,
+    response: Response,
+    root_type: Optional[str] = Query(None, description="Корень поддерева: organization или division"),
+    root_id: Optional[int] = None,
+    relation_type: Optional[str] = Query(None, description="Типы функциональных отношений через запятую"),
+    db: sqlite3.Connection = Depends(get_export_db),
+):
+    """
+    Граф организаций, подразделений, сотрудников и их связей в формате GraphML
+    (graph.graphml), DOT (graph.dot) или node-link JSON (graph.json).
+    root_type и root_id ограничивают выгрузку поддеревом, relation_type - типами отношений.
+    """
+    if format not in GRAPH_FORMATS:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Неизвестный формат графа: {format}. Доступные: {', '.join(GRAPH_FORMATS)}",
+        )
+    if (root_type is None) != (root_id is None):
+        raise HTTPException(status_code=400, detail="Параметры root_type и root_id указываются вместе")
+    if root_type is not None:
+        if root_type not in GRAPH_ROOTS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Неизвестный тип корня: {root_type}. Допустимые: {', '.join(GRAPH_ROOTS)}",
+            )
+        # Корень проверяется до начала потоковой выдачи - потом ошибку уже не вернуть
+        if db.execute(f"SELECT 1 FROM {GRAPH_ROOTS[root_type]} WHERE id = ?", (root_id,)).fetchone() is None:
+            raise HTTPException(status_code=404, detail=f"Узел {root_type} с ID {root_id} не найден")
+
+    relation_types = [value.strip() for value in (relation_type or "").split(",") if value.strip()] or None
+    _, media_type, filename = GRAPH_FORMATS[format]
+    return StreamingResponse(
+        stream_graph(db, format, root_type, root_id, relation_types),
+        media_type=media_type,
+        headers={**response.headers, **attachment(filename)},
+    )
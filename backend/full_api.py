@@ -2,14 +2,34 @@ import sqlite3
 import os
 import traceback  # Добавляем модуль для печати стека вызовов
 import logging    # Добавляем логирование
-from fastapi import FastAPI, HTTPException, Depends, Request, APIRouter # <--- Добавляем APIRouter
+import time
+from fastapi import FastAPI, HTTPException, Depends, Request, Response, APIRouter # <--- Добавляем APIRouter
 from fastapi.middleware.cors import CORSMiddleware  # Импортируем CORS middleware
 from pydantic import BaseModel, EmailStr, Field
 from typing import List, Optional, Dict, Any, Union
 from enum import Enum
 import uvicorn
 from datetime import datetime, date, timedelta
-from complete_schema import ALL_SCHEMAS
+from complete_schema import ALL_SCHEMAS, VFP_SCHEMA, SEARCH_SCHEMA, CHANGE_LOG_SCHEMA, CHANGE_LOG_SEED_SQL, TEMPORAL_SCHEMA, SNAPSHOT_SCHEMA, TABLE_VERSION_SCHEMA, ANALYTICS_SCHEMA, JOBS_SCHEMA, SHARD_CATALOG_SCHEMA
+from search_api import router as search_router, build_match_query, rebuild_search_index
+from changes_api import (
+    router as changes_router, compact_change_log, change_log_outdated, upgrade_change_log,
+    update_triggers_outdated, upgrade_update_triggers,
+)
+from events_api import router as events_router, publish_change
+from snapshots_api import router as snapshots_router
+from analytics_api import router as analytics_router, rebuild_analytics
+from export_api import router as export_router
+from jobs_api import router as jobs_router, recover_jobs, cleanup_expired_jobs, shutdown_jobs
+from replica import start_replica_publisher, stop_replica_publisher
+from invalidation import bus as invalidation_bus
+import sharding
+from temporal import as_of_condition, rebuild_validity_index, validity_index_outdated, upgrade_validity_index
+from logging_config import setup_logging, shutdown_logging, log_request, get_logging_stats
+from http_cache import table_etag
+from includes import parse_ids, ids_condition, parse_include, compound_document
+from compression import CompressionMiddleware
+from vfp_rollup import add_metric_columns, get_vfp_rollup, install_vfp_rollup, vfp_rollup_outdated
 import json
 
 # --- НОВЫЕ ИМПОРТЫ ДЛЯ АУТЕНТИФИКАЦИИ ---
@@ -18,15 +38,8 @@ from jose import JWTError, jwt
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 # --- КОНЕЦ НОВЫХ ИМПОРТОВ ---
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler("api_debug.log")
-    ]
-)
+# Настройка логирования (очередь + отдельный поток записи, см. logging_config.py)
+setup_logging()
 logger = logging.getLogger("ofs_api")
 
 # Имя нашей базы данных с новой схемой
@@ -60,15 +73,22 @@ app.add_middleware(
     allow_headers=["*"],  # Разрешаем все заголовки
 )
 
+# Сжатие ответов (brotli/gzip): деревья оргструктуры и списки сотрудников занимают мегабайты
+app.add_middleware(CompressionMiddleware)
+
 # Добавляем middleware для глобальной обработки ошибок
 @app.middleware("http")
 async def log_exceptions(request: Request, call_next):
+    started = time.perf_counter()
     try:
-        return await call_next(request)
+        response = await call_next(request)
     except Exception as e:
         logger.error(f"Ошибка при обработке запроса {request.url}: {str(e)}")
         logger.error(traceback.format_exc())
+        log_request(request.method, request.url.path, 500, started)
         raise
+    log_request(request.method, request.url.path, response.status_code, started)
+    return response
 
 # Подключаем роутер для организационной структуры, если он доступен
 try:
@@ -84,6 +104,23 @@ def startup_event():
     logger.info("Выполняется событие startup: инициализация базы данных...")
     init_db()
     logger.info("Инициализация базы данных завершена.")
+    # Шина инвалидации: изменения, сделанные другими воркерами, доходят до кэшей и подписчиков этого
+    invalidation_bus.start(DB_PATH)
+    # В режиме шардирования - шины шардов и копирование справочников каталога в шарды
+    if sharding.is_enabled():
+        sharding.start_shard_buses(DB_PATH, invalidation_bus)
+    # Публикация реплики для эндпоинтов чтения (если включен режим реплики)
+    if start_replica_publisher(DB_PATH):
+        logger.info("Запущена публикация реплики только для чтения")
+
+# Останавливаем пул фоновых заданий, публикацию реплики и шины инвалидации, дописываем очередь логов при остановке сервера
+@app.on_event("shutdown")
+def shutdown_event():
+    shutdown_jobs()
+    stop_replica_publisher()
+    sharding.stop_shard_buses()
+    invalidation_bus.stop()
+    shutdown_logging()
 
 # ================== МОДЕЛИ PYDANTIC ==================
 
@@ -384,8 +421,21 @@ class VFP(VFPBase):
     class Config:
         orm_mode = True
 
+# Сводка ЦКП по узлу оргструктуры (узел и все его потомки)
+class VFPRollup(BaseModel):
+    entity_type: str
+    entity_id: int
+    vfp_count: int
+    progress_avg: float
+    status_counts: Dict[str, int]
+
 # --- НОВЫЕ МОДЕЛИ ДЛЯ АУТЕНТИФИКАЦИИ --- 
 
+# Составной документ для списков с include=: строки списка и связанные записи по таблицам
+class CompoundDocument(BaseModel):
+    data: List[Dict[str, Any]]
+    included: Dict[str, List[Dict[str, Any]]] = {}
+
 class Token(BaseModel):
     """Модель ответа с JWT токеном."""
     access_token: str
@@ -425,13 +475,65 @@ class User(UserBase):
 
 # ================== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==================
 
+async def request_organization_id(request: Request) -> Optional[int]:
+    """
+    Организация, по которой запрос направляется в шард: параметр organization_id,
+    а для изменений - organization_id или primary_organization_id из тела запроса.
+    """
+    if not sharding.is_enabled():
+        return None
+    value = request.query_params.get("organization_id")
+    if value is None and request.method not in ("GET", "HEAD", "OPTIONS"):
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        if isinstance(body, dict):
+            value = body.get("organization_id") or body.get("primary_organization_id")
+    return int(value) if value is not None and str(value).isdigit() else None
+
 # Функция для получения соединения с базой данных
-def get_db():
+def get_db(request: Request, response: Response, organization_id: Optional[int] = Depends(request_organization_id)):
     """
     Возвращает соединение с базой данных для текущего запроса.
     SQLite не поддерживает многопоточность, поэтому устанавливаем check_same_thread=False
     и включаем режим WAL для улучшения конкурентного доступа.
+    В режиме шардирования запрос направляется в шард холдинга (заголовок X-OFS-Holding
+    или организация запроса), см. sharding.py.
     """
+    if sharding.is_enabled():
+        holding = request.headers.get(sharding.HOLDING_HEADER)
+        try:
+            conn, target = sharding.connect_for_request(
+                DB_PATH,
+                holding_id=int(holding) if holding else None,
+                organization_id=organization_id,
+                write=request.method not in ("GET", "HEAD", "OPTIONS"),
+            )
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Некорректный id холдинга в заголовке {sharding.HOLDING_HEADER}")
+        except sharding.ShardingError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        response.headers["X-OFS-Shard"] = target
+        try:
+            yield conn
+        except sqlite3.OperationalError as e:
+            # В шарде холдинга справочники - представления каталога только для чтения
+            if "because it is a view" in str(e):
+                raise HTTPException(status_code=400, detail="Справочники изменяются без указания холдинга (в каталоге)")
+            raise
+        except sqlite3.IntegrityError as e:
+            # Строка холдинга, перенесенного в шард, изменяется без холдинга
+            if sharding.SHARD_WRITE_ERROR in str(e):
+                raise HTTPException(status_code=409, detail=str(e))
+            # Копия строки каталога (ЦКП отдела или функции) изменяется в шарде
+            if sharding.SHARD_REFERENCE_ERROR in str(e):
+                raise HTTPException(status_code=400, detail=str(e))
+            raise
+        finally:
+            conn.close()
+        return
+
     conn = sqlite3.connect(DB_PATH, check_same_thread=False)
     conn.row_factory = sqlite3.Row  # Это позволит получать данные как словари
     conn.execute('PRAGMA journal_mode=WAL')  # Улучшает поддержку конкурентного доступа
@@ -541,6 +643,96 @@ def init_db():
             cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
             existing_tables = [row[0] for row in cursor.fetchall()]
             logger.info(f"Существующие таблицы: {', '.join(existing_tables)}")
+            
+            # Таблица ЦКП раньше создавалась отдельным скриптом update_vfp_schema.py
+            if "valuable_final_products" not in existing_tables:
+                logger.info("Таблица ЦКП не найдена. Создаем...")
+                cursor.executescript(VFP_SCHEMA)
+                conn.commit()
+            
+            # Досоздаем поисковые индексы для баз, созданных до их появления
+            if "staff_fts" not in existing_tables:
+                logger.info("Поисковые индексы не найдены. Создаем и заполняем...")
+                cursor.executescript(SEARCH_SCHEMA)
+                rebuild_search_index(conn)
+            
+            # Досоздаем журнал изменений и заносим в него существующие строки
+            if "change_log" not in existing_tables:
+                logger.info("Журнал изменений не найден. Создаем и заполняем...")
+                cursor.executescript(CHANGE_LOG_SCHEMA)
+                cursor.executescript(CHANGE_LOG_SEED_SQL)
+                conn.commit()
+            elif change_log_outdated(conn):
+                logger.info("Журнал изменений создан прежней схемой. Обновляем...")
+                upgrade_change_log(conn)
+            
+            # Досоздаем интервальные индексы для запросов на дату (as_of)
+            if "staff_positions_validity" not in existing_tables:
+                logger.info("Интервальные индексы не найдены. Создаем и заполняем...")
+                cursor.executescript(TEMPORAL_SCHEMA)
+                rebuild_validity_index(conn)
+            elif validity_index_outdated(conn):
+                logger.info("Интервальные индексы созданы прежней схемой. Перестраиваем...")
+                upgrade_validity_index(conn)
+            
+            # Досоздаем таблицы снимков оргструктуры
+            if "org_snapshots" not in existing_tables:
+                logger.info("Таблицы снимков оргструктуры не найдены. Создаем...")
+                cursor.executescript(SNAPSHOT_SCHEMA)
+                conn.commit()
+            
+            # Досоздаем версии таблиц для HTTP-кэширования (ETag)
+            if "table_versions" not in existing_tables:
+                logger.info("Версии таблиц не найдены. Создаем...")
+                cursor.executescript(TABLE_VERSION_SCHEMA)
+                conn.commit()
+            
+            # Триггеры прежней схемы увеличивали версии дважды на каждый UPDATE
+            if update_triggers_outdated(conn):
+                logger.info("Триггеры изменения строк созданы прежней схемой. Пересоздаем...")
+                upgrade_update_triggers(conn)
+            
+            # Досоздаем индексируемые столбцы метрик ЦКП и сводку ЦКП по оргструктуре
+            # (сводку дальше поддерживают только триггеры, чтение ее не пересчитывает)
+            add_metric_columns(conn)
+            if "vfp_rollup" not in existing_tables:
+                logger.info("Сводка ЦКП не найдена. Создаем и заполняем...")
+                install_vfp_rollup(conn)
+            elif vfp_rollup_outdated(conn):
+                logger.info("Сводка ЦКП создана прежней версией схемы. Пересоздаем...")
+                install_vfp_rollup(conn)
+            
+            # Досоздаем счетчики аналитики численности и заполняем их
+            if "headcount_cube" not in existing_tables:
+                logger.info("Счетчики аналитики не найдены. Создаем и заполняем...")
+                cursor.executescript(ANALYTICS_SCHEMA)
+                rebuild_analytics(conn)
+            # Триггер прежней версии счетчиков, который ничего не менял
+            cursor.execute("DROP TRIGGER IF EXISTS positions_headcount_insert")
+            conn.commit()
+            
+            # Досоздаем таблицу фоновых заданий
+            if "jobs" not in existing_tables:
+                logger.info("Таблица фоновых заданий не найдена. Создаем...")
+                cursor.executescript(JOBS_SCHEMA)
+                conn.commit()
+            
+            # Досоздаем каталог шардов (режим шардирования по холдингам)
+            if "shards" not in existing_tables:
+                logger.info("Каталог шардов не найден. Создаем...")
+                cursor.executescript(SHARD_CATALOG_SCHEMA)
+                conn.commit()
+            
+            # Задания, прерванные остановкой сервера, помечаем ошибочными; устаревшие удаляем
+            lost = recover_jobs(conn)
+            if lost:
+                logger.info(f"Прервано фоновых заданий: {lost}")
+            cleanup_expired_jobs(conn)
+            
+            # Сжимаем журнал изменений: убираем старые записи об удалениях
+            removed = compact_change_log(conn)
+            if removed:
+                logger.info(f"Из журнала изменений удалено записей: {removed}")
         except Exception as e:
             logger.error(f"Ошибка при проверке существующей базы данных: {str(e)}")
         finally:
@@ -635,12 +827,21 @@ async def read_users_me(current_user: User = Depends(get_current_active_user)):
 # --- КОНЕЦ НОВЫХ ЭНДПОИНТОВ АУТЕНТИФИКАЦИИ ---
 
 # API для организаций
-@app.get("/organizations/", response_model=List[Organization])
+@app.get("/organizations/", response_model=Union[List[Organization], CompoundDocument],
+         dependencies=[table_etag(get_db, "organizations", entity="organizations")])
 def read_organizations(
     org_type: Optional[OrgType] = None,
     parent_id: Optional[int] = None,
+    ids: Optional[str] = None,
+    include: Optional[str] = None,
     db: sqlite3.Connection = Depends(get_db)
 ):
+    """
+    Список организаций. ids=1,2,3 - выбрать организации по id;
+    include=parent,children,divisions - вернуть вместе со связанными записями.
+    """
+    id_list = parse_ids(ids)
+    include_list = parse_include("organizations", include)
     cursor = db.cursor()
     query = "SELECT * FROM organizations"
     params = []
@@ -659,9 +860,14 @@ def read_organizations(
             if parent_id != 0:
                 params.append(parent_id)
     
+    if id_list is not None:
+        condition, condition_params = ids_condition(id_list)
+        query += (" AND " if org_type or parent_id is not None else " WHERE ") + condition
+        params.extend(condition_params)
+    
     cursor.execute(query, params)
     rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+    return compound_document(db, "organizations", [dict(row) for row in rows], include_list)
 
 @app.post("/organizations/", response_model=Organization)
 def create_organization(organization: OrganizationCreate, db: sqlite3.Connection = Depends(get_db)):
@@ -707,6 +913,7 @@ def create_organization(organization: OrganizationCreate, db: sqlite3.Connection
             )
         )
         db.commit()
+        publish_change(db, "organizations", cursor.lastrowid, "insert")
     except sqlite3.IntegrityError as e:
         raise HTTPException(status_code=400, detail=f"Ошибка при создании организации: {str(e)}")
     
@@ -715,7 +922,7 @@ def create_organization(organization: OrganizationCreate, db: sqlite3.Connection
     cursor.execute("SELECT * FROM organizations WHERE id = ?", (new_id,))
     return dict(cursor.fetchone())
 
-@app.get("/organizations/{organization_id}", response_model=Organization)
+@app.get("/organizations/{organization_id}", response_model=Organization, dependencies=[table_etag(get_db, "organizations")])
 def read_organization(organization_id: int, db: sqlite3.Connection = Depends(get_db)):
     cursor = db.cursor()
     cursor.execute("SELECT * FROM organizations WHERE id = ?", (organization_id,))
@@ -780,6 +987,7 @@ def update_organization(
             )
         )
         db.commit()
+        publish_change(db, "organizations", organization_id, "update")
     except sqlite3.IntegrityError as e:
         raise HTTPException(status_code=400, detail=f"Ошибка при обновлении организации: {str(e)}")
     
@@ -793,7 +1001,8 @@ def delete_organization(organization_id: int, db: sqlite3.Connection = Depends(g
     
     # Проверяем существование организации
     cursor.execute("SELECT * FROM organizations WHERE id = ?", (organization_id,))
-    if not cursor.fetchone():
+    existing = cursor.fetchone()
+    if not existing:
         raise HTTPException(status_code=404, detail="Организация не найдена")
     
     # Проверяем, есть ли дочерние организации
@@ -808,16 +1017,26 @@ def delete_organization(organization_id: int, db: sqlite3.Connection = Depends(g
     # Удаляем организацию
     cursor.execute("DELETE FROM organizations WHERE id = ?", (organization_id,))
     db.commit()
+    publish_change(db, "organizations", organization_id, "delete", row=dict(existing))
     
     return {"message": f"Организация с ID {organization_id} успешно удалена"}
 
 # API для подразделений (Division)
-@app.get("/divisions/", response_model=List[Division])
+@app.get("/divisions/", response_model=Union[List[Division], CompoundDocument],
+         dependencies=[table_etag(get_db, "divisions", entity="divisions")])
 def read_divisions(
     organization_id: Optional[int] = None,
     parent_id: Optional[int] = None,
+    ids: Optional[str] = None,
+    include: Optional[str] = None,
     db: sqlite3.Connection = Depends(get_db)
 ):
+    """
+    Список подразделений. ids=1,2,3 - выбрать по id;
+    include=organization,parent,children,sections - вернуть вместе со связанными записями.
+    """
+    id_list = parse_ids(ids)
+    include_list = parse_include("divisions", include)
     cursor = db.cursor()
     query = "SELECT * FROM divisions"
     params = []
@@ -836,9 +1055,14 @@ def read_divisions(
             if parent_id != 0:
                 params.append(parent_id)
     
+    if id_list is not None:
+        condition, condition_params = ids_condition(id_list)
+        query += (" AND " if organization_id or parent_id is not None else " WHERE ") + condition
+        params.extend(condition_params)
+    
     cursor.execute(query, params)
     rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+    return compound_document(db, "divisions", [dict(row) for row in rows], include_list)
 
 @app.post("/divisions/", response_model=Division)
 def create_division(division: DivisionCreate, db: sqlite3.Connection = Depends(get_db)):
@@ -882,6 +1106,7 @@ def create_division(division: DivisionCreate, db: sqlite3.Connection = Depends(g
             )
         )
         db.commit()
+        publish_change(db, "divisions", cursor.lastrowid, "insert")
     except sqlite3.IntegrityError as e:
         raise HTTPException(status_code=400, detail=f"Ошибка при создании подразделения: {str(e)}")
     
@@ -890,7 +1115,7 @@ def create_division(division: DivisionCreate, db: sqlite3.Connection = Depends(g
     cursor.execute("SELECT * FROM divisions WHERE id = ?", (new_id,))
     return dict(cursor.fetchone())
 
-@app.get("/divisions/{division_id}", response_model=Division)
+@app.get("/divisions/{division_id}", response_model=Division, dependencies=[table_etag(get_db, "divisions")])
 def read_division(division_id: int, db: sqlite3.Connection = Depends(get_db)):
     cursor = db.cursor()
     cursor.execute("SELECT * FROM divisions WHERE id = ?", (division_id,))
@@ -954,6 +1179,7 @@ def update_division(
             )
         )
         db.commit()
+        publish_change(db, "divisions", division_id, "update")
     except sqlite3.IntegrityError as e:
         raise HTTPException(status_code=400, detail=f"Ошибка при обновлении подразделения: {str(e)}")
     
@@ -967,7 +1193,8 @@ def delete_division(division_id: int, db: sqlite3.Connection = Depends(get_db)):
     
     # Проверяем существование подразделения
     cursor.execute("SELECT * FROM divisions WHERE id = ?", (division_id,))
-    if not cursor.fetchone():
+    existing = cursor.fetchone()
+    if not existing:
         raise HTTPException(status_code=404, detail="Подразделение не найдено")
     
     # Проверяем, есть ли дочерние подразделения
@@ -985,16 +1212,32 @@ def delete_division(division_id: int, db: sqlite3.Connection = Depends(get_db)):
     # Удаляем подразделение
     cursor.execute("DELETE FROM divisions WHERE id = ?", (division_id,))
     db.commit()
+    publish_change(db, "divisions", division_id, "delete", row=dict(existing))
     
     return {"message": f"Подразделение с ID {division_id} успешно удалено"}
 
 # API для отделов (Section)
-@app.get("/sections/", response_model=List[Section])
-def read_sections(db: sqlite3.Connection = Depends(get_db)):
+@app.get("/sections/", response_model=Union[List[Section], CompoundDocument],
+         dependencies=[table_etag(get_db, "sections", entity="sections")])
+def read_sections(
+    ids: Optional[str] = None,
+    include: Optional[str] = None,
+    db: sqlite3.Connection = Depends(get_db)
+):
+    """ids=1,2,3 - выбрать по id; include=divisions,functions - вернуть вместе со связанными записями."""
+    id_list = parse_ids(ids)
+    include_list = parse_include("sections", include)
+    query = "SELECT * FROM sections"
+    params = []
+    
+    if id_list is not None:
+        condition, params = ids_condition(id_list)
+        query += f" WHERE {condition}"
+    
     cursor = db.cursor()
-    cursor.execute("SELECT * FROM sections")
+    cursor.execute(query, params)
     rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+    return compound_document(db, "sections", [dict(row) for row in rows], include_list)
 
 @app.post("/sections/", response_model=Section)
 def create_section(section: SectionCreate, db: sqlite3.Connection = Depends(get_db)):
@@ -1016,6 +1259,7 @@ def create_section(section: SectionCreate, db: sqlite3.Connection = Depends(get_
             )
         )
         db.commit()
+        publish_change(db, "sections", cursor.lastrowid, "insert")
     except sqlite3.IntegrityError as e:
         raise HTTPException(status_code=400, detail=f"Ошибка при создании отдела: {str(e)}")
     
@@ -1024,7 +1268,7 @@ def create_section(section: SectionCreate, db: sqlite3.Connection = Depends(get_
     cursor.execute("SELECT * FROM sections WHERE id = ?", (new_id,))
     return dict(cursor.fetchone())
 
-@app.get("/sections/{section_id}", response_model=Section)
+@app.get("/sections/{section_id}", response_model=Section, dependencies=[table_etag(get_db, "sections")])
 def read_section(section_id: int, db: sqlite3.Connection = Depends(get_db)):
     cursor = db.cursor()
     cursor.execute("SELECT * FROM sections WHERE id = ?", (section_id,))
@@ -1066,6 +1310,7 @@ def update_section(
             )
         )
         db.commit()
+        publish_change(db, "sections", section_id, "update")
     except sqlite3.IntegrityError as e:
         raise HTTPException(status_code=400, detail=f"Ошибка при обновлении отдела: {str(e)}")
     
@@ -1079,7 +1324,8 @@ def delete_section(section_id: int, db: sqlite3.Connection = Depends(get_db)):
     
     # Проверяем существование отдела
     cursor.execute("SELECT * FROM sections WHERE id = ?", (section_id,))
-    if not cursor.fetchone():
+    existing = cursor.fetchone()
+    if not existing:
         raise HTTPException(status_code=404, detail="Отдел не найден")
     
     # Удаляем связи с подразделениями
@@ -1091,16 +1337,23 @@ def delete_section(section_id: int, db: sqlite3.Connection = Depends(get_db)):
     # Удаляем отдел
     cursor.execute("DELETE FROM sections WHERE id = ?", (section_id,))
     db.commit()
+    publish_change(db, "sections", section_id, "delete", row=dict(existing))
     
     return {"message": f"Отдел с ID {section_id} успешно удален"}
 
 # API для связи Division-Section
-@app.get("/division-sections/", response_model=List[DivisionSection])
+@app.get("/division-sections/", response_model=Union[List[DivisionSection], CompoundDocument],
+         dependencies=[table_etag(get_db, "division_sections", entity="division_sections")])
 def read_division_sections(
     division_id: Optional[int] = None,
     section_id: Optional[int] = None,
+    ids: Optional[str] = None,
+    include: Optional[str] = None,
     db: sqlite3.Connection = Depends(get_db)
 ):
+    """ids=1,2,3 - выбрать по id; include=division,section - вернуть вместе со связанными записями."""
+    id_list = parse_ids(ids)
+    include_list = parse_include("division_sections", include)
     cursor = db.cursor()
     query = "SELECT * FROM division_sections"
     params = []
@@ -1118,9 +1371,14 @@ def read_division_sections(
             query += " section_id = ?"
             params.append(section_id)
     
+    if id_list is not None:
+        condition, condition_params = ids_condition(id_list)
+        query += (" AND " if params else " WHERE ") + condition
+        params.extend(condition_params)
+    
     cursor.execute(query, params)
     rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+    return compound_document(db, "division_sections", [dict(row) for row in rows], include_list)
 
 @app.post("/division-sections/", response_model=DivisionSection)
 def create_division_section(div_section: DivisionSectionCreate, db: sqlite3.Connection = Depends(get_db)):
@@ -1146,6 +1404,7 @@ def create_division_section(div_section: DivisionSectionCreate, db: sqlite3.Conn
             (div_section.division_id, div_section.section_id, 1 if div_section.is_primary else 0)
         )
         db.commit()
+        publish_change(db, "division_sections", cursor.lastrowid, "insert")
     except sqlite3.IntegrityError as e:
         raise HTTPException(status_code=400, detail=f"Ошибка при создании связи: {str(e)}")
     
@@ -1160,22 +1419,39 @@ def delete_division_section(id: int, db: sqlite3.Connection = Depends(get_db)):
     
     # Проверяем существование связи
     cursor.execute("SELECT * FROM division_sections WHERE id = ?", (id,))
-    if not cursor.fetchone():
+    existing = cursor.fetchone()
+    if not existing:
         raise HTTPException(status_code=404, detail="Связь не найдена")
     
     # Удаляем связь
     cursor.execute("DELETE FROM division_sections WHERE id = ?", (id,))
     db.commit()
+    publish_change(db, "division_sections", id, "delete", row=dict(existing))
     
     return {"message": f"Связь с ID {id} успешно удалена"}
 
 # API для функций (Function)
-@app.get("/functions/", response_model=List[Function])
-def read_functions(db: sqlite3.Connection = Depends(get_db)):
+@app.get("/functions/", response_model=Union[List[Function], CompoundDocument],
+         dependencies=[table_etag(get_db, "functions", entity="functions")])
+def read_functions(
+    ids: Optional[str] = None,
+    include: Optional[str] = None,
+    db: sqlite3.Connection = Depends(get_db)
+):
+    """ids=1,2,3 - выбрать по id; include=sections,positions - вернуть вместе со связанными записями."""
+    id_list = parse_ids(ids)
+    include_list = parse_include("functions", include)
+    query = "SELECT * FROM functions"
+    params = []
+    
+    if id_list is not None:
+        condition, params = ids_condition(id_list)
+        query += f" WHERE {condition}"
+    
     cursor = db.cursor()
-    cursor.execute("SELECT * FROM functions")
+    cursor.execute(query, params)
     rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+    return compound_document(db, "functions", [dict(row) for row in rows], include_list)
 
 @app.post("/functions/", response_model=Function)
 def create_function(function: FunctionCreate, db: sqlite3.Connection = Depends(get_db)):
@@ -1196,6 +1472,7 @@ def create_function(function: FunctionCreate, db: sqlite3.Connection = Depends(g
             )
         )
         db.commit()
+        publish_change(db, "functions", cursor.lastrowid, "insert")
     except sqlite3.IntegrityError as e:
         raise HTTPException(status_code=400, detail=f"Ошибка при создании функции: {str(e)}")
     
@@ -1204,7 +1481,7 @@ def create_function(function: FunctionCreate, db: sqlite3.Connection = Depends(g
     cursor.execute("SELECT * FROM functions WHERE id = ?", (new_id,))
     return dict(cursor.fetchone())
 
-@app.get("/functions/{function_id}", response_model=Function)
+@app.get("/functions/{function_id}", response_model=Function, dependencies=[table_etag(get_db, "functions")])
 def read_function(function_id: int, db: sqlite3.Connection = Depends(get_db)):
     cursor = db.cursor()
     cursor.execute("SELECT * FROM functions WHERE id = ?", (function_id,))
@@ -1245,6 +1522,7 @@ def update_function(
             )
         )
         db.commit()
+        publish_change(db, "functions", function_id, "update")
     except sqlite3.IntegrityError as e:
         raise HTTPException(status_code=400, detail=f"Ошибка при обновлении функции: {str(e)}")
     
@@ -1258,7 +1536,8 @@ def delete_function(function_id: int, db: sqlite3.Connection = Depends(get_db)):
     
     # Проверяем существование функции
     cursor.execute("SELECT * FROM functions WHERE id = ?", (function_id,))
-    if not cursor.fetchone():
+    existing = cursor.fetchone()
+    if not existing:
         raise HTTPException(status_code=404, detail="Функция не найдена")
     
     # Удаляем связи с отделами
@@ -1277,16 +1556,23 @@ def delete_function(function_id: int, db: sqlite3.Connection = Depends(get_db)):
     # Удаляем функцию
     cursor.execute("DELETE FROM functions WHERE id = ?", (function_id,))
     db.commit()
+    publish_change(db, "functions", function_id, "delete", row=dict(existing))
     
     return {"message": f"Функция с ID {function_id} успешно удалена"}
 
 # API для связи Section-Function
-@app.get("/section-functions/", response_model=List[SectionFunction])
+@app.get("/section-functions/", response_model=Union[List[SectionFunction], CompoundDocument],
+         dependencies=[table_etag(get_db, "section_functions", entity="section_functions")])
 def read_section_functions(
     section_id: Optional[int] = None,
     function_id: Optional[int] = None,
+    ids: Optional[str] = None,
+    include: Optional[str] = None,
     db: sqlite3.Connection = Depends(get_db)
 ):
+    """ids=1,2,3 - выбрать по id; include=section,function - вернуть вместе со связанными записями."""
+    id_list = parse_ids(ids)
+    include_list = parse_include("section_functions", include)
     cursor = db.cursor()
     query = "SELECT * FROM section_functions"
     params = []
@@ -1304,9 +1590,14 @@ def read_section_functions(
             query += " function_id = ?"
             params.append(function_id)
     
+    if id_list is not None:
+        condition, condition_params = ids_condition(id_list)
+        query += (" AND " if params else " WHERE ") + condition
+        params.extend(condition_params)
+    
     cursor.execute(query, params)
     rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+    return compound_document(db, "section_functions", [dict(row) for row in rows], include_list)
 
 @app.post("/section-functions/", response_model=SectionFunction)
 def create_section_function(section_function: SectionFunctionCreate, db: sqlite3.Connection = Depends(get_db)):
@@ -1332,6 +1623,7 @@ def create_section_function(section_function: SectionFunctionCreate, db: sqlite3
             (section_function.section_id, section_function.function_id, 1 if section_function.is_primary else 0)
         )
         db.commit()
+        publish_change(db, "section_functions", cursor.lastrowid, "insert")
     except sqlite3.IntegrityError as e:
         raise HTTPException(status_code=400, detail=f"Ошибка при создании связи: {str(e)}")
     
@@ -1346,28 +1638,45 @@ def delete_section_function(id: int, db: sqlite3.Connection = Depends(get_db)):
     
     # Проверяем существование связи
     cursor.execute("SELECT * FROM section_functions WHERE id = ?", (id,))
-    if not cursor.fetchone():
+    existing = cursor.fetchone()
+    if not existing:
         raise HTTPException(status_code=404, detail="Связь не найдена")
     
     # Удаляем связь
     cursor.execute("DELETE FROM section_functions WHERE id = ?", (id,))
     db.commit()
+    publish_change(db, "section_functions", id, "delete", row=dict(existing))
     
     return {"message": f"Связь с ID {id} успешно удалена"}
 
 # API для должностей (Position)
-@app.get("/positions/", response_model=List[Position])
+@app.get("/positions/", response_model=Union[List[Position], CompoundDocument],
+         dependencies=[table_etag(get_db, "positions", entity="positions")])
 def read_positions(
     function_id: Optional[int] = None,
+    ids: Optional[str] = None,
+    include: Optional[str] = None,
     db: sqlite3.Connection = Depends(get_db)
 ):
-    cursor = db.cursor()
+    """ids=1,2,3 - выбрать по id; include=function - вернуть вместе с функциями."""
+    id_list = parse_ids(ids)
+    include_list = parse_include("positions", include)
+    query = "SELECT * FROM positions WHERE 1=1"
+    params = []
+    
     if function_id:
-        cursor.execute("SELECT * FROM positions WHERE function_id = ?", (function_id,))
-    else:
-        cursor.execute("SELECT * FROM positions")
+        query += " AND function_id = ?"
+        params.append(function_id)
+    
+    if id_list is not None:
+        condition, condition_params = ids_condition(id_list)
+        query += f" AND {condition}"
+        params.extend(condition_params)
+    
+    cursor = db.cursor()
+    cursor.execute(query, params)
     rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+    return compound_document(db, "positions", [dict(row) for row in rows], include_list)
 
 @app.post("/positions/", response_model=Position)
 def create_position(position: PositionCreate, db: sqlite3.Connection = Depends(get_db)):
@@ -1395,6 +1704,7 @@ def create_position(position: PositionCreate, db: sqlite3.Connection = Depends(g
             )
         )
         db.commit()
+        publish_change(db, "positions", cursor.lastrowid, "insert")
     except sqlite3.IntegrityError as e:
         raise HTTPException(status_code=400, detail=f"Ошибка при создании должности: {str(e)}")
     
@@ -1403,7 +1713,7 @@ def create_position(position: PositionCreate, db: sqlite3.Connection = Depends(g
     cursor.execute("SELECT * FROM positions WHERE id = ?", (new_id,))
     return dict(cursor.fetchone())
 
-@app.get("/positions/{position_id}", response_model=Position)
+@app.get("/positions/{position_id}", response_model=Position, dependencies=[table_etag(get_db, "positions")])
 def read_position(position_id: int, db: sqlite3.Connection = Depends(get_db)):
     cursor = db.cursor()
     cursor.execute("SELECT * FROM positions WHERE id = ?", (position_id,))
@@ -1451,6 +1761,7 @@ def update_position(
             )
         )
         db.commit()
+        publish_change(db, "positions", position_id, "update")
     except sqlite3.IntegrityError as e:
         raise HTTPException(status_code=400, detail=f"Ошибка при обновлении должности: {str(e)}")
     
@@ -1464,7 +1775,8 @@ def delete_position(position_id: int, db: sqlite3.Connection = Depends(get_db)):
     
     # Проверяем существование должности
     cursor.execute("SELECT * FROM positions WHERE id = ?", (position_id,))
-    if not cursor.fetchone():
+    existing = cursor.fetchone()
+    if not existing:
         raise HTTPException(status_code=404, detail="Должность не найдена")
     
     # Проверяем, есть ли сотрудники на этой должности
@@ -1479,23 +1791,52 @@ def delete_position(position_id: int, db: sqlite3.Connection = Depends(get_db)):
     # Удаляем должность
     cursor.execute("DELETE FROM positions WHERE id = ?", (position_id,))
     db.commit()
+    publish_change(db, "positions", position_id, "delete", row=dict(existing))
     
     return {"message": f"Должность с ID {position_id} успешно удалена"}
 
 # API для сотрудников (Staff)
-@app.get("/staff/", response_model=List[Staff])
+@app.get("/staff/", response_model=Union[List[Staff], CompoundDocument],
+         dependencies=[table_etag(get_db, "staff", "staff_positions", entity="staff")])
 def read_staff(
     organization_id: Optional[int] = None,
     primary_organization_id: Optional[int] = None,
     is_active: Optional[bool] = None,
+    search: Optional[str] = None,
+    as_of: Optional[date] = None,
+    ids: Optional[str] = None,
+    include: Optional[str] = None,
     db: sqlite3.Connection = Depends(get_db)
 ):
     """
     Получить список сотрудников с возможностью фильтрации.
+    Параметр search ищет по ФИО, email и телефону (по началу слов).
+    Параметр as_of оставляет только сотрудников, занимавших должность на указанную дату.
+    Параметр ids=1,2,3 выбирает сотрудников по id, а include=positions,divisions,functions,locations,organization
+    возвращает их вместе со связанными записями (одним запросом на связь).
     """
+    id_list = parse_ids(ids)
+    include_list = parse_include("staff", include)
     query = "SELECT * FROM staff WHERE 1=1"
     params = []
     
+    if id_list is not None:
+        condition, condition_params = ids_condition(id_list)
+        query += f" AND {condition}"
+        params.extend(condition_params)
+    
+    if search:
+        match_query = build_match_query(search)
+        if match_query is None:
+            return compound_document(db, "staff", [], include_list)
+        query += " AND id IN (SELECT rowid FROM staff_fts WHERE staff_fts MATCH ?)"
+        params.append(match_query)
+    
+    if as_of is not None:
+        condition, condition_params = as_of_condition("staff_positions", as_of, alias="sp")
+        query += f" AND id IN (SELECT sp.staff_id FROM staff_positions sp WHERE {condition})"
+        params.extend(condition_params)
+    
     if organization_id is not None:
         query += " AND organization_id = ?"
         params.append(organization_id)
@@ -1528,7 +1869,7 @@ def read_staff(
             "updated_at": s["updated_at"]
         })
     
-    return result
+    return compound_document(db, "staff", result, include_list)
 
 @app.post("/staff/", response_model=Staff)
 def create_staff(staff: StaffCreate, db: sqlite3.Connection = Depends(get_db)):
@@ -1567,6 +1908,7 @@ def create_staff(staff: StaffCreate, db: sqlite3.Connection = Depends(get_db)):
         )
     )
     db.commit()
+    publish_change(db, "staff", cursor.lastrowid, "insert")
     
     # Получаем созданного сотрудника
     created_id = cursor.lastrowid
@@ -1588,6 +1930,57 @@ def create_staff(staff: StaffCreate, db: sqlite3.Connection = Depends(get_db)):
         "updated_at": created["updated_at"]
     }
 
+@app.get("/staff-positions/", response_model=Union[List[StaffPosition], CompoundDocument],
+         dependencies=[table_etag(get_db, "staff_positions", entity="staff_positions")])
+def read_staff_positions(
+    staff_id: Optional[int] = None,
+    position_id: Optional[int] = None,
+    division_id: Optional[int] = None,
+    is_active: Optional[bool] = None,
+    as_of: Optional[date] = None,
+    ids: Optional[str] = None,
+    include: Optional[str] = None,
+    db: sqlite3.Connection = Depends(get_db)
+):
+    """
+    Получить список назначений сотрудников на должности с возможностью фильтрации.
+    Параметр as_of оставляет только назначения, действовавшие на указанную дату.
+    Параметр ids=1,2,3 выбирает записи по id, include=staff,position,division,location - вместе со связанными записями.
+    """
+    id_list = parse_ids(ids)
+    include_list = parse_include("staff_positions", include)
+    query = "SELECT * FROM staff_positions WHERE 1=1"
+    params = []
+    
+    if id_list is not None:
+        condition, condition_params = ids_condition(id_list)
+        query += f" AND {condition}"
+        params.extend(condition_params)
+    
+    if staff_id is not None:
+        query += " AND staff_id = ?"
+        params.append(staff_id)
+    
+    if position_id is not None:
+        query += " AND position_id = ?"
+        params.append(position_id)
+    
+    if division_id is not None:
+        query += " AND division_id = ?"
+        params.append(division_id)
+    
+    if is_active is not None:
+        query += " AND is_active = ?"
+        params.append(1 if is_active else 0)
+    
+    if as_of is not None:
+        condition, condition_params = as_of_condition("staff_positions", as_of)
+        query += f" AND {condition}"
+        params.extend(condition_params)
+    
+    cursor = db.execute(query, params)
+    return compound_document(db, "staff_positions", [dict(row) for row in cursor.fetchall()], include_list)
+
 @app.post("/staff-positions/", response_model=StaffPosition)
 def create_staff_position(staff_position: StaffPositionCreate, db: sqlite3.Connection = Depends(get_db)):
     cursor = db.cursor()
@@ -1635,6 +2028,7 @@ def create_staff_position(staff_position: StaffPositionCreate, db: sqlite3.Conne
             )
         )
         db.commit()
+        publish_change(db, "staff_positions", cursor.lastrowid, "insert")
     except sqlite3.IntegrityError as e:
         raise HTTPException(status_code=400, detail=f"Ошибка при создании связи: {str(e)}")
     
@@ -1700,6 +2094,7 @@ def update_staff_position(
             )
         )
         db.commit()
+        publish_change(db, "staff_positions", id, "update")
     except sqlite3.IntegrityError as e:
         raise HTTPException(status_code=400, detail=f"Ошибка при обновлении связи: {str(e)}")
     
@@ -1713,29 +2108,44 @@ def delete_staff_position(id: int, db: sqlite3.Connection = Depends(get_db)):
     
     # Проверяем существование связи
     cursor.execute("SELECT * FROM staff_positions WHERE id = ?", (id,))
-    if not cursor.fetchone():
+    existing = cursor.fetchone()
+    if not existing:
         raise HTTPException(status_code=404, detail="Связь не найдена")
     
     # Удаляем связь
     cursor.execute("DELETE FROM staff_positions WHERE id = ?", (id,))
     db.commit()
+    publish_change(db, "staff_positions", id, "delete", row=dict(existing))
     
     return {"message": f"Связь с ID {id} успешно удалена"}
 
 # API для связи сотрудников и функций (Staff-Function)
-@app.get("/staff-functions/", response_model=List[StaffFunction])
+@app.get("/staff-functions/", response_model=Union[List[StaffFunction], CompoundDocument],
+         dependencies=[table_etag(get_db, "staff_functions", entity="staff_functions")])
 def read_staff_functions(
     staff_id: Optional[int] = None,
     function_id: Optional[int] = None,
     is_primary: Optional[bool] = None,
+    as_of: Optional[date] = None,
+    ids: Optional[str] = None,
+    include: Optional[str] = None,
     db: sqlite3.Connection = Depends(get_db)
 ):
     """
     Получить список связей сотрудников с функциями с возможностью фильтрации.
+    Параметр as_of оставляет только связи, действовавшие на указанную дату.
+    Параметр ids=1,2,3 выбирает записи по id, include=staff,function - вместе со связанными записями.
     """
+    id_list = parse_ids(ids)
+    include_list = parse_include("staff_functions", include)
     query = "SELECT * FROM staff_functions WHERE 1=1"
     params = []
     
+    if id_list is not None:
+        condition, condition_params = ids_condition(id_list)
+        query += f" AND {condition}"
+        params.extend(condition_params)
+    
     if staff_id is not None:
         query += " AND staff_id = ?"
         params.append(staff_id)
@@ -1748,6 +2158,11 @@ def read_staff_functions(
         query += " AND is_primary = ?"
         params.append(1 if is_primary else 0)
     
+    if as_of is not None:
+        condition, condition_params = as_of_condition("staff_functions", as_of)
+        query += f" AND {condition}"
+        params.extend(condition_params)
+    
     cursor = db.execute(query, params)
     staff_functions = cursor.fetchall()
     
@@ -1765,7 +2180,7 @@ def read_staff_functions(
             "updated_at": func["updated_at"]
         })
     
-    return result
+    return compound_document(db, "staff_functions", result, include_list)
 
 @app.post("/staff-functions/", response_model=StaffFunction)
 def create_staff_function(staff_function: StaffFunctionCreate, db: sqlite3.Connection = Depends(get_db)):
@@ -1808,6 +2223,7 @@ def create_staff_function(staff_function: StaffFunctionCreate, db: sqlite3.Conne
         )
     )
     db.commit()
+    publish_change(db, "staff_functions", cursor.lastrowid, "insert")
     
     # Получаем созданную запись
     created_id = cursor.lastrowid
@@ -1874,6 +2290,7 @@ def update_staff_function(
         )
     )
     db.commit()
+    publish_change(db, "staff_functions", id, "update")
     
     # Получаем обновленную запись
     cursor = db.execute("SELECT * FROM staff_functions WHERE id = ?", (id,))
@@ -1897,29 +2314,43 @@ def delete_staff_function(id: int, db: sqlite3.Connection = Depends(get_db)):
     
     # Проверяем существование связи
     cursor.execute("SELECT * FROM staff_functions WHERE id = ?", (id,))
-    if not cursor.fetchone():
+    existing = cursor.fetchone()
+    if not existing:
         raise HTTPException(status_code=404, detail="Связь не найдена")
     
     # Удаляем связь
     cursor.execute("DELETE FROM staff_functions WHERE id = ?", (id,))
     db.commit()
+    publish_change(db, "staff_functions", id, "delete", row=dict(existing))
     
     return {"message": f"Связь с ID {id} успешно удалена"}
 
 # API для функциональных отношений (FunctionalRelation)
-@app.get("/functional-relations/", response_model=List[FunctionalRelation])
+@app.get("/functional-relations/", response_model=Union[List[FunctionalRelation], CompoundDocument],
+         dependencies=[table_etag(get_db, "functional_relations", entity="functional_relations")])
 def read_functional_relations(
     manager_id: Optional[int] = None,
     subordinate_id: Optional[int] = None,
     relation_type: Optional[RelationType] = None,
     is_active: Optional[bool] = None,
+    as_of: Optional[date] = None,
+    ids: Optional[str] = None,
+    include: Optional[str] = None,
     db: sqlite3.Connection = Depends(get_db)
 ):
+    """ids=1,2,3 - выбрать по id; include=manager,subordinate - вернуть вместе с сотрудниками."""
+    id_list = parse_ids(ids)
+    include_list = parse_include("functional_relations", include)
     cursor = db.cursor()
     query = "SELECT * FROM functional_relations"
     params = []
     conditions = []
     
+    if id_list is not None:
+        condition, condition_params = ids_condition(id_list)
+        conditions.append(condition)
+        params.extend(condition_params)
+    
     if manager_id:
         conditions.append("manager_id = ?")
         params.append(manager_id)
@@ -1936,12 +2367,18 @@ def read_functional_relations(
         conditions.append("is_active = ?")
         params.append(1 if is_active else 0)
     
+    # Отношения, действовавшие на указанную дату
+    if as_of is not None:
+        condition, condition_params = as_of_condition("functional_relations", as_of)
+        conditions.append(condition)
+        params.extend(condition_params)
+    
     if conditions:
         query += " WHERE " + " AND ".join(conditions)
     
     cursor.execute(query, params)
     rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+    return compound_document(db, "functional_relations", [dict(row) for row in rows], include_list)
 
 @app.post("/functional-relations/", response_model=FunctionalRelation)
 def create_functional_relation(relation: FunctionalRelationCreate, db: sqlite3.Connection = Depends(get_db)):
@@ -1981,6 +2418,7 @@ def create_functional_relation(relation: FunctionalRelationCreate, db: sqlite3.C
             )
         )
         db.commit()
+        publish_change(db, "functional_relations", cursor.lastrowid, "insert")
     except sqlite3.IntegrityError as e:
         raise HTTPException(status_code=400, detail=f"Ошибка при создании отношения: {str(e)}")
     
@@ -1989,7 +2427,7 @@ def create_functional_relation(relation: FunctionalRelationCreate, db: sqlite3.C
     cursor.execute("SELECT * FROM functional_relations WHERE id = ?", (new_id,))
     return dict(cursor.fetchone())
 
-@app.get("/functional-relations/{id}", response_model=FunctionalRelation)
+@app.get("/functional-relations/{id}", response_model=FunctionalRelation, dependencies=[table_etag(get_db, "functional_relations")])
 def read_functional_relation(id: int, db: sqlite3.Connection = Depends(get_db)):
     cursor = db.cursor()
     cursor.execute("SELECT * FROM functional_relations WHERE id = ?", (id,))
@@ -2006,12 +2444,14 @@ def delete_functional_relation(id: int, db: sqlite3.Connection = Depends(get_db)
     
     # Проверяем существование отношения
     cursor.execute("SELECT * FROM functional_relations WHERE id = ?", (id,))
-    if not cursor.fetchone():
+    existing = cursor.fetchone()
+    if not existing:
         raise HTTPException(status_code=404, detail="Отношение не найдено")
     
     # Удаляем отношение
     cursor.execute("DELETE FROM functional_relations WHERE id = ?", (id,))
     db.commit()
+    publish_change(db, "functional_relations", id, "delete", row=dict(existing))
     
     return {"message": f"Отношение с ID {id} успешно удалено"}
 
@@ -2032,19 +2472,32 @@ if has_org_structure_router:
 
 # ================== STAFF LOCATIONS ENDPOINTS ==================
 
-@app.get("/staff-locations/", response_model=List[StaffLocation])
+@app.get("/staff-locations/", response_model=Union[List[StaffLocation], CompoundDocument],
+         dependencies=[table_etag(get_db, "staff_locations", entity="staff_locations")])
 def read_staff_locations(
     staff_id: Optional[int] = None,
     location_id: Optional[int] = None,
     is_current: Optional[bool] = None,
+    as_of: Optional[date] = None,
+    ids: Optional[str] = None,
+    include: Optional[str] = None,
     db: sqlite3.Connection = Depends(get_db)
 ):
     """
     Получить список связей сотрудников с локациями с возможностью фильтрации.
+    Параметр as_of оставляет только связи, действовавшие на указанную дату.
+    Параметр ids=1,2,3 выбирает записи по id, include=staff,location - вместе со связанными записями.
     """
+    id_list = parse_ids(ids)
+    include_list = parse_include("staff_locations", include)
     query = "SELECT * FROM staff_locations WHERE 1=1"
     params = []
     
+    if id_list is not None:
+        condition, condition_params = ids_condition(id_list)
+        query += f" AND {condition}"
+        params.extend(condition_params)
+    
     if staff_id is not None:
         query += " AND staff_id = ?"
         params.append(staff_id)
@@ -2057,6 +2510,11 @@ def read_staff_locations(
         query += " AND is_current = ?"
         params.append(1 if is_current else 0)
     
+    if as_of is not None:
+        condition, condition_params = as_of_condition("staff_locations", as_of)
+        query += f" AND {condition}"
+        params.extend(condition_params)
+    
     cursor = db.execute(query, params)
     staff_locations = cursor.fetchall()
     
@@ -2073,7 +2531,7 @@ def read_staff_locations(
             "updated_at": loc["updated_at"]
         })
     
-    return result
+    return compound_document(db, "staff_locations", result, include_list)
 
 @app.post("/staff-locations/", response_model=StaffLocation)
 def create_staff_location(staff_location: StaffLocationCreate, db: sqlite3.Connection = Depends(get_db)):
@@ -2123,6 +2581,7 @@ def create_staff_location(staff_location: StaffLocationCreate, db: sqlite3.Conne
         )
     )
     db.commit()
+    publish_change(db, "staff_locations", cursor.lastrowid, "insert")
     
     # Получаем созданную запись
     created_id = cursor.lastrowid
@@ -2198,6 +2657,7 @@ def update_staff_location(
         )
     )
     db.commit()
+    publish_change(db, "staff_locations", id, "update")
     
     # Получаем обновленную запись
     cursor = db.execute("SELECT * FROM staff_locations WHERE id = ?", (id,))
@@ -2220,16 +2680,18 @@ def delete_staff_location(id: int, db: sqlite3.Connection = Depends(get_db)):
     Удалить связь сотрудника с локацией.
     """
     # Проверяем, что запись существует
-    cursor = db.execute("SELECT id FROM staff_locations WHERE id = ?", (id,))
-    if not cursor.fetchone():
+    cursor = db.execute("SELECT * FROM staff_locations WHERE id = ?", (id,))
+    existing = cursor.fetchone()
+    if not existing:
         raise HTTPException(status_code=404, detail=f"Связь локации с ID {id} не найдена")
     
     db.execute("DELETE FROM staff_locations WHERE id = ?", (id,))
     db.commit()
+    publish_change(db, "staff_locations", id, "delete", row=dict(existing))
     
     return {"message": f"Связь локации с ID {id} успешно удалена"}
 
-@app.get("/staff/{staff_id}", response_model=Staff)
+@app.get("/staff/{staff_id}", response_model=Staff, dependencies=[table_etag(get_db, "staff")])
 def read_staff_member(staff_id: int, db: sqlite3.Connection = Depends(get_db)):
     """
     Получить данные конкретного сотрудника по ID.
@@ -2298,6 +2760,7 @@ def update_staff(staff_id: int, staff: StaffCreate, db: sqlite3.Connection = Dep
         )
     )
     db.commit()
+    publish_change(db, "staff", staff_id, "update")
     
     # Получаем обновленного сотрудника
     cursor = db.execute("SELECT * FROM staff WHERE id = ?", (staff_id,))
@@ -2324,8 +2787,9 @@ def delete_staff(staff_id: int, db: sqlite3.Connection = Depends(get_db)):
     Удалить сотрудника и все связанные записи.
     """
     # Проверяем, что сотрудник существует
-    cursor = db.execute("SELECT id FROM staff WHERE id = ?", (staff_id,))
-    if not cursor.fetchone():
+    cursor = db.execute("SELECT * FROM staff WHERE id = ?", (staff_id,))
+    existing = cursor.fetchone()
+    if not existing:
         raise HTTPException(status_code=404, detail=f"Сотрудник с ID {staff_id} не найден")
     
     # Удаляем все связанные записи
@@ -2344,6 +2808,7 @@ def delete_staff(staff_id: int, db: sqlite3.Connection = Depends(get_db)):
     # 5. Удаляем самого сотрудника
     db.execute("DELETE FROM staff WHERE id = ?", (staff_id,))
     db.commit()
+    publish_change(db, "staff", staff_id, "delete", row=dict(existing))
     
     return {"message": f"Сотрудник с ID {staff_id} и все связанные записи успешно удалены"}
 
@@ -2381,6 +2846,15 @@ def get_db_info():
         "table_stats": table_stats
     }
 
+# Состояние очереди логирования
+@app.get("/logging-stats")
+def read_logging_stats():
+    """
+    Возвращает число записей в очереди логирования, ее емкость и число
+    отброшенных из-за переполнения записей
+    """
+    return get_logging_stats()
+
 # Эндпоинты для ЦКП
 @app.post("/vfp/", response_model=VFP)
 def create_vfp(vfp: VFPCreate, db: sqlite3.Connection = Depends(get_db)):
@@ -2397,6 +2871,7 @@ def create_vfp(vfp: VFPCreate, db: sqlite3.Connection = Depends(get_db)):
         vfp.status, vfp.progress, vfp.start_date, vfp.target_date, vfp.is_active
     ))
     db.commit()
+    publish_change(db, "vfp", cursor.lastrowid, "insert")
     
     vfp_id = cursor.lastrowid
     cursor.execute("SELECT * FROM valuable_final_products WHERE id = ?", (vfp_id,))
@@ -2418,7 +2893,21 @@ def create_vfp(vfp: VFPCreate, db: sqlite3.Connection = Depends(get_db)):
         "updated_at": row[12]
     }
 
-@app.get("/vfp/{vfp_id}", response_model=VFP)
+@app.get("/vfp/rollup", response_model=List[VFPRollup], dependencies=[table_etag(
+    get_db, "valuable_final_products", "organizations", "divisions", "division_sections", "section_functions"
+)])
+def vfp_rollup(
+    entity_type: Optional[str] = None,
+    entity_id: Optional[int] = None,
+    db: sqlite3.Connection = Depends(get_db)
+):
+    """
+    Сводка ЦКП по узлам оргструктуры: число активных ЦКП узла и всех его потомков,
+    средний прогресс и число ЦКП в каждом статусе.
+    """
+    return get_vfp_rollup(db, entity_type, entity_id)
+
+@app.get("/vfp/{vfp_id}", response_model=VFP, dependencies=[table_etag(get_db, "valuable_final_products")])
 def get_vfp(vfp_id: int, db: sqlite3.Connection = Depends(get_db)):
     cursor = db.cursor()
     cursor.execute("SELECT * FROM valuable_final_products WHERE id = ?", (vfp_id,))
@@ -2443,17 +2932,34 @@ def get_vfp(vfp_id: int, db: sqlite3.Connection = Depends(get_db)):
         "updated_at": row[12]
     }
 
-@app.get("/vfp/", response_model=List[VFP])
+@app.get("/vfp/", response_model=Union[List[VFP], CompoundDocument],
+         dependencies=[table_etag(get_db, "valuable_final_products", entity="valuable_final_products")])
 def list_vfps(
     entity_type: Optional[str] = None,
     entity_id: Optional[int] = None,
     status: Optional[str] = None,
+    ids: Optional[str] = None,
+    include: Optional[str] = None,
+    kpi: Optional[str] = None,
+    unit: Optional[str] = None,
+    target_min: Optional[float] = None,
+    target_max: Optional[float] = None,
+    actual_min: Optional[float] = None,
+    actual_max: Optional[float] = None,
     db: sqlite3.Connection = Depends(get_db)
 ):
+    """ids=1,2,3 - выбрать по id; include=organization,division,section,function - вернуть вместе с узлами ЦКП."""
+    id_list = parse_ids(ids)
+    include_list = parse_include("valuable_final_products", include)
     cursor = db.cursor()
     query = "SELECT * FROM valuable_final_products WHERE 1=1"
     params = []
     
+    if id_list is not None:
+        condition, condition_params = ids_condition(id_list)
+        query += f" AND {condition}"
+        params.extend(condition_params)
+    
     if entity_type:
         query += " AND entity_type = ?"
         params.append(entity_type)
@@ -2464,10 +2970,27 @@ def list_vfps(
         query += " AND status = ?"
         params.append(status)
     
+    # Фильтры по метрикам идут по генерируемым столбцам и их индексам
+    if kpi:
+        query += " AND metric_kpi = ?"
+        params.append(kpi)
+    if unit:
+        query += " AND metric_unit = ?"
+        params.append(unit)
+    for column, operator, value in (
+        ("metric_target", ">=", target_min),
+        ("metric_target", "<=", target_max),
+        ("metric_actual", ">=", actual_min),
+        ("metric_actual", "<=", actual_max),
+    ):
+        if value is not None:
+            query += f" AND {column} {operator} ?"
+            params.append(value)
+    
     cursor.execute(query, params)
     rows = cursor.fetchall()
     
-    return [{
+    return compound_document(db, "valuable_final_products", [{
         "id": row[0],
         "entity_type": row[1],
         "entity_id": row[2],
@@ -2481,7 +3004,7 @@ def list_vfps(
         "is_active": bool(row[10]),
         "created_at": row[11],
         "updated_at": row[12]
-    } for row in rows]
+    } for row in rows], include_list)
 
 @app.put("/vfp/{vfp_id}", response_model=VFP)
 def update_vfp(vfp_id: int, vfp: VFPBase, db: sqlite3.Connection = Depends(get_db)):
@@ -2499,8 +3022,7 @@ def update_vfp(vfp_id: int, vfp: VFPBase, db: sqlite3.Connection = Depends(get_d
             progress = ?,
             start_date = ?,
             target_date = ?,
-            is_active = ?,
-            updated_at = datetime('now')
+            is_active = ?
         WHERE id = ?
     """, (
         vfp.name,
@@ -2514,6 +3036,7 @@ def update_vfp(vfp_id: int, vfp: VFPBase, db: sqlite3.Connection = Depends(get_d
         vfp_id
     ))
     db.commit()
+    publish_change(db, "vfp", vfp_id, "update")
     
     cursor.execute("SELECT * FROM valuable_final_products WHERE id = ?", (vfp_id,))
     row = cursor.fetchone()
@@ -2537,12 +3060,14 @@ def update_vfp(vfp_id: int, vfp: VFPBase, db: sqlite3.Connection = Depends(get_d
 @app.delete("/vfp/{vfp_id}")
 def delete_vfp(vfp_id: int, db: sqlite3.Connection = Depends(get_db)):
     cursor = db.cursor()
-    cursor.execute("SELECT id FROM valuable_final_products WHERE id = ?", (vfp_id,))
-    if not cursor.fetchone():
+    cursor.execute("SELECT * FROM valuable_final_products WHERE id = ?", (vfp_id,))
+    existing = cursor.fetchone()
+    if not existing:
         raise HTTPException(status_code=404, detail="ЦКП не найден")
     
     cursor.execute("DELETE FROM valuable_final_products WHERE id = ?", (vfp_id,))
     db.commit()
+    publish_change(db, "vfp", vfp_id, "delete", row=dict(existing))
     
     return {"message": "ЦКП успешно удален"}
 
@@ -2551,6 +3076,27 @@ def delete_vfp(vfp_id: int, db: sqlite3.Connection = Depends(get_db)):
 # Подключаем роутер аутентификации
 app.include_router(auth_router)
 
+# Подключаем роутер полнотекстового поиска
+app.include_router(search_router)
+
+# Подключаем роутер журнала изменений
+app.include_router(changes_router)
+
+# Подключаем поток событий об изменениях (SSE)
+app.include_router(events_router)
+
+# Подключаем снимки оргструктуры и сравнение между ними
+app.include_router(snapshots_router)
+
+# Подключаем аналитику численности и охвата управления
+app.include_router(analytics_router)
+
+# Подключаем выгрузку оргструктуры в Excel и CSV
+app.include_router(export_router)
+
+# Подключаем фоновые задания (выгрузки и отчеты в пуле процессов)
+app.include_router(jobs_router)
+
 # Подключаем роутер организационной структуры, если он найден
 if has_org_structure_router:
     app.include_router(org_structure_router, prefix="/org-structure")
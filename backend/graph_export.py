@@ -0,0 +1,261 @@
+"""
+Граф оргструктуры для инструментов анализа графов: организации, подразделения,
+сотрудники и связи между ними (иерархия, назначения, функциональные отношения).
+
+Узлы и ребра читаются несколькими потоковыми запросами по всей выборке, без
+запросов на отдельный узел. Область выгрузки (поддерево) отбирается один раз во
+временные таблицы graph_*, поэтому ребра всегда ссылаются на выгруженные узлы.
+
+Форматы: GraphML, DOT (Graphviz) и node-link JSON (формат networkx node_link_data).
+Id узла - "<тип>:<id>", например "division:12".
+"""
+
+import json
+import sqlite3
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+# Атрибуты узлов и ребер: имя -> тип GraphML
+NODE_ATTRIBUTES = {
+    "kind": "string",  # organization, division, staff
+    "name": "string",
+    "code": "string",
+    "org_type": "string",
+    "email": "string",
+}
+EDGE_ATTRIBUTES = {
+    "kind": "string",  # parent, assignment, relation
+    "relation_type": "string",
+    "position": "string",
+    "is_primary": "boolean",
+    "description": "string",
+}
+
+# Корни поддерева, доступные для выгрузки
+GRAPH_ROOTS = {
+    "organization": "organizations",
+    "division": "divisions",
+}
+
+Node = Tuple[str, Dict[str, Any]]
+Edge = Tuple[str, str, Dict[str, Any]]
+
+
+def select_scope(db: sqlite3.Connection, root_type: Optional[str] = None, root_id: Optional[int] = None):
+    """
+    Заполняет temp.graph_organizations, temp.graph_divisions и temp.graph_staff
+    узлами выгрузки: весь граф или поддерево организации/подразделения.
+    """
+    for table in ("graph_organizations", "graph_divisions", "graph_staff"):
+        db.execute(f"CREATE TEMP TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY)")
+        db.execute(f"DELETE FROM temp.{table}")
+
+    if root_type is None:
+        db.execute("INSERT INTO temp.graph_organizations SELECT id FROM organizations WHERE is_active = 1")
+        db.execute("INSERT INTO temp.graph_divisions SELECT id FROM divisions WHERE is_active = 1")
+    elif root_type == "organization":
+        db.execute("""
+            INSERT INTO temp.graph_organizations
+            WITH RECURSIVE subtree(id) AS (
+                SELECT ?
+                UNION
+                SELECT o.id FROM organizations o JOIN subtree ON o.parent_id = subtree.id WHERE o.is_active = 1
+            )
+            SELECT id FROM subtree
+        """, (root_id,))
+        db.execute("""
+            INSERT INTO temp.graph_divisions
+            SELECT d.id FROM divisions d JOIN temp.graph_organizations o ON o.id = d.organization_id
+            WHERE d.is_active = 1
+        """)
+    else:
+        db.execute("""
+            INSERT INTO temp.graph_divisions
+            WITH RECURSIVE subtree(id) AS (
+                SELECT ?
+                UNION
+                SELECT d.id FROM divisions d JOIN subtree ON d.parent_id = subtree.id WHERE d.is_active = 1
+            )
+            SELECT id FROM subtree
+        """, (root_id,))
+
+    # Сотрудники: с активным назначением в подразделения выгрузки, а при выгрузке
+    # организаций - и сотрудники этих юрлиц без подразделения
+    staff_condition = """
+        s.id IN (
+            SELECT sp.staff_id FROM staff_positions sp JOIN temp.graph_divisions d ON d.id = sp.division_id
+            WHERE sp.is_active = 1
+        )
+        OR s.organization_id IN (SELECT id FROM temp.graph_organizations)
+    """
+    if root_type is None:
+        staff_condition = "1"
+    db.execute(f"INSERT INTO temp.graph_staff SELECT s.id FROM staff s WHERE s.is_active = 1 AND ({staff_condition})")
+
+
+def _attributes(row: sqlite3.Row, **values) -> Dict[str, Any]:
+    attributes = dict(values)
+    for key in row.keys():
+        if key != "id" and row[key] is not None:
+            attributes[key] = row[key]
+    return attributes
+
+
+def iter_nodes(db: sqlite3.Connection) -> Iterator[Node]:
+    """Узлы выгрузки, выбранной select_scope."""
+    for row in db.execute("""
+        SELECT o.id, o.name, o.code, o.org_type FROM organizations o
+        JOIN temp.graph_organizations t ON t.id = o.id ORDER BY o.id
+    """):
+        yield f"organization:{row['id']}", _attributes(row, kind="organization")
+    for row in db.execute("""
+        SELECT d.id, d.name, d.code FROM divisions d
+        JOIN temp.graph_divisions t ON t.id = d.id ORDER BY d.id
+    """):
+        yield f"division:{row['id']}", _attributes(row, kind="division")
+    for row in db.execute("""
+        SELECT s.id, trim(s.last_name || ' ' || s.first_name || ' ' || coalesce(s.middle_name, '')) AS name, s.email
+        FROM staff s JOIN temp.graph_staff t ON t.id = s.id ORDER BY s.id
+    """):
+        yield f"staff:{row['id']}", _attributes(row, kind="staff")
+
+
+def iter_edges(db: sqlite3.Connection, relation_types: Optional[List[str]] = None) -> Iterator[Edge]:
+    """Ребра между узлами выгрузки; relation_types ограничивает функциональные отношения."""
+    for row in db.execute("""
+        SELECT o.id, o.parent_id FROM organizations o
+        JOIN temp.graph_organizations t ON t.id = o.id
+        WHERE o.parent_id IN (SELECT id FROM temp.graph_organizations)
+    """):
+        yield f"organization:{row['parent_id']}", f"organization:{row['id']}", {"kind": "parent"}
+
+    # Подразделение подчинено родительскому подразделению, а верхнее - своей организации
+    for row in db.execute("""
+        SELECT d.id,
+               CASE WHEN d.parent_id IN (SELECT id FROM temp.graph_divisions)
+                    THEN 'division:' || d.parent_id
+                    WHEN d.organization_id IN (SELECT id FROM temp.graph_organizations)
+                    THEN 'organization:' || d.organization_id
+               END AS parent
+        FROM divisions d JOIN temp.graph_divisions t ON t.id = d.id
+    """):
+        if row["parent"]:
+            yield row["parent"], f"division:{row['id']}", {"kind": "parent"}
+
+    for row in db.execute("""
+        SELECT sp.staff_id, sp.division_id, p.name AS position, sp.is_primary
+        FROM staff_positions sp
+        JOIN temp.graph_staff s ON s.id = sp.staff_id
+        JOIN temp.graph_divisions d ON d.id = sp.division_id
+        LEFT JOIN positions p ON p.id = sp.position_id
+        WHERE sp.is_active = 1
+    """):
+        attributes = {"kind": "assignment", "is_primary": bool(row["is_primary"])}
+        if row["position"]:
+            attributes["position"] = row["position"]
+        yield f"staff:{row['staff_id']}", f"division:{row['division_id']}", attributes
+
+    # Сотрудник без назначения в подразделения выгрузки привязан к своему юрлицу
+    for row in db.execute("""
+        SELECT s.id, s.organization_id FROM staff s
+        JOIN temp.graph_staff t ON t.id = s.id
+        WHERE s.organization_id IN (SELECT id FROM temp.graph_organizations)
+          AND NOT EXISTS (
+              SELECT 1 FROM staff_positions sp JOIN temp.graph_divisions d ON d.id = sp.division_id
+              WHERE sp.staff_id = s.id AND sp.is_active = 1
+          )
+    """):
+        yield f"staff:{row['id']}", f"organization:{row['organization_id']}", {"kind": "assignment"}
+
+    query = """
+        SELECT fr.manager_id, fr.subordinate_id, fr.relation_type, fr.description
+        FROM functional_relations fr
+        JOIN temp.graph_staff m ON m.id = fr.manager_id
+        JOIN temp.graph_staff s ON s.id = fr.subordinate_id
+        WHERE fr.is_active = 1
+    """
+    params: List[Any] = []
+    if relation_types:
+        query += f" AND fr.relation_type IN ({', '.join('?' for _ in relation_types)})"
+        params.extend(relation_types)
+    for row in db.execute(query, params):
+        attributes = {"kind": "relation", "relation_type": row["relation_type"]}
+        if row["description"]:
+            attributes["description"] = row["description"]
+        yield f"staff:{row['manager_id']}", f"staff:{row['subordinate_id']}", attributes
+
+
+# ================== ФОРМАТЫ ==================
+
+def _graphml_value(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return escape(str(value))
+
+
+def graphml_lines(db: sqlite3.Connection, relation_types: Optional[List[str]] = None) -> Iterator[str]:
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield ('<graphml xmlns="http://graphml.graphdrawing.org/xmlns" '
+           'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+           'xsi:schemaLocation="http://graphml.graphdrawing.org/xmlns '
+           'http://graphml.graphdrawing.org/xmlns/1.0/graphml.xsd">\n')
+    for scope, attributes in (("node", NODE_ATTRIBUTES), ("edge", EDGE_ATTRIBUTES)):
+        for name, attr_type in attributes.items():
+            yield f'  <key id="{scope[0]}_{name}" for="{scope}" attr.name="{name}" attr.type="{attr_type}"/>\n'
+    yield '  <graph id="ofs" edgedefault="directed">\n'
+    for node_id, attributes in iter_nodes(db):
+        data = "".join(f'<data key="n_{key}">{_graphml_value(value)}</data>' for key, value in attributes.items())
+        yield f'    <node id={quoteattr(node_id)}>{data}</node>\n'
+    for source, target, attributes in iter_edges(db, relation_types):
+        data = "".join(f'<data key="e_{key}">{_graphml_value(value)}</data>' for key, value in attributes.items())
+        yield f'    <edge source={quoteattr(source)} target={quoteattr(target)}>{data}</edge>\n'
+    yield '  </graph>\n</graphml>\n'
+
+
+def _dot_id(value: Any) -> str:
+    text = str(value).lower() if isinstance(value, bool) else str(value)
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+
+
+def _dot_attributes(attributes: Dict[str, Any]) -> str:
+    return ", ".join(f"{key}={_dot_id(value)}" for key, value in attributes.items())
+
+
+# Оформление Graphviz по типу узла и ребра
+DOT_NODE_STYLE = {
+    "organization": {"shape": "box", "style": "bold"},
+    "division": {"shape": "box"},
+    "staff": {"shape": "ellipse"},
+}
+DOT_EDGE_STYLE = {
+    "parent": {},
+    "assignment": {"style": "dotted"},
+    "relation": {"style": "dashed"},
+}
+
+
+def dot_lines(db: sqlite3.Connection, relation_types: Optional[List[str]] = None) -> Iterator[str]:
+    yield "digraph ofs {\n"
+    for node_id, attributes in iter_nodes(db):
+        style = {"label": attributes["name"], **DOT_NODE_STYLE[attributes["kind"]], **attributes}
+        yield f"  {_dot_id(node_id)} [{_dot_attributes(style)}];\n"
+    for source, target, attributes in iter_edges(db, relation_types):
+        style = {**DOT_EDGE_STYLE[attributes["kind"]], **attributes}
+        if attributes["kind"] == "relation":
+            style["label"] = attributes["relation_type"]
+        yield f"  {_dot_id(source)} -> {_dot_id(target)} [{_dot_attributes(style)}];\n"
+    yield "}\n"
+
+
+def node_link_lines(db: sqlite3.Connection, relation_types: Optional[List[str]] = None) -> Iterator[str]:
+    yield '{"directed": true, "multigraph": true, "graph": {"name": "ofs"}, "nodes": ['
+    separator = "\n"
+    for node_id, attributes in iter_nodes(db):
+        yield separator + json.dumps({"id": node_id, **attributes}, ensure_ascii=False)
+        separator = ",\n"
+    yield '\n], "links": ['
+    separator = "\n"
+    for source, target, attributes in iter_edges(db, relation_types):
+        yield separator + json.dumps({"source": source, "target": target, **attributes}, ensure_ascii=False)
+        separator = ",\n"
+    yield "\n]}\n"
@@ -0,0 +1,95 @@
+"""
+HTTP-кэширование GET-ответов по версиям таблиц.
+
+Версия таблицы (table_versions) увеличивается триггерами при любом изменении
+строк. ETag ответа строится из URL и версий таблиц, которые читает эндпоинт,
+поэтому проверка If-None-Match стоит одного чтения table_versions по первичному
+ключу и выполняется до запросов самого эндпоинта: совпадение сразу дает 304.
+
+Подключение к эндпоинту:
+
+    @router.get("/items/", dependencies=[table_etag(get_db, "items", "item_tags")])
+"""
+
+import hashlib
+import sqlite3
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi import Depends, HTTPException, Request, Response
+
+from includes import include_tables
+
+# Клиент всегда перепроверяет ответ, но при совпадении ETag получает пустой 304
+CACHE_CONTROL = "no-cache"
+
+
+def get_table_versions(db: sqlite3.Connection, tables: Tuple[str, ...]) -> Tuple[Dict[str, int], Optional[str]]:
+    """Возвращает версии таблиц и время последнего изменения любой из них."""
+    placeholders = ", ".join("?" for _ in tables)
+    rows = db.execute(
+        f"SELECT table_name, version, updated_at FROM table_versions WHERE table_name IN ({placeholders})",
+        tables,
+    ).fetchall()
+    versions = {row[0]: row[1] for row in rows}
+    updated = [row[2] for row in rows if row[2]]
+    return versions, max(updated) if updated else None
+
+
+def make_etag(request: Request, versions: Dict[str, int]) -> str:
+    """Сильный ETag: хеш пути, нормализованных параметров запроса и версий таблиц."""
+    query = "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+    state = ";".join(f"{table}={versions[table]}" for table in sorted(versions))
+    digest = hashlib.blake2b(f"{request.url.path}?{query}|{state}".encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Проверка If-None-Match (слабое сравнение, как требует RFC 9110)."""
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def http_date(timestamp: str) -> str:
+    """Переводит CURRENT_TIMESTAMP SQLite (UTC) в формат заголовка Last-Modified."""
+    moment = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    return format_datetime(moment, usegmt=True)
+
+
+def conditional_get(get_db: Callable, *tables: str, entity: Optional[str] = None) -> Callable:
+    """
+    Создает зависимость, которая ставит ETag/Last-Modified и отвечает 304 на совпавший If-None-Match.
+    entity - таблица списка с include= (см. includes.py): к tables добавляются таблицы запрошенных связей.
+    Зависимость возвращает заголовки кэширования - эндпоинт, который сам создает Response
+    (например, StreamingResponse), передает их в ответ явно.
+    """
+
+    def check_etag(request: Request, response: Response, db: sqlite3.Connection = Depends(get_db)):
+        read_tables = tables
+        if entity is not None:
+            read_tables = tuple(dict.fromkeys(tables + include_tables(entity, request.query_params.get("include"))))
+        versions, updated_at = get_table_versions(db, read_tables)
+        if len(versions) != len(read_tables):
+            # Таблица не версионируется (или схема версий не создана) - отвечаем без кэширования
+            return {}
+
+        headers = {"ETag": make_etag(request, versions), "Cache-Control": CACHE_CONTROL}
+        if updated_at:
+            headers["Last-Modified"] = http_date(updated_at)
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, headers["ETag"]):
+            raise HTTPException(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return headers
+
+    return check_etag
+
+
+def table_etag(get_db: Callable, *tables: str, entity: Optional[str] = None):
+    """Depends(...) для параметра dependencies= декоратора эндпоинта."""
+    return Depends(conditional_get(get_db, *tables, entity=entity))
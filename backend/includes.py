@@ -0,0 +1,250 @@
+"""
+Мульти-выборка (ids=) и подгрузка связанных записей (include=) для списков сущностей.
+
+Связанные записи загружаются пачками через IN (...) - по одному-два запроса на
+связь, независимо от числа строк в ответе. Ответ с include= - составной документ:
+
+    {
+        "data": [...],                          # строки самого списка
+        "included": {
+            "staff_positions": [...],           # связанные строки по таблицам,
+            "positions": [...]                  # каждая строка - один раз
+        }
+    }
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+# Максимум id в одном ids= (и размер пачки в IN (...))
+MAX_IDS = 500
+
+
+class BelongsTo:
+    """Запись, на которую ссылается столбец column строки списка."""
+
+    def __init__(self, column: str, table: str):
+        self.column = column
+        self.table = table
+
+    @property
+    def tables(self) -> Tuple[str, ...]:
+        return (self.table,)
+
+
+class HasMany:
+    """Записи таблицы table, ссылающиеся на строку списка через столбец column."""
+
+    def __init__(self, table: str, column: str):
+        self.table = table
+        self.column = column
+
+    @property
+    def tables(self) -> Tuple[str, ...]:
+        return (self.table,)
+
+
+class Through:
+    """Записи table, связанные через таблицу связей link (link.source -> строка, link.target -> table)."""
+
+    def __init__(self, link: str, source: str, target: str, table: str):
+        self.link = link
+        self.source = source
+        self.target = target
+        self.table = table
+
+    @property
+    def tables(self) -> Tuple[str, ...]:
+        return (self.link, self.table)
+
+
+class EntityOf:
+    """Запись table, на которую ссылается полиморфная пара entity_type/entity_id строки со своим entity_type."""
+
+    def __init__(self, entity_type: str, table: str):
+        self.entity_type = entity_type
+        self.table = table
+
+    @property
+    def tables(self) -> Tuple[str, ...]:
+        return (self.table,)
+
+
+# Допустимые include для каждой таблицы списка
+INCLUDES = {
+    "organizations": {
+        "parent": BelongsTo("parent_id", "organizations"),
+        "children": HasMany("organizations", "parent_id"),
+        "divisions": HasMany("divisions", "organization_id"),
+    },
+    "divisions": {
+        "organization": BelongsTo("organization_id", "organizations"),
+        "parent": BelongsTo("parent_id", "divisions"),
+        "children": HasMany("divisions", "parent_id"),
+        "sections": Through("division_sections", "division_id", "section_id", "sections"),
+    },
+    "sections": {
+        "divisions": Through("division_sections", "section_id", "division_id", "divisions"),
+        "functions": Through("section_functions", "section_id", "function_id", "functions"),
+    },
+    "division_sections": {
+        "division": BelongsTo("division_id", "divisions"),
+        "section": BelongsTo("section_id", "sections"),
+    },
+    "functions": {
+        "sections": Through("section_functions", "function_id", "section_id", "sections"),
+        "positions": HasMany("positions", "function_id"),
+    },
+    "section_functions": {
+        "section": BelongsTo("section_id", "sections"),
+        "function": BelongsTo("function_id", "functions"),
+    },
+    "positions": {
+        "function": BelongsTo("function_id", "functions"),
+    },
+    "staff": {
+        "organization": BelongsTo("organization_id", "organizations"),
+        "positions": Through("staff_positions", "staff_id", "position_id", "positions"),
+        "divisions": Through("staff_positions", "staff_id", "division_id", "divisions"),
+        "functions": Through("staff_functions", "staff_id", "function_id", "functions"),
+        "locations": Through("staff_locations", "staff_id", "location_id", "organizations"),
+    },
+    "staff_positions": {
+        "staff": BelongsTo("staff_id", "staff"),
+        "position": BelongsTo("position_id", "positions"),
+        "division": BelongsTo("division_id", "divisions"),
+        "location": BelongsTo("location_id", "organizations"),
+    },
+    "staff_functions": {
+        "staff": BelongsTo("staff_id", "staff"),
+        "function": BelongsTo("function_id", "functions"),
+    },
+    "staff_locations": {
+        "staff": BelongsTo("staff_id", "staff"),
+        "location": BelongsTo("location_id", "organizations"),
+    },
+    "functional_relations": {
+        "manager": BelongsTo("manager_id", "staff"),
+        "subordinate": BelongsTo("subordinate_id", "staff"),
+    },
+    # ЦКП правления и директора не ссылаются на таблицы, поэтому связей для них нет
+    "valuable_final_products": {
+        "organization": EntityOf("organization", "organizations"),
+        "division": EntityOf("division", "divisions"),
+        "section": EntityOf("section", "sections"),
+        "function": EntityOf("function", "functions"),
+    },
+}
+
+
+def parse_ids(ids: Optional[str]) -> Optional[List[int]]:
+    """Разбирает ids=1,2,3; None - фильтр не задан."""
+    if ids is None:
+        return None
+    try:
+        values = list(dict.fromkeys(int(value) for value in ids.split(",") if value.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Параметр ids должен быть списком чисел через запятую")
+    if len(values) > MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"В параметре ids не более {MAX_IDS} значений")
+    return values
+
+
+def ids_condition(id_list: List[int], column: str = "id") -> Tuple[str, List[int]]:
+    """Условие "column IN (...)" для ids=; пустой список не находит ничего."""
+    if not id_list:
+        return "0", []
+    return f"{column} IN ({', '.join('?' for _ in id_list)})", list(id_list)
+
+
+def parse_include(entity: str, include: Optional[str]) -> List[str]:
+    """Разбирает include=a,b и проверяет, что такие связи есть у сущности."""
+    if not include:
+        return []
+    names = list(dict.fromkeys(name.strip() for name in include.split(",") if name.strip()))
+    unknown = [name for name in names if name not in INCLUDES[entity]]
+    if unknown:
+        allowed = ", ".join(INCLUDES[entity]) or "нет"
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неизвестные связи в include: {', '.join(unknown)}. Допустимые: {allowed}",
+        )
+    return names
+
+
+def include_tables(entity: str, include: Optional[str]) -> Tuple[str, ...]:
+    """Таблицы, которые читает include= (для ETag); неизвестные имена пропускаются."""
+    tables = []
+    relations = INCLUDES.get(entity, {})
+    for name in (include or "").split(","):
+        relation = relations.get(name.strip())
+        if relation is not None:
+            tables.extend(relation.tables)
+    return tuple(dict.fromkeys(tables))
+
+
+def select_in(db, table: str, column: str, values) -> List[Dict[str, Any]]:
+    """SELECT * FROM table WHERE column IN (values) пачками по MAX_IDS."""
+    values = [value for value in dict.fromkeys(values) if value is not None]
+    rows = []
+    for start in range(0, len(values), MAX_IDS):
+        batch = values[start:start + MAX_IDS]
+        cursor = db.execute(
+            f"SELECT * FROM {table} WHERE {column} IN ({', '.join('?' for _ in batch)})", batch
+        )
+        rows.extend(dict(row) for row in cursor.fetchall())
+    return rows
+
+
+class _IncludedRows:
+    """Связанные строки по таблицам без повторов; таблицы связей читаются один раз."""
+
+    def __init__(self, db):
+        self.db = db
+        self.tables: Dict[str, Dict[Any, Dict[str, Any]]] = {}
+        self._links: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+
+    def add(self, table: str, rows: List[Dict[str, Any]]):
+        bucket = self.tables.setdefault(table, {})
+        for row in rows:
+            bucket.setdefault(row["id"], row)
+
+    def load_missing(self, table: str, ids) -> None:
+        known = self.tables.get(table, {})
+        self.add(table, select_in(self.db, table, "id", [i for i in ids if i not in known]))
+        self.tables.setdefault(table, {})
+
+    def link_rows(self, link: str, source: str, ids: List[int]) -> List[Dict[str, Any]]:
+        key = (link, source)
+        if key not in self._links:
+            self._links[key] = select_in(self.db, link, source, ids)
+        return self._links[key]
+
+
+def compound_document(db, entity: str, rows: List[Dict[str, Any]], include_list: List[str]):
+    """Возвращает rows как есть или, если задан include=, составной документ со связанными записями."""
+    if not include_list:
+        return rows
+
+    ids = [row["id"] for row in rows]
+    included = _IncludedRows(db)
+    for name in include_list:
+        relation = INCLUDES[entity][name]
+        if isinstance(relation, BelongsTo):
+            included.load_missing(relation.table, [row.get(relation.column) for row in rows])
+        elif isinstance(relation, EntityOf):
+            included.load_missing(
+                relation.table, [row["entity_id"] for row in rows if row["entity_type"] == relation.entity_type]
+            )
+        elif isinstance(relation, HasMany):
+            included.add(relation.table, select_in(db, relation.table, relation.column, ids))
+        else:
+            links = included.link_rows(relation.link, relation.source, ids)
+            included.add(relation.link, links)
+            included.load_missing(relation.table, [link[relation.target] for link in links])
+
+    return {
+        "data": rows,
+        "included": {table: list(bucket.values()) for table, bucket in included.tables.items()},
+    }
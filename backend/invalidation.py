@@ -0,0 +1,187 @@
+"""
+Шина инвалидации между процессами API (несколько воркеров uvicorn).
+
+Каждый воркер держит свои кэши и подписчиков, а запись обрабатывает один из них.
+Внешних сервисов шине не нужно: источник изменений - сама база. Поток шины в
+каждом процессе раз в poll_ms миллисекунд проверяет PRAGMA data_version (число
+в разделяемой памяти WAL, меняется при commit любого другого соединения - без
+чтения таблиц). Только если база изменилась, читаются:
+
+- новые записи change_log (version > последней прочитанной) - изменения строк
+  (для удалений - с организацией удаленной строки);
+- table_versions - изменения таблиц, в том числе не попадающих в журнал.
+
+Подписчики (subscribe) получают список Invalidation в потоке шины. Процесс,
+сам выполнивший запись, может вызвать poke() - тогда изменения разошлются сразу,
+не дожидаясь очередного опроса.
+
+Настройки берутся из переменных окружения (значения по умолчанию в BUS_DEFAULTS):
+
+    OFS_INVALIDATION_POLL_MS=10      интервал опроса базы, мс
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger("ofs_api.invalidation")
+
+BUS_DEFAULTS = {
+    "poll_ms": 10,
+}
+
+# Сколько записей журнала читать за один запрос
+BATCH_SIZE = 1000
+
+
+class Invalidation(NamedTuple):
+    table: str
+    row_id: Optional[int]  # None - изменилась таблица (строки неизвестны)
+    operation: Optional[str]  # insert, update, delete для строк
+    version: int  # версия журнала для строк, версия таблицы для таблиц
+    organization_id: Optional[int] = None  # организация удаленной строки (см. CHANGE_LOG_SCHEMA)
+
+
+Subscriber = Callable[[sqlite3.Connection, List[Invalidation]], None]
+
+
+def load_settings() -> Dict:
+    """Собирает настройки шины из BUS_DEFAULTS и переменных окружения."""
+    settings = {}
+    for key, default in BUS_DEFAULTS.items():
+        value = os.environ.get(f"OFS_INVALIDATION_{key.upper()}")
+        settings[key] = default if value is None else int(value)
+    return settings
+
+
+class InvalidationBus:
+    """Опрос базы в фоновом потоке и рассылка изменений подписчикам процесса."""
+
+    def __init__(self, name: str = "ofs-invalidation-bus", subscribers: Optional[List[Subscriber]] = None):
+        self.name = name
+        self._subscribers: List[Subscriber] = list(subscribers or [])
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._db: Optional[sqlite3.Connection] = None
+        self._data_version: Optional[int] = None
+        self.log_version = 0
+        self.table_versions: Dict[str, int] = {}
+        self.polls = 0
+        self.delivered = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    @property
+    def subscribers(self) -> List[Subscriber]:
+        return list(self._subscribers)
+
+    def subscribe(self, subscriber: Subscriber):
+        self._subscribers.append(subscriber)
+
+    def start(self, db_path: str):
+        if self._thread is not None:
+            return
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        # Отсчет с текущего состояния: изменения до запуска процесса уже учтены при чтении
+        self.log_version = self._query_scalar("SELECT COALESCE(MAX(version), 0) FROM change_log")
+        self.table_versions = self._load_table_versions()
+        self._data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        self.poll_interval = load_settings()["poll_ms"] / 1000
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        self._db.close()
+        self._db = None
+
+    def poke(self):
+        """Разослать изменения сразу (вызывает процесс, только что выполнивший commit)."""
+        self._wakeup.set()
+
+    def _query_scalar(self, sql: str) -> int:
+        try:
+            return self._db.execute(sql).fetchone()[0]
+        except sqlite3.OperationalError:
+            # Таблица журнала еще не создана
+            return 0
+
+    def _load_table_versions(self) -> Dict[str, int]:
+        try:
+            return {row[0]: row[1] for row in self._db.execute("SELECT table_name, version FROM table_versions")}
+        except sqlite3.OperationalError:
+            return {}
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Ошибка опроса шины инвалидации")
+
+    def poll(self):
+        """Читает изменения с прошлого опроса и рассылает их подписчикам."""
+        self.polls += 1
+        # Соединение шины только читает, поэтому data_version меняется при любой записи
+        data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+
+        invalidations: List[Invalidation] = []
+        try:
+            while True:
+                rows = self._db.execute(
+                    "SELECT version, table_name, row_id, operation, organization_id FROM change_log "
+                    "WHERE version > ? ORDER BY version LIMIT ?",
+                    (self.log_version, BATCH_SIZE),
+                ).fetchall()
+                invalidations.extend(Invalidation(row[1], row[2], row[3], row[0], row[4]) for row in rows)
+                if rows:
+                    self.log_version = rows[-1][0]
+                if len(rows) < BATCH_SIZE:
+                    break
+        except sqlite3.OperationalError:
+            pass
+
+        versions = self._load_table_versions()
+        for table, version in versions.items():
+            if self.table_versions.get(table) != version:
+                invalidations.append(Invalidation(table, None, None, version))
+        self.table_versions = versions
+
+        if not invalidations:
+            return
+        self.delivered += len(invalidations)
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber(self._db, invalidations)
+            except Exception:
+                logger.exception("Ошибка подписчика шины инвалидации")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "running": int(self.running),
+            "polls": self.polls,
+            "delivered": self.delivered,
+            "log_version": self.log_version,
+        }
+
+
+bus = InvalidationBus()
@@ -0,0 +1,507 @@
+"""
+Фоновые задания: выгрузки и отчеты, которые долго строить в рамках запроса.
+
+POST /jobs/{kind} ставит задание в очередь и сразу отвечает 202 с id задания,
+GET /jobs/{id} возвращает статус и ход выполнения, GET /jobs/{id}/artifact -
+готовый файл. Задания выполняются в ограниченном пуле процессов, поэтому тяжелая
+выгрузка не занимает потоки API и не упирается в GIL.
+
+Состояние заданий хранится в таблице jobs, общей для всех процессов API:
+повторный запрос с теми же параметрами по тем же данным (версии таблиц, которые
+читает задание, не изменились) возвращает уже поставленное (или еще не устаревшее
+готовое) задание, а не запускает новое. Файлы результатов лежат в
+каталоге загрузок (uploads/jobs/<id>/) и удаляются по истечении срока хранения.
+
+Настройки берутся из переменных окружения (значения по умолчанию в JOB_DEFAULTS):
+
+    OFS_JOB_WORKERS=2           число процессов пула
+    OFS_JOB_QUEUE_LIMIT=50      максимум заданий в очереди и в работе
+    OFS_JOB_TTL_HOURS=24        сколько часов хранится результат
+    OFS_JOB_DIR=                каталог результатов (по умолчанию uploads/jobs)
+"""
+
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import APIRouter, Body, Depends, HTTPException, Request
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
+
+import analytics_api
+import export_api
+import sharding
+from http_cache import get_table_versions
+from replica import connect_for_read
+
+logger = logging.getLogger("ofs_api.jobs")
+
+DB_PATH = "full_api_new.db"
+
+JOB_DEFAULTS = {
+    "workers": 2,
+    "queue_limit": 50,
+    "ttl_hours": 24,
+    "dir": "",
+}
+
+# Ход выполнения пишется в БД не чаще, чем раз в PROGRESS_INTERVAL секунд
+PROGRESS_INTERVAL = 0.5
+
+# Создаем свою функцию для получения соединения с БД
+def get_db():
+    """
+    Предоставляет соединение с основной базой: таблица заданий в ней. Данные задания
+    читают через open_source (в режиме шардирования - из каталога и всех шардов).
+    """
+    # Соединение создается и используется в разных потоках пула FastAPI
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["jobs"],
+)
+
+
+def load_settings() -> Dict:
+    """Собирает настройки заданий из JOB_DEFAULTS и переменных окружения."""
+    settings = {}
+    for key, default in JOB_DEFAULTS.items():
+        value = os.environ.get(f"OFS_JOB_{key.upper()}")
+        if value is None:
+            settings[key] = default
+        elif isinstance(default, int):
+            settings[key] = int(value)
+        else:
+            settings[key] = value
+    # Результаты лежат рядом с остальными загрузками (settings.UPLOAD_DIR)
+    settings["dir"] = settings["dir"] or os.path.join(os.getcwd(), "uploads", "jobs")
+    return settings
+
+
+# ================== ВИДЫ ЗАДАНИЙ ==================
+
+class JobKind:
+    """Вид задания: допустимые параметры со значениями по умолчанию и функция выполнения."""
+
+    def __init__(self, run: Callable, filename: str, media_type: str, params: Dict[str, Any], tables: Tuple[str, ...]):
+        # run(db, target, params, progress) пишет результат в открытый бинарный файл target
+        self.run = run
+        self.filename = filename
+        self.media_type = media_type
+        self.params = params
+        # Таблицы, которые читает задание: их версии входят в ключ дедупликации
+        self.tables = tables
+
+
+def _export_xlsx(db: sqlite3.Connection, target, params: Dict[str, Any], progress):
+    if export_api.Workbook is None:
+        raise RuntimeError("Экспорт в Excel недоступен: не установлен пакет openpyxl")
+    export_api.write_workbook(db, target, params["organization_id"], progress)
+
+
+def _export_csv(db: sqlite3.Connection, target, params: Dict[str, Any], progress):
+    for chunk in export_api.iter_csv_chunks(db, params["organization_id"], progress):
+        target.write(chunk)
+
+
+def _analytics_report(db: sqlite3.Connection, target, params: Dict[str, Any], progress):
+    # Обработчики аналитики вызываются напрямую, поэтому передаем все аргументы явно
+    report = {
+        "headcount": analytics_api.headcount(
+            group_by=params["group_by"], organization_id=params["organization_id"],
+            division_id=None, position_id=None, location_id=None, function_id=None, db=db,
+        ),
+    }
+    progress(1, 2)
+    report["span_of_control"] = analytics_api.span_of_control(
+        group_by=params["span_group_by"], relation_type=None, manager_id=None,
+        min_reports=1, limit=10000, db=db,
+    )
+    progress(2, 2)
+    target.write(json.dumps(report, ensure_ascii=False).encode("utf-8"))
+
+
+JOB_KINDS: Dict[str, JobKind] = {
+    "org-export-xlsx": JobKind(
+        _export_xlsx, "ОФС стандартизированная.xlsx", export_api.XLSX_MEDIA_TYPE,
+        {"organization_id": None}, export_api.EXPORT_TABLES,
+    ),
+    "org-export-csv": JobKind(
+        _export_csv, "ОФС стандартизированная.csv", "text/csv; charset=utf-8",
+        {"organization_id": None}, export_api.EXPORT_TABLES,
+    ),
+    "analytics-report": JobKind(
+        _analytics_report, "analytics.json", "application/json",
+        {"group_by": "organization,division", "span_group_by": "organization", "organization_id": None},
+        tuple(dict.fromkeys(analytics_api.HEADCOUNT_TABLES + analytics_api.SPAN_TABLES)),
+    ),
+}
+
+# Параметры, которые должны быть целыми числами
+INT_PARAMS = {"organization_id"}
+
+
+def normalize_params(kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Проверяет параметры задания и дополняет их значениями по умолчанию."""
+    allowed = JOB_KINDS[kind].params
+    unknown = [name for name in params if name not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неизвестные параметры задания: {', '.join(unknown)}. Допустимые: {', '.join(allowed) or 'нет'}",
+        )
+    result = dict(allowed)
+    for name, value in params.items():
+        if value is not None and name in INT_PARAMS:
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail=f"Параметр {name} должен быть целым числом")
+        elif value is not None:
+            value = str(value)
+        result[name] = value
+    return result
+
+
+def params_hash(kind: str, params: Dict[str, Any], versions: Dict[str, int]) -> str:
+    """Ключ дедупликации: вид задания, параметры и версии читаемых таблиц (после изменения данных - новое задание)."""
+    canonical = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    state = json.dumps(versions, sort_keys=True)
+    return hashlib.blake2b(f"{kind}|{canonical}|{state}".encode(), digest_size=16).hexdigest()
+
+
+# ================== ВЫПОЛНЕНИЕ В ПРОЦЕССЕ ПУЛА ==================
+
+def run_job(job_id: str, db_path: str, jobs_dir: str, ttl_hours: int):
+    """Выполняет задание в процессе пула; результат и ошибки записываются в таблицу jobs."""
+    db = sqlite3.connect(db_path, timeout=30)
+    db.row_factory = sqlite3.Row
+    part_path = None
+    try:
+        job = db.execute("SELECT kind, params FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if job is None:
+            return
+        kind = JOB_KINDS[job["kind"]]
+        with db:
+            db.execute(
+                "UPDATE jobs SET status = 'running', started_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (job_id,),
+            )
+
+        last_update = 0.0
+
+        def progress(done: int, total: int):
+            nonlocal last_update
+            now = time.monotonic()
+            if done < total and now - last_update < PROGRESS_INTERVAL:
+                return
+            last_update = now
+            with db:
+                db.execute(
+                    "UPDATE jobs SET progress = ?, message = ? WHERE id = ?",
+                    (round(done / total, 4) if total else 1.0, f"{done} из {total}", job_id),
+                )
+
+        job_dir = os.path.join(jobs_dir, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        artifact_path = os.path.join(job_dir, kind.filename)
+        part_path = artifact_path + ".part"
+
+        # Источник читается в отдельном соединении одной транзакцией, как и при выгрузке из API
+        source = open_source(db_path)
+        try:
+            with open(part_path, "wb") as target:
+                kind.run(source, target, json.loads(job["params"]), progress)
+        finally:
+            source.close()
+        os.replace(part_path, artifact_path)
+        part_path = None
+
+        with db:
+            db.execute(
+                """
+                UPDATE jobs SET status = 'succeeded', progress = 1, artifact_path = ?,
+                    finished_at = CURRENT_TIMESTAMP, expires_at = datetime('now', ?)
+                WHERE id = ?
+                """,
+                (artifact_path, f"+{ttl_hours} hours", job_id),
+            )
+    except Exception as e:
+        logger.exception(f"Задание {job_id} завершилось с ошибкой")
+        if part_path and os.path.exists(part_path):
+            os.remove(part_path)
+        with db:
+            db.execute(
+                """
+                UPDATE jobs SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP,
+                    expires_at = datetime('now', ?)
+                WHERE id = ?
+                """,
+                (str(e), f"+{ttl_hours} hours", job_id),
+            )
+    finally:
+        db.close()
+
+
+def open_source(db_path: str) -> sqlite3.Connection:
+    """
+    Соединение, из которого задание читает данные, в одной транзакции - как у выгрузок
+    из API (см. replica.connect_for_read): с репликой, если она включена и свежая,
+    в режиме шардирования - каталог с подключенными шардами.
+    """
+    conn, _ = connect_for_read(db_path)
+    return conn
+
+
+def source_versions(tables: Tuple[str, ...]) -> Dict[str, int]:
+    """Версии таблиц в тех данных, которые прочитает задание (для ключа дедупликации)."""
+    try:
+        conn = open_source(DB_PATH)
+    except sharding.ShardingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        return get_table_versions(conn, tables)[0]
+    finally:
+        conn.close()
+
+
+# ================== ПУЛ ПРОЦЕССОВ ==================
+
+_settings: Dict = {}
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Пул создается при первом задании; spawn - дочерние процессы не наследуют потоки и соединения API."""
+    global _pool, _settings
+    if _pool is None:
+        _settings = load_settings()
+        _pool = ProcessPoolExecutor(
+            max_workers=_settings["workers"],
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def fail_job(job_id: str, error: str):
+    """Помечает задание ошибочным, если процесс пула не смог сам записать результат."""
+    settings = _settings or load_settings()
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        with conn:
+            conn.execute(
+                """
+                UPDATE jobs SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP,
+                    expires_at = datetime('now', ?)
+                WHERE id = ? AND status IN ('queued', 'running')
+                """,
+                (error, f"+{settings['ttl_hours']} hours", job_id),
+            )
+    finally:
+        conn.close()
+
+
+def submit_job(job_id: str):
+    global _pool
+    pool = get_pool()
+
+    def on_done(future: Future):
+        global _pool
+        error = future.exception()
+        if error is None:
+            return
+        logger.error(f"Процесс задания {job_id} аварийно завершился: {error}")
+        if isinstance(error, BrokenProcessPool) and _pool is pool:
+            # Сломанный пул не принимает задания - следующее создаст новый
+            _pool = None
+        fail_job(job_id, f"Процесс задания аварийно завершился: {error}")
+
+    try:
+        future = pool.submit(run_job, job_id, DB_PATH, _settings["dir"], _settings["ttl_hours"])
+    except BrokenProcessPool as e:
+        _pool = None
+        fail_job(job_id, str(e))
+        raise HTTPException(status_code=503, detail="Пул фоновых заданий недоступен, повторите запрос")
+    future.add_done_callback(on_done)
+
+
+def shutdown_jobs():
+    """Останавливает пул; незавершенные задания помечаются при следующем запуске."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _process_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def recover_jobs(db: sqlite3.Connection) -> int:
+    """Помечает ошибочными задания, чей процесс API завершился, не дождавшись результата."""
+    settings = load_settings()
+    rows = db.execute("SELECT id, owner_pid FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+    lost = [row[0] for row in rows if row[1] == os.getpid() or not _process_alive(row[1])]
+    with db:
+        db.executemany(
+            """
+            UPDATE jobs SET status = 'failed', error = 'Задание прервано перезапуском сервера',
+                finished_at = CURRENT_TIMESTAMP, expires_at = datetime('now', ?)
+            WHERE id = ?
+            """,
+            [(f"+{settings['ttl_hours']} hours", job_id) for job_id in lost],
+        )
+    return len(lost)
+
+
+def cleanup_expired_jobs(db: sqlite3.Connection) -> int:
+    """Удаляет устаревшие задания вместе с файлами результатов."""
+    jobs_dir = load_settings()["dir"]
+    expired = [row[0] for row in db.execute(
+        "SELECT id FROM jobs WHERE expires_at IS NOT NULL AND expires_at <= CURRENT_TIMESTAMP"
+    ).fetchall()]
+    for job_id in expired:
+        shutil.rmtree(os.path.join(jobs_dir, job_id), ignore_errors=True)
+    with db:
+        db.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in expired])
+    return len(expired)
+
+
+# ================== ЭНДПОИНТЫ ==================
+
+class JobInfo(BaseModel):
+    id: str
+    kind: str
+    params: Dict[str, Any]
+    status: str  # queued, running, succeeded, failed
+    progress: float
+    message: Optional[str] = None
+    error: Optional[str] = None
+    created_at: Optional[str] = None
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    expires_at: Optional[str] = None
+    artifact_url: Optional[str] = None
+    deduplicated: bool = False  # возвращено уже существующее задание с теми же параметрами
+
+
+def job_info(request: Request, row: sqlite3.Row, deduplicated: bool = False) -> Dict[str, Any]:
+    info = {key: row[key] for key in (
+        "id", "kind", "status", "progress", "message", "error",
+        "created_at", "started_at", "finished_at", "expires_at",
+    )}
+    info["params"] = json.loads(row["params"])
+    info["deduplicated"] = deduplicated
+    if row["status"] == "succeeded":
+        info["artifact_url"] = str(request.url_for("get_job_artifact", job_id=row["id"]))
+    return info
+
+
+def get_job_row(db: sqlite3.Connection, job_id: str) -> sqlite3.Row:
+    row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    return row
+
+
+@router.post("/{kind}", response_model=JobInfo, status_code=202)
+def create_job(
+    kind: str,
+    request: Request,
+    params: Dict[str, Any] = Body(default_factory=dict),
+    db: sqlite3.Connection = Depends(get_db),
+):
+    """
+    Ставит задание в очередь. Если задание с такими же параметрами по тем же данным
+    уже выполняется или его результат еще хранится, возвращается оно (deduplicated = true).
+    """
+    if kind not in JOB_KINDS:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Неизвестный вид задания: {kind}. Доступные: {', '.join(JOB_KINDS)}",
+        )
+    params = normalize_params(kind, params)
+    digest = params_hash(kind, params, source_versions(JOB_KINDS[kind].tables))
+    settings = load_settings()
+    cleanup_expired_jobs(db)
+
+    # Поиск и вставка в одной транзакции записи: процессы API не создадут два одинаковых задания
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        existing = db.execute(
+            """
+            SELECT * FROM jobs
+            WHERE kind = ? AND params_hash = ?
+              AND (status IN ('queued', 'running') OR (status = 'succeeded' AND expires_at > CURRENT_TIMESTAMP))
+            ORDER BY created_at DESC LIMIT 1
+            """,
+            (kind, digest),
+        ).fetchone()
+        # Файл результата мог быть удален вручную раньше срока - такое задание не переиспользуем
+        if existing is not None and (existing["status"] != "succeeded" or os.path.exists(existing["artifact_path"] or "")):
+            db.rollback()
+            return job_info(request, existing, deduplicated=True)
+
+        active = db.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+        if active >= settings["queue_limit"]:
+            raise HTTPException(
+                status_code=503,
+                detail="Очередь фоновых заданий заполнена, повторите запрос позже",
+                headers={"Retry-After": "30"},
+            )
+
+        job_id = uuid.uuid4().hex
+        db.execute(
+            "INSERT INTO jobs (id, kind, params, params_hash, owner_pid) VALUES (?, ?, ?, ?, ?)",
+            (job_id, kind, json.dumps(params, sort_keys=True, ensure_ascii=False), digest, os.getpid()),
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    submit_job(job_id)
+    return job_info(request, get_job_row(db, job_id))
+
+
+@router.get("/{job_id}", response_model=JobInfo)
+def get_job(job_id: str, request: Request, db: sqlite3.Connection = Depends(get_db)):
+    """Статус и ход выполнения задания."""
+    return job_info(request, get_job_row(db, job_id))
+
+
+@router.get("/{job_id}/artifact", name="get_job_artifact")
+def get_job_artifact(job_id: str, db: sqlite3.Connection = Depends(get_db)):
+    """Файл результата завершенного задания."""
+    row = get_job_row(db, job_id)
+    if row["status"] == "failed":
+        raise HTTPException(status_code=409, detail=f"Задание завершилось с ошибкой: {row['error']}")
+    if row["status"] != "succeeded":
+        raise HTTPException(status_code=409, detail="Задание еще не завершено")
+    if not row["artifact_path"] or not os.path.exists(row["artifact_path"]):
+        raise HTTPException(status_code=410, detail="Результат задания удален по истечении срока хранения")
+    kind = JOB_KINDS[row["kind"]]
+    return FileResponse(row["artifact_path"], media_type=kind.media_type, filename=kind.filename)
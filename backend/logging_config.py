@@ -0,0 +1,232 @@
+"""
+Неблокирующее структурированное логирование API.
+
+Обработчики запросов только кладут записи в ограниченную очередь (QueueHandler),
+а форматирование и запись на диск выполняет отдельный поток QueueListener.
+Если диск тормозит и очередь переполнена, новые записи отбрасываются и
+считаются - логирование никогда не задерживает обработку запроса.
+
+Настройки берутся из переменных окружения (значения по умолчанию в LOGGING_DEFAULTS):
+
+    OFS_LOG_LEVEL=INFO                          уровень корневого логгера
+    OFS_LOG_LEVELS=ofs_api=INFO,ofs_api.events=DEBUG   уровни отдельных логгеров
+    OFS_LOG_FORMAT=json                         json или text
+    OFS_LOG_FILE=api.log                        пустое значение - только консоль
+    OFS_LOG_ROTATION=size                       size (по размеру) или time (по времени)
+    OFS_LOG_MAX_BYTES=10485760                  размер файла для ротации по размеру
+    OFS_LOG_WHEN=midnight                       интервал для ротации по времени
+    OFS_LOG_BACKUP_COUNT=7                      сколько старых файлов хранить
+    OFS_LOG_QUEUE_SIZE=10000                    емкость очереди записей
+    OFS_LOG_ACCESS_SAMPLE_RATE=0.1              доля успешных запросов в журнале доступа
+    OFS_LOG_SLOW_REQUEST_MS=1000                медленные запросы пишутся всегда
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# Логгер журнала HTTP-запросов - самый многословный, к нему применяется выборка
+ACCESS_LOGGER = "ofs_api.access"
+
+LOGGING_DEFAULTS = {
+    "level": "INFO",
+    "levels": "ofs_api=INFO",
+    "format": "json",
+    "file": "api.log",
+    "rotation": "size",
+    "max_bytes": 10 * 1024 * 1024,
+    "when": "midnight",
+    "backup_count": 7,
+    "queue_size": 10000,
+    "access_sample_rate": 0.1,
+    "slow_request_ms": 1000,
+}
+
+# Стандартные атрибуты LogRecord; все остальное пришло через extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["DroppingQueueHandler"] = None
+_settings: Dict = {}
+
+
+def load_settings() -> Dict:
+    """Собирает настройки логирования из LOGGING_DEFAULTS и переменных окружения."""
+    settings = {}
+    for key, default in LOGGING_DEFAULTS.items():
+        value = os.environ.get(f"OFS_LOG_{key.upper()}")
+        if value is None:
+            settings[key] = default
+        elif isinstance(default, float):
+            settings[key] = float(value)
+        elif isinstance(default, int):
+            settings[key] = int(value)
+        else:
+            settings[key] = value
+    return settings
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """Разбирает строку вида "ofs_api=INFO,ofs_api.events=DEBUG"."""
+    levels = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, level = item.partition("=")
+        if not level:
+            raise ValueError(f"Неверная настройка уровня логгера: {item!r}")
+        levels[name.strip()] = logging.getLevelName(level.strip().upper())
+    return levels
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON; поля из extra= попадают в объект как есть."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который не ждет места в очереди, а отбрасывает запись."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # В отличие от базовой реализации не форматируем сообщение здесь: сериализация
+        # выполняется в потоке слушателя, в очередь идет копия с подставленными args
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает долю rate записей ниже WARNING; предупреждения и ошибки - всегда."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+def _build_handlers(settings: Dict):
+    if settings["format"] == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    handlers = [logging.StreamHandler()]
+    if settings["file"]:
+        if settings["rotation"] == "time":
+            file_handler = logging.handlers.TimedRotatingFileHandler(
+                settings["file"], when=settings["when"], backupCount=settings["backup_count"],
+                encoding="utf-8", delay=True)
+        else:
+            file_handler = logging.handlers.RotatingFileHandler(
+                settings["file"], maxBytes=settings["max_bytes"], backupCount=settings["backup_count"],
+                encoding="utf-8", delay=True)
+        handlers.append(file_handler)
+
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def setup_logging() -> None:
+    """Настраивает очередь логирования и запускает поток записи (повторный вызов ничего не делает)."""
+    global _listener, _queue_handler, _settings
+    if _listener is not None:
+        return
+
+    _settings = load_settings()
+    log_queue = queue.Queue(maxsize=_settings["queue_size"])
+    _queue_handler = DroppingQueueHandler(log_queue)
+
+    root = logging.getLogger()
+    root.handlers = [_queue_handler]
+    root.setLevel(_settings["level"].upper())
+    for name, level in parse_levels(_settings["levels"]).items():
+        logging.getLogger(name).setLevel(level)
+
+    # Выборка выполняется на логгере, т.е. еще до постановки в очередь
+    access_logger = logging.getLogger(ACCESS_LOGGER)
+    access_logger.filters = [f for f in access_logger.filters if not isinstance(f, SamplingFilter)]
+    access_logger.addFilter(SamplingFilter(_settings["access_sample_rate"]))
+
+    _listener = logging.handlers.QueueListener(log_queue, *_build_handlers(_settings))
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Дописывает оставшиеся в очереди записи и останавливает поток записи."""
+    global _listener
+    if _listener is None:
+        return
+    if _queue_handler is not None and _queue_handler.dropped:
+        logging.getLogger("ofs_api").warning(
+            "Отброшено записей лога из-за переполнения очереди: %d", _queue_handler.dropped)
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+def get_logging_stats() -> Dict:
+    """Состояние очереди логирования для диагностики."""
+    if _queue_handler is None:
+        return {"queued": 0, "dropped": 0, "capacity": 0}
+    return {
+        "queued": _queue_handler.queue.qsize(),
+        "dropped": _queue_handler.dropped,
+        "capacity": _queue_handler.queue.maxsize,
+    }
+
+
+def log_request(method: str, path: str, status_code: int, started: float) -> None:
+    """Пишет запись журнала доступа; ошибки сервера и медленные запросы - уровнем WARNING."""
+    duration_ms = round((time.perf_counter() - started) * 1000, 2)
+    level = logging.INFO
+    if status_code >= 500 or duration_ms >= _settings.get("slow_request_ms", LOGGING_DEFAULTS["slow_request_ms"]):
+        level = logging.WARNING
+    logging.getLogger(ACCESS_LOGGER).log(
+        level, "%s %s %d", method, path, status_code,
+        extra={"method": method, "path": path, "status": status_code, "duration_ms": duration_ms})
@@ -0,0 +1,253 @@
+"""
+Серверная раскладка орг-диаграммы (аккуратное дерево в духе Рейнгольда - Тилфорда).
+
+Каждое поддерево раскладывается независимо от остального дерева: потомки
+ставятся слева направо вплотную по контурам (самая левая и самая правая точка
+поддерева на каждом уровне), родитель - по центру над крайними потомками.
+Сравнение контуров идет только до глубины более мелкого из поддеревьев, поэтому
+раскладка линейна по числу узлов при ограниченной глубине оргструктуры.
+
+Раскладка поддерева зависит только от его формы (набора форм потомков), а не от
+названий и id узлов. Формы нумеруются (hash-consing) и кэшируются: после
+изменения в одном поддереве заново раскладываются только узлы новой формы - само
+измененное поддерево и его предки, остальные поддеревья берутся из кэша.
+
+Координаты узлов - центр узла по x и верхний край по y, в пикселях.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+# Размеры узла и отступы диаграммы (px)
+NODE_WIDTH = 180
+NODE_HEIGHT = 60
+H_GAP = 20
+V_GAP = 60
+MARGIN = 20
+
+# Сколько форм поддеревьев хранить; при переполнении кэш форм очищается целиком
+MAX_SHAPES = 200000
+
+# Сколько готовых раскладок (по версиям таблиц) хранить
+RESULT_CACHE_SIZE = 16
+
+
+class _ShapeLayout:
+    """Раскладка формы: смещения потомков от родителя и контуры по уровням (в ширинах узла)."""
+
+    __slots__ = ("offsets", "left", "right")
+
+    def __init__(self, offsets: Tuple[float, ...], left: Tuple[float, ...], right: Tuple[float, ...]):
+        self.offsets = offsets
+        self.left = left
+        self.right = right
+
+
+def arrange(children: List[_ShapeLayout]) -> _ShapeLayout:
+    """Раскладывает узел по раскладкам его потомков (слева направо)."""
+    if not children:
+        return _ShapeLayout((), (0.0,), (0.0,))
+
+    first = children[0]
+    left = list(first.left)
+    right = list(first.right)
+    positions = [0.0]
+    for child in children[1:]:
+        # Минимальный сдвиг, при котором поддерево не заходит на уже расставленные
+        # ни на одном общем уровне (соседи на расстоянии не меньше одного узла)
+        common = min(len(right), len(child.left))
+        shift = max(right[depth] - child.left[depth] for depth in range(common)) + 1.0
+        positions.append(shift)
+        for depth, value in enumerate(child.right):
+            if depth < len(right):
+                right[depth] = value + shift
+            else:
+                right.append(value + shift)
+        for depth in range(len(left), len(child.left)):
+            left.append(child.left[depth] + shift)
+
+    middle = (positions[0] + positions[-1]) / 2
+    return _ShapeLayout(
+        tuple(position - middle for position in positions),
+        (0.0,) + tuple(value - middle for value in left),
+        (0.0,) + tuple(value - middle for value in right),
+    )
+
+
+class ShapeCache:
+    """Номера форм поддеревьев и их раскладки."""
+
+    def __init__(self, max_shapes: int = MAX_SHAPES):
+        self.max_shapes = max_shapes
+        self.lock = threading.Lock()
+        self._ids: Dict[Tuple[int, ...], int] = {}
+        self._layouts: List[_ShapeLayout] = []
+        self.computed = 0
+
+    def shape(self, children: Tuple[int, ...]) -> int:
+        """Номер формы узла с потомками данных форм; новая форма раскладывается сразу."""
+        shape_id = self._ids.get(children)
+        if shape_id is None:
+            shape_id = len(self._layouts)
+            self._layouts.append(arrange([self._layouts[child] for child in children]))
+            self._ids[children] = shape_id
+            self.computed += 1
+        return shape_id
+
+    def layout(self, shape_id: int) -> _ShapeLayout:
+        return self._layouts[shape_id]
+
+    def trim(self):
+        if len(self._layouts) > self.max_shapes:
+            self._ids.clear()
+            self._layouts.clear()
+
+    def __len__(self) -> int:
+        return len(self._layouts)
+
+
+shape_cache = ShapeCache()
+
+
+def flatten(roots: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Обходит лес (узлы с полем children) в прямом порядке без рекурсии.
+    Возвращает узлы раскладки: key - номер узла, parent - номер родителя.
+    """
+    nodes = []
+    stack = [(root, None, 0) for root in reversed(roots)]
+    while stack:
+        node, parent, depth = stack.pop()
+        key = len(nodes)
+        nodes.append({
+            "key": key,
+            "entity_type": node["entity_type"],
+            "id": node["id"],
+            "name": node["name"],
+            "parent": parent,
+            "depth": depth,
+        })
+        stack.extend((child, key, depth + 1) for child in reversed(node.get("children") or []))
+    return nodes
+
+
+def layout_forest(roots: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Раскладывает лес; корни стоят рядом как потомки невидимого общего корня."""
+    nodes = flatten(roots)
+    children: List[List[int]] = [[] for _ in nodes]
+    top = []
+    for node in nodes:
+        (top if node["parent"] is None else children[node["parent"]]).append(node["key"])
+
+    with shape_cache.lock:
+        shape_cache.trim()
+        computed_before = shape_cache.computed
+
+        # Формы снизу вверх: в прямом порядке потомок всегда правее родителя
+        shapes = [0] * len(nodes)
+        for key in range(len(nodes) - 1, -1, -1):
+            shapes[key] = shape_cache.shape(tuple(shapes[child] for child in children[key]))
+        forest = shape_cache.layout(shape_cache.shape(tuple(shapes[key] for key in top)))
+
+        # Координаты сверху вниз: x потомка = x родителя + смещение из раскладки формы
+        x = [0.0] * len(nodes)
+        for key, offset in zip(top, forest.offsets):
+            x[key] = offset
+        for key in range(len(nodes)):
+            if children[key]:
+                offsets = shape_cache.layout(shapes[key]).offsets
+                for child, offset in zip(children[key], offsets):
+                    x[child] = x[key] + offset
+        computed = shape_cache.computed - computed_before
+
+    step = NODE_WIDTH + H_GAP
+    left = min(x, default=0.0)
+    for node, value in zip(nodes, x):
+        node["x"] = round((value - left) * step + NODE_WIDTH / 2 + MARGIN, 1)
+        node["y"] = node["depth"] * (NODE_HEIGHT + V_GAP) + MARGIN
+
+    width = max((node["x"] for node in nodes), default=0) + NODE_WIDTH / 2 + MARGIN
+    depth = max((node["depth"] for node in nodes), default=-1) + 1
+    return {
+        "width": round(width, 1),
+        "height": depth * NODE_HEIGHT + max(depth - 1, 0) * V_GAP + 2 * MARGIN,
+        "node_width": NODE_WIDTH,
+        "node_height": NODE_HEIGHT,
+        "nodes": nodes,
+        "edges": [],
+        "stats": {"nodes": len(nodes), "computed_subtrees": computed, "reused_subtrees": len(nodes) + 1 - computed},
+    }
+
+
+def render_svg(layout: Dict[str, Any]) -> str:
+    """SVG орг-диаграммы: узлы, связи иерархии уступом и матричные связи пунктиром."""
+    nodes = layout["nodes"]
+    half = NODE_WIDTH / 2
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{layout["width"]}" height="{layout["height"]}" '
+        f'viewBox="0 0 {layout["width"]} {layout["height"]}" font-family="sans-serif" font-size="12">',
+        '<g fill="none" stroke="#8a94a6">',
+    ]
+    for node in nodes:
+        if node["parent"] is not None:
+            parent = nodes[node["parent"]]
+            bend = node["y"] - V_GAP / 2
+            parts.append(
+                f'<path d="M{parent["x"]},{parent["y"] + NODE_HEIGHT}V{bend}H{node["x"]}V{node["y"]}"/>'
+            )
+    for edge in layout["edges"]:
+        source, target = nodes[edge["from_key"]], nodes[edge["to_key"]]
+        parts.append(
+            f'<line x1="{source["x"]}" y1="{source["y"] + NODE_HEIGHT / 2}" '
+            f'x2="{target["x"]}" y2="{target["y"] + NODE_HEIGHT / 2}" '
+            f'stroke="#d9822b" stroke-dasharray="4 3"><title>{escape(edge["relation_type"])}</title></line>'
+        )
+    parts.append('</g>')
+    for node in nodes:
+        parts.append(
+            f'<g class="{node["entity_type"]}"><rect x="{node["x"] - half}" y="{node["y"]}" '
+            f'width="{NODE_WIDTH}" height="{NODE_HEIGHT}" rx="6" fill="#fff" stroke="#3b5b92"/>'
+            f'<text x="{node["x"]}" y="{node["y"] + NODE_HEIGHT / 2 + 4}" text-anchor="middle">'
+            f'{escape(node["name"] or "")}</text></g>'
+        )
+    parts.append('</svg>')
+    return "\n".join(parts)
+
+
+class LayoutCache:
+    """Готовые раскладки по ключу, включающему версии прочитанных таблиц (LRU)."""
+
+    def __init__(self, size: int = RESULT_CACHE_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+
+    def get_or_build(self, key: Hashable, build: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        result = build()
+        with self._lock:
+            self._items[key] = result
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return result
+
+    def discard_tables(self, tables):
+        """Удаляет раскладки, построенные по прежним версиям изменившихся таблиц."""
+        with self._lock:
+            for key in [key for key in self._items if any(table in tables for table, _ in key[-1])]:
+                del self._items[key]
+
+
+layout_cache = LayoutCache()
+
+
+def versions_key(versions: Dict[str, int], tables: Tuple[str, ...]) -> Optional[Tuple[Tuple[str, int], ...]]:
+    """Ключ версии структуры; None - не все таблицы версионируются, кэшировать нельзя."""
+    if len(versions) != len(tables):
+        return None
+    return tuple(sorted(versions.items()))
@@ -1,15 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 import sqlite3
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
-from datetime import datetime
+from enum import Enum
+from datetime import datetime, date
+
+from temporal import as_of_condition
+from single_flight import SingleFlight
+from http_cache import table_etag, get_table_versions
+from replica import connect_for_read
+from invalidation import bus
+from org_layout import layout_forest, layout_cache, render_svg, versions_key
 
 # Создаем свою функцию для получения соединения с БД
-def get_db():
-    """Предоставляет соединение с базой данных."""
+def get_db(response: Response):
+    """Предоставляет соединение для чтения: с репликой, если она включена и свежая (см. replica.py)."""
     DB_PATH = "full_api_new.db"
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    # Соединение создается и используется в разных потоках пула FastAPI
+    conn, headers = connect_for_read(DB_PATH)
+    response.headers.update(headers)
     try:
         yield conn
     finally:
@@ -21,7 +30,32 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+# Тяжелые деревья запрашивают одновременно многие клиенты (например, сразу после
+# публикации реорганизации): одинаковые запросы выполняются один раз
+structure_flight = SingleFlight()
+
+# Таблицы, которые читают деревья оргструктуры и сотрудников (для ETag, ключей single-flight и кэша раскладок)
+HIERARCHY_TABLES = ("organizations", "divisions", "division_sections", "sections", "section_functions", "functions")
+STAFF_TREE_TABLES = ("staff", "functional_relations")
+STAFF_HIERARCHY_TABLES = ("staff", "functional_relations", "staff_positions", "positions")
+MATRIX_TABLES = ("functional_relations", "staff")
+
+def versioned_flight(db, tables, key, build):
+    """
+    Одинаковые одновременные запросы выполняются один раз; ключ включает версии таблиц.
+    Версии читаются после ETag, поэтому запрос, пришедший после записи, не присоединится
+    к выполнению, начатому до нее, и не получит прежнее тело под новым ETag.
+    """
+    return structure_flight.do(key + (versions_key(get_table_versions(db, tables)[0], tables),), build)
+
 # Модели для возвращаемых данных
+class EntityType(str, Enum):
+    """Типы узлов дерева оргструктуры"""
+    ORGANIZATION = "organization"
+    DIVISION = "division"
+    SECTION = "section"
+    FUNCTION = "function"
+
 class OrgStructureNode(BaseModel):
     id: int
     name: str
@@ -29,6 +63,8 @@ class OrgStructureNode(BaseModel):
     entity_type: str  # organization, division, section, etc.
     org_type: Optional[str] = None  # для organization: HOLDING, LEGAL_ENTITY, LOCATION, BOARD
     children: Optional[List[Any]] = []
+    children_count: int = 0  # число прямых потомков (в том числе незагруженных)
+    has_children: bool = False
 
 class StaffNode(BaseModel):
     id: int
@@ -37,6 +73,35 @@ class StaffNode(BaseModel):
     email: Optional[str] = None
     relations: Optional[List[Dict[str, Any]]] = []
 
+class LayoutFormat(str, Enum):
+    """Формат раскладки орг-диаграммы"""
+    JSON = "json"
+    SVG = "svg"
+
+class LayoutNode(BaseModel):
+    key: int  # номер узла в раскладке (один объект может встречаться в дереве несколько раз)
+    entity_type: str
+    id: int
+    name: str
+    parent: Optional[int] = None  # key родителя
+    depth: int
+    x: float  # центр узла
+    y: float  # верхний край узла
+
+class LayoutEdge(BaseModel):
+    from_key: int
+    to_key: int
+    relation_type: str
+
+class OrgChartLayout(BaseModel):
+    width: float
+    height: float
+    node_width: int
+    node_height: int
+    nodes: List[LayoutNode]
+    edges: List[LayoutEdge] = []  # матричные связи (кроме ребер дерева)
+    stats: Dict[str, int]
+
 class MatrixRelation(BaseModel):
     id: int
     from_id: int
@@ -48,237 +113,247 @@ class MatrixRelation(BaseModel):
     extra_info: Optional[str] = None
 
 # API эндпоинты для организационной структуры
-@router.get("/hierarchy", response_model=List[OrgStructureNode])
-def get_org_hierarchy(db: sqlite3.Connection = Depends(get_db)):
+@router.get("/hierarchy", response_model=List[OrgStructureNode],
+            dependencies=[table_etag(get_db, *HIERARCHY_TABLES)])
+def get_org_hierarchy(
+    root_type: Optional[EntityType] = None,
+    root_id: Optional[int] = None,
+    depth: Optional[int] = Query(None, ge=0),
+    db: sqlite3.Connection = Depends(get_db)
+):
     """
     Получает иерархическую структуру организации.
     Структура включает организации, подразделения, отделы.
-    """
-    cursor = db.cursor()
-    
-    # Получаем все организации верхнего уровня (без parent_id или parent_id = NULL)
-    cursor.execute("""
-        SELECT id, name, code, org_type, description
-        FROM organizations
-        WHERE parent_id IS NULL
-        ORDER BY name
-    """)
-    
-    top_orgs = cursor.fetchall()
-    result = []
-    
-    # Для каждой организации верхнего уровня строим дерево
-    for org in top_orgs:
-        org_node = build_org_tree(db, org)
-        result.append(org_node)
     
-    return result
+    Для ленивой загрузки дерева:
+    - root_type и root_id - построить дерево от указанного узла (по умолчанию - от организаций верхнего уровня);
+    - depth - сколько уровней потомков вернуть (0 - только сам корень).
+    У каждого узла есть children_count и has_children, даже если его потомки не загружены.
+    """
+    if (root_type is None) != (root_id is None):
+        raise HTTPException(status_code=400, detail="Параметры root_type и root_id указываются вместе")
+    
+    root_key = root_type.value if root_type else None
+    return versioned_flight(
+        db, HIERARCHY_TABLES, ("hierarchy", root_key, root_id, depth),
+        lambda: load_org_hierarchy(db, root_key, root_id, depth),
+    )
 
-def build_org_tree(db, org):
-    """Рекурсивно строит дерево организационной структуры"""
-    org_id, name, code, org_type, desc = org
-    
-    # Создаем узел для текущей организации
+# Связи "родитель -> потомки" для каждого типа узла, в порядке вывода потомков:
+# (тип потомка, FROM, столбец родителя, дополнительное условие, столбец org_type).
+# Все выборки идут по индексам на столбце родителя.
+CHILD_RELATIONS = {
+    "organization": [
+        ("organization", "organizations c", "c.parent_id", None, "c.org_type"),
+        # Подразделения есть только у холдингов и юрлиц
+        ("division", "divisions c JOIN organizations o ON o.id = c.organization_id", "c.organization_id",
+         "c.parent_id IS NULL AND o.org_type IN ('holding', 'legal_entity')", "NULL"),
+    ],
+    "division": [
+        ("section", "sections c JOIN division_sections l ON c.id = l.section_id", "l.division_id", None, "NULL"),
+        ("division", "divisions c", "c.parent_id", None, "NULL"),
+    ],
+    "section": [
+        ("function", "functions c JOIN section_functions l ON c.id = l.function_id", "l.section_id", None, "NULL"),
+    ],
+    "function": [],
+}
+
+NODE_TABLES = {
+    "organization": ("organizations", "org_type"),
+    "division": ("divisions", "NULL"),
+    "section": ("sections", "NULL"),
+    "function": ("functions", "NULL"),
+}
+
+# Ограничение числа параметров в одном IN (...)
+HIERARCHY_BATCH_SIZE = 500
+
+def make_node(entity_type, row):
+    node_id, name, code, org_type = row
     node = {
-        "id": org_id,
+        "id": node_id,
         "name": name,
         "code": code,
-        "entity_type": "organization",
-        "org_type": org_type,
-        "children": []
+        "entity_type": entity_type,
+        "children": [],
+        "children_count": 0,
+        "has_children": False,
     }
-    
-    cursor = db.cursor()
-    
-    # Получаем дочерние организации
-    cursor.execute("""
-        SELECT id, name, code, org_type, description
-        FROM organizations
-        WHERE parent_id = ?
-        ORDER BY name
-    """, (org_id,))
-    
-    child_orgs = cursor.fetchall()
-    for child_org in child_orgs:
-        child_node = build_org_tree(db, child_org)
-        node["children"].append(child_node)
-    
-    # Если это HOLDING или LEGAL_ENTITY, получаем связанные подразделения
-    if org_type in ["holding", "legal_entity"]:
-        cursor.execute("""
-            SELECT id, name, code, description
-            FROM divisions
-            WHERE organization_id = ?
-            AND parent_id IS NULL
-            ORDER BY name
-        """, (org_id,))
-        
-        divisions = cursor.fetchall()
-        for div in divisions:
-            div_id, div_name, div_code, div_desc = div
-            div_node = {
-                "id": div_id,
-                "name": div_name,
-                "code": div_code,
-                "entity_type": "division",
-                "children": []
-            }
-            
-            # Получаем отделы этого подразделения
-            cursor.execute("""
-                SELECT s.id, s.name, s.code, s.description
-                FROM sections s
-                JOIN division_sections ds ON s.id = ds.section_id
-                WHERE ds.division_id = ?
-                ORDER BY s.name
-            """, (div_id,))
-            
-            sections = cursor.fetchall()
-            for section in sections:
-                sec_id, sec_name, sec_code, sec_desc = section
-                sec_node = {
-                    "id": sec_id,
-                    "name": sec_name,
-                    "code": sec_code,
-                    "entity_type": "section",
-                    "children": []
-                }
-                
-                # Получаем функции этого отдела
-                cursor.execute("""
-                    SELECT f.id, f.name, f.code, f.description
-                    FROM functions f
-                    JOIN section_functions sf ON f.id = sf.function_id
-                    WHERE sf.section_id = ?
-                    ORDER BY f.name
-                """, (sec_id,))
-                
-                functions = cursor.fetchall()
-                for func in functions:
-                    func_id, func_name, func_code, func_desc = func
-                    func_node = {
-                        "id": func_id,
-                        "name": func_name,
-                        "code": func_code,
-                        "entity_type": "function",
-                        "children": []
-                    }
-                    
-                    sec_node["children"].append(func_node)
-                
-                div_node["children"].append(sec_node)
-            
-            # Получаем дочерние подразделения
-            cursor.execute("""
-                SELECT id, name, code, description
-                FROM divisions
-                WHERE parent_id = ?
-                ORDER BY name
-            """, (div_id,))
-            
-            child_divisions = cursor.fetchall()
-            for child_div in child_divisions:
-                child_div_id, child_div_name, child_div_code, child_div_desc = child_div
-                child_div_node = build_division_tree(db, child_div)
-                div_node["children"].append(child_div_node)
-                
-            node["children"].append(div_node)
-    
+    if entity_type == "organization":
+        node["org_type"] = org_type
     return node
 
-def build_division_tree(db, division):
-    """Рекурсивно строит дерево подразделений"""
-    div_id, div_name, div_code, div_desc = division
-    
-    div_node = {
-        "id": div_id,
-        "name": div_name,
-        "code": div_code,
-        "entity_type": "division",
-        "children": []
-    }
-    
+def select_by_parents(cursor, sql_template, parent_ids):
+    """Выполняет запрос для родителей пачками; {ids} в шаблоне заменяется на плейсхолдеры."""
+    rows = []
+    for start in range(0, len(parent_ids), HIERARCHY_BATCH_SIZE):
+        batch = parent_ids[start:start + HIERARCHY_BATCH_SIZE]
+        placeholders = ", ".join("?" for _ in batch)
+        cursor.execute(sql_template.format(ids=placeholders), batch)
+        rows.extend(cursor.fetchall())
+    return rows
+
+def relation_sql(relation, count=False):
+    _, from_clause, parent_column, condition, org_type_column = relation
+    where = f"{parent_column} IN ({{ids}})"
+    if condition:
+        where += f" AND {condition}"
+    if count:
+        return f"SELECT {parent_column}, COUNT(*) FROM {from_clause} WHERE {where} GROUP BY {parent_column}"
+    return (f"SELECT {parent_column}, c.id, c.name, c.code, {org_type_column} "
+            f"FROM {from_clause} WHERE {where} ORDER BY c.name")
+
+def group_by_type(nodes):
+    groups = {}
+    for node in nodes:
+        groups.setdefault(node["entity_type"], {}).setdefault(node["id"], []).append(node)
+    return groups
+
+def is_ancestor(parents, node, entity_type, node_id) -> bool:
+    """Есть ли узел entity_type/node_id на пути от node (включительно) к корню."""
+    while node is not None:
+        if node["entity_type"] == entity_type and node["id"] == node_id:
+            return True
+        node = parents.get(id(node))
+    return False
+
+def load_children(cursor, frontier, parents):
+    """
+    Загружает прямых потомков всех узлов уровня: один запрос на тип связи, а не на узел.
+    parents - родитель каждого загруженного узла (по id() словаря узла), пополняется здесь.
+    Потомок, который уже есть выше по ветке (цикл в ссылках на родителя), не добавляется -
+    иначе обход по уровням не закончился бы.
+    """
+    next_level = []
+    for entity_type, by_id in group_by_type(frontier).items():
+        parent_ids = list(by_id)
+        for relation in CHILD_RELATIONS[entity_type]:
+            child_type = relation[0]
+            for parent_id, *child_row in select_by_parents(cursor, relation_sql(relation), parent_ids):
+                for parent in by_id[parent_id]:
+                    if is_ancestor(parents, parent, child_type, child_row[0]):
+                        continue
+                    child = make_node(child_type, child_row)
+                    parents[id(child)] = parent
+                    parent["children"].append(child)
+                    next_level.append(child)
+    for node in frontier:
+        node["children_count"] = len(node["children"])
+        node["has_children"] = node["children_count"] > 0
+    return next_level
+
+def count_children(cursor, frontier):
+    """Заполняет children_count у узлов, потомки которых не загружаются (граница depth)."""
+    for entity_type, by_id in group_by_type(frontier).items():
+        parent_ids = list(by_id)
+        for relation in CHILD_RELATIONS[entity_type]:
+            for parent_id, count in select_by_parents(cursor, relation_sql(relation, count=True), parent_ids):
+                for node in by_id[parent_id]:
+                    node["children_count"] += count
+    for node in frontier:
+        node["has_children"] = node["children_count"] > 0
+
+def load_org_hierarchy(db, root_type: Optional[str] = None, root_id: Optional[int] = None,
+                       depth: Optional[int] = None):
+    """
+    Строит дерево организаций, подразделений, отделов и функций уровень за уровнем.
+    Без depth дерево строится целиком; с depth загружается depth уровней ниже корней.
+    """
     cursor = db.cursor()
     
-    # Получаем отделы этого подразделения
-    cursor.execute("""
-        SELECT s.id, s.name, s.code, s.description
-        FROM sections s
-        JOIN division_sections ds ON s.id = ds.section_id
-        WHERE ds.division_id = ?
-        ORDER BY s.name
-    """, (div_id,))
-    
-    sections = cursor.fetchall()
-    for section in sections:
-        sec_id, sec_name, sec_code, sec_desc = section
-        sec_node = {
-            "id": sec_id,
-            "name": sec_name,
-            "code": sec_code,
-            "entity_type": "section",
-            "children": []
-        }
-        
-        # Получаем функции этого отдела
+    if root_type is None:
+        # Организации верхнего уровня (без parent_id)
         cursor.execute("""
-            SELECT f.id, f.name, f.code, f.description
-            FROM functions f
-            JOIN section_functions sf ON f.id = sf.function_id
-            WHERE sf.section_id = ?
-            ORDER BY f.name
-        """, (sec_id,))
-        
-        functions = cursor.fetchall()
-        for func in functions:
-            func_id, func_name, func_code, func_desc = func
-            func_node = {
-                "id": func_id,
-                "name": func_name,
-                "code": func_code,
-                "entity_type": "function",
-                "children": []
-            }
-            
-            sec_node["children"].append(func_node)
-        
-        div_node["children"].append(sec_node)
-    
-    # Получаем дочерние подразделения
-    cursor.execute("""
-        SELECT id, name, code, description
-        FROM divisions
-        WHERE parent_id = ?
-        ORDER BY name
-    """, (div_id,))
-    
-    child_divisions = cursor.fetchall()
-    for child_div in child_divisions:
-        child_div_node = build_division_tree(db, child_div)
-        div_node["children"].append(child_div_node)
-    
-    return div_node
+            SELECT id, name, code, org_type
+            FROM organizations
+            WHERE parent_id IS NULL
+            ORDER BY name
+        """)
+        roots = [make_node("organization", row) for row in cursor.fetchall()]
+    else:
+        table, org_type_column = NODE_TABLES[root_type]
+        cursor.execute(f"SELECT id, name, code, {org_type_column} FROM {table} WHERE id = ?", (root_id,))
+        row = cursor.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail=f"Узел {root_type} с ID {root_id} не найден")
+        roots = [make_node(root_type, row)]
+    
+    frontier = roots
+    parents = {}
+    level = 0
+    while frontier and (depth is None or level < depth):
+        frontier = load_children(cursor, frontier, parents)
+        level += 1
+    
+    if frontier:
+        count_children(cursor, frontier)
+    
+    return roots
 
-@router.get("/staff-tree", response_model=List[StaffNode])
-def get_staff_hierarchy(db: sqlite3.Connection = Depends(get_db)):
+def relation_condition(as_of: Optional[date], alias: str = "fr"):
+    """
+    Условие актуальности функциональных отношений:
+    без даты - по флагу is_active, с датой - по периоду действия.
+    """
+    if as_of is None:
+        return f"{alias}.is_active = 1", []
+    return as_of_condition("functional_relations", as_of, alias)
+
+def get_primary_position(cursor, staff_id: int, as_of: Optional[date] = None) -> str:
+    """Возвращает название основной должности сотрудника (на дату as_of, если указана)"""
+    query = """
+        SELECT p.name
+        FROM positions p
+        JOIN staff_positions sp ON p.id = sp.position_id
+        WHERE sp.staff_id = ? AND sp.is_primary = 1
+    """
+    params = [staff_id]
+    if as_of is not None:
+        condition, condition_params = as_of_condition("staff_positions", as_of, "sp")
+        query += f" AND {condition}"
+        params.extend(condition_params)
+    cursor.execute(query + " LIMIT 1", params)
+    
+    position_row = cursor.fetchone()
+    return position_row[0] if position_row else "Неизвестная должность"
+
+@router.get("/staff-tree", response_model=List[StaffNode],
+            dependencies=[table_etag(get_db, *STAFF_HIERARCHY_TABLES)])
+def get_staff_hierarchy(as_of: Optional[date] = None, db: sqlite3.Connection = Depends(get_db)):
     """
     Получает иерархию сотрудников на основе функциональных отношений.
     Показывает административное подчинение и другие типы отношений.
+    С параметром as_of строит иерархию на указанную дату: учитываются отношения
+    и должности, действовавшие на эту дату, а не текущие флаги активности.
     """
+    return versioned_flight(db, STAFF_HIERARCHY_TABLES, ("staff-tree", as_of), lambda: load_staff_hierarchy(db, as_of))
+
+def load_staff_hierarchy(db, as_of: Optional[date] = None):
+    """Строит дерево сотрудников по административному подчинению."""
     cursor = db.cursor()
     
+    rel_condition, params = relation_condition(as_of)
+    if as_of is None:
+        staff_condition = "s.is_active = 1"
+    else:
+        # На дату в дерево попадают сотрудники, занимавшие должность в этот день
+        sp_condition, sp_params = as_of_condition("staff_positions", as_of, "sp")
+        staff_condition = f"s.id IN (SELECT sp.staff_id FROM staff_positions sp WHERE {sp_condition})"
+        params = params + sp_params
+    
     # Находим топ-менеджеров (тех, кто не имеет менеджеров с типом отношения 'administrative')
-    cursor.execute("""
+    cursor.execute(f"""
         SELECT s.id, s.first_name, s.last_name, s.email 
         FROM staff s
         WHERE s.id NOT IN (
-            SELECT subordinate_id 
-            FROM functional_relations 
-            WHERE relation_type = 'administrative' AND is_active = 1
+            SELECT fr.subordinate_id 
+            FROM functional_relations fr
+            WHERE fr.relation_type = 'administrative' AND {rel_condition}
         )
-        AND s.is_active = 1
+        AND {staff_condition}
         ORDER BY s.last_name, s.first_name
-    """)
+    """, params)
     
     top_managers = cursor.fetchall()
     result = []
@@ -288,16 +363,7 @@ def get_staff_hierarchy(db: sqlite3.Connection = Depends(get_db)):
         manager_id, first_name, last_name, email = manager
         
         # Получаем основную должность менеджера
-        cursor.execute("""
-            SELECT p.name
-            FROM positions p
-            JOIN staff_positions sp ON p.id = sp.position_id
-            WHERE sp.staff_id = ? AND sp.is_primary = 1
-            LIMIT 1
-        """, (manager_id,))
-        
-        position_row = cursor.fetchone()
-        position = position_row[0] if position_row else "Неизвестная должность"
+        position = get_primary_position(cursor, manager_id, as_of)
         
         manager_node = {
             "id": manager_id,
@@ -309,23 +375,24 @@ def get_staff_hierarchy(db: sqlite3.Connection = Depends(get_db)):
         }
         
         # Строим дерево подчиненных для этого менеджера
-        build_staff_tree(db, manager_id, manager_node)
+        build_staff_tree(db, manager_id, manager_node, as_of)
         result.append(manager_node)
     
     return result
 
-def build_staff_tree(db, manager_id, node):
+def build_staff_tree(db, manager_id, node, as_of=None):
     """Рекурсивно строит дерево подчиненных для менеджера"""
     cursor = db.cursor()
+    rel_condition, rel_params = relation_condition(as_of)
     
     # Получаем прямых подчиненных текущего менеджера (административное подчинение)
-    cursor.execute("""
+    cursor.execute(f"""
         SELECT s.id, s.first_name, s.last_name, s.email, fr.relation_type, fr.description
         FROM staff s
         JOIN functional_relations fr ON s.id = fr.subordinate_id
-        WHERE fr.manager_id = ? AND fr.relation_type = 'administrative' AND fr.is_active = 1
+        WHERE fr.manager_id = ? AND fr.relation_type = 'administrative' AND {rel_condition}
         ORDER BY s.last_name, s.first_name
-    """, (manager_id,))
+    """, [manager_id] + rel_params)
     
     subordinates = cursor.fetchall()
     
@@ -333,16 +400,7 @@ def build_staff_tree(db, manager_id, node):
         sub_id, first_name, last_name, email, relation_type, description = sub
         
         # Получаем основную должность сотрудника
-        cursor.execute("""
-            SELECT p.name
-            FROM positions p
-            JOIN staff_positions sp ON p.id = sp.position_id
-            WHERE sp.staff_id = ? AND sp.is_primary = 1
-            LIMIT 1
-        """, (sub_id,))
-        
-        position_row = cursor.fetchone()
-        position = position_row[0] if position_row else "Неизвестная должность"
+        position = get_primary_position(cursor, sub_id, as_of)
         
         sub_node = {
             "id": sub_id,
@@ -354,15 +412,15 @@ def build_staff_tree(db, manager_id, node):
         }
         
         # Получаем другие типы отношений для этого сотрудника
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT fr.id, fr.manager_id, fr.relation_type, fr.description, 
                    m.first_name, m.last_name
             FROM functional_relations fr
             JOIN staff m ON fr.manager_id = m.id
             WHERE fr.subordinate_id = ? 
               AND fr.relation_type != 'administrative'
-              AND fr.is_active = 1
-        """, (sub_id,))
+              AND {rel_condition}
+        """, [sub_id] + rel_params)
         
         other_relations = cursor.fetchall()
         for rel in other_relations:
@@ -377,34 +435,44 @@ def build_staff_tree(db, manager_id, node):
             sub_node["relations"].append(relation)
         
         # Рекурсивно строим дерево для этого подчиненного
-        build_staff_tree(db, sub_id, sub_node)
+        build_staff_tree(db, sub_id, sub_node, as_of)
         
         # Добавляем подчиненного в дерево
         node["children"].append(sub_node)
 
-@router.get("/matrix-relations", response_model=List[MatrixRelation])
+@router.get("/matrix-relations", response_model=List[MatrixRelation],
+            dependencies=[table_etag(get_db, *MATRIX_TABLES)])
 def get_matrix_relations(
     relation_type: Optional[str] = None,
+    as_of: Optional[date] = None,
     db: sqlite3.Connection = Depends(get_db)
 ):
     """
     Получает матричные отношения между сотрудниками.
-    Можно фильтровать по типу отношения.
+    Можно фильтровать по типу отношения и получить отношения на дату (as_of).
     """
+    # Пустой фильтр по типу равнозначен его отсутствию
+    relation_type = relation_type or None
+    return versioned_flight(
+        db, MATRIX_TABLES, ("matrix-relations", relation_type, as_of),
+        lambda: load_matrix_relations(db, relation_type, as_of),
+    )
+
+def load_matrix_relations(db, relation_type: Optional[str] = None, as_of: Optional[date] = None):
+    """Возвращает список матричных отношений между сотрудниками."""
     cursor = db.cursor()
+    rel_condition, params = relation_condition(as_of)
     
-    query = """
+    query = f"""
         SELECT fr.id, fr.manager_id, fr.subordinate_id, fr.relation_type, fr.description, fr.extra_field1,
                m.first_name AS m_first, m.last_name AS m_last,
                s.first_name AS s_first, s.last_name AS s_last
         FROM functional_relations fr
         JOIN staff m ON fr.manager_id = m.id
         JOIN staff s ON fr.subordinate_id = s.id
-        WHERE fr.is_active = 1
+        WHERE {rel_condition}
     """
     
-    params = []
-    
     if relation_type:
         query += " AND fr.relation_type = ?"
         params.append(relation_type)
@@ -433,14 +501,153 @@ def get_matrix_relations(
     
     return result
 
-@router.get("/staff-info/{staff_id}", response_model=Dict[str, Any])
-def get_staff_detailed_info(staff_id: int, db: sqlite3.Connection = Depends(get_db)):
+def layout_response(layout: Dict[str, Any], format: LayoutFormat):
+    if format == LayoutFormat.SVG:
+        return Response(content=render_svg(layout), media_type="image/svg+xml")
+    return layout
+
+def cached_layout(db, tables, key, build):
+    """
+    Раскладка из кэша по версиям таблиц структуры. Одинаковые одновременные запросы
+    строят ее один раз; без версий таблиц раскладка строится заново.
+    """
+    versions = versions_key(get_table_versions(db, tables)[0], tables)
+    if versions is None:
+        return structure_flight.do(key, build)
+    key = key + (versions,)
+    return structure_flight.do(key, lambda: layout_cache.get_or_build(key, build))
+
+# Раскладки прежних версий структуры больше не понадобятся - освобождаем их сразу
+# после изменения в любом процессе
+bus.subscribe(lambda db, invalidations: layout_cache.discard_tables(
+    {item.table for item in invalidations if item.row_id is None}
+))
+
+@router.get("/layout", response_model=OrgChartLayout,
+            dependencies=[table_etag(get_db, *HIERARCHY_TABLES)])
+def get_org_layout(
+    root_type: Optional[EntityType] = None,
+    root_id: Optional[int] = None,
+    depth: Optional[int] = Query(None, ge=0),
+    format: LayoutFormat = LayoutFormat.JSON,
+    db: sqlite3.Connection = Depends(get_db)
+):
+    """
+    Готовая раскладка дерева оргструктуры (те же узлы, что и /hierarchy):
+    координаты узлов для отрисовки без вычислений в браузере, format=svg - сразу SVG.
+    Раскладка кэшируется по версиям таблиц структуры.
+    """
+    if (root_type is None) != (root_id is None):
+        raise HTTPException(status_code=400, detail="Параметры root_type и root_id указываются вместе")
+    
+    root_key = root_type.value if root_type else None
+    layout = cached_layout(
+        db, HIERARCHY_TABLES, ("layout", root_key, root_id, depth),
+        lambda: layout_forest(load_org_hierarchy(db, root_key, root_id, depth)),
+    )
+    return layout_response(layout, format)
+
+@router.get("/staff-tree/layout", response_model=OrgChartLayout,
+            dependencies=[table_etag(get_db, *STAFF_TREE_TABLES)])
+def get_staff_layout(
+    format: LayoutFormat = LayoutFormat.JSON,
+    db: sqlite3.Connection = Depends(get_db)
+):
+    """
+    Раскладка дерева административного подчинения сотрудников. Остальные
+    функциональные связи (и дополнительные административные руководители)
+    возвращаются в edges и рисуются поверх дерева.
+    """
+    layout = cached_layout(db, STAFF_TREE_TABLES, ("staff-layout",), lambda: load_staff_layout(db))
+    return layout_response(layout, format)
+
+def load_staff_layout(db):
+    """
+    Дерево сотрудников для раскладки: загружается двумя запросами, каждый сотрудник
+    стоит в дереве один раз - под первым по порядку административным руководителем.
+    """
+    cursor = db.cursor()
+    cursor.execute("""
+        SELECT id, first_name, last_name FROM staff
+        WHERE is_active = 1
+        ORDER BY last_name, first_name
+    """)
+    nodes = {
+        staff_id: {"entity_type": "staff", "id": staff_id, "name": f"{first_name} {last_name}", "children": []}
+        for staff_id, first_name, last_name in cursor.fetchall()
+    }
+    order = {staff_id: index for index, staff_id in enumerate(nodes)}
+    
+    cursor.execute("""
+        SELECT manager_id, subordinate_id, relation_type FROM functional_relations
+        WHERE is_active = 1 AND manager_id != subordinate_id
+    """)
+    relations = [tuple(row) for row in cursor.fetchall()]
+    administrative = {}
+    for manager_id, subordinate_id, relation_type in relations:
+        if relation_type == "administrative" and manager_id in nodes and subordinate_id in nodes:
+            administrative.setdefault(manager_id, []).append(subordinate_id)
+    subordinates = {sub for manager, sub, relation_type in relations if relation_type == "administrative"}
+    
+    # Корни - сотрудники без административного руководителя (как в /staff-tree);
+    # обход в глубину без рекурсии, повторная встреча сотрудника (второй руководитель
+    # или цикл подчинения) не добавляет его в дерево еще раз
+    roots = [node for staff_id, node in nodes.items() if staff_id not in subordinates]
+    placed = {node["id"] for node in roots}
+    stack = list(roots)
+    while stack:
+        node = stack.pop()
+        for sub_id in sorted(administrative.get(node["id"], []), key=order.get):
+            if sub_id not in placed:
+                placed.add(sub_id)
+                node["children"].append(nodes[sub_id])
+                stack.append(nodes[sub_id])
+    
+    layout = layout_forest(roots)
+    keys = {}
+    for node in layout["nodes"]:
+        keys.setdefault(node["id"], node["key"])
+    tree_edges = {
+        (layout["nodes"][node["parent"]]["id"], node["id"])
+        for node in layout["nodes"] if node["parent"] is not None
+    }
+    layout["edges"] = [
+        {"from_key": keys[manager_id], "to_key": keys[subordinate_id], "relation_type": relation_type}
+        for manager_id, subordinate_id, relation_type in relations
+        if manager_id in keys and subordinate_id in keys
+        and not (relation_type == "administrative" and (manager_id, subordinate_id) in tree_edges)
+    ]
+    return layout
+
+@router.get("/coalescing-stats", response_model=Dict[str, Any])
+def get_coalescing_stats():
+    """
+    Статистика объединения одинаковых запросов к деревьям оргструктуры:
+    executed - выполненные вычисления, coalesced - запросы, получившие чужой результат.
+    """
+    return structure_flight.stats()
+
+@router.get("/staff-info/{staff_id}", response_model=Dict[str, Any],
+            dependencies=[table_etag(get_db, "staff", "staff_positions", "positions", "organizations", "divisions", "staff_locations", "staff_functions", "functions", "functional_relations")])
+def get_staff_detailed_info(
+    staff_id: int,
+    as_of: Optional[date] = None,
+    db: sqlite3.Connection = Depends(get_db)
+):
     """
     Получает детальную информацию о сотруднике, включая все его должности,
     локации, функции и отношения с другими сотрудниками.
+    С параметром as_of возвращаются только назначения и отношения, действовавшие на эту дату.
     """
     cursor = db.cursor()
     
+    def period_filter(table, alias):
+        """Дополнительное условие по дате для назначений сотрудника"""
+        if as_of is None:
+            return "", []
+        condition, params = as_of_condition(table, as_of, alias)
+        return f" AND {condition}", params
+    
     # Получаем основную информацию о сотруднике
     cursor.execute("""
         SELECT id, first_name, last_name, middle_name, email, phone, 
@@ -464,15 +671,16 @@ def get_staff_detailed_info(staff_id: int, db: sqlite3.Connection = Depends(get_
             primary_org_name = org_row[0]
     
     # Получаем все должности сотрудника
-    cursor.execute("""
+    period, period_params = period_filter("staff_positions", "sp")
+    cursor.execute(f"""
         SELECT sp.id, p.name AS position_name, d.name AS division_name, 
                sp.is_primary, sp.start_date, sp.end_date
         FROM staff_positions sp
         JOIN positions p ON sp.position_id = p.id
         LEFT JOIN divisions d ON sp.division_id = d.id
-        WHERE sp.staff_id = ?
+        WHERE sp.staff_id = ?{period}
         ORDER BY sp.is_primary DESC, sp.start_date DESC
-    """, (staff_id,))
+    """, [staff_id] + period_params)
     
     positions = []
     for pos in cursor.fetchall():
@@ -487,13 +695,14 @@ def get_staff_detailed_info(staff_id: int, db: sqlite3.Connection = Depends(get_
         })
     
     # Получаем все локации сотрудника
-    cursor.execute("""
+    period, period_params = period_filter("staff_locations", "sl")
+    cursor.execute(f"""
         SELECT sl.id, o.name AS location_name, sl.is_current, sl.date_from, sl.date_to
         FROM staff_locations sl
         JOIN organizations o ON sl.location_id = o.id
-        WHERE sl.staff_id = ?
+        WHERE sl.staff_id = ?{period}
         ORDER BY sl.is_current DESC, sl.date_from DESC
-    """, (staff_id,))
+    """, [staff_id] + period_params)
     
     locations = []
     for loc in cursor.fetchall():
@@ -507,14 +716,15 @@ def get_staff_detailed_info(staff_id: int, db: sqlite3.Connection = Depends(get_
         })
     
     # Получаем все функции сотрудника
-    cursor.execute("""
+    period, period_params = period_filter("staff_functions", "sf")
+    cursor.execute(f"""
         SELECT sf.id, f.name AS function_name, sf.commitment_percent, 
                sf.is_primary, sf.date_from, sf.date_to
         FROM staff_functions sf
         JOIN functions f ON sf.function_id = f.id
-        WHERE sf.staff_id = ?
+        WHERE sf.staff_id = ?{period}
         ORDER BY sf.is_primary DESC, sf.date_from DESC
-    """, (staff_id,))
+    """, [staff_id] + period_params)
     
     functions = []
     for func in cursor.fetchall():
@@ -528,15 +738,17 @@ def get_staff_detailed_info(staff_id: int, db: sqlite3.Connection = Depends(get_
             "date_to": date_to
         })
     
+    rel_condition, rel_params = relation_condition(as_of)
+    
     # Получаем все отношения, где сотрудник является подчиненным
-    cursor.execute("""
+    cursor.execute(f"""
         SELECT fr.id, fr.manager_id, m.first_name, m.last_name, 
                fr.relation_type, fr.description, fr.start_date, fr.end_date
         FROM functional_relations fr
         JOIN staff m ON fr.manager_id = m.id
-        WHERE fr.subordinate_id = ? AND fr.is_active = 1
+        WHERE fr.subordinate_id = ? AND {rel_condition}
         ORDER BY fr.relation_type
-    """, (staff_id,))
+    """, [staff_id] + rel_params)
     
     managers = []
     for rel in cursor.fetchall():
@@ -552,14 +764,14 @@ def get_staff_detailed_info(staff_id: int, db: sqlite3.Connection = Depends(get_
         })
     
     # Получаем все отношения, где сотрудник является руководителем
-    cursor.execute("""
+    cursor.execute(f"""
         SELECT fr.id, fr.subordinate_id, s.first_name, s.last_name, 
                fr.relation_type, fr.description, fr.start_date, fr.end_date
         FROM functional_relations fr
         JOIN staff s ON fr.subordinate_id = s.id
-        WHERE fr.manager_id = ? AND fr.is_active = 1
+        WHERE fr.manager_id = ? AND {rel_condition}
         ORDER BY fr.relation_type
-    """, (staff_id,))
+    """, [staff_id] + rel_params)
     
     subordinates = []
     for rel in cursor.fetchall():
@@ -0,0 +1,335 @@
+"""
+Реплика только для чтения: согласованная копия основной базы для тяжелых чтений.
+
+Долгие чтения деревьев и выгрузок держат снимок WAL основной базы и мешают
+контрольным точкам. В режиме реплики фоновый поток основного процесса
+периодически снимает копию базы онлайн-бэкапом SQLite (backup API) в новый файл
+поколения (full_api_replica.<n>.db) и переключает на него указатель
+(full_api_replica.db.current - номер текущего поколения). Опубликованный файл
+больше не меняется, поэтому эндпоинты чтения открывают его как неизменяемый
+(immutable, без блокировок и WAL) с отображением в память. Подмена открытого
+файла не нужна (на Windows она невозможна): старые поколения удаляются, когда их
+никто не читает, а предыдущее хранится, пока его дочитывают открывшие до переключения.
+
+Реплика считается свежей, пока с момента последней сверки с основной базой
+прошло не больше max_staleness секунд (время сверки - mtime указателя:
+публикатор обновляет его, даже когда данные не менялись). Устаревшая или
+отсутствующая реплика - чтение идет из основной базы.
+
+Все чтение запроса (проверка ETag и тело ответа) идет в одной транзакции одного
+соединения - с репликой или с основной базой, - поэтому ETag и заголовки версии
+соответствуют отданным данным.
+
+Версия данных - сумма версий таблиц (table_versions): она растет при любом
+изменении версионируемых таблиц и одинаково считается для реплики и основной
+базы. Ответ сообщает, какие данные видел клиент:
+
+    X-OFS-Read-Source: replica | primary
+    X-OFS-Data-Version: 1234
+    X-OFS-Replica-Age: 3          секунд с последней сверки реплики (только для реплики)
+
+Настройки берутся из переменных окружения (значения по умолчанию в REPLICA_DEFAULTS):
+
+    OFS_REPLICA_ENABLED=0                   1 - включить режим реплики
+    OFS_REPLICA_PATH=full_api_replica.db    имя реплики (файлы поколений и указатель - рядом)
+    OFS_REPLICA_INTERVAL=5                  как часто сверять реплику с основной базой, с
+    OFS_REPLICA_MAX_STALENESS=30            максимальный возраст реплики для чтения, с
+    OFS_REPLICA_MMAP_SIZE=268435456         объем отображения файла реплики в память
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import sharding
+
+try:
+    import fcntl
+except ImportError:  # Windows: публикует каждый процесс (переключение указателя все равно атомарно)
+    fcntl = None
+
+logger = logging.getLogger("ofs_api.replica")
+
+REPLICA_DEFAULTS = {
+    "enabled": 0,
+    "path": "full_api_replica.db",
+    "interval": 5,
+    "max_staleness": 30,
+    "mmap_size": 256 * 1024 * 1024,
+}
+
+# Попытки переключить указатель, пока его читает другой процесс (Windows)
+POINTER_RETRIES = 50
+
+_settings: Optional[Dict] = None
+_publisher: Optional["ReplicaPublisher"] = None
+
+
+def load_settings() -> Dict:
+    """Собирает настройки реплики из REPLICA_DEFAULTS и переменных окружения."""
+    settings = {}
+    for key, default in REPLICA_DEFAULTS.items():
+        value = os.environ.get(f"OFS_REPLICA_{key.upper()}")
+        if value is None:
+            settings[key] = default
+        elif isinstance(default, int):
+            settings[key] = int(value)
+        else:
+            settings[key] = value
+    return settings
+
+
+def get_settings() -> Dict:
+    global _settings
+    if _settings is None:
+        _settings = load_settings()
+    return _settings
+
+
+def data_version(db: sqlite3.Connection) -> Optional[int]:
+    """Версия данных: сумма версий таблиц; None - версии таблиц не ведутся."""
+    try:
+        return db.execute("SELECT COALESCE(SUM(version), 0) FROM table_versions").fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+
+
+# ================== ПОКОЛЕНИЯ РЕПЛИКИ ==================
+
+def pointer_path(replica_path: str) -> str:
+    return f"{replica_path}.current"
+
+
+def generation_path(replica_path: str, generation: int) -> str:
+    root, ext = os.path.splitext(replica_path)
+    return f"{root}.{generation}{ext or '.db'}"
+
+
+def current_generation(replica_path: str) -> Optional[Tuple[int, str]]:
+    """Номер и файл опубликованного поколения по указателю; None - реплика еще не опубликована."""
+    try:
+        with open(pointer_path(replica_path), encoding="utf-8") as pointer:
+            generation = int(pointer.read().strip())
+    except (OSError, ValueError):
+        return None
+    return generation, generation_path(replica_path, generation)
+
+
+def switch_pointer(replica_path: str, generation: int):
+    """Атомарно переключает указатель на новое поколение."""
+    pointer = pointer_path(replica_path)
+    tmp_path = f"{pointer}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as tmp:
+        tmp.write(str(generation))
+    # Читатели держат указатель открытым только на время чтения номера, но на Windows
+    # в этот момент подменить файл нельзя - повторяем
+    for _ in range(POINTER_RETRIES - 1):
+        try:
+            os.replace(tmp_path, pointer)
+            return
+        except PermissionError:
+            time.sleep(0.01)
+    os.replace(tmp_path, pointer)
+
+
+def remove_old_generations(replica_path: str, current: int) -> int:
+    """
+    Удаляет поколения старше предыдущего (предыдущее могут еще открывать запросы,
+    прочитавшие указатель до переключения). Файл, который еще читают, на Windows
+    удалить нельзя - он удаляется при следующей публикации.
+    """
+    directory = os.path.dirname(os.path.abspath(replica_path))
+    root, ext = os.path.splitext(os.path.basename(replica_path))
+    pattern = re.compile(rf"{re.escape(root)}\.(\d+){re.escape(ext or '.db')}")
+    removed = 0
+    for name in os.listdir(directory):
+        match = pattern.fullmatch(name)
+        if match is None or int(match.group(1)) >= current - 1:
+            continue
+        try:
+            os.remove(os.path.join(directory, name))
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+# ================== ПУБЛИКАЦИЯ (основной процесс) ==================
+
+def publish_replica(primary_path: str, replica_path: str) -> Optional[int]:
+    """Снимает согласованную копию основной базы в новое поколение и переключает на него указатель."""
+    current = current_generation(replica_path)
+    generation = current[0] + 1 if current is not None else 1
+    target_path = generation_path(replica_path, generation)
+    # Остаток неудачной публикации: указатель на него еще не переключался
+    if os.path.exists(target_path):
+        os.remove(target_path)
+    source = sqlite3.connect(primary_path)
+    target = sqlite3.connect(target_path)
+    try:
+        # Копия за один шаг - один снимок основной базы; писатели в режиме WAL не ждут
+        source.backup(target)
+        # Реплика открывается как immutable: режим WAL ей не нужен
+        target.execute("PRAGMA journal_mode=DELETE")
+        version = data_version(target)
+        target.execute("CREATE TABLE IF NOT EXISTS replica_info (data_version INTEGER, published_at TEXT)")
+        target.execute("DELETE FROM replica_info")
+        target.execute("INSERT INTO replica_info VALUES (?, CURRENT_TIMESTAMP)", (version,))
+        target.commit()
+    finally:
+        target.close()
+        source.close()
+    switch_pointer(replica_path, generation)
+    remove_old_generations(replica_path, generation)
+    return version
+
+
+def replica_version(replica_path: str) -> Optional[int]:
+    current = current_generation(replica_path)
+    if current is None or not os.path.exists(current[1]):
+        return None
+    conn = connect_replica(current[1])
+    try:
+        return conn.execute("SELECT data_version FROM replica_info").fetchone()[0]
+    except sqlite3.DatabaseError:
+        return None
+    finally:
+        conn.close()
+
+
+class ReplicaPublisher(threading.Thread):
+    """Поток, сверяющий реплику с основной базой раз в interval секунд."""
+
+    def __init__(self, primary_path: str, settings: Dict):
+        super().__init__(name="ofs-replica-publisher", daemon=True)
+        self.primary_path = primary_path
+        self.replica_path = settings["path"]
+        self.interval = settings["interval"]
+        self.stopped = threading.Event()
+        self._lock_file = None
+
+    def acquire(self) -> bool:
+        """Публикует один процесс на файл реплики (остальные воркеры только читают)."""
+        if fcntl is None:
+            return True
+        self._lock_file = open(f"{self.replica_path}.lock", "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+        return True
+
+    def check(self):
+        current = replica_version(self.replica_path)
+        primary = sqlite3.connect(self.primary_path)
+        try:
+            version = data_version(primary)
+        finally:
+            primary.close()
+        if version is not None and version == current:
+            # Данные не менялись - реплика по-прежнему актуальна
+            os.utime(pointer_path(self.replica_path))
+            return
+        started = time.perf_counter()
+        version = publish_replica(self.primary_path, self.replica_path)
+        logger.info(
+            f"Реплика опубликована: версия данных {version}",
+            extra={"data_version": version, "duration_ms": round((time.perf_counter() - started) * 1000, 1)},
+        )
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Ошибка публикации реплики")
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        if self._lock_file is not None:
+            self._lock_file.close()
+
+
+def start_replica_publisher(primary_path: str) -> bool:
+    """Запускает публикацию реплики, если режим включен и этот процесс ее владелец."""
+    global _publisher
+    settings = get_settings()
+    if not settings["enabled"] or _publisher is not None:
+        return False
+    publisher = ReplicaPublisher(primary_path, settings)
+    if not publisher.acquire():
+        return False
+    _publisher = publisher
+    publisher.start()
+    return True
+
+
+def stop_replica_publisher():
+    global _publisher
+    if _publisher is not None:
+        _publisher.stop()
+        _publisher = None
+
+
+# ================== ЧТЕНИЕ ==================
+
+def connect_replica(generation_file: str) -> sqlite3.Connection:
+    """Соединение только для чтения к неизменяемому файлу поколения реплики с отображением в память."""
+    path = os.path.abspath(generation_file).replace("?", "%3f").replace("#", "%23")
+    conn = sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+    conn.execute(f"PRAGMA mmap_size={int(get_settings()['mmap_size'])}")
+    return conn
+
+
+def replica_age(replica_path: str) -> Optional[float]:
+    """Секунды с последней сверки реплики с основной базой; None - реплики нет."""
+    try:
+        return max(time.time() - os.path.getmtime(pointer_path(replica_path)), 0.0)
+    except OSError:
+        return None
+
+
+def connect_for_read(primary_path: str) -> Tuple[sqlite3.Connection, Dict[str, str]]:
+    """
+    Соединение для эндпоинтов чтения: со свежей репликой, если режим включен,
+    иначе с основной базой. Соединение с основной базой открывается в транзакции
+    чтения (файл реплики и так неизменен): версия в заголовках, ETag и все запросы
+    эндпоинта видят один снимок данных. Возвращает и заголовки с версией прочитанных данных.
+    """
+    settings = get_settings()
+    # Реплика копирует только основную базу, в режиме шардирования читаются все шарды
+    if settings["enabled"] and not sharding.is_enabled():
+        age = replica_age(settings["path"])
+        current = current_generation(settings["path"])
+        if age is not None and age <= settings["max_staleness"] and current is not None:
+            try:
+                conn = connect_replica(current[1])
+                version = conn.execute("SELECT data_version FROM replica_info").fetchone()[0]
+            except sqlite3.DatabaseError:
+                logger.warning("Реплика недоступна, чтение из основной базы")
+            else:
+                conn.row_factory = sqlite3.Row
+                return conn, {
+                    "X-OFS-Read-Source": "replica",
+                    "X-OFS-Data-Version": str(version),
+                    "X-OFS-Replica-Age": str(int(age)),
+                }
+
+    if sharding.is_enabled():
+        conn = sharding.connect_federated(primary_path)
+    else:
+        conn = sqlite3.connect(primary_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+    conn.execute("BEGIN")
+    headers = {"X-OFS-Read-Source": "primary"}
+    version = data_version(conn)
+    if version is not None:
+        headers["X-OFS-Data-Version"] = str(version)
+    return conn, headers
@@ -0,0 +1,167 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+import re
+import sqlite3
+from typing import List, Optional
+from pydantic import BaseModel
+
+import sharding
+from complete_schema import SEARCH_REBUILD_SQL
+
+# Создаем свою функцию для получения соединения с БД
+def get_db():
+    """Предоставляет соединение с базой данных."""
+    DB_PATH = "full_api_new.db"
+    if sharding.is_enabled():
+        # Строки всех холдингов: каталог с подключенными шардами
+        conn = sharding.connect_federated(DB_PATH)
+    else:
+        # Соединение создается и используется в разных потоках пула FastAPI
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+router = APIRouter(
+    prefix="/search",
+    tags=["search"],
+)
+
+# Максимальное число слов в поисковой строке, остальные отбрасываются
+MAX_QUERY_TOKENS = 8
+
+# Настройка поиска по каждому типу сущностей:
+# исходная таблица, FTS-таблица, веса колонок для bm25 и запрос для получения заголовков найденных записей
+SEARCH_ENTITIES = {
+    "staff": {
+        "table": "staff",
+        "fts_table": "staff_fts",
+        "rank": "bm25(10.0, 3.0, 2.0)",
+        "select": """
+            SELECT s.id,
+                   s.last_name || ' ' || s.first_name || COALESCE(' ' || s.middle_name, '') AS title,
+                   s.email AS subtitle
+            FROM staff s
+        """,
+    },
+    "positions": {
+        "table": "positions",
+        "fts_table": "positions_fts",
+        "rank": "bm25(10.0, 5.0, 1.0)",
+        "select": "SELECT p.id, p.name AS title, p.code AS subtitle FROM positions p",
+    },
+    "functions": {
+        "table": "functions",
+        "fts_table": "functions_fts",
+        "rank": "bm25(10.0, 5.0, 1.0)",
+        "select": "SELECT f.id, f.name AS title, f.code AS subtitle FROM functions f",
+    },
+    "sections": {
+        "table": "sections",
+        "fts_table": "sections_fts",
+        "rank": "bm25(10.0, 5.0, 1.0)",
+        "select": "SELECT sc.id, sc.name AS title, sc.code AS subtitle FROM sections sc",
+    },
+    "organizations": {
+        "table": "organizations",
+        "fts_table": "organizations_fts",
+        "rank": "bm25(10.0, 5.0, 1.0, 5.0)",
+        "select": "SELECT o.id, o.name AS title, o.org_type AS subtitle FROM organizations o",
+    },
+}
+
+class SearchHit(BaseModel):
+    entity_type: str
+    id: int
+    title: str
+    subtitle: Optional[str] = None
+    score: float
+
+def build_match_query(text: str) -> Optional[str]:
+    """
+    Преобразует пользовательскую строку в выражение FTS5 MATCH.
+    Каждое слово ищется по префиксу (typeahead), все слова должны присутствовать.
+    Возвращает None, если в строке нет ни одного слова.
+    """
+    # "ё" в индексе хранится как "е", поэтому приводим и запрос
+    tokens = re.findall(r"\w+", text.lower().replace("ё", "е"))[:MAX_QUERY_TOKENS]
+    if not tokens:
+        return None
+    # Слова берем в кавычки, чтобы служебные слова FTS5 (AND, NEAR и т.д.) не трактовались как операторы
+    return " ".join(f'"{token}"*' for token in tokens)
+
+def search_entities(db: sqlite3.Connection, entity_type: str, match_query: str, limit: int) -> List[dict]:
+    """Ищет записи одного типа, отсортированные по релевантности."""
+    entity = SEARCH_ENTITIES[entity_type]
+    fts_table = entity["fts_table"]
+
+    # В режиме шардирования у каждой базы свой индекс по ее строкам; справочники
+    # в шардах - копии каталога, их ищем только в каталоге
+    schemas = sharding.federated_schemas(db) if entity["table"] in sharding.SHARDED_TABLES else ["main"]
+
+    # Сортировка по bm25 и LIMIT выполняются внутри FTS-индекса по всем совпадениям
+    # (FTS5 держит только лучшие limit строк), затем заголовки подтягиваются по первичному ключу
+    rows = []
+    for schema in schemas:
+        query = f"""
+            SELECT e.*, hits.score
+            FROM (
+                SELECT rowid, rank AS score
+                FROM {schema}.{fts_table}
+                WHERE {fts_table} MATCH ? AND rank MATCH ?
+                ORDER BY rank
+                LIMIT ?
+            ) hits
+            JOIN ({entity["select"]}) e ON e.id = hits.rowid
+            ORDER BY hits.score
+        """
+        rows.extend(db.execute(query, (match_query, entity["rank"], limit)).fetchall())
+    if len(schemas) > 1:
+        rows = sorted(rows, key=lambda row: row["score"])[:limit]
+    return [
+        {
+            "entity_type": entity_type,
+            "id": row["id"],
+            "title": row["title"],
+            "subtitle": row["subtitle"],
+            "score": row["score"],
+        }
+        for row in rows
+    ]
+
+def rebuild_search_index(db: sqlite3.Connection):
+    """Полностью перестраивает поисковые индексы по данным исходных таблиц."""
+    db.executescript(SEARCH_REBUILD_SQL)
+    db.commit()
+
+@router.get("", response_model=List[SearchHit])
+def search(
+    q: str = Query(..., min_length=1, description="Строка поиска, слова ищутся по началу"),
+    types: Optional[str] = Query(None, description="Типы через запятую: " + ", ".join(SEARCH_ENTITIES)),
+    limit: int = Query(20, ge=1, le=100),
+    db: sqlite3.Connection = Depends(get_db)
+):
+    """
+    Полнотекстовый поиск с подсказками по сотрудникам, должностям, функциям,
+    отделам и организациям. Результаты разных типов объединяются по релевантности.
+    """
+    if types:
+        entity_types = [t.strip() for t in types.split(",") if t.strip()]
+        unknown = [t for t in entity_types if t not in SEARCH_ENTITIES]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Неизвестные типы для поиска: {', '.join(unknown)}")
+    else:
+        entity_types = list(SEARCH_ENTITIES)
+
+    match_query = build_match_query(q)
+    if match_query is None:
+        return []
+
+    hits = []
+    for entity_type in entity_types:
+        hits.extend(search_entities(db, entity_type, match_query, limit))
+
+    # bm25 возвращает отрицательные значения: чем меньше, тем релевантнее
+    hits.sort(key=lambda hit: hit["score"])
+    return hits[:limit]
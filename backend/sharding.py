@@ -0,0 +1,636 @@
+"""
+Шардирование по холдингам: организации, подразделения, сотрудники и их связи
+каждого холдинга хранятся в отдельном файле базы (шарде).
+
+Писатель в SQLite один на файл, поэтому изменения в одной базе выполняются
+строго по очереди. У каждого шарда своя блокировка записи: изменения разных
+холдингов идут параллельно.
+
+Основная база остается каталогом. В ней таблица шардов (shards), холдинг каждой
+перенесенной организации (shard_routes), справочники (отделы, функции,
+должности и их связи), ЦКП отделов и функций, совет учредителей и все, что еще
+не перенесено в шард. Шард - полная схема базы с триггерами журнала, версий и
+аналитики; справочники и ЦКП отделов и функций копируются в него из каталога
+(sync_references, вызывается шиной инвалидации при их изменении), чтобы триггеры
+и запросы шарда работали без каталога.
+
+Маршрутизация запроса (connect_for_request):
+
+- заголовок X-OFS-Holding: <id холдинга> или организация запроса (параметр
+  organization_id, у изменений и organization_id/primary_organization_id тела)
+  из перенесенных - соединение с шардом холдинга; справочники в нем читаются
+  из каталога и только для чтения;
+- изменение без холдинга - соединение с каталогом; изменения строк, которые
+  относятся к перенесенному в шард холдингу, отклоняются (SHARD_WRITE_GUARDS);
+- чтение без холдинга - каталог с подключенными (ATTACH) шардами: временные
+  представления с именами таблиц объединяют (UNION ALL) строки каталога и всех
+  шардов, поэтому существующие запросы читают все холдинги без изменений.
+  Так же объединяются производные таблицы, которые триггеры ведут в каждой базе
+  (счетчики аналитики, интервальные индексы), а строки сводки ЦКП (vfp_rollup)
+  складываются по узлам. Копии строк каталога из шардов в общее чтение не
+  попадают. Полнотекстовые индексы и журнал изменений читаются по каждой базе
+  отдельно (federated_schemas).
+
+Число подключаемых к соединению баз ограничено SQLite (обычно 10). Если шардов
+больше, общее чтение через представления недоступно: запрос выполняется на
+каждом шарде по очереди, а результаты объединяются (fan_out).
+
+id новых строк шарда начинаются с shard_no << 40 и не пересекаются между
+шардами. Уникальность кодов и email между шардами не проверяется.
+
+Перенос холдинга из каталога в собственный шард:
+
+    python sharding.py split <id холдинга> [--db full_api_new.db]
+
+Настройки берутся из переменных окружения (значения по умолчанию в SHARD_DEFAULTS):
+
+    OFS_SHARD_ENABLED=0      1 - включить режим шардирования
+    OFS_SHARD_DIR=shards     каталог файлов шардов
+"""
+
+import argparse
+import heapq
+import logging
+import os
+import sqlite3
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from complete_schema import ALL_SCHEMAS, SHARD_CATALOG_SCHEMA, SHARD_LOCAL_SCHEMA, VALIDITY_COLUMNS, VFP_STATUS_COLUMNS
+from invalidation import Invalidation, InvalidationBus
+
+logger = logging.getLogger("ofs_api.sharding")
+
+SHARD_DEFAULTS = {
+    "enabled": 0,
+    "dir": "shards",
+}
+
+# Таблицы, строки которых принадлежат холдингу, и условие отбора строк холдинга
+# (по временным таблицам shard_organizations, shard_divisions, shard_staff)
+SHARDED_TABLES = {
+    "organizations": "id IN (SELECT id FROM temp.shard_organizations)",
+    "divisions": "id IN (SELECT id FROM temp.shard_divisions)",
+    "division_sections": "division_id IN (SELECT id FROM temp.shard_divisions)",
+    "staff": "id IN (SELECT id FROM temp.shard_staff)",
+    "staff_positions": "staff_id IN (SELECT id FROM temp.shard_staff)",
+    "staff_locations": "staff_id IN (SELECT id FROM temp.shard_staff)",
+    "staff_functions": "staff_id IN (SELECT id FROM temp.shard_staff)",
+    "functional_relations": "manager_id IN (SELECT id FROM temp.shard_staff)",
+    "valuable_final_products": (
+        "(entity_type = 'organization' AND entity_id IN (SELECT id FROM temp.shard_organizations))"
+        " OR (entity_type = 'division' AND entity_id IN (SELECT id FROM temp.shard_divisions))"
+    ),
+}
+
+# Производные таблицы: триггеры каждой базы ведут их по ее строкам, в общем чтении
+# они объединяются так же, как таблицы холдингов
+DERIVED_TABLES = ["headcount_cube", "span_of_control"] + [f"{table}_validity" for table in VALIDITY_COLUMNS]
+
+# Условие, по которому новая строка (NEW) относится к холдингу, перенесенному в шард:
+# такие изменения в каталоге (без холдинга) отклоняются
+SHARD_WRITE_GUARDS = {
+    "organizations": "NEW.parent_id IN (SELECT organization_id FROM shard_routes)",
+    "divisions": "NEW.organization_id IN (SELECT organization_id FROM shard_routes)",
+    "division_sections": "NEW.division_id NOT IN (SELECT id FROM divisions)",
+    "staff": (
+        "NEW.organization_id IN (SELECT organization_id FROM shard_routes)"
+        " OR NEW.primary_organization_id IN (SELECT organization_id FROM shard_routes)"
+    ),
+    "staff_positions": "NEW.staff_id NOT IN (SELECT id FROM staff) OR NEW.division_id NOT IN (SELECT id FROM divisions)",
+    "staff_locations": "NEW.staff_id NOT IN (SELECT id FROM staff)",
+    "staff_functions": "NEW.staff_id NOT IN (SELECT id FROM staff)",
+    "functional_relations": "NEW.manager_id NOT IN (SELECT id FROM staff)",
+    "valuable_final_products": (
+        "(NEW.entity_type = 'organization' AND NEW.entity_id IN (SELECT organization_id FROM shard_routes))"
+        " OR (NEW.entity_type = 'division' AND NEW.entity_id NOT IN (SELECT id FROM divisions))"
+    ),
+}
+
+SHARD_WRITE_ERROR = "Связанная строка не найдена в каталоге"
+SHARD_REFERENCE_ERROR = "Копия строки каталога в шарде не изменяется"
+
+# Справочники: изменяются в каталоге, в шарды копируются целиком
+REFERENCE_TABLES = ["sections", "functions", "section_functions", "positions"]
+
+# Строки таблиц холдингов, которые принадлежат справочникам ({row} - NEW., OLD. или пусто):
+# изменяются в каталоге и копируются в шарды вместе со справочниками. По копиям ЦКП
+# отделов и функций триггеры шарда считают сводку ЦКП его подразделений и организаций
+REFERENCE_ROWS = {
+    "valuable_final_products": "{row}entity_type IN ('section', 'function')",
+}
+
+# Все, что sync_references копирует из каталога в шарды
+SYNCED_TABLES = REFERENCE_TABLES + list(REFERENCE_ROWS)
+
+# id новых строк шарда: shard_no << ID_BITS и дальше
+ID_BITS = 40
+
+HOLDING_HEADER = "X-OFS-Holding"
+
+_settings: Optional[Dict] = None
+_buses: List[InvalidationBus] = []
+
+
+class ShardingError(Exception):
+    """Запрос нельзя направить в шард (неизвестный холдинг, слишком много шардов)."""
+
+
+def load_settings() -> Dict:
+    """Собирает настройки шардирования из SHARD_DEFAULTS и переменных окружения."""
+    settings = {}
+    for key, default in SHARD_DEFAULTS.items():
+        value = os.environ.get(f"OFS_SHARD_{key.upper()}")
+        if value is None:
+            settings[key] = default
+        elif isinstance(default, int):
+            settings[key] = int(value)
+        else:
+            settings[key] = value
+    return settings
+
+
+def get_settings() -> Dict:
+    global _settings
+    if _settings is None:
+        _settings = load_settings()
+    return _settings
+
+
+def is_enabled() -> bool:
+    return bool(get_settings()["enabled"])
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def _columns(db: sqlite3.Connection, schema: str, table: str, generated: bool = False) -> str:
+    """Столбцы таблицы через запятую; generated - вместе с генерируемыми (только для чтения)."""
+    if generated:
+        rows = db.execute(f"PRAGMA {schema}.table_xinfo({table})").fetchall()
+        names = [row[1] for row in rows if row[6] != 1]
+    else:
+        names = [row[1] for row in db.execute(f"PRAGMA {schema}.table_info({table})")]
+    return ", ".join(names)
+
+
+# ================== КАТАЛОГ ==================
+
+def list_shards(catalog: sqlite3.Connection) -> List[sqlite3.Row]:
+    try:
+        return catalog.execute("SELECT holding_id, shard_no, path FROM main.shards ORDER BY shard_no").fetchall()
+    except sqlite3.OperationalError:
+        # Каталог шардов еще не создан
+        return []
+
+
+def get_shard(catalog: sqlite3.Connection, holding_id: int) -> Optional[sqlite3.Row]:
+    try:
+        return catalog.execute(
+            "SELECT holding_id, shard_no, path FROM main.shards WHERE holding_id = ?", (holding_id,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None
+
+
+def holding_for_organization(catalog: sqlite3.Connection, organization_id: int) -> Optional[int]:
+    """Холдинг, в шард которого перенесена организация; None - организация в каталоге."""
+    try:
+        row = catalog.execute(
+            "SELECT holding_id FROM main.shard_routes WHERE organization_id = ?", (organization_id,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+# ================== СОЕДИНЕНИЯ ==================
+
+def connect_shard(catalog_path: str, shard: sqlite3.Row) -> sqlite3.Connection:
+    """
+    Соединение с шардом холдинга. Справочники читаются из каталога (представления
+    только для чтения), новые и удаленные организации сразу отражаются в маршрутах.
+    """
+    conn = _connect(shard["path"])
+    conn.execute("ATTACH DATABASE ? AS catalog", (catalog_path,))
+    for table in REFERENCE_TABLES:
+        conn.execute(f"CREATE TEMP VIEW {table} AS SELECT * FROM catalog.{table}")
+    # Временный триггер может изменять таблицу другой базы; shard_routes есть только в каталоге
+    conn.executescript(f"""
+        CREATE TEMP TRIGGER shard_route_insert AFTER INSERT ON main.organizations
+        BEGIN
+            INSERT OR REPLACE INTO shard_routes (organization_id, holding_id) VALUES (NEW.id, {int(shard['holding_id'])});
+        END;
+        CREATE TEMP TRIGGER shard_route_delete AFTER DELETE ON main.organizations
+        BEGIN
+            DELETE FROM shard_routes WHERE organization_id = OLD.id;
+        END;
+    """)
+    # Копии строк каталога (ЦКП отделов и функций) изменяются только в каталоге
+    for table, condition in REFERENCE_ROWS.items():
+        for operation, when in (
+            ("insert", condition.format(row="NEW.")),
+            ("update", f"{condition.format(row='OLD.')} OR {condition.format(row='NEW.')}"),
+            ("delete", condition.format(row="OLD.")),
+        ):
+            conn.execute(f"""
+                CREATE TEMP TRIGGER shard_reference_{table}_{operation} BEFORE {operation.upper()} ON main.{table}
+                WHEN {when}
+                BEGIN
+                    SELECT RAISE(ABORT, '{SHARD_REFERENCE_ERROR}: она изменяется без заголовка {HOLDING_HEADER}');
+                END
+            """)
+    return conn
+
+
+def attach_shards(catalog: sqlite3.Connection):
+    """
+    Подключает к соединению с каталогом все шарды и закрывает таблицы холдингов
+    временными представлениями, объединяющими строки каталога и шардов.
+    """
+    shards = list_shards(catalog)
+    if not shards:
+        return
+    limit = catalog.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    if len(shards) > limit:
+        raise ShardingError(
+            f"Шардов ({len(shards)}) больше, чем можно подключить к одному соединению ({limit}): "
+            f"укажите холдинг в заголовке {HOLDING_HEADER}"
+        )
+    schemas = ["main"]
+    for shard in shards:
+        schema = f"shard_{int(shard['holding_id'])}"
+        catalog.execute(f"ATTACH DATABASE ? AS {schema}", (shard["path"],))
+        schemas.append(schema)
+
+    for table in list(SHARDED_TABLES) + DERIVED_TABLES:
+        columns = _columns(catalog, "main", table, generated=True)
+        # Копии строк каталога в шардах не повторяются
+        local = f" WHERE NOT ({REFERENCE_ROWS[table].format(row='')})" if table in REFERENCE_ROWS else ""
+        union = " UNION ALL ".join(
+            f"SELECT {columns} FROM {schema}.{table}" + (local if schema != "main" else "") for schema in schemas
+        )
+        catalog.execute(f"CREATE TEMP VIEW {table} AS {union}")
+    # Сводка ЦКП узла складывается по базам: ЦКП потомков организации или подразделения
+    # шарда лежат и в шарде, и (отделы и функции) в каталоге, а копии ЦКП отделов и функций
+    # в шарде учтены в сводке их собственных узлов только в каталоге
+    counters = ["vfp_count", "progress_sum"] + VFP_STATUS_COLUMNS
+    reference_nodes = REFERENCE_ROWS["valuable_final_products"].format(row="")
+    union = " UNION ALL ".join(
+        f"SELECT entity_type, entity_id, {', '.join(counters)} FROM {schema}.vfp_rollup"
+        + (f" WHERE NOT ({reference_nodes})" if schema != "main" else "")
+        for schema in schemas
+    )
+    catalog.execute(f"""
+        CREATE TEMP VIEW vfp_rollup AS
+        SELECT entity_type, entity_id, {', '.join(f'SUM({c}) AS {c}' for c in counters)}
+        FROM ({union}) GROUP BY entity_type, entity_id
+    """)
+    # Версия таблицы - сумма версий по всем базам: растет при изменении в любой из них
+    union = " UNION ALL ".join(f"SELECT table_name, version, updated_at FROM {schema}.table_versions" for schema in schemas)
+    catalog.execute(f"""
+        CREATE TEMP VIEW table_versions AS
+        SELECT table_name, SUM(version) AS version, MAX(updated_at) AS updated_at
+        FROM ({union}) GROUP BY table_name
+    """)
+
+
+def federated_schemas(conn: sqlite3.Connection) -> List[str]:
+    """
+    Базы, строки которых объединяют представления соединения: main и подключенные
+    шарды (для соединения без шардов - только main). По ним по очереди читаются
+    таблицы, которые нельзя закрыть представлением (полнотекстовые индексы, журнал изменений).
+    """
+    return ["main"] + [row[1] for row in conn.execute("PRAGMA database_list") if row[1].startswith("shard_")]
+
+
+def guard_catalog_writes(catalog: sqlite3.Connection):
+    """
+    Временные триггеры соединения с каталогом: изменение строки холдинга, перенесенного
+    в шард, прерывается ошибкой SHARD_WRITE_ERROR (иначе строка осталась бы в каталоге).
+    """
+    for table, condition in SHARD_WRITE_GUARDS.items():
+        for operation in ("insert", "update"):
+            catalog.execute(f"""
+                CREATE TEMP TRIGGER shard_guard_{table}_{operation} BEFORE {operation.upper()} ON main.{table}
+                WHEN {condition}
+                BEGIN
+                    SELECT RAISE(ABORT, '{SHARD_WRITE_ERROR}: строки холдинга в шарде изменяются с заголовком {HOLDING_HEADER}');
+                END
+            """)
+
+
+def connect_federated(catalog_path: str) -> sqlite3.Connection:
+    """Соединение для чтения всех холдингов: каталог с подключенными шардами."""
+    conn = _connect(catalog_path)
+    try:
+        attach_shards(conn)
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+
+def connect_for_request(
+    catalog_path: str,
+    holding_id: Optional[int] = None,
+    organization_id: Optional[int] = None,
+    write: bool = False,
+) -> Tuple[sqlite3.Connection, str]:
+    """
+    Соединение для запроса по правилам маршрутизации (см. описание модуля).
+    Возвращает соединение и куда направлен запрос: id холдинга, catalog или all.
+    """
+    catalog = _connect(catalog_path)
+    try:
+        if holding_id is not None:
+            shard = get_shard(catalog, holding_id)
+            if shard is None:
+                raise ShardingError(f"Шард холдинга {holding_id} не найден")
+        elif organization_id is not None:
+            routed = holding_for_organization(catalog, organization_id)
+            shard = get_shard(catalog, routed) if routed is not None else None
+        else:
+            shard = None
+
+        if shard is not None:
+            catalog.close()
+            return connect_shard(catalog_path, shard), str(shard["holding_id"])
+        if write:
+            if list_shards(catalog):
+                guard_catalog_writes(catalog)
+            return catalog, "catalog"
+        attach_shards(catalog)
+        return catalog, "all"
+    except Exception:
+        catalog.close()
+        raise
+
+
+def database_paths(catalog_path: str) -> List[str]:
+    """Файлы каталога и всех шардов."""
+    catalog = _connect(catalog_path)
+    try:
+        return [catalog_path] + [shard["path"] for shard in list_shards(catalog)]
+    finally:
+        catalog.close()
+
+
+def fan_out(
+    catalog_path: str,
+    sql: str,
+    params: Sequence[Any] = (),
+    key: Optional[Callable[[sqlite3.Row], Any]] = None,
+) -> Iterator[sqlite3.Row]:
+    """
+    Выполняет запрос в каталоге и в каждом шарде отдельно (без ограничения на число
+    подключаемых баз) и объединяет результаты. С key результаты каждой базы должны
+    быть упорядочены по нему (ORDER BY) - объединение сохраняет порядок.
+    """
+    results = []
+    for path in database_paths(catalog_path):
+        conn = _connect(path)
+        try:
+            results.append(conn.execute(sql, params).fetchall())
+        finally:
+            conn.close()
+    if key is None:
+        for rows in results:
+            yield from rows
+    else:
+        yield from heapq.merge(*results, key=key)
+
+
+# ================== СПРАВОЧНИКИ ==================
+
+def _copy_references(conn: sqlite3.Connection, source: str, target: str, tables: Sequence[str]):
+    """
+    Копирует справочники (и строки справочников из REFERENCE_ROWS), версия которых
+    в шарде отстает от каталога (внутри транзакции).
+    """
+    for table in tables:
+        version = conn.execute(
+            f"SELECT version FROM {source}.table_versions WHERE table_name = ?", (table,)
+        ).fetchone()
+        copied = conn.execute(
+            f"SELECT version FROM {target}.shard_sources WHERE table_name = ?", (table,)
+        ).fetchone()
+        if version is not None and copied is not None and version[0] == copied[0]:
+            continue
+        columns = _columns(conn, target, table)
+        condition = REFERENCE_ROWS[table].format(row="") if table in REFERENCE_ROWS else "1"
+        logged = conn.execute(f"SELECT COALESCE(MAX(version), 0) FROM {target}.change_log").fetchone()[0]
+        conn.execute(f"DELETE FROM {target}.{table} WHERE {condition}")
+        conn.execute(f"INSERT INTO {target}.{table} ({columns}) SELECT {columns} FROM {source}.{table} WHERE {condition}")
+        if table in REFERENCE_ROWS:
+            # Изменения копий выдает журнал каталога; справочники журнал шарда не выдает и так
+            conn.execute(f"DELETE FROM {target}.change_log WHERE table_name = ? AND version > ?", (table, logged))
+        conn.execute(
+            f"INSERT OR REPLACE INTO {target}.shard_sources (table_name, version) VALUES (?, ?)",
+            (table, version[0] if version else 0),
+        )
+
+
+def sync_references(catalog_path: str, tables: Sequence[str] = SYNCED_TABLES) -> int:
+    """Копирует изменившиеся справочники каталога во все шарды. Возвращает число шардов."""
+    catalog = _connect(catalog_path)
+    try:
+        shards = list_shards(catalog)
+    finally:
+        catalog.close()
+    for shard in shards:
+        conn = _connect(shard["path"])
+        try:
+            conn.execute("ATTACH DATABASE ? AS catalog", (catalog_path,))
+            # Несколько воркеров могут синхронизировать одновременно: копирует первый,
+            # остальные после ожидания блокировки видят совпадающие версии
+            conn.execute("BEGIN IMMEDIATE")
+            _copy_references(conn, "catalog", "main", tables)
+            conn.commit()
+        finally:
+            conn.close()
+    return len(shards)
+
+
+def sync_references_subscriber(db: sqlite3.Connection, invalidations: List[Invalidation]):
+    """Подписчик шины каталога: копирует в шарды изменившиеся справочники."""
+    tables = sorted({item.table for item in invalidations if item.table in SYNCED_TABLES})
+    if tables:
+        catalog_path = db.execute("PRAGMA database_list").fetchone()[2]
+        sync_references(catalog_path, tables)
+
+
+def start_shard_buses(catalog_path: str, catalog_bus: InvalidationBus):
+    """
+    Шина инвалидации на каждый шард с подписчиками шины каталога: изменения
+    в шардах доходят до кэшей и потоков событий так же, как изменения каталога.
+    """
+    catalog_bus.subscribe(sync_references_subscriber)
+    # Изменения справочников, пока API был остановлен, и копии, которых нет в шардах,
+    # перенесенных прежней версией (сверка по версиям - неизменившееся не копируется)
+    sync_references(catalog_path)
+    catalog = _connect(catalog_path)
+    try:
+        shards = list_shards(catalog)
+    finally:
+        catalog.close()
+    subscribers = [subscriber for subscriber in catalog_bus.subscribers if subscriber is not sync_references_subscriber]
+    for shard in shards:
+        bus = InvalidationBus(name=f"ofs-invalidation-shard-{shard['holding_id']}", subscribers=subscribers)
+        bus.start(shard["path"])
+        _buses.append(bus)
+
+
+def stop_shard_buses():
+    while _buses:
+        _buses.pop().stop()
+
+
+# ================== ПЕРЕНОС ХОЛДИНГА В ШАРД ==================
+
+def _select_holding_rows(conn: sqlite3.Connection, holding_id: int):
+    """Заполняет temp.shard_organizations, temp.shard_divisions и temp.shard_staff строками холдинга."""
+    for table in ("shard_organizations", "shard_divisions", "shard_staff"):
+        conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY)")
+        conn.execute(f"DELETE FROM temp.{table}")
+    conn.execute("""
+        INSERT INTO temp.shard_organizations
+        WITH RECURSIVE subtree(id) AS (
+            SELECT ?
+            UNION
+            SELECT o.id FROM main.organizations o JOIN subtree ON o.parent_id = subtree.id
+        )
+        SELECT id FROM subtree
+    """, (holding_id,))
+    conn.execute("""
+        INSERT INTO temp.shard_divisions
+        SELECT id FROM main.divisions WHERE organization_id IN (SELECT id FROM temp.shard_organizations)
+    """)
+    # Сотрудник переносится с основным юрлицом, а без юрлица - с назначениями в подразделения холдинга
+    conn.execute("""
+        INSERT INTO temp.shard_staff
+        SELECT s.id FROM main.staff s
+        WHERE COALESCE(s.primary_organization_id, s.organization_id) IN (SELECT id FROM temp.shard_organizations)
+           OR (COALESCE(s.primary_organization_id, s.organization_id) IS NULL AND s.id IN (
+               SELECT staff_id FROM main.staff_positions
+               WHERE division_id IN (SELECT id FROM temp.shard_divisions)
+           ))
+    """)
+
+
+def create_shard_file(path: str):
+    """Создает файл шарда: полная схема базы без каталога шардов."""
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        for schema in ALL_SCHEMAS:
+            if schema is not SHARD_CATALOG_SCHEMA:
+                conn.executescript(schema)
+        conn.executescript(SHARD_LOCAL_SCHEMA)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def split_holding(catalog_path: str, holding_id: int, shard_dir: Optional[str] = None) -> Dict[str, int]:
+    """
+    Переносит холдинг (организацию типа holding с дочерними организациями, их
+    подразделениями, сотрудниками и связями) из каталога в новый шард.
+    Возвращает число перенесенных строк по таблицам.
+    """
+    shard_dir = shard_dir or get_settings()["dir"]
+    conn = _connect(catalog_path)
+    try:
+        conn.executescript(SHARD_CATALOG_SCHEMA)
+        holding = conn.execute("SELECT org_type FROM main.organizations WHERE id = ?", (holding_id,)).fetchone()
+        if holding is None or holding["org_type"] != "holding":
+            raise ShardingError(f"Холдинг {holding_id} не найден в каталоге")
+        if get_shard(conn, holding_id) is not None:
+            raise ShardingError(f"Холдинг {holding_id} уже перенесен в шард")
+
+        os.makedirs(shard_dir, exist_ok=True)
+        path = os.path.join(shard_dir, f"holding_{holding_id}.db")
+        # Файл от прерванного переноса (шард не успел попасть в каталог)
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        create_shard_file(path)
+        shard_no = conn.execute("SELECT COALESCE(MAX(shard_no), 0) + 1 FROM main.shards").fetchone()[0]
+
+        conn.execute("ATTACH DATABASE ? AS shard", (path,))
+        _select_holding_rows(conn, holding_id)
+        conn.commit()
+
+        # Сначала строки копируются в шард (триггеры шарда ведут его журнал, версии и аналитику)
+        counts = {}
+        conn.execute("BEGIN IMMEDIATE")
+        _copy_references(conn, "main", "shard", SYNCED_TABLES)
+        for table, condition in SHARDED_TABLES.items():
+            columns = _columns(conn, "shard", table)
+            counts[table] = conn.execute(
+                f"INSERT INTO shard.{table} ({columns}) SELECT {columns} FROM main.{table} WHERE {condition}"
+            ).rowcount
+        base = shard_no << ID_BITS
+        for table in SHARDED_TABLES:
+            updated = conn.execute(
+                "UPDATE shard.sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (base, table)
+            ).rowcount
+            if not updated:
+                conn.execute("INSERT INTO shard.sqlite_sequence (name, seq) VALUES (?, ?)", (table, base))
+        conn.commit()
+
+        # Затем удаляются из каталога и регистрируются в маршрутах. Отдельная транзакция:
+        # при сбое между ними шард не зарегистрирован, и повторный перенос создаст его заново
+        conn.execute("BEGIN IMMEDIATE")
+        for table, condition in reversed(list(SHARDED_TABLES.items())):
+            conn.execute(f"DELETE FROM main.{table} WHERE {condition}")
+        # Строки не удалены, а перенесены: в журнале шарда они уже записаны вставками,
+        # надгробия каталога убираются, чтобы общий журнал не выдавал их удаление
+        for table in SHARDED_TABLES:
+            conn.execute(
+                f"DELETE FROM main.change_log WHERE table_name = ? AND operation = 'delete' "
+                f"AND row_id IN (SELECT id FROM shard.{table})",
+                (table,),
+            )
+        conn.execute("""
+            INSERT OR REPLACE INTO main.shard_routes (organization_id, holding_id)
+            SELECT id, ? FROM temp.shard_organizations
+        """, (holding_id,))
+        conn.execute(
+            "INSERT INTO main.shards (holding_id, shard_no, path) VALUES (?, ?, ?)", (holding_id, shard_no, path)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    logger.info(f"Холдинг {holding_id} перенесен в шард {path}", extra={"rows": sum(counts.values())})
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Шардирование базы OFS по холдингам")
+    commands = parser.add_subparsers(dest="command", required=True)
+    split = commands.add_parser("split", help="перенести холдинг из каталога в собственный шард")
+    split.add_argument("holding_id", type=int)
+    split.add_argument("--db", default="full_api_new.db", help="основная база (каталог)")
+    split.add_argument("--dir", default=None, help="каталог файлов шардов")
+    commands.add_parser("list", help="список шардов").add_argument("--db", default="full_api_new.db")
+    args = parser.parse_args()
+
+    if args.command == "split":
+        counts = split_holding(args.db, args.holding_id, args.dir)
+        for table, count in counts.items():
+            print(f"{table}: {count}")
+    else:
+        catalog = _connect(args.db)
+        try:
+            for shard in list_shards(catalog):
+                print(f"{shard['holding_id']}\t{shard['shard_no']}\t{shard['path']}")
+        finally:
+            catalog.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Объединение одинаковых одновременных запросов (single-flight).
+
+Пока вычисление для ключа выполняется, повторные вызовы с тем же ключом не
+запускают его заново, а ждут и получают тот же результат (или ту же ошибку).
+После завершения ключ освобождается - это не кэш, следующий вызов снова
+выполнит вычисление.
+
+Все ожидавшие получают один и тот же объект результата и один и тот же объект
+исключения, без копирования: вызывающий не должен изменять результат (например,
+дописывать поля в возвращенный словарь) - изменение увидят остальные вызовы.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+
+class _Call:
+    """Выполняющееся вычисление, результат которого ждут остальные вызовы."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Группа вычислений, объединяемых по ключу, со статистикой вызовов."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._executed = 0
+        self._coalesced = 0
+        self._errors = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Возвращает результат fn(); одновременные вызовы с одним key выполняют fn один раз
+        и получают общий (не копируемый) результат, который нельзя изменять.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self._errors += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> Dict[str, Any]:
+        """Сколько вычислений выполнено, сколько вызовов получили чужой результат."""
+        with self._lock:
+            total = self._executed + self._coalesced
+            return {
+                "executed": self._executed,
+                "coalesced": self._coalesced,
+                "errors": self._errors,
+                "in_flight": len(self._calls),
+                "coalesced_ratio": round(self._coalesced / total, 4) if total else 0.0,
+            }
@@ -0,0 +1,350 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+import hashlib
+import json
+import sqlite3
+from collections import defaultdict
+from typing import List, Dict, Any, Optional, Tuple
+from pydantic import BaseModel
+
+import sharding
+
+# Создаем свою функцию для получения соединения с БД
+def get_db():
+    """Предоставляет соединение с базой данных; снимки хранятся в основной базе (каталоге)."""
+    DB_PATH = "full_api_new.db"
+    if sharding.is_enabled():
+        # Структура всех холдингов: каталог с подключенными шардами
+        conn = sharding.connect_federated(DB_PATH)
+    else:
+        # Соединение создается и используется в разных потоках пула FastAPI
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+router = APIRouter(
+    prefix="/org-structure",
+    tags=["org-structure"],
+)
+
+# Служебные поля, которые не считаются изменением структуры
+IGNORED_FIELDS = {"created_at", "updated_at"}
+
+# Сколько узлов читать из snapshot_nodes одним запросом
+LOAD_BATCH_SIZE = 500
+
+# Корень дерева снимка: под ним находятся организации верхнего уровня
+ROOT_KEY = ("root", 0)
+
+class SnapshotInfo(BaseModel):
+    id: int
+    name: Optional[str] = None
+    root_hash: str
+    node_count: int
+    created_at: Optional[str] = None
+
+class NodeChange(BaseModel):
+    operation: str  # added, removed, modified, moved
+    node_type: str  # organization, division, division_section, staff_position
+    id: int
+    parent_type: Optional[str] = None
+    parent_id: Optional[int] = None
+    old_parent_type: Optional[str] = None  # только для moved
+    old_parent_id: Optional[int] = None
+    fields: Optional[Dict[str, List[Any]]] = None  # поле -> [старое значение, новое значение]
+    data: Optional[Dict[str, Any]] = None  # поля узла для added и removed
+
+class SnapshotDiff(BaseModel):
+    from_snapshot: int
+    to_snapshot: Optional[int] = None  # None - сравнение с текущим состоянием
+    changes: List[NodeChange]
+    nodes_loaded: int  # сколько узлов пришлось прочитать для сравнения
+
+# Каноническая сериализация: одинаковое содержимое всегда дает одинаковую строку
+_canonical_encoder = json.JSONEncoder(ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+
+def to_json(value: Any) -> str:
+    return _canonical_encoder.encode(value)
+
+def node_hash(node_type: str, node_id: int, payload_json: str, children_json: str) -> str:
+    """Хеш узла по его полям и хешам дочерних узлов."""
+    data = f"{node_type}\n{node_id}\n{payload_json}\n{children_json}"
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+def payload_of(row: Dict[str, Any], structural: Tuple[str, ...] = ()) -> Dict[str, Any]:
+    """
+    Поля записи, входящие в содержимое узла. Ссылки на родителя (structural)
+    не включаются - они выражаются положением узла в дереве.
+    """
+    return {k: v for k, v in row.items() if k not in IGNORED_FIELDS and k not in structural}
+
+def build_structure(db: sqlite3.Connection) -> Tuple[str, Dict[str, tuple]]:
+    """
+    Строит дерево текущей оргструктуры: организации -> подразделения -> отделы
+    и назначения сотрудников на должности. Возвращает хеш корня и словарь узлов
+    {хеш: (тип, id, JSON полей, JSON-список [тип, id, хеш] дочерних узлов)}.
+    Записи с циклическими ссылками на родителя в дерево не попадают.
+    """
+    # Поля узлов сразу сериализуем: строка нужна и для хеша, и для сохранения
+    payloads: Dict[Tuple[str, int], str] = {ROOT_KEY: "{}"}
+    children = defaultdict(list)
+
+    organizations = [dict(row) for row in db.execute("SELECT * FROM organizations")]
+    org_ids = {row["id"] for row in organizations}
+    for row in organizations:
+        key = ("organization", row["id"])
+        payloads[key] = to_json(payload_of(row, ("parent_id",)))
+        parent_id = row["parent_id"]
+        if parent_id in org_ids and parent_id != row["id"]:
+            children[("organization", parent_id)].append(key)
+        else:
+            children[ROOT_KEY].append(key)
+
+    divisions = [dict(row) for row in db.execute("SELECT * FROM divisions")]
+    division_ids = {row["id"] for row in divisions}
+    for row in divisions:
+        key = ("division", row["id"])
+        payloads[key] = to_json(payload_of(row, ("organization_id", "parent_id")))
+        parent_id = row["parent_id"]
+        if parent_id in division_ids and parent_id != row["id"]:
+            children[("division", parent_id)].append(key)
+        elif row["organization_id"] in org_ids:
+            children[("organization", row["organization_id"])].append(key)
+        else:
+            children[ROOT_KEY].append(key)
+
+    # Отдел может входить в несколько подразделений, поэтому узлом является связь division_sections
+    for row in db.execute("""
+        SELECT ds.id, ds.division_id, ds.section_id, ds.is_primary,
+               s.name, s.code, s.description, s.is_active, s.ckp
+        FROM division_sections ds
+        JOIN sections s ON ds.section_id = s.id
+    """):
+        row = dict(row)
+        if row["division_id"] not in division_ids:
+            continue
+        key = ("division_section", row["id"])
+        payloads[key] = to_json(payload_of(row, ("division_id",)))
+        children[("division", row["division_id"])].append(key)
+
+    for row in db.execute("""
+        SELECT sp.*,
+               s.last_name || ' ' || s.first_name || COALESCE(' ' || s.middle_name, '') AS staff_name,
+               s.email AS staff_email, p.name AS position_name
+        FROM staff_positions sp
+        JOIN staff s ON sp.staff_id = s.id
+        JOIN positions p ON sp.position_id = p.id
+    """):
+        row = dict(row)
+        key = ("staff_position", row["id"])
+        payloads[key] = to_json(payload_of(row, ("division_id",)))
+        if row["division_id"] in division_ids:
+            children[("division", row["division_id"])].append(key)
+        elif row["location_id"] in org_ids:
+            children[("organization", row["location_id"])].append(key)
+        else:
+            children[ROOT_KEY].append(key)
+
+    # Хеши считаем снизу вверх без рекурсии: глубина дерева не ограничена
+    hashes: Dict[Tuple[str, int], str] = {}
+    nodes: Dict[str, tuple] = {}
+    stack = [(ROOT_KEY, False)]
+    while stack:
+        key, children_done = stack.pop()
+        if children_done:
+            children_json = to_json([[t, i, hashes[(t, i)]] for t, i in sorted(children.get(key, ()))])
+            h = node_hash(key[0], key[1], payloads[key], children_json)
+            hashes[key] = h
+            nodes[h] = (key[0], key[1], payloads[key], children_json)
+        else:
+            stack.append((key, True))
+            stack.extend((child, False) for child in children.get(key, ()))
+
+    return hashes[ROOT_KEY], nodes
+
+def create_snapshot(db: sqlite3.Connection, name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Сохраняет снимок текущей оргструктуры. Узлы, уже сохраненные в предыдущих
+    снимках (тот же хеш), повторно не записываются.
+    """
+    root_hash, nodes = build_structure(db)
+    db.executemany(
+        "INSERT OR IGNORE INTO snapshot_nodes (hash, node_type, node_id, payload, children) VALUES (?, ?, ?, ?, ?)",
+        ((h,) + node for h, node in nodes.items())
+    )
+    cursor = db.execute(
+        "INSERT INTO org_snapshots (name, root_hash, node_count) VALUES (?, ?, ?)",
+        (name, root_hash, len(nodes) - 1)
+    )
+    db.commit()
+    row = db.execute("SELECT * FROM org_snapshots WHERE id = ?", (cursor.lastrowid,)).fetchone()
+    return dict(row)
+
+class NodeLoader:
+    """
+    Читает узлы снимков по хешам пачками и кэширует их.
+    Узлы текущего состояния (не сохраненные в базе) передаются через overlay.
+    """
+
+    def __init__(self, db: sqlite3.Connection, overlay: Optional[Dict[str, tuple]] = None):
+        self.db = db
+        self.overlay = overlay or {}
+        self.cache: Dict[str, tuple] = {}
+        self.loaded = 0
+
+    def load(self, hashes: List[str]) -> Dict[str, tuple]:
+        for h in hashes:
+            if h in self.overlay and h not in self.cache:
+                t, i, payload, children = self.overlay[h]
+                self.cache[h] = (t, i, json.loads(payload), json.loads(children))
+        missing = list({h for h in hashes if h not in self.cache})
+        for start in range(0, len(missing), LOAD_BATCH_SIZE):
+            batch = missing[start:start + LOAD_BATCH_SIZE]
+            placeholders = ", ".join("?" for _ in batch)
+            rows = self.db.execute(
+                f"SELECT hash, node_type, node_id, payload, children FROM snapshot_nodes WHERE hash IN ({placeholders})",
+                batch
+            ).fetchall()
+            for row in rows:
+                self.cache[row[0]] = (row[1], row[2], json.loads(row[3]), json.loads(row[4]))
+        self.loaded += len(hashes)
+        return {h: self.cache[h] for h in hashes}
+
+def changed_fields(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, List[Any]]:
+    return {k: [old.get(k), new.get(k)] for k in sorted(old.keys() | new.keys()) if old.get(k) != new.get(k)}
+
+def expand_subtrees(loader: NodeLoader, roots: List[Tuple[Tuple[str, int], str]]) -> Dict[Tuple[str, int], tuple]:
+    """Разворачивает добавленные или удаленные поддеревья: {ключ узла: (ключ родителя, поля)}."""
+    result = {}
+    frontier = roots
+    while frontier:
+        nodes = loader.load([h for _, h in frontier])
+        next_frontier = []
+        for parent_key, h in frontier:
+            node_type, node_id, payload, children = nodes[h]
+            key = (node_type, node_id)
+            result[key] = (parent_key, payload)
+            next_frontier.extend((key, child_hash) for _, _, child_hash in children)
+        frontier = next_frontier
+    return result
+
+def diff_trees(loader: NodeLoader, old_root: str, new_root: str) -> List[Dict[str, Any]]:
+    """
+    Сравнивает два дерева снимков. Поддеревья с одинаковым хешем пропускаются целиком,
+    поэтому читаются только узлы на путях к изменениям и их непосредственные дети.
+    Узел, удаленный в одном месте и добавленный в другом, считается перемещенным.
+    """
+    changes = []
+    removed_roots = []
+    added_roots = []
+
+    frontier = [(None, old_root, new_root)] if old_root != new_root else []
+    while frontier:
+        nodes = loader.load([h for _, old_hash, new_hash in frontier for h in (old_hash, new_hash)])
+        next_frontier = []
+        for parent_key, old_hash, new_hash in frontier:
+            node_type, node_id, old_payload, old_children = nodes[old_hash]
+            _, _, new_payload, new_children = nodes[new_hash]
+            key = (node_type, node_id)
+
+            fields = changed_fields(old_payload, new_payload)
+            if fields:
+                changes.append({
+                    "operation": "modified", "node_type": node_type, "id": node_id,
+                    "parent_type": parent_key and parent_key[0], "parent_id": parent_key and parent_key[1],
+                    "fields": fields,
+                })
+
+            old_map = {(t, i): h for t, i, h in old_children}
+            new_map = {(t, i): h for t, i, h in new_children}
+            for child_key, child_hash in old_map.items():
+                new_child_hash = new_map.get(child_key)
+                if new_child_hash is None:
+                    removed_roots.append((key, child_hash))
+                elif new_child_hash != child_hash:
+                    next_frontier.append((key, child_hash, new_child_hash))
+            for child_key, child_hash in new_map.items():
+                if child_key not in old_map:
+                    added_roots.append((key, child_hash))
+        frontier = next_frontier
+
+    removed = expand_subtrees(loader, removed_roots)
+    added = expand_subtrees(loader, added_roots)
+
+    for key in sorted(removed.keys() & added.keys()):
+        old_parent, old_payload = removed.pop(key)
+        new_parent, new_payload = added.pop(key)
+        fields = changed_fields(old_payload, new_payload) or None
+        if old_parent != new_parent:
+            changes.append({
+                "operation": "moved", "node_type": key[0], "id": key[1],
+                "parent_type": new_parent[0], "parent_id": new_parent[1],
+                "old_parent_type": old_parent[0], "old_parent_id": old_parent[1],
+                "fields": fields,
+            })
+        elif fields:
+            # Родитель тот же, но сам родитель перемещался - для узла это просто изменение полей
+            changes.append({
+                "operation": "modified", "node_type": key[0], "id": key[1],
+                "parent_type": new_parent[0], "parent_id": new_parent[1],
+                "fields": fields,
+            })
+
+    for operation, nodes_by_key in (("removed", removed), ("added", added)):
+        for key in sorted(nodes_by_key):
+            parent_key, payload = nodes_by_key[key]
+            changes.append({
+                "operation": operation, "node_type": key[0], "id": key[1],
+                "parent_type": parent_key[0], "parent_id": parent_key[1],
+                "data": payload,
+            })
+
+    return changes
+
+def get_snapshot_root(db: sqlite3.Connection, snapshot_id: int) -> str:
+    row = db.execute("SELECT root_hash FROM org_snapshots WHERE id = ?", (snapshot_id,)).fetchone()
+    if not row:
+        raise HTTPException(status_code=404, detail=f"Снимок с ID {snapshot_id} не найден")
+    return row[0]
+
+@router.post("/snapshots", response_model=SnapshotInfo)
+def create_org_snapshot(
+    name: Optional[str] = Query(None, description="Название снимка, например 'До реорганизации 2024-05'"),
+    db: sqlite3.Connection = Depends(get_db)
+):
+    """Сохраняет снимок текущей оргструктуры."""
+    return create_snapshot(db, name)
+
+@router.get("/snapshots", response_model=List[SnapshotInfo])
+def read_org_snapshots(db: sqlite3.Connection = Depends(get_db)):
+    """Возвращает список сохраненных снимков оргструктуры."""
+    rows = db.execute("SELECT * FROM org_snapshots ORDER BY id DESC").fetchall()
+    return [dict(row) for row in rows]
+
+@router.get("/diff", response_model=SnapshotDiff)
+def diff_org_snapshots(
+    from_snapshot: int = Query(..., alias="from", description="ID исходного снимка"),
+    to_snapshot: Optional[int] = Query(None, alias="to", description="ID конечного снимка, по умолчанию текущее состояние"),
+    db: sqlite3.Connection = Depends(get_db)
+):
+    """
+    Сравнивает два снимка оргструктуры (или снимок с текущим состоянием).
+    Возвращает добавленные, удаленные, измененные и перемещенные узлы.
+    """
+    old_root = get_snapshot_root(db, from_snapshot)
+    if to_snapshot is None:
+        new_root, current_nodes = build_structure(db)
+        loader = NodeLoader(db, current_nodes)
+    else:
+        new_root = get_snapshot_root(db, to_snapshot)
+        loader = NodeLoader(db)
+
+    changes = diff_trees(loader, old_root, new_root)
+    return {
+        "from_snapshot": from_snapshot,
+        "to_snapshot": to_snapshot,
+        "changes": changes,
+        "nodes_loaded": loader.loaded,
+    }
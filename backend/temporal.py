@@ -0,0 +1,57 @@
+"""
+Вспомогательные функции для запросов "на дату" (параметр as_of).
+Периоды действия записей индексируются R-Tree таблицами <table>_validity
+(см. TEMPORAL_SCHEMA в complete_schema.py).
+"""
+
+import sqlite3
+from datetime import date
+from typing import List, Optional, Tuple
+
+from complete_schema import VALIDITY_COLUMNS, TEMPORAL_SCHEMA, TEMPORAL_REBUILD_SQL
+
+# Разница между порядковым номером даты в Python и юлианским днем SQLite (julianday() на полночь, без дробной части)
+_JULIAN_DAY_OFFSET = 1721424
+
+
+def julian_day(value: date) -> int:
+    """Переводит дату в целый юлианский день, как CAST(julianday(date(...)) AS INTEGER) в SQLite."""
+    return value.toordinal() + _JULIAN_DAY_OFFSET
+
+
+def as_of_condition(table: str, as_of: date, alias: Optional[str] = None) -> Tuple[str, List[int]]:
+    """
+    Возвращает условие WHERE и параметры для отбора записей table, действующих на дату as_of.
+    Флаги is_active/is_current не учитываются - только период действия.
+    """
+    if table not in VALIDITY_COLUMNS:
+        raise ValueError(f"Таблица {table} не имеет периода действия")
+    day = julian_day(as_of)
+    condition = (
+        f"{alias or table}.id IN "
+        f"(SELECT id FROM {table}_validity WHERE start_day <= ? AND end_day >= ?)"
+    )
+    return condition, [day, day]
+
+
+def rebuild_validity_index(db: sqlite3.Connection):
+    """Полностью перестраивает интервальные индексы по данным исходных таблиц."""
+    db.executescript(TEMPORAL_REBUILD_SQL)
+    db.commit()
+
+
+def validity_index_outdated(db: sqlite3.Connection) -> bool:
+    """Триггеры интервальных индексов созданы прежней схемой (день считался с учетом времени)."""
+    row = db.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'staff_positions_validity_insert'"
+    ).fetchone()
+    return row is not None and "julianday(date(" not in row[0]
+
+
+def upgrade_validity_index(db: sqlite3.Connection):
+    """Пересоздает триггеры интервальных индексов по текущей схеме и перестраивает индексы."""
+    for table in VALIDITY_COLUMNS:
+        for operation in ("insert", "update", "delete"):
+            db.execute(f"DROP TRIGGER IF EXISTS {table}_validity_{operation}")
+    db.executescript(TEMPORAL_SCHEMA)
+    rebuild_validity_index(db)
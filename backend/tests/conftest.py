@@ -0,0 +1,4 @@
+import os
+
+# Тесты, импортирующие full_api, пишут журнал только в консоль, а не в api.log текущего каталога
+os.environ.setdefault("OFS_LOG_FILE", "")
@@ -0,0 +1,150 @@
+"""
+Сжатие ответов: выбор кодировки по q-значениям, пропуск text/event-stream,
+суффиксы кодировки в ETag и If-None-Match, повторное использование сжатых тел.
+"""
+
+import json
+
+import pytest
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+import compression
+from compression import CompressionMiddleware, choose_encoding
+
+BODY = {"items": [{"id": i, "name": f"Подразделение {i}"} for i in range(200)]}
+ETAG = '"0123456789abcdef"'
+
+
+@pytest.fixture
+def without_brotli(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+
+
+@pytest.fixture
+def with_brotli(monkeypatch):
+    # choose_encoding проверяет только наличие пакета
+    monkeypatch.setattr(compression, "brotli", object())
+
+
+@pytest.fixture
+def app(without_brotli):
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @app.get("/items")
+    def items(request: Request):
+        # Как http_cache: приложение сравнивает If-None-Match со своим ETag без суффикса
+        if request.headers.get("if-none-match") == ETAG:
+            return Response(status_code=304, headers={"ETag": ETAG})
+        return Response(json.dumps(BODY), media_type="application/json", headers={"ETag": ETAG})
+
+    @app.get("/small")
+    def small():
+        return {"ok": True}
+
+    @app.get("/events")
+    def events():
+        return StreamingResponse(iter([b"data: 1\n\n", b"data: 2\n\n"]), media_type="text/event-stream")
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(
+            (json.dumps(item).encode() + b"\n" for item in BODY["items"]), media_type="application/json"
+        )
+
+    return app
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip", "gzip"),
+    ("gzip;q=0", None),
+    ("identity", None),
+    ("", None),
+    ("*", "gzip"),
+    ("*;q=0.5, gzip;q=0", None),
+    ("deflate, GZIP;q=0.3", "gzip"),
+    ("gzip;q=abc", None),
+])
+def test_choose_encoding_without_brotli(without_brotli, header, expected):
+    assert choose_encoding(header) == expected
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate, br", "br"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("br;q=0.9, gzip;q=0.9", "br"),
+    ("br;q=0, *", "gzip"),
+    ("*;q=0.2", "br"),
+])
+def test_choose_encoding_with_brotli(with_brotli, header, expected):
+    assert choose_encoding(header) == expected
+
+
+def test_json_is_compressed_with_etag_suffix(app):
+    response = TestClient(app).get("/items", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["ETag"] == ETAG[:-1] + '-gzip"'
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert response.json() == BODY
+
+
+def test_if_none_match_with_encoding_suffix_reaches_app_without_it(app):
+    client = TestClient(app)
+    etag = client.get("/items", headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+    cached = client.get("/items", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert cached.status_code == 304
+    assert "Content-Encoding" not in cached.headers
+
+
+def test_small_and_uncompressed_responses_pass_through(app):
+    client = TestClient(app)
+    assert "Content-Encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    plain = client.get("/items", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in plain.headers
+    assert plain.headers["ETag"] == ETAG
+
+
+def test_event_stream_is_not_compressed(app):
+    response = TestClient(app).get("/events", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.text == "data: 1\n\ndata: 2\n\n"
+
+
+def test_streaming_response_is_compressed_by_parts(app):
+    response = TestClient(app).get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert [json.loads(line) for line in response.text.splitlines()] == BODY["items"]
+
+
+def test_compressed_body_is_reused_for_same_etag(app, monkeypatch):
+    calls = []
+    original = compression.compress
+    monkeypatch.setattr(compression, "compress", lambda body, encoding: calls.append(encoding) or original(body, encoding))
+
+    client = TestClient(app)
+    first = client.get("/items", headers={"Accept-Encoding": "gzip"})
+    second = client.get("/items", headers={"Accept-Encoding": "gzip"})
+    assert first.content == second.content
+    assert calls == ["gzip"]
+
+    middleware = app.middleware_stack
+    while not isinstance(middleware, CompressionMiddleware):
+        middleware = middleware.app
+    assert (middleware.cache.hits, middleware.cache.misses) == (1, 1)
+
+
+def test_compressed_cache_evicts_least_recently_used():
+    cache = compression.CompressedCache(max_bytes=10)
+    cache.put(("a", "gzip"), b"12345")
+    cache.put(("b", "gzip"), b"12345")
+    assert cache.get(("a", "gzip")) == b"12345"
+    cache.put(("c", "gzip"), b"12345")
+    assert cache.get(("b", "gzip")) is None
+    assert cache.get(("a", "gzip")) == b"12345"
+    assert cache.size == 10
+    # Тело больше всего кэша не сохраняется
+    cache.put(("d", "gzip"), b"x" * 11)
+    assert cache.get(("d", "gzip")) is None
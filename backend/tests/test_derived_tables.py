@@ -0,0 +1,228 @@
+"""
+Производные таблицы, которые поддерживаются триггерами (сводка ЦКП, счетчики
+аналитики), после случайных записей должны совпадать с полным пересчетом.
+"""
+
+import random
+import sqlite3
+
+import pytest
+
+from complete_schema import ALL_SCHEMAS, ANALYTICS_REBUILD_SQL, VFP_ROLLUP_REBUILD_SQL, VFP_STATUS_COLUMNS
+
+WRITES = 400
+
+
+@pytest.fixture
+def db():
+    conn = sqlite3.connect(":memory:")
+    for schema in ALL_SCHEMAS:
+        conn.executescript(schema)
+    yield conn
+    conn.close()
+
+
+def ids(db: sqlite3.Connection, table: str) -> list:
+    return [row[0] for row in db.execute(f"SELECT id FROM {table}")]
+
+
+def seed_structure(db: sqlite3.Connection, rnd: random.Random):
+    """Организации и подразделения ссылаются только на ранее созданные (без циклов)."""
+    for i in range(1, 9):
+        db.execute(
+            "INSERT INTO organizations (id, name, code, org_type, parent_id) VALUES (?, ?, ?, 'legal_entity', ?)",
+            (i, f"Организация {i}", f"O{i}", rnd.choice([None] + list(range(1, i)))),
+        )
+    for i in range(1, 21):
+        db.execute(
+            "INSERT INTO divisions (id, name, code, organization_id, parent_id) VALUES (?, ?, ?, ?, ?)",
+            (i, f"Подразделение {i}", f"D{i}", rnd.randint(1, 8), rnd.choice([None] + list(range(1, i)))),
+        )
+    for i in range(1, 16):
+        db.execute("INSERT INTO sections (id, name, code) VALUES (?, ?, ?)", (i, f"Отдел {i}", f"S{i}"))
+    for i in range(1, 21):
+        db.execute("INSERT INTO functions (id, name, code) VALUES (?, ?, ?)", (i, f"Функция {i}", f"F{i}"))
+    for _ in range(25):
+        db.execute("INSERT OR IGNORE INTO division_sections (division_id, section_id) VALUES (?, ?)",
+                   (rnd.randint(1, 20), rnd.randint(1, 15)))
+    for _ in range(30):
+        db.execute("INSERT OR IGNORE INTO section_functions (section_id, function_id) VALUES (?, ?)",
+                   (rnd.randint(1, 15), rnd.randint(1, 20)))
+
+
+def random_vfp_owner(rnd: random.Random) -> tuple:
+    return rnd.choice([("organization", 8), ("division", 20), ("section", 15), ("function", 20)])
+
+
+def upsert_random_vfp(db: sqlite3.Connection, rnd: random.Random):
+    entity_type, count = random_vfp_owner(rnd)
+    db.execute(
+        """
+        INSERT OR IGNORE INTO valuable_final_products (entity_type, entity_id, name, status, progress, is_active)
+        VALUES (?, ?, 'ЦКП', ?, ?, ?)
+        """,
+        (entity_type, rnd.randint(1, count), rnd.choice(VFP_STATUS_COLUMNS + [None]),
+         rnd.choice([None, rnd.randint(0, 100)]), rnd.choice([1, 1, 0])),
+    )
+
+
+def vfp_rollup_state(db: sqlite3.Connection) -> tuple:
+    # Строки "узел сам себе предок" триггеры добавляют, только когда у узла появляются связи или ЦКП
+    return (
+        sorted(db.execute(
+            "SELECT * FROM org_ancestors WHERE descendant_type <> ancestor_type OR descendant_id <> ancestor_id"
+        ).fetchall()),
+        sorted(db.execute("SELECT * FROM vfp_rollup WHERE vfp_count <> 0").fetchall()),
+    )
+
+
+def seed_staff(db: sqlite3.Connection, rnd: random.Random):
+    for i in range(1, 31):
+        db.execute("INSERT INTO positions (name, code, function_id) VALUES (?, ?, ?)",
+                   (f"Должность {i}", f"P{i}", rnd.choice([None, rnd.randint(1, 20)])))
+    for i in range(1, 61):
+        db.execute(
+            "INSERT INTO staff (email, first_name, last_name, organization_id) VALUES (?, 'Имя', 'Фамилия', ?)",
+            (f"staff{i}@example.com", rnd.choice([None, rnd.randint(1, 8)])),
+        )
+    for staff_id in range(1, 61):
+        insert_random_assignment(db, rnd, staff_id, is_primary=1)
+    for _ in range(80):
+        insert_random_relation(db, rnd)
+
+
+def insert_random_assignment(db: sqlite3.Connection, rnd: random.Random, staff_id: int, is_primary: int):
+    db.execute(
+        "INSERT INTO staff_positions (staff_id, position_id, division_id, location_id, is_primary) VALUES (?, ?, ?, ?, ?)",
+        (staff_id, rnd.choice(ids(db, "positions")), rnd.choice([None, rnd.randint(1, 20)]),
+         rnd.choice([None, rnd.randint(1, 8)]), is_primary),
+    )
+
+
+def insert_random_relation(db: sqlite3.Connection, rnd: random.Random):
+    db.execute(
+        "INSERT INTO functional_relations (manager_id, subordinate_id, relation_type) VALUES (?, ?, ?)",
+        (rnd.choice(ids(db, "staff")), rnd.choice(ids(db, "staff")), rnd.choice(["functional", "administrative", "project"])),
+    )
+
+
+def analytics_state(db: sqlite3.Connection) -> tuple:
+    return (
+        sorted(db.execute("SELECT * FROM headcount_cube WHERE assignments <> 0 OR headcount <> 0").fetchall()),
+        sorted(db.execute("SELECT * FROM span_of_control WHERE direct_reports <> 0").fetchall()),
+    )
+
+
+def rebuilt(db: sqlite3.Connection, rebuild_sql: str, state) -> tuple:
+    db.commit()
+    copy = sqlite3.connect(":memory:")
+    db.backup(copy)
+    copy.executescript(rebuild_sql)
+    result = state(copy)
+    copy.close()
+    return result
+
+
+def test_vfp_rollup_matches_rebuild_after_random_writes(db):
+    rnd = random.Random(39)
+    seed_structure(db, rnd)
+    for _ in range(40):
+        upsert_random_vfp(db, rnd)
+    assert vfp_rollup_state(db) == rebuilt(db, VFP_ROLLUP_REBUILD_SQL, vfp_rollup_state)
+
+    for _ in range(WRITES):
+        kind = rnd.randrange(10)
+        if kind == 0:
+            org_id = rnd.randint(2, 8)
+            db.execute("UPDATE organizations SET parent_id = ? WHERE id = ?",
+                       (rnd.choice([None] + list(range(1, org_id))), org_id))
+        elif kind == 1:
+            division_id = rnd.randint(2, 20)
+            db.execute("UPDATE divisions SET parent_id = ?, organization_id = ? WHERE id = ?",
+                       (rnd.choice([None] + list(range(1, division_id))), rnd.randint(1, 8), division_id))
+        elif kind == 2:
+            db.execute("INSERT OR IGNORE INTO division_sections (division_id, section_id) VALUES (?, ?)",
+                       (rnd.randint(1, 20), rnd.randint(1, 15)))
+        elif kind == 3:
+            db.execute("UPDATE OR IGNORE division_sections SET division_id = ? WHERE id = ?",
+                       (rnd.randint(1, 20), rnd.choice(ids(db, "division_sections"))))
+        elif kind == 4:
+            db.execute("DELETE FROM division_sections WHERE id = ?", (rnd.choice(ids(db, "division_sections")),))
+        elif kind == 5:
+            db.execute("INSERT OR IGNORE INTO section_functions (section_id, function_id) VALUES (?, ?)",
+                       (rnd.randint(1, 15), rnd.randint(1, 20)))
+        elif kind == 6:
+            db.execute("UPDATE OR IGNORE section_functions SET section_id = ?, function_id = ? WHERE id = ?",
+                       (rnd.randint(1, 15), rnd.randint(1, 20), rnd.choice(ids(db, "section_functions"))))
+        elif kind == 7:
+            db.execute("DELETE FROM section_functions WHERE id = ?", (rnd.choice(ids(db, "section_functions")),))
+        elif kind == 8:
+            upsert_random_vfp(db, rnd)
+        else:
+            entity_type, count = random_vfp_owner(rnd)
+            db.execute(
+                """
+                UPDATE OR IGNORE valuable_final_products
+                SET status = ?, progress = ?, is_active = ?, entity_type = ?, entity_id = ?
+                WHERE id = ?
+                """,
+                (rnd.choice(VFP_STATUS_COLUMNS), rnd.randint(0, 100), rnd.choice([1, 1, 0]),
+                 entity_type, rnd.randint(1, count), rnd.choice(ids(db, "valuable_final_products"))),
+            )
+    assert vfp_rollup_state(db) == rebuilt(db, VFP_ROLLUP_REBUILD_SQL, vfp_rollup_state)
+
+    # Удаление узлов вместе с их связями вверх
+    db.execute("DELETE FROM divisions WHERE id IN (3, 7)")
+    db.execute("DELETE FROM organizations WHERE id = 2")
+    db.execute("DELETE FROM valuable_final_products WHERE id IN (SELECT id FROM valuable_final_products LIMIT 5)")
+    assert vfp_rollup_state(db) == rebuilt(db, VFP_ROLLUP_REBUILD_SQL, vfp_rollup_state)
+
+
+def test_analytics_counters_match_rebuild_after_random_writes(db):
+    rnd = random.Random(40)
+    seed_structure(db, rnd)
+    seed_staff(db, rnd)
+    assert analytics_state(db) == rebuilt(db, ANALYTICS_REBUILD_SQL, analytics_state)
+
+    for _ in range(WRITES):
+        kind = rnd.randrange(12)
+        if kind == 0:
+            db.execute("UPDATE staff_positions SET is_active = 1 - is_active WHERE id = ?",
+                       (rnd.choice(ids(db, "staff_positions")),))
+        elif kind == 1:
+            db.execute("UPDATE staff_positions SET division_id = ?, location_id = ?, is_primary = ? WHERE id = ?",
+                       (rnd.randint(1, 20), rnd.choice([None, rnd.randint(1, 8)]), rnd.randrange(2),
+                        rnd.choice(ids(db, "staff_positions"))))
+        elif kind == 2:
+            db.execute("UPDATE staff_positions SET staff_id = ?, position_id = ? WHERE id = ?",
+                       (rnd.choice(ids(db, "staff")), rnd.choice(ids(db, "positions")), rnd.choice(ids(db, "staff_positions"))))
+        elif kind == 3:
+            insert_random_assignment(db, rnd, rnd.choice(ids(db, "staff")), is_primary=rnd.randrange(2))
+        elif kind == 4:
+            db.execute("DELETE FROM staff_positions WHERE id = ?", (rnd.choice(ids(db, "staff_positions")),))
+        elif kind == 5:
+            db.execute("UPDATE staff SET organization_id = ? WHERE id = ?",
+                       (rnd.choice([None, rnd.randint(1, 8)]), rnd.choice(ids(db, "staff"))))
+        elif kind == 6:
+            db.execute("UPDATE staff SET is_active = 1 - is_active WHERE id = ?", (rnd.choice(ids(db, "staff")),))
+        elif kind == 7:
+            db.execute("UPDATE positions SET function_id = ? WHERE id = ?",
+                       (rnd.choice([None, rnd.randint(1, 20)]), rnd.choice(ids(db, "positions"))))
+        elif kind == 8:
+            db.execute("INSERT INTO positions (name, code, function_id) VALUES ('Новая должность', ?, ?)",
+                       (f"NP{rnd.random()}", rnd.choice([None, rnd.randint(1, 20)])))
+        elif kind == 9:
+            db.execute(
+                "UPDATE functional_relations SET is_active = 1 - is_active, manager_id = ?, relation_type = ? WHERE id = ?",
+                (rnd.choice(ids(db, "staff")), rnd.choice(["functional", "project"]), rnd.choice(ids(db, "functional_relations"))),
+            )
+        elif kind == 10:
+            insert_random_relation(db, rnd)
+        else:
+            db.execute("DELETE FROM functional_relations WHERE id = ?", (rnd.choice(ids(db, "functional_relations")),))
+    assert analytics_state(db) == rebuilt(db, ANALYTICS_REBUILD_SQL, analytics_state)
+
+    # Удаление должностей и сотрудников, на которые остались назначения
+    db.execute("DELETE FROM positions WHERE id IN (SELECT position_id FROM staff_positions LIMIT 3)")
+    db.execute("DELETE FROM staff WHERE id IN (SELECT staff_id FROM staff_positions LIMIT 3)")
+    assert analytics_state(db) == rebuilt(db, ANALYTICS_REBUILD_SQL, analytics_state)
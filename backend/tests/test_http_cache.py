@@ -0,0 +1,108 @@
+"""
+Условные GET-запросы по версиям таблиц: 304 на совпавший If-None-Match отдается
+до выполнения эндпоинта, а запись в таблицу меняет ETag.
+"""
+
+import sqlite3
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from complete_schema import ALL_SCHEMAS
+from http_cache import table_etag
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "cache.db")
+    conn = sqlite3.connect(path)
+    for schema in ALL_SCHEMAS:
+        conn.executescript(schema)
+    conn.execute("INSERT INTO sections (id, name, code) VALUES (1, 'Отдел', 'S1')")
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def app(db_path):
+    def get_db():
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    app = FastAPI()
+    app.state.calls = 0
+
+    @app.get("/sections", dependencies=[table_etag(get_db, "sections")])
+    def list_sections(db: sqlite3.Connection = Depends(get_db)):
+        app.state.calls += 1
+        return [row[0] for row in db.execute("SELECT name FROM sections ORDER BY id")]
+
+    @app.get("/untracked", dependencies=[table_etag(get_db, "jobs")])
+    def untracked():
+        return []
+
+    return app
+
+
+def write(db_path: str, sql: str):
+    conn = sqlite3.connect(db_path)
+    conn.execute(sql)
+    conn.commit()
+    conn.close()
+
+
+def test_matching_etag_returns_304_before_handler(app):
+    client = TestClient(app)
+    first = client.get("/sections")
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"] == "no-cache"
+    assert "Last-Modified" in first.headers
+    etag = first.headers["ETag"]
+    assert app.state.calls == 1
+
+    cached = client.get("/sections", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["ETag"] == etag
+    assert app.state.calls == 1
+
+    # Слабое сравнение и список значений
+    weak = client.get("/sections", headers={"If-None-Match": f'"other", W/{etag}'})
+    assert weak.status_code == 304
+    assert app.state.calls == 1
+
+
+def test_etag_changes_after_write(app, db_path):
+    client = TestClient(app)
+    etag = client.get("/sections").headers["ETag"]
+
+    write(db_path, "UPDATE sections SET name = 'Новое имя' WHERE id = 1")
+    changed = client.get("/sections", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json() == ["Новое имя"]
+    assert changed.headers["ETag"] != etag
+    assert app.state.calls == 2
+
+    # Запись в таблицу, которую эндпоинт не читает, ETag не меняет
+    etag = changed.headers["ETag"]
+    write(db_path, "INSERT INTO functions (name, code) VALUES ('Функция', 'F1')")
+    assert client.get("/sections", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_etag_depends_on_query_parameters(app):
+    client = TestClient(app)
+    etag = client.get("/sections", params={"a": "1", "b": "2"}).headers["ETag"]
+    # Порядок параметров не важен, значения - важны
+    assert client.get("/sections", params={"b": "2", "a": "1"}, headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/sections", params={"a": "2", "b": "2"}, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_unversioned_table_is_not_cached(app):
+    response = TestClient(app).get("/untracked", headers={"If-None-Match": "*"})
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
@@ -0,0 +1,135 @@
+"""
+Мульти-выборка ids= и подгрузка связанных записей include=: предел числа id,
+число запросов не зависит от числа строк, ЦКП подгружают свои узлы.
+"""
+
+import sqlite3
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import full_api
+import sharding
+from complete_schema import ALL_SCHEMAS
+from includes import MAX_IDS, compound_document, parse_ids, select_in
+
+
+def create_db(conn: sqlite3.Connection, divisions: int):
+    for schema in ALL_SCHEMAS:
+        conn.executescript(schema)
+    conn.execute("INSERT INTO organizations (id, name, code, org_type) VALUES (1, 'Холдинг', 'H1', 'holding')")
+    conn.execute("INSERT INTO functions (id, name, code) VALUES (1, 'Продажи', 'F1')")
+    for division_id in range(1, divisions + 1):
+        conn.execute(
+            "INSERT INTO divisions (id, name, code, organization_id) VALUES (?, ?, ?, 1)",
+            (division_id, f"Подразделение {division_id}", f"D{division_id}"),
+        )
+        conn.execute("INSERT INTO sections (id, name, code) VALUES (?, ?, ?)", (division_id, f"Отдел {division_id}", f"S{division_id}"))
+        conn.execute("INSERT INTO division_sections (division_id, section_id) VALUES (?, ?)", (division_id, division_id))
+        conn.execute("INSERT INTO section_functions (section_id, function_id) VALUES (?, 1)", (division_id,))
+    conn.commit()
+
+
+@pytest.fixture
+def db():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
+
+
+def count_queries(db: sqlite3.Connection, call) -> int:
+    queries = []
+    db.set_trace_callback(queries.append)
+    try:
+        call()
+    finally:
+        db.set_trace_callback(None)
+    return len(queries)
+
+
+def test_parse_ids():
+    assert parse_ids(None) is None
+    assert parse_ids("") == []
+    assert parse_ids("3, 1,3,,2") == [3, 1, 2]
+    assert parse_ids(",".join(str(i) for i in range(MAX_IDS))) == list(range(MAX_IDS))
+    # Повторы не считаются в предел
+    assert len(parse_ids(",".join(["7"] * (MAX_IDS + 1)))) == 1
+
+
+@pytest.mark.parametrize("ids", [",".join(str(i) for i in range(MAX_IDS + 1)), "1,x", "1.5"])
+def test_parse_ids_rejects_invalid(ids):
+    with pytest.raises(HTTPException) as error:
+        parse_ids(ids)
+    assert error.value.status_code == 400
+
+
+def test_select_in_reads_in_batches(db):
+    create_db(db, MAX_IDS + 10)
+    ids = list(range(1, MAX_IDS + 11))
+    assert count_queries(db, lambda: select_in(db, "divisions", "id", ids)) == 2
+    assert len(select_in(db, "divisions", "id", ids + [None])) == MAX_IDS + 10
+
+
+@pytest.mark.parametrize("include", [["organization"], ["sections"], ["organization", "parent", "children", "sections"]])
+def test_include_query_count_does_not_depend_on_rows(include):
+    counts = []
+    for divisions in (5, 200):
+        conn = sqlite3.connect(":memory:")
+        conn.row_factory = sqlite3.Row
+        create_db(conn, divisions)
+        rows = [dict(row) for row in conn.execute("SELECT * FROM divisions")]
+        counts.append(count_queries(conn, lambda: compound_document(conn, "divisions", rows, include)))
+        conn.close()
+    assert counts[0] == counts[1]
+
+
+def test_included_rows_are_not_repeated(db):
+    create_db(db, 10)
+    rows = [dict(row) for row in db.execute("SELECT * FROM sections")]
+    document = compound_document(db, "sections", rows, ["functions", "divisions"])
+    assert [row["id"] for row in document["included"]["functions"]] == [1]
+    assert len(document["included"]["section_functions"]) == 10
+    assert sorted(row["id"] for row in document["included"]["divisions"]) == list(range(1, 11))
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    path = str(tmp_path / "full_api_new.db")
+    conn = sqlite3.connect(path)
+    create_db(conn, 3)
+    for entity_type, entity_id in (("organization", 1), ("division", 2), ("section", 3), ("function", 1), ("board", 1)):
+        conn.execute(
+            "INSERT INTO valuable_final_products (entity_type, entity_id, name) VALUES (?, ?, ?)",
+            (entity_type, entity_id, f"ЦКП {entity_type}"),
+        )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(full_api, "DB_PATH", path)
+    monkeypatch.setattr(sharding, "_settings", dict(sharding.SHARD_DEFAULTS, enabled=0))
+    return TestClient(full_api.app)
+
+
+def test_vfp_list_with_include(client):
+    response = client.get("/vfp/", params={"include": "organization,division,section,function"})
+    assert response.status_code == 200
+    document = response.json()
+    assert len(document["data"]) == 5
+    assert {table: [row["id"] for row in rows] for table, rows in document["included"].items()} == {
+        "organizations": [1], "divisions": [2], "sections": [3], "functions": [1],
+    }
+
+    selected = client.get("/vfp/", params={"ids": "2,3", "include": "division"}).json()
+    assert [row["entity_type"] for row in selected["data"]] == ["division", "section"]
+    assert [row["id"] for row in selected["included"]["divisions"]] == [2]
+
+    # Без include= - прежний список
+    assert len(client.get("/vfp/").json()) == 5
+    assert client.get("/vfp/", params={"include": "staff"}).status_code == 400
+
+
+def test_list_rejects_too_many_ids(client):
+    too_many = ",".join(str(i) for i in range(1, MAX_IDS + 2))
+    assert client.get("/vfp/", params={"ids": too_many}).status_code == 400
+    assert client.get("/divisions/", params={"ids": too_many}).status_code == 400
@@ -0,0 +1,88 @@
+"""
+Шина инвалидации: запись из другого соединения (другого процесса) доходит до
+подписчиков, удаление - с организацией удаленной строки.
+"""
+
+import sqlite3
+import threading
+
+import pytest
+
+from complete_schema import ALL_SCHEMAS
+from invalidation import Invalidation, InvalidationBus
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "full_api_new.db")
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    for schema in ALL_SCHEMAS:
+        conn.executescript(schema)
+    conn.execute("INSERT INTO organizations (id, name, code, org_type) VALUES (1, 'Холдинг', 'H1', 'holding')")
+    conn.execute("INSERT INTO divisions (id, name, code, organization_id) VALUES (1, 'Подразделение', 'D1', 1)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def bus(db_path, monkeypatch):
+    # Фоновый поток почти не опрашивает: опрос вызывает тест
+    monkeypatch.setenv("OFS_INVALIDATION_POLL_MS", "3600000")
+    bus = InvalidationBus(name="test-invalidation-bus")
+    received = []
+    bus.subscribe(lambda db, invalidations: received.extend(invalidations))
+    bus.received = received
+    bus.start(db_path)
+    yield bus
+    bus.stop()
+
+
+@pytest.fixture
+def writer(db_path):
+    conn = sqlite3.connect(db_path)
+    yield conn
+    conn.close()
+
+
+def row_events(received):
+    return [(item.table, item.row_id, item.operation, item.organization_id) for item in received if item.row_id is not None]
+
+
+def test_changes_before_start_are_not_delivered(bus):
+    bus.poll()
+    assert bus.received == []
+    assert bus.log_version > 0
+
+
+def test_write_from_other_connection_reaches_subscriber(bus, writer):
+    writer.execute("UPDATE divisions SET name = 'Новое имя' WHERE id = 1")
+    writer.commit()
+    bus.poll()
+
+    assert row_events(bus.received) == [("divisions", 1, "update", None)]
+    version = writer.execute("SELECT version FROM table_versions WHERE table_name = 'divisions'").fetchone()[0]
+    assert Invalidation("divisions", None, None, version) in bus.received
+
+    # Без новых записей подписчики не вызываются
+    bus.received.clear()
+    bus.poll()
+    assert bus.received == []
+
+
+def test_delete_carries_organization_id(bus, writer):
+    writer.execute("DELETE FROM divisions WHERE id = 1")
+    writer.commit()
+    bus.poll()
+    assert row_events(bus.received) == [("divisions", 1, "delete", 1)]
+
+
+def test_poke_delivers_in_bus_thread(bus, writer):
+    delivered = threading.Event()
+    bus.subscribe(lambda db, invalidations: delivered.set())
+    writer.execute("INSERT INTO divisions (id, name, code, organization_id) VALUES (2, 'Второе', 'D2', 1)")
+    writer.commit()
+    bus.poke()
+    assert delivered.wait(5)
+    assert ("divisions", 2, "insert", None) in row_events(bus.received)
@@ -0,0 +1,170 @@
+"""
+Фоновые задания: дедупликация по параметрам и версиям таблиц, предел очереди,
+удаление устаревших результатов и восстановление после перезапуска.
+Задания выполняются в процессе теста (run_job), без пула.
+"""
+
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import jobs_api
+from complete_schema import ALL_SCHEMAS
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "full_api_new.db")
+    conn = sqlite3.connect(path)
+    # Как у API: задание читает источник в транзакции и параллельно пишет ход выполнения
+    conn.execute("PRAGMA journal_mode=WAL")
+    for schema in ALL_SCHEMAS:
+        conn.executescript(schema)
+    conn.execute("INSERT INTO organizations (id, name, code, org_type) VALUES (1, 'Холдинг', 'H1', 'holding')")
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(jobs_api, "DB_PATH", path)
+    monkeypatch.setenv("OFS_JOB_DIR", str(tmp_path / "jobs"))
+    return path
+
+
+@pytest.fixture
+def submitted(db_path, monkeypatch):
+    # Задания не уходят в пул: тест сам решает, когда их выполнить
+    submitted = []
+    monkeypatch.setattr(jobs_api, "submit_job", submitted.append)
+    return submitted
+
+
+@pytest.fixture
+def client(submitted):
+    app = FastAPI()
+    app.include_router(jobs_api.router)
+    return TestClient(app)
+
+
+def run(job_id: str):
+    settings = jobs_api.load_settings()
+    jobs_api.run_job(job_id, jobs_api.DB_PATH, settings["dir"], settings["ttl_hours"])
+
+
+def execute(sql: str, *params):
+    conn = sqlite3.connect(jobs_api.DB_PATH)
+    with conn:
+        conn.execute(sql, params)
+    conn.close()
+
+
+def job_rows() -> dict:
+    conn = sqlite3.connect(jobs_api.DB_PATH)
+    rows = dict(conn.execute("SELECT id, status FROM jobs").fetchall())
+    conn.close()
+    return rows
+
+
+def test_same_params_and_data_are_deduplicated(client, submitted):
+    first = client.post("/jobs/analytics-report", json={"organization_id": 1})
+    assert first.status_code == 202
+    assert first.json()["deduplicated"] is False
+
+    # Параметры сравниваются после приведения: "1" и 1 - одно задание
+    second = client.post("/jobs/analytics-report", json={"organization_id": "1"}).json()
+    assert second["id"] == first.json()["id"]
+    assert second["deduplicated"] is True
+    assert submitted == [first.json()["id"]]
+
+    other_params = client.post("/jobs/analytics-report", json={"organization_id": 2}).json()
+    assert other_params["id"] != first.json()["id"]
+
+    # Изменились данные, которые читает задание - новое задание
+    execute("INSERT INTO organizations (id, name, code, org_type) VALUES (3, 'Второй холдинг', 'H3', 'holding')")
+    after_write = client.post("/jobs/analytics-report", json={"organization_id": 1}).json()
+    assert after_write["id"] not in (first.json()["id"], other_params["id"])
+
+
+def test_finished_job_is_reused_until_artifact_is_gone(client):
+    job = client.post("/jobs/analytics-report", json={}).json()
+    run(job["id"])
+
+    info = client.get(f"/jobs/{job['id']}").json()
+    assert info["status"] == "succeeded"
+    assert info["progress"] == 1
+    artifact = client.get(info["artifact_url"])
+    assert artifact.status_code == 200
+    assert set(json.loads(artifact.content)) == {"headcount", "span_of_control"}
+
+    reused = client.post("/jobs/analytics-report", json={}).json()
+    assert (reused["id"], reused["deduplicated"], reused["status"]) == (job["id"], True, "succeeded")
+
+    os.remove(os.path.join(jobs_api.load_settings()["dir"], job["id"], "analytics.json"))
+    assert client.post("/jobs/analytics-report", json={}).json()["id"] != job["id"]
+
+
+def test_unknown_kind_and_params_are_rejected(client):
+    assert client.post("/jobs/unknown", json={}).status_code == 404
+    assert client.post("/jobs/analytics-report", json={"format": "pdf"}).status_code == 400
+    assert client.post("/jobs/analytics-report", json={"organization_id": "x"}).status_code == 400
+
+
+def test_full_queue_returns_503(client, submitted, monkeypatch):
+    monkeypatch.setenv("OFS_JOB_QUEUE_LIMIT", "2")
+    for organization_id in (1, 2):
+        assert client.post("/jobs/analytics-report", json={"organization_id": organization_id}).status_code == 202
+
+    response = client.post("/jobs/analytics-report", json={"organization_id": 3})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "30"
+    assert len(submitted) == 2
+    # Повтор уже поставленного задания не упирается в предел очереди
+    assert client.post("/jobs/analytics-report", json={"organization_id": 1}).json()["deduplicated"] is True
+
+    # Завершенные задания место в очереди не занимают
+    run(submitted[0])
+    assert client.post("/jobs/analytics-report", json={"organization_id": 3}).status_code == 202
+
+
+def test_expired_jobs_are_removed_with_artifacts(client, db_path):
+    expired = client.post("/jobs/analytics-report", json={"organization_id": 1}).json()["id"]
+    kept = client.post("/jobs/analytics-report", json={"organization_id": 2}).json()["id"]
+    run(expired)
+    run(kept)
+    execute("UPDATE jobs SET expires_at = datetime('now', '-1 minute') WHERE id = ?", expired)
+
+    jobs_dir = jobs_api.load_settings()["dir"]
+    conn = sqlite3.connect(db_path)
+    assert jobs_api.cleanup_expired_jobs(conn) == 1
+    conn.close()
+    assert list(job_rows()) == [kept]
+    assert not os.path.exists(os.path.join(jobs_dir, expired))
+    assert os.path.exists(os.path.join(jobs_dir, kept))
+    assert client.get(f"/jobs/{expired}").status_code == 404
+
+
+def test_orphaned_jobs_are_failed_on_recovery(db_path):
+    finished = subprocess.Popen([sys.executable, "-c", "pass"])
+    finished.wait()
+    owners = {
+        "dead-owner": finished.pid,
+        "own-process": os.getpid(),  # пул этого процесса только создается, его заданий в нем нет
+        "alive-owner": os.getppid(),
+        "no-owner": None,
+    }
+    for job_id, pid in owners.items():
+        execute(
+            "INSERT INTO jobs (id, kind, params, params_hash, status, owner_pid) VALUES (?, 'analytics-report', '{}', ?, 'running', ?)",
+            job_id, job_id, pid,
+        )
+    execute("INSERT INTO jobs (id, kind, params, params_hash, status) VALUES ('done', 'analytics-report', '{}', 'done', 'succeeded')")
+
+    conn = sqlite3.connect(db_path)
+    assert jobs_api.recover_jobs(conn) == 3
+    conn.close()
+    assert job_rows() == {
+        "dead-owner": "failed", "own-process": "failed", "alive-owner": "running", "no-owner": "failed", "done": "succeeded",
+    }
@@ -0,0 +1,144 @@
+"""
+Раскладка орг-диаграммы: узлы одного уровня не перекрываются, формы поддеревьев
+переиспользуются после изменения в одном поддереве, кэш раскладок сбрасывается
+по изменившимся таблицам.
+"""
+
+import random
+from collections import defaultdict
+
+import pytest
+
+import org_layout
+from org_layout import H_GAP, NODE_WIDTH, LayoutCache, ShapeCache, arrange, layout_forest, versions_key
+
+STEP = NODE_WIDTH + H_GAP
+
+
+@pytest.fixture(autouse=True)
+def shapes(monkeypatch):
+    cache = ShapeCache()
+    monkeypatch.setattr(org_layout, "shape_cache", cache)
+    return cache
+
+
+def node(node_id: int, children=()):
+    return {"entity_type": "division", "id": node_id, "name": f"Узел {node_id}", "children": list(children)}
+
+
+def random_forest(seed: int, count: int = 300):
+    rng = random.Random(seed)
+    nodes = [node(0)]
+    for node_id in range(1, count):
+        # Чаще к недавним узлам: получаются и глубокие цепочки, и широкие уровни
+        parent = nodes[max(0, len(nodes) - 1 - int(rng.expovariate(0.2)))]
+        child = node(node_id)
+        parent["children"].append(child)
+        nodes.append(child)
+    return [nodes[0], node(count, [node(count + 1)])]
+
+
+def assert_tidy(layout):
+    nodes = layout["nodes"]
+    by_depth = defaultdict(list)
+    children = defaultdict(list)
+    for item in nodes:
+        by_depth[item["depth"]].append(item)
+        if item["parent"] is not None:
+            children[item["parent"]].append(item)
+    for level in by_depth.values():
+        # В прямом порядке обхода узлы уровня идут слева направо
+        xs = [item["x"] for item in level]
+        assert all(right - left >= STEP - 0.1 for left, right in zip(xs, xs[1:]))
+    for parent_key, items in children.items():
+        assert nodes[parent_key]["x"] == pytest.approx((items[0]["x"] + items[-1]["x"]) / 2, abs=0.2)
+    assert min(item["x"] for item in nodes) == NODE_WIDTH / 2 + org_layout.MARGIN
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_nodes_do_not_overlap(seed):
+    assert_tidy(layout_forest(random_forest(seed)))
+
+
+def test_deep_contour_is_respected():
+    # Узкое сверху, но широкое на третьем уровне поддерево отодвигает соседа той же глубины
+    leaf = arrange([])
+    wide_below = arrange([arrange([leaf, leaf, leaf])])
+    chain = arrange([arrange([leaf])])
+    assert arrange([wide_below, chain]).offsets == (-1.0, 1.0)
+    # Соседа меньшей глубины сравниваем только на общих уровнях
+    assert arrange([wide_below, arrange([leaf])]).offsets == (-0.5, 0.5)
+
+
+def test_shapes_are_reused_after_subtree_change(shapes, monkeypatch):
+    forest = random_forest(1)
+    first = layout_forest(forest)
+    assert first["stats"]["computed_subtrees"] == len(shapes)
+
+    # Переименование не меняет форму: ничего не раскладывается заново
+    forest[0]["name"] = "Новое имя"
+    assert layout_forest(forest)["stats"]["computed_subtrees"] == 0
+
+    # Новый лист: заново раскладываются только новые формы на пути к корню
+    leaf = forest[0]["children"][0]
+    while leaf["children"]:
+        leaf = leaf["children"][-1]
+    depth = next(item["depth"] for item in first["nodes"] if item["id"] == leaf["id"])
+    leaf["children"].append(node(10000))
+    second = layout_forest(forest)
+    assert 0 < second["stats"]["computed_subtrees"] <= depth + 2
+    assert second["stats"]["reused_subtrees"] >= len(second["nodes"]) - depth - 1
+    assert_tidy(second)
+
+    # Раскладка не зависит от того, была ли форма в кэше
+    monkeypatch.setattr(org_layout, "shape_cache", ShapeCache())
+    assert [(n["x"], n["y"]) for n in layout_forest(forest)["nodes"]] == [(n["x"], n["y"]) for n in second["nodes"]]
+
+
+def test_shape_cache_is_cleared_when_full():
+    cache = ShapeCache(max_shapes=2)
+    for width in range(4):
+        cache.shape((cache.shape(()),) * width)
+    assert len(cache) == 4
+    cache.trim()
+    assert len(cache) == 0
+    assert cache.shape(()) == 0
+
+
+def test_layout_cache_discards_changed_tables():
+    cache = LayoutCache(size=3)
+    builds = []
+
+    def build(name):
+        builds.append(name)
+        return {"name": name}
+
+    hierarchy = ("layout", None) + (versions_key({"divisions": 1, "organizations": 1}, ("organizations", "divisions")),)
+    staff = ("staff-layout",) + (versions_key({"staff": 1}, ("staff",)),)
+    assert cache.get_or_build(hierarchy, lambda: build("hierarchy")) == {"name": "hierarchy"}
+    cache.get_or_build(staff, lambda: build("staff"))
+    cache.get_or_build(hierarchy, lambda: build("hierarchy"))
+    assert builds == ["hierarchy", "staff"]
+
+    cache.discard_tables({"divisions"})
+    cache.get_or_build(staff, lambda: build("staff"))
+    cache.get_or_build(hierarchy, lambda: build("hierarchy"))
+    assert builds == ["hierarchy", "staff", "hierarchy"]
+
+
+def test_layout_cache_evicts_least_recently_used():
+    cache = LayoutCache(size=2)
+    keys = [(name, (("divisions", 1),)) for name in "abc"]
+    for key in keys:
+        cache.get_or_build(key, dict)
+    builds = []
+    cache.get_or_build(keys[0], lambda: builds.append("a") or {})
+    cache.get_or_build(keys[2], lambda: builds.append("c") or {})
+    assert builds == ["a"]
+
+
+def test_versions_key_requires_all_tables():
+    assert versions_key({"divisions": 2, "organizations": 1}, ("organizations", "divisions")) == (
+        ("divisions", 2), ("organizations", 1),
+    )
+    assert versions_key({"divisions": 2}, ("organizations", "divisions")) is None
@@ -0,0 +1,160 @@
+"""
+Реплика только для чтения: поколения и указатель, удаление старых поколений,
+чтение из основной базы при устаревшей реплике и заголовки версии данных.
+"""
+
+import os
+import sqlite3
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import replica
+import sharding
+from complete_schema import ALL_SCHEMAS
+
+
+@pytest.fixture
+def primary(tmp_path, monkeypatch):
+    path = str(tmp_path / "full_api_new.db")
+    conn = sqlite3.connect(path)
+    for schema in ALL_SCHEMAS:
+        conn.executescript(schema)
+    conn.execute("INSERT INTO organizations (id, name, code, org_type) VALUES (1, 'Холдинг', 'H1', 'holding')")
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(sharding, "_settings", dict(sharding.SHARD_DEFAULTS, enabled=0))
+    return path
+
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    settings = dict(replica.REPLICA_DEFAULTS, enabled=1, path=str(tmp_path / "full_api_replica.db"))
+    monkeypatch.setattr(replica, "_settings", settings)
+    return settings
+
+
+def rename_organization(path: str, name: str):
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE organizations SET name = ? WHERE id = 1", (name,))
+    conn.commit()
+    conn.close()
+
+
+def generation_files(replica_path: str) -> list:
+    directory = os.path.dirname(replica_path)
+    return sorted(name for name in os.listdir(directory) if name.startswith("full_api_replica.") and name.endswith(".db"))
+
+
+def test_publish_creates_generations_and_switches_pointer(primary, settings):
+    path = settings["path"]
+    assert replica.current_generation(path) is None
+
+    version = replica.publish_replica(primary, path)
+    assert replica.current_generation(path) == (1, replica.generation_path(path, 1))
+    assert replica.replica_version(path) == version
+
+    rename_organization(primary, "Новое имя")
+    new_version = replica.publish_replica(primary, path)
+    assert new_version > version
+    assert replica.current_generation(path)[0] == 2
+    assert replica.replica_version(path) == new_version
+
+    # Опубликованное поколение не меняется: предыдущее видит прежние данные
+    previous = replica.connect_replica(replica.generation_path(path, 1))
+    current = replica.connect_replica(replica.generation_path(path, 2))
+    assert previous.execute("SELECT name FROM organizations").fetchone()[0] == "Холдинг"
+    assert current.execute("SELECT name FROM organizations").fetchone()[0] == "Новое имя"
+    previous.close()
+    current.close()
+
+
+def test_generations_older_than_previous_are_removed(primary, settings):
+    path = settings["path"]
+    for _ in range(4):
+        replica.publish_replica(primary, path)
+    # Текущее (4) и предыдущее (3), которое еще могут дочитывать
+    assert generation_files(path) == ["full_api_replica.3.db", "full_api_replica.4.db"]
+
+
+def test_leftover_of_failed_publication_is_replaced(primary, settings):
+    path = settings["path"]
+    replica.publish_replica(primary, path)
+    with open(replica.generation_path(path, 2), "wb") as leftover:
+        leftover.write(b"not a database")
+    replica.publish_replica(primary, path)
+    assert replica.replica_version(path) is not None
+
+
+def test_fresh_replica_is_read_with_headers(primary, settings):
+    version = replica.publish_replica(primary, settings["path"])
+    rename_organization(primary, "Новое имя")
+
+    conn, headers = replica.connect_for_read(primary)
+    try:
+        assert conn.execute("SELECT name FROM organizations").fetchone()[0] == "Холдинг"
+    finally:
+        conn.close()
+    assert headers["X-OFS-Read-Source"] == "replica"
+    assert headers["X-OFS-Data-Version"] == str(version)
+    assert int(headers["X-OFS-Replica-Age"]) <= settings["max_staleness"]
+
+
+def test_stale_replica_falls_back_to_primary(primary, settings):
+    replica.publish_replica(primary, settings["path"])
+    rename_organization(primary, "Новое имя")
+    stale = time.time() - settings["max_staleness"] - 10
+    os.utime(replica.pointer_path(settings["path"]), (stale, stale))
+
+    conn, headers = replica.connect_for_read(primary)
+    try:
+        assert conn.execute("SELECT name FROM organizations").fetchone()[0] == "Новое имя"
+        assert headers["X-OFS-Data-Version"] == str(replica.data_version(conn))
+    finally:
+        conn.close()
+    assert headers["X-OFS-Read-Source"] == "primary"
+    assert "X-OFS-Replica-Age" not in headers
+
+
+def test_missing_replica_falls_back_to_primary(primary, settings):
+    conn, headers = replica.connect_for_read(primary)
+    conn.close()
+    assert headers["X-OFS-Read-Source"] == "primary"
+
+
+def test_publisher_check_refreshes_pointer_without_new_generation(primary, settings):
+    publisher = replica.ReplicaPublisher(primary, settings)
+    publisher.check()
+    stale = time.time() - settings["max_staleness"] - 10
+    os.utime(replica.pointer_path(settings["path"]), (stale, stale))
+
+    # Данные не менялись: только сверка
+    publisher.check()
+    assert replica.current_generation(settings["path"])[0] == 1
+    assert replica.replica_age(settings["path"]) < settings["max_staleness"]
+
+    rename_organization(primary, "Новое имя")
+    publisher.check()
+    assert replica.current_generation(settings["path"])[0] == 2
+
+
+def test_read_endpoint_reports_source_and_version(primary, settings, monkeypatch):
+    # Эндпоинты чтения открывают full_api_new.db в текущем каталоге
+    monkeypatch.chdir(os.path.dirname(primary))
+    from org_structure_api import router
+
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+
+    response = client.get("/org-structure/hierarchy")
+    assert response.status_code == 200
+    assert response.headers["X-OFS-Read-Source"] == "primary"
+
+    version = replica.publish_replica(primary, settings["path"])
+    response = client.get("/org-structure/hierarchy")
+    assert response.headers["X-OFS-Read-Source"] == "replica"
+    assert response.headers["X-OFS-Data-Version"] == str(version)
+    assert [node["name"] for node in response.json()] == ["Холдинг"]
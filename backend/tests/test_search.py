@@ -0,0 +1,97 @@
+"""
+Полнотекстовый поиск: построение выражения MATCH (кавычки, префиксы, предел
+слов, ё -> е) и триггеры, поддерживающие индекс при изменении и удалении строк.
+"""
+
+import sqlite3
+
+import pytest
+
+from complete_schema import ALL_SCHEMAS
+from search_api import MAX_QUERY_TOKENS, build_match_query, rebuild_search_index, search_entities
+
+
+@pytest.fixture
+def db():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    for schema in ALL_SCHEMAS:
+        conn.executescript(schema)
+    conn.execute(
+        "INSERT INTO staff (id, email, first_name, last_name, middle_name, phone) "
+        "VALUES (1, 'fedorova@example.com', 'Алёна', 'Фёдорова', 'Петровна', '+7 (912) 345-67-89')"
+    )
+    conn.execute("INSERT INTO sections (id, name, code) VALUES (1, 'Отдел продаж', 'SALES')")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def found(db: sqlite3.Connection, entity_type: str, text: str) -> list:
+    return [hit["id"] for hit in search_entities(db, entity_type, build_match_query(text), 20)]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Иван", '"иван"*'),
+    ("  иван   петров ", '"иван"* "петров"*'),
+    ("Фёдор", '"федор"*'),
+    ("ЁЖИК", '"ежик"*'),
+    # Служебные слова FTS5 и кавычки не становятся операторами
+    ('near AND "x', '"near"* "and"* "x"*'),
+    ("o'neil-smith", '"o"* "neil"* "smith"*'),
+    ("", None),
+    ("!!! --- ...", None),
+])
+def test_build_match_query(text, expected):
+    assert build_match_query(text) == expected
+
+
+def test_build_match_query_keeps_first_tokens():
+    words = [f"слово{i}" for i in range(MAX_QUERY_TOKENS + 4)]
+    assert build_match_query(" ".join(words)) == " ".join(f'"{word}"*' for word in words[:MAX_QUERY_TOKENS])
+
+
+def test_prefix_and_yo_folding(db):
+    assert found(db, "staff", "фед") == [1]
+    assert found(db, "staff", "Фёдорова але") == [1]
+    assert found(db, "staff", "ФЕДОРОВА АЛЁНА ПЕТРОВНА") == [1]
+    assert found(db, "staff", "9123456789") == [1]
+    assert found(db, "staff", "федорова иван") == []
+
+
+def test_operator_words_do_not_break_query(db):
+    assert found(db, "sections", "отдел AND") == []
+    assert found(db, "sections", "NEAR") == []
+    assert found(db, "sections", "отдел прод") == [1]
+
+
+def test_words_beyond_limit_are_ignored(db):
+    words = ["отдел", "продаж"] * (MAX_QUERY_TOKENS // 2) + ["несуществующее"]
+    assert found(db, "sections", " ".join(words)) == [1]
+
+
+def test_triggers_keep_index_in_sync(db):
+    db.execute("UPDATE staff SET last_name = 'Семёнова' WHERE id = 1")
+    assert found(db, "staff", "федорова") == []
+    assert found(db, "staff", "семенова") == [1]
+
+    # Изменение непроиндексированных полей индекс не трогает
+    db.execute("UPDATE staff SET description = 'Новое описание' WHERE id = 1")
+    assert found(db, "staff", "семенова алена") == [1]
+
+    db.execute("UPDATE sections SET name = 'Отдел закупок' WHERE id = 1")
+    assert found(db, "sections", "продаж") == []
+    assert found(db, "sections", "закуп") == [1]
+
+    db.execute("DELETE FROM staff WHERE id = 1")
+    db.execute("DELETE FROM sections WHERE id = 1")
+    assert found(db, "staff", "семенова") == []
+    assert found(db, "sections", "отдел") == []
+    assert db.execute("SELECT COUNT(*) FROM staff_fts").fetchone()[0] == 0
+
+
+def test_rebuild_matches_triggers(db):
+    before = db.execute("SELECT rowid, full_name, email, phone FROM staff_fts").fetchall()
+    rebuild_search_index(db)
+    assert db.execute("SELECT rowid, full_name, email, phone FROM staff_fts").fetchall() == before
+    assert found(db, "staff", "федорова") == [1]
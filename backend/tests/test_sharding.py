@@ -0,0 +1,445 @@
+"""
+Шардирование по холдингам: перенос холдинга в шард, общее чтение каталога
+с шардами, маршрутизация запросов, отклонение изменений холдинга шарда в каталоге,
+копирование справочников и сводка ЦКП после переноса.
+"""
+
+import sqlite3
+
+import pytest
+
+import sharding
+from complete_schema import ALL_SCHEMAS
+from vfp_rollup import get_vfp_rollup
+
+
+@pytest.fixture
+def catalog_path(tmp_path, monkeypatch):
+    """
+    Холдинг 1 с юрлицом 2 и подразделением 1 (переносится в шард) и холдинг 3
+    с подразделением 2 (остается в каталоге). Отдел 1 с функцией 1 входит в оба подразделения.
+    """
+    path = str(tmp_path / "full_api_new.db")
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    for schema in ALL_SCHEMAS:
+        conn.executescript(schema)
+    conn.executescript("""
+        INSERT INTO organizations (id, name, code, org_type) VALUES (1, 'Холдинг А', 'HA', 'holding');
+        INSERT INTO organizations (id, name, code, org_type, parent_id) VALUES (2, 'Юрлицо А', 'LA', 'legal_entity', 1);
+        INSERT INTO organizations (id, name, code, org_type) VALUES (3, 'Холдинг Б', 'HB', 'holding');
+        INSERT INTO divisions (id, name, code, organization_id) VALUES (1, 'Департамент А', 'DA', 2);
+        INSERT INTO divisions (id, name, code, organization_id) VALUES (2, 'Департамент Б', 'DB', 3);
+        INSERT INTO sections (id, name, code) VALUES (1, 'Отдел продаж', 'S1');
+        INSERT INTO functions (id, name, code) VALUES (1, 'Продажи', 'F1');
+        INSERT INTO positions (id, name, code) VALUES (1, 'Менеджер', 'P1');
+        INSERT INTO section_functions (section_id, function_id) VALUES (1, 1);
+        INSERT INTO division_sections (division_id, section_id) VALUES (1, 1), (2, 1);
+        INSERT INTO staff (id, email, first_name, last_name, primary_organization_id) VALUES (1, 'a@example.com', 'Анна', 'Иванова', 2);
+        INSERT INTO staff (id, email, first_name, last_name, primary_organization_id) VALUES (2, 'b@example.com', 'Борис', 'Петров', 3);
+        INSERT INTO staff_positions (staff_id, position_id, division_id) VALUES (1, 1, 1), (2, 1, 2);
+        INSERT INTO valuable_final_products (entity_type, entity_id, name, status, progress) VALUES
+            ('division', 1, 'ЦКП департамента А', 'in_progress', 40),
+            ('section', 1, 'ЦКП отдела', 'completed', 100),
+            ('function', 1, 'ЦКП функции', 'in_progress', 20),
+            ('organization', 3, 'ЦКП холдинга Б', 'not_started', 0);
+    """)
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(sharding, "_settings", dict(sharding.SHARD_DEFAULTS, enabled=1, dir=str(tmp_path / "shards")))
+    return path
+
+
+def rollup(conn: sqlite3.Connection) -> dict:
+    return {(row["entity_type"], row["entity_id"]): row for row in get_vfp_rollup(conn)}
+
+
+def read_catalog(path: str, sql: str, params=()) -> list:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def test_vfp_rollup_is_unchanged_by_split(catalog_path):
+    conn = sharding.connect_federated(catalog_path)
+    before = rollup(conn)
+    conn.close()
+    assert before[("organization", 1)]["vfp_count"] == 3
+    assert before[("division", 2)]["vfp_count"] == 2
+
+    sharding.split_holding(catalog_path, 1)
+    conn = sharding.connect_federated(catalog_path)
+    try:
+        assert rollup(conn) == before
+        # Журнал шарда выдает только перенесенный ЦКП, копии ЦКП отдела и функции - в журнале каталога
+        assert conn.execute(
+            "SELECT COUNT(*) FROM shard_1.change_log WHERE table_name = 'valuable_final_products'"
+        ).fetchone()[0] == 1
+    finally:
+        conn.close()
+
+
+def test_vfp_rollup_follows_changes_after_split(catalog_path):
+    sharding.split_holding(catalog_path, 1)
+
+    # ЦКП функции изменяется в каталоге и доходит до подразделений шарда после синхронизации
+    catalog, _ = sharding.connect_for_request(catalog_path, write=True)
+    catalog.execute("UPDATE valuable_final_products SET progress = 60 WHERE entity_type = 'function'")
+    catalog.commit()
+    catalog.close()
+    sharding.sync_references(catalog_path)
+
+    # ЦКП подразделения изменяется в шарде
+    shard, target = sharding.connect_for_request(catalog_path, holding_id=1, write=True)
+    assert target == "1"
+    shard.execute(
+        "INSERT INTO valuable_final_products (entity_type, entity_id, name, status, progress) "
+        "VALUES ('organization', 2, 'ЦКП юрлица', 'blocked', 10)"
+    )
+    shard.commit()
+    shard.close()
+
+    conn = sharding.connect_federated(catalog_path)
+    try:
+        result = rollup(conn)
+        all_vfps = conn.execute("SELECT COUNT(*) FROM valuable_final_products").fetchone()[0]
+    finally:
+        conn.close()
+    assert result[("organization", 1)]["vfp_count"] == 4
+    assert result[("organization", 1)]["progress_avg"] == round((40 + 100 + 60 + 10) / 4, 2)
+    assert result[("division", 2)]["progress_avg"] == 80
+    assert result[("function", 1)]["vfp_count"] == 1
+    # Копии ЦКП отделов и функций в шарде в общем чтении не повторяются
+    assert all_vfps == 5
+
+
+
+def test_shard_without_reference_copies_catches_up(catalog_path):
+    conn = sharding.connect_federated(catalog_path)
+    before = rollup(conn)
+    conn.close()
+    sharding.split_holding(catalog_path, 1)
+
+    # Шард, перенесенный до копирования ЦКП отделов и функций
+    shard = sqlite3.connect(read_catalog(catalog_path, "SELECT path FROM shards WHERE holding_id = 1")[0][0])
+    shard.execute("DELETE FROM valuable_final_products WHERE entity_type IN ('section', 'function')")
+    shard.execute("DELETE FROM shard_sources WHERE table_name = 'valuable_final_products'")
+    shard.commit()
+    shard.close()
+
+    assert sharding.sync_references(catalog_path) == 1
+    conn = sharding.connect_federated(catalog_path)
+    try:
+        assert rollup(conn) == before
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def client(catalog_path, monkeypatch):
+    import full_api
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(full_api, "DB_PATH", catalog_path)
+    return TestClient(full_api.app)
+
+
+def test_vfp_rollup_endpoint_after_split(client, catalog_path):
+    before = client.get("/vfp/rollup").json()
+    assert len(before) == 7
+
+    sharding.split_holding(catalog_path, 1)
+    response = client.get("/vfp/rollup")
+    assert response.headers["X-OFS-Shard"] == "all"
+    assert response.json() == before
+
+
+def test_reference_vfp_copies_are_changed_in_catalog_only(client, catalog_path):
+    sharding.split_holding(catalog_path, 1)
+    vfp_id = read_catalog(catalog_path, "SELECT id FROM valuable_final_products WHERE entity_type = 'section'")[0][0]
+    body = {"entity_type": "section", "entity_id": 1, "name": "ЦКП отдела", "status": "completed", "progress": 90}
+
+    response = client.put(f"/vfp/{vfp_id}", json=body, headers={sharding.HOLDING_HEADER: "1"})
+    assert response.status_code == 400
+    assert sharding.SHARD_REFERENCE_ERROR in response.json()["detail"]
+
+    assert client.put(f"/vfp/{vfp_id}", json=body).status_code == 200
+    sharding.sync_references(catalog_path)
+    rollup = {(row["entity_type"], row["entity_id"]): row for row in client.get("/vfp/rollup").json()}
+    assert rollup[("organization", 1)]["progress_avg"] == round((40 + 90 + 20) / 3, 2)
+
+
+@pytest.fixture
+def jobs_client(catalog_path, monkeypatch, tmp_path):
+    import jobs_api
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(jobs_api, "DB_PATH", catalog_path)
+    monkeypatch.setenv("OFS_JOB_DIR", str(tmp_path / "jobs"))
+    submitted = []
+    monkeypatch.setattr(jobs_api, "submit_job", submitted.append)
+    app = FastAPI()
+    app.include_router(jobs_api.router)
+    client = TestClient(app)
+    client.submitted = submitted
+    return client
+
+
+def test_jobs_read_all_holdings(jobs_client, catalog_path):
+    import json
+    import jobs_api
+
+    sharding.split_holding(catalog_path, 1)
+    job = jobs_client.post("/jobs/analytics-report", json={"group_by": "division"}).json()
+    jobs_api.run_job(job["id"], catalog_path, jobs_api.load_settings()["dir"], 24)
+    info = jobs_client.get(f"/jobs/{job['id']}").json()
+    assert info["status"] == "succeeded"
+    report = json.loads(jobs_client.get(info["artifact_url"]).content)
+    assert {row["division_id"]: row["headcount"] for row in report["headcount"]["groups"]} == {1: 1, 2: 1}
+
+    # Изменение в шарде - новые данные для задания, а не повтор готового
+    assert jobs_client.post("/jobs/analytics-report", json={"group_by": "division"}).json()["deduplicated"]
+    shard, _ = sharding.connect_for_request(catalog_path, holding_id=1, write=True)
+    shard.execute("UPDATE staff_positions SET is_active = 0 WHERE staff_id = 1")
+    shard.commit()
+    shard.close()
+    repeated = jobs_client.post("/jobs/analytics-report", json={"group_by": "division"}).json()
+    assert repeated["id"] != job["id"]
+    assert repeated["deduplicated"] is False
+
+
+def test_snapshots_cover_all_holdings(catalog_path, monkeypatch):
+    import os
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from snapshots_api import router
+
+    monkeypatch.chdir(os.path.dirname(catalog_path))
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+
+    before = client.post("/org-structure/snapshots", params={"name": "До переноса"}).json()
+    sharding.split_holding(catalog_path, 1)
+    after = client.post("/org-structure/snapshots", params={"name": "После переноса"}).json()
+    assert (after["root_hash"], after["node_count"]) == (before["root_hash"], before["node_count"])
+
+    shard, _ = sharding.connect_for_request(catalog_path, holding_id=1, write=True)
+    shard.execute("UPDATE divisions SET name = 'Новый департамент' WHERE id = 1")
+    shard.commit()
+    shard.close()
+    diff = client.get("/org-structure/diff", params={"from": after["id"]}).json()
+    assert [(c["operation"], c["node_type"], c["id"], c["fields"]) for c in diff["changes"]] == [
+        ("modified", "division", 1, {"name": ["Департамент А", "Новый департамент"]}),
+    ]
+    # Снимки хранятся в каталоге
+    assert len(read_catalog(catalog_path, "SELECT id FROM org_snapshots")) == 2
+
+
+HOLDING_TABLES = ["organizations", "divisions", "division_sections", "staff", "staff_positions", "valuable_final_products"]
+
+
+def read_all(conn: sqlite3.Connection) -> dict:
+    return {
+        table: [tuple(row) for row in conn.execute(f"SELECT * FROM {table} ORDER BY id")]
+        for table in HOLDING_TABLES
+    }
+
+
+def test_split_holding_moves_holding_rows(catalog_path):
+    conn = sharding.connect_federated(catalog_path)
+    before = read_all(conn)
+    conn.close()
+
+    counts = sharding.split_holding(catalog_path, 1)
+    assert {table: counts[table] for table in HOLDING_TABLES} == {
+        "organizations": 2,
+        "divisions": 1,
+        "division_sections": 1,
+        "staff": 1,
+        "staff_positions": 1,
+        "valuable_final_products": 1,
+    }
+    # В каталоге остается только холдинг 3, строки холдинга 1 - в файле шарда
+    assert read_catalog(catalog_path, "SELECT id FROM organizations ORDER BY id") == [(3,)]
+    assert read_catalog(catalog_path, "SELECT id FROM divisions") == [(2,)]
+    assert read_catalog(catalog_path, "SELECT id FROM staff") == [(2,)]
+    assert read_catalog(catalog_path, "SELECT organization_id, holding_id FROM shard_routes ORDER BY 1") == [(1, 1), (2, 1)]
+    [(shard_path,)] = read_catalog(catalog_path, "SELECT path FROM shards WHERE holding_id = 1")
+    assert read_catalog(shard_path, "SELECT id FROM organizations ORDER BY id") == [(1,), (2,)]
+    assert read_catalog(shard_path, "SELECT id FROM staff") == [(1,)]
+    # Справочники скопированы в шард вместе с копиями ЦКП отделов и функций
+    assert read_catalog(shard_path, "SELECT id FROM sections") == [(1,)]
+    assert read_catalog(
+        shard_path, "SELECT entity_type FROM valuable_final_products ORDER BY id"
+    ) == [("division",), ("section",), ("function",)]
+
+    # Общее чтение после переноса совпадает с чтением до него
+    conn = sharding.connect_federated(catalog_path)
+    try:
+        assert read_all(conn) == before
+        assert sharding.federated_schemas(conn) == ["main", "shard_1"]
+    finally:
+        conn.close()
+    assert sharding.database_paths(catalog_path) == [catalog_path, shard_path]
+
+
+def test_split_holding_errors(catalog_path):
+    with pytest.raises(sharding.ShardingError):
+        sharding.split_holding(catalog_path, 2)  # юрлицо, а не холдинг
+    with pytest.raises(sharding.ShardingError):
+        sharding.split_holding(catalog_path, 99)
+    sharding.split_holding(catalog_path, 1)
+    with pytest.raises(sharding.ShardingError):
+        sharding.split_holding(catalog_path, 1)
+
+
+def test_connect_for_request_routing(catalog_path):
+    # До переноса все запросы идут в каталог
+    conn, target = sharding.connect_for_request(catalog_path, organization_id=2, write=True)
+    conn.close()
+    assert target == "catalog"
+
+    sharding.split_holding(catalog_path, 1)
+    for kwargs, expected in (
+        ({"holding_id": 1}, "1"),
+        ({"organization_id": 2}, "1"),
+        ({"organization_id": 2, "write": True}, "1"),
+        ({"organization_id": 3}, "all"),
+        ({"organization_id": 3, "write": True}, "catalog"),
+        ({}, "all"),
+        ({"write": True}, "catalog"),
+    ):
+        conn, target = sharding.connect_for_request(catalog_path, **kwargs)
+        conn.close()
+        assert target == expected, kwargs
+
+    shard, _ = sharding.connect_for_request(catalog_path, holding_id=1)
+    try:
+        assert [row[0] for row in shard.execute("SELECT id FROM organizations ORDER BY id")] == [1, 2]
+        # Справочники в шарде - представления каталога только для чтения
+        with pytest.raises(sqlite3.OperationalError, match="view"):
+            shard.execute("INSERT INTO sections (name, code) VALUES ('Новый отдел', 'S2')")
+    finally:
+        shard.close()
+    with pytest.raises(sharding.ShardingError):
+        sharding.connect_for_request(catalog_path, holding_id=3)
+
+
+def test_shard_ids_and_routes_for_new_organizations(catalog_path):
+    sharding.split_holding(catalog_path, 1)
+    shard, _ = sharding.connect_for_request(catalog_path, holding_id=1, write=True)
+    try:
+        org_id = shard.execute(
+            "INSERT INTO organizations (name, code, org_type, parent_id) VALUES ('Юрлицо Б', 'LB', 'legal_entity', 1)"
+        ).lastrowid
+        shard.commit()
+    finally:
+        shard.close()
+    assert org_id == (1 << sharding.ID_BITS) + 1
+
+    catalog, target = sharding.connect_for_request(catalog_path, organization_id=org_id)
+    catalog.close()
+    assert target == "1"
+
+
+def test_catalog_writes_of_split_holding_are_rejected(catalog_path):
+    sharding.split_holding(catalog_path, 1)
+    catalog, _ = sharding.connect_for_request(catalog_path, write=True)
+    try:
+        for sql in (
+            "INSERT INTO organizations (name, code, org_type, parent_id) VALUES ('Юрлицо Б', 'LB', 'legal_entity', 1)",
+            "INSERT INTO divisions (name, code, organization_id) VALUES ('Департамент В', 'DV', 2)",
+            "INSERT INTO staff (email, first_name, last_name, primary_organization_id) VALUES ('c@example.com', 'Вера', 'Смирнова', 2)",
+            "INSERT INTO staff_positions (staff_id, position_id, division_id) VALUES (2, 1, 1)",
+            "INSERT INTO valuable_final_products (entity_type, entity_id, name) VALUES ('division', 1, 'ЦКП')",
+            "UPDATE divisions SET organization_id = 1 WHERE id = 2",
+        ):
+            with pytest.raises(sqlite3.IntegrityError, match=sharding.SHARD_WRITE_ERROR):
+                catalog.execute(sql)
+        # Строки холдинга, оставшегося в каталоге, изменяются как прежде
+        catalog.execute("INSERT INTO divisions (name, code, organization_id) VALUES ('Департамент В', 'DV', 3)")
+        catalog.execute("INSERT INTO valuable_final_products (entity_type, entity_id, name) VALUES ('division', 2, 'ЦКП')")
+        catalog.commit()
+    finally:
+        catalog.close()
+
+
+def test_routed_writes_and_rejected_catalog_writes(client, catalog_path):
+    sharding.split_holding(catalog_path, 1)
+
+    # Подразделение холдинга 1 по organization_id тела запроса попадает в шард
+    response = client.post("/divisions/", json={"name": "Департамент В", "code": "DV", "organization_id": 1})
+    assert response.status_code == 200
+    assert response.headers["X-OFS-Shard"] == "1"
+    division_id = response.json()["id"]
+    assert division_id > 1 << sharding.ID_BITS
+    assert read_catalog(catalog_path, "SELECT id FROM divisions WHERE id = ?", (division_id,)) == []
+    assert division_id in [row["id"] for row in client.get("/divisions/").json()]
+
+    # ЦКП подразделения шарда без заголовка холдинга - в каталог, где его подразделения нет
+    body = {"entity_type": "division", "entity_id": division_id, "name": "ЦКП департамента В"}
+    response = client.post("/vfp/", json=body)
+    assert response.status_code == 409
+    assert sharding.SHARD_WRITE_ERROR in response.json()["detail"]
+    assert read_catalog(catalog_path, "SELECT COUNT(*) FROM valuable_final_products WHERE entity_type = 'division'") == [(0,)]
+
+    response = client.post("/vfp/", json=body, headers={sharding.HOLDING_HEADER: "1"})
+    assert response.status_code == 200
+    assert response.headers["X-OFS-Shard"] == "1"
+
+    assert client.get("/divisions/", headers={sharding.HOLDING_HEADER: "abc"}).status_code == 400
+    assert client.get("/divisions/", headers={sharding.HOLDING_HEADER: "3"}).status_code == 400
+
+
+def test_sync_references_copies_changed_tables(catalog_path):
+    sharding.split_holding(catalog_path, 1)
+    [(shard_path,)] = read_catalog(catalog_path, "SELECT path FROM shards WHERE holding_id = 1")
+
+    catalog, _ = sharding.connect_for_request(catalog_path, write=True)
+    catalog.execute("UPDATE sections SET name = 'Отдел закупок' WHERE id = 1")
+    catalog.execute("INSERT INTO functions (id, name, code) VALUES (2, 'Закупки', 'F2')")
+    catalog.commit()
+    catalog.close()
+    assert read_catalog(shard_path, "SELECT name FROM sections") == [("Отдел продаж",)]
+
+    assert sharding.sync_references(catalog_path) == 1
+    assert read_catalog(shard_path, "SELECT name FROM sections") == [("Отдел закупок",)]
+    assert read_catalog(shard_path, "SELECT id FROM functions ORDER BY id") == [(1,), (2,)]
+    synced = read_catalog(shard_path, "SELECT table_name, version FROM shard_sources ORDER BY 1")
+    assert dict(synced) == dict(read_catalog(
+        catalog_path,
+        f"SELECT table_name, version FROM table_versions WHERE table_name IN ({', '.join('?' * len(sharding.SYNCED_TABLES))})",
+        sharding.SYNCED_TABLES,
+    ))
+
+    # Версии совпадают - повторная синхронизация ничего не копирует
+    changes = read_catalog(shard_path, "SELECT COUNT(*) FROM change_log")
+    sharding.sync_references(catalog_path)
+    assert read_catalog(shard_path, "SELECT COUNT(*) FROM change_log") == changes
+    assert read_catalog(shard_path, "SELECT table_name, version FROM shard_sources ORDER BY 1") == synced
+
+
+def test_fan_out(catalog_path):
+    sharding.split_holding(catalog_path, 1)
+    sql = "SELECT id FROM organizations ORDER BY id"
+    # Без key - подряд по базам (каталог, затем шарды), с key - одним упорядоченным списком
+    assert [row["id"] for row in sharding.fan_out(catalog_path, sql)] == [3, 1, 2]
+    assert [row["id"] for row in sharding.fan_out(catalog_path, sql, key=lambda row: row["id"])] == [1, 2, 3]
+    assert [row[0] for row in sharding.fan_out(
+        catalog_path, "SELECT COUNT(*) FROM staff WHERE primary_organization_id = ?", (2,)
+    )] == [0, 1]
+
+
+def test_attach_shards_over_limit(catalog_path):
+    sharding.split_holding(catalog_path, 1)
+    conn = sqlite3.connect(catalog_path)
+    try:
+        conn.setlimit(sqlite3.SQLITE_LIMIT_ATTACHED, 0)
+        with pytest.raises(sharding.ShardingError):
+            sharding.attach_shards(conn)
+    finally:
+        conn.close()
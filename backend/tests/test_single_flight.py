@@ -0,0 +1,98 @@
+"""
+Объединение одновременных вызовов SingleFlight: одно выполнение на ключ, общая
+ошибка для ожидающих, освобождение ключа после завершения.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from single_flight import SingleFlight
+
+CALLERS = 8
+
+
+def run_concurrently(flight: SingleFlight, key, fn, callers: int = CALLERS) -> list:
+    """
+    Запускает callers вызовов flight.do(key, fn). Возвращает результаты или ошибки.
+    fn должна дождаться остальных вызовов (wait_for_waiters), чтобы они пересеклись по времени.
+    """
+    with ThreadPoolExecutor(callers) as pool:
+        futures = [pool.submit(flight.do, key, fn) for _ in range(callers)]
+        return [future.exception() or future.result() for future in futures]
+
+
+def wait_for_waiters(flight: SingleFlight, count: int):
+    """Ждет, пока count вызовов присоединятся к выполняющемуся."""
+    while flight.stats()["coalesced"] < count:
+        threading.Event().wait(0.001)
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight()
+    executions = []
+
+    def build():
+        executions.append(1)
+        wait_for_waiters(flight, CALLERS - 1)
+        return {"tree": [1, 2, 3]}
+
+    results = run_concurrently(flight, "tree", build)
+
+    assert len(executions) == 1
+    assert all(result is results[0] for result in results)
+    stats = flight.stats()
+    assert stats["executed"] == 1
+    assert stats["coalesced"] == CALLERS - 1
+    assert stats["in_flight"] == 0
+
+
+def test_error_is_propagated_to_waiters():
+    flight = SingleFlight()
+
+    def fail():
+        wait_for_waiters(flight, CALLERS - 1)
+        raise ValueError("Ошибка построения")
+
+    errors = run_concurrently(flight, "tree", fail)
+
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert all(error is errors[0] for error in errors)
+    assert flight.stats()["errors"] == 1
+
+
+def test_key_is_released_after_completion():
+    flight = SingleFlight()
+    calls = []
+
+    assert flight.do("tree", lambda: calls.append(1) or len(calls)) == 1
+    assert flight.do("tree", lambda: calls.append(1) or len(calls)) == 2
+    assert flight.stats()["in_flight"] == 0
+
+    def fail():
+        raise ValueError("Ошибка")
+
+    with pytest.raises(ValueError):
+        flight.do("tree", fail)
+    # После ошибки ключ тоже освобожден: следующий вызов выполняется заново
+    assert flight.do("tree", lambda: "снова") == "снова"
+    assert flight.stats() == {
+        "executed": 4, "coalesced": 0, "errors": 1, "in_flight": 0, "coalesced_ratio": 0.0,
+    }
+
+
+def test_different_keys_do_not_wait_for_each_other():
+    flight = SingleFlight()
+    started = threading.Barrier(2, timeout=5)
+
+    def build(value):
+        # Оба вычисления должны выполняться одновременно, иначе барьер не пройти
+        started.wait()
+        return value
+
+    with ThreadPoolExecutor(2) as pool:
+        first = pool.submit(flight.do, "a", lambda: build("a"))
+        second = pool.submit(flight.do, "b", lambda: build("b"))
+        assert (first.result(), second.result()) == ("a", "b")
+    assert flight.stats()["executed"] == 2
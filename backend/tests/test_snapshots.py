@@ -0,0 +1,100 @@
+"""
+Сравнение снимков оргструктуры: поддеревья с одинаковым хешем не читаются,
+поэтому объем работы зависит от размера изменения, а не от размера дерева;
+узел, удаленный в одном месте и добавленный в другом, - перемещение.
+"""
+
+import sqlite3
+
+import pytest
+
+from complete_schema import ALL_SCHEMAS
+from snapshots_api import NodeLoader, build_structure, create_snapshot, diff_trees
+
+# Подразделения верхнего уровня и дочерние подразделения у каждого
+TOP_DIVISIONS = 30
+CHILD_DIVISIONS = 10
+
+
+@pytest.fixture
+def db():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    for schema in ALL_SCHEMAS:
+        conn.executescript(schema)
+    conn.execute("INSERT INTO organizations (id, name, code, org_type) VALUES (1, 'Холдинг', 'H1', 'holding')")
+    for top in range(1, TOP_DIVISIONS + 1):
+        conn.execute(
+            "INSERT INTO divisions (id, name, code, organization_id) VALUES (?, ?, ?, 1)",
+            (top, f"Департамент {top}", f"D{top}"),
+        )
+    division_id = TOP_DIVISIONS
+    for top in range(1, TOP_DIVISIONS + 1):
+        for _ in range(CHILD_DIVISIONS):
+            division_id += 1
+            conn.execute(
+                "INSERT INTO divisions (id, name, code, organization_id, parent_id) VALUES (?, ?, ?, 1, ?)",
+                (division_id, f"Отдел {division_id}", f"D{division_id}", top),
+            )
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def diff_with_current(db: sqlite3.Connection, snapshot: dict):
+    new_root, current_nodes = build_structure(db)
+    loader = NodeLoader(db, current_nodes)
+    return diff_trees(loader, snapshot["root_hash"], new_root), loader
+
+
+def test_unchanged_structure_reads_nothing(db):
+    snapshot = create_snapshot(db)
+    changes, loader = diff_with_current(db, snapshot)
+    assert changes == []
+    assert loader.loaded == 0
+
+
+def test_equal_subtrees_are_skipped(db):
+    snapshot = create_snapshot(db)
+    assert snapshot["node_count"] == 1 + TOP_DIVISIONS * (CHILD_DIVISIONS + 1)
+
+    child_id = TOP_DIVISIONS + 1
+    db.execute("UPDATE divisions SET name = 'Новое имя' WHERE id = ?", (child_id,))
+    changes, loader = diff_with_current(db, snapshot)
+
+    assert changes == [{
+        "operation": "modified", "node_type": "division", "id": child_id,
+        "parent_type": "division", "parent_id": 1,
+        "fields": {"name": [f"Отдел {child_id}", "Новое имя"]},
+    }]
+    # Прочитаны только пары узлов на пути корень -> холдинг -> департамент -> отдел
+    assert loader.loaded == 2 * 4
+
+
+def test_moved_subtree_is_reported_once(db):
+    snapshot = create_snapshot(db)
+    db.execute("UPDATE divisions SET parent_id = 2 WHERE id = 1")
+    changes, loader = diff_with_current(db, snapshot)
+
+    # Дочерние отделы переехали вместе с родителем и отдельно не сообщаются
+    assert changes == [{
+        "operation": "moved", "node_type": "division", "id": 1,
+        "parent_type": "division", "parent_id": 2,
+        "old_parent_type": "organization", "old_parent_id": 1,
+        "fields": None,
+    }]
+    assert loader.loaded < snapshot["node_count"] // 4
+
+
+def test_added_and_removed_nodes_between_snapshots(db):
+    first = create_snapshot(db)
+    db.execute("DELETE FROM divisions WHERE id = ?", (TOP_DIVISIONS + 1,))
+    db.execute("INSERT INTO divisions (id, name, code, organization_id) VALUES (1000, 'Новый департамент', 'D1000', 1)")
+    second = create_snapshot(db)
+
+    changes = diff_trees(NodeLoader(db), first["root_hash"], second["root_hash"])
+    assert [(c["operation"], c["node_type"], c["id"], c["parent_type"], c["parent_id"]) for c in changes] == [
+        ("removed", "division", TOP_DIVISIONS + 1, "division", 1),
+        ("added", "division", 1000, "organization", 1),
+    ]
+    assert changes[1]["data"]["name"] == "Новый департамент"
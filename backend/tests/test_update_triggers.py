@@ -0,0 +1,82 @@
+"""
+Одно изменение строки дает ровно одну версию журнала изменений и таблицы, хотя
+триггер отметки времени обновляет updated_at вложенным UPDATE.
+"""
+
+import re
+import sqlite3
+
+import pytest
+
+from changes_api import update_triggers_outdated, upgrade_update_triggers
+from complete_schema import ALL_SCHEMAS, CHANGE_LOG_TABLES, ROW_UPDATE_CONDITION, TIMESTAMP_TRIGGER_CONDITION
+
+
+@pytest.fixture
+def db():
+    conn = sqlite3.connect(":memory:")
+    for schema in ALL_SCHEMAS:
+        conn.executescript(schema)
+    conn.execute("INSERT INTO organizations (id, name, code, org_type) VALUES (1, 'Холдинг', 'H1', 'holding')")
+    conn.execute("INSERT INTO divisions (id, name, code, organization_id) VALUES (1, 'Подразделение', 'D1', 1)")
+    conn.execute("INSERT INTO sections (id, name, code) VALUES (1, 'Отдел', 'S1')")
+    conn.execute("INSERT INTO division_sections (id, division_id, section_id) VALUES (1, 1, 1)")
+    yield conn
+    conn.close()
+
+
+def versions(db: sqlite3.Connection, table: str) -> tuple:
+    log = db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()[0]
+    version = db.execute("SELECT version FROM table_versions WHERE table_name = ?", (table,)).fetchone()[0]
+    return log, version
+
+
+def assert_one_version(db: sqlite3.Connection, table: str, sql: str):
+    log, version = versions(db, table)
+    db.execute(sql)
+    assert versions(db, table) == (log + 1, version + 1)
+
+
+def test_update_with_stale_timestamp_gives_one_version(db):
+    db.execute("UPDATE organizations SET updated_at = '2000-01-01 00:00:00' WHERE id = 1")
+    assert_one_version(db, "organizations", "UPDATE organizations SET name = 'Новое имя' WHERE id = 1")
+    # Отметка времени все равно обновлена вложенным UPDATE
+    updated_at, now = db.execute("SELECT updated_at, CURRENT_TIMESTAMP FROM organizations WHERE id = 1").fetchone()
+    assert updated_at == now
+
+
+def test_update_with_current_timestamp_gives_one_version(db):
+    # Вставка и изменение в одну секунду: вложенный UPDATE не нужен
+    assert_one_version(db, "divisions", "UPDATE divisions SET name = 'Новое имя' WHERE id = 1")
+    assert_one_version(db, "divisions", "UPDATE divisions SET name = 'Еще одно имя' WHERE id = 1")
+
+
+def test_update_with_explicit_timestamp_gives_one_version(db):
+    assert_one_version(db, "organizations", "UPDATE organizations SET updated_at = '2001-01-01 00:00:00' WHERE id = 1")
+
+
+def test_update_of_table_without_timestamp_gives_one_version(db):
+    assert_one_version(db, "division_sections", "UPDATE division_sections SET is_primary = 0 WHERE id = 1")
+
+
+def test_upgrade_of_previous_triggers(db):
+    # Триггеры прежней схемы: без условий WHEN
+    for name, sql in db.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall():
+        if re.fullmatch(r"update_\w+_timestamp|\w+_change_log_update|\w+_version_update", name):
+            db.execute(f"DROP TRIGGER {name}")
+            db.execute(sql.replace(TIMESTAMP_TRIGGER_CONDITION, "").replace(ROW_UPDATE_CONDITION, ""))
+    db.execute("UPDATE organizations SET updated_at = '2000-01-01 00:00:00' WHERE id = 1")
+    log, version = versions(db, "organizations")
+    db.execute("UPDATE organizations SET name = 'Новое имя' WHERE id = 1")
+    assert versions(db, "organizations") == (log + 2, version + 2)
+
+    assert update_triggers_outdated(db)
+    upgrade_update_triggers(db)
+    assert not update_triggers_outdated(db)
+    db.execute("UPDATE organizations SET updated_at = '2000-01-01 00:00:00' WHERE id = 1")
+    for table in CHANGE_LOG_TABLES:
+        assert db.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name IN (?, ?)",
+            (f"{table}_change_log_update", f"{table}_version_update"),
+        ).fetchone()[0] == 2
+    assert_one_version(db, "organizations", "UPDATE organizations SET name = 'Третье имя' WHERE id = 1")
@@ -7,6 +7,9 @@ import logging
 import json
 from datetime import datetime
 
+# SQL для создания таблицы ЦКП
+from complete_schema import VFP_SCHEMA
+
 # Настройка логирования
 logging.basicConfig(
     filename='vfp_schema_update.log',
@@ -14,46 +17,6 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-# SQL для создания таблицы ЦКП
-VFP_SCHEMA = """
-CREATE TABLE IF NOT EXISTS valuable_final_products (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    entity_type TEXT NOT NULL CHECK(
-        entity_type IN ('board', 'director', 'division', 'section', 'function', 'organization')
-    ),
-    entity_id INTEGER NOT NULL,
-    name TEXT NOT NULL,
-    description TEXT,
-    metrics TEXT,  -- JSON с метриками для измерения
-    status TEXT CHECK(
-        status IN ('not_started', 'in_progress', 'completed', 'blocked', 'delayed')
-    ),
-    progress INTEGER CHECK(progress BETWEEN 0 AND 100),
-    start_date DATE,
-    target_date DATE,
-    is_active INTEGER NOT NULL DEFAULT 1,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    
-    -- Ограничение уникальности для комбинации тип+id
-    UNIQUE(entity_type, entity_id)
-);
-
--- Триггер для автоматического обновления даты изменения
-CREATE TRIGGER IF NOT EXISTS update_vfp_timestamp 
-AFTER UPDATE ON valuable_final_products
-FOR EACH ROW
-BEGIN
-    UPDATE valuable_final_products 
-    SET updated_at = CURRENT_TIMESTAMP 
-    WHERE id = OLD.id;
-END;
-
--- Индексы для оптимизации запросов
-CREATE INDEX IF NOT EXISTS idx_vfp_entity ON valuable_final_products(entity_type, entity_id);
-CREATE INDEX IF NOT EXISTS idx_vfp_status ON valuable_final_products(status);
-"""
-
 def update_schema(db_path='full_api_new.db'):
     """Обновляет схему БД, добавляя таблицу ЦКП"""
     try:
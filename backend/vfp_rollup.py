@@ -0,0 +1,91 @@
+"""
+Сводка прогресса и статусов ЦКП по узлам оргструктуры.
+
+Сводка (vfp_rollup) поддерживается триггерами на valuable_final_products по
+замыканию дерева (org_ancestors), см. VFP_ROLLUP_SCHEMA в complete_schema.py.
+Замыкание поддерживают триггеры на связях оргструктуры, поэтому чтение сводки -
+выборка по первичному ключу без пересчета и без записи (подходит для реплики).
+Полный пересчет выполняется только при создании сводки и миграции базы.
+"""
+
+import sqlite3
+from typing import Any, Dict, List, Optional
+
+from complete_schema import (
+    ORG_CLOSURE_EDGES,
+    VFP_METRIC_COLUMNS,
+    VFP_METRICS_SCHEMA,
+    VFP_ROLLUP_REBUILD_SQL,
+    VFP_ROLLUP_SCHEMA,
+    VFP_STATUS_COLUMNS,
+)
+
+# Триггеры прежней версии сводки: структура только помечала сводку устаревшей,
+# и она пересчитывалась при чтении
+LEGACY_ROLLUP_TRIGGERS = [
+    "organizations_vfp_rollup_delete", "organizations_vfp_rollup_update",
+    "divisions_vfp_rollup_delete", "divisions_vfp_rollup_update",
+    "division_sections_vfp_rollup_insert", "division_sections_vfp_rollup_delete", "division_sections_vfp_rollup_update",
+    "section_functions_vfp_rollup_insert", "section_functions_vfp_rollup_delete", "section_functions_vfp_rollup_update",
+]
+
+
+def add_metric_columns(db: sqlite3.Connection):
+    """Добавляет генерируемые столбцы метрик ЦКП в базу, созданную до их появления."""
+    columns = {row[1] for row in db.execute("PRAGMA table_xinfo(valuable_final_products)")}
+    if not set(VFP_METRIC_COLUMNS) <= columns:
+        db.executescript(VFP_METRICS_SCHEMA)
+        db.commit()
+
+
+def rebuild_vfp_rollup(db: sqlite3.Connection):
+    """Полностью пересчитывает замыкание оргструктуры и сводку ЦКП."""
+    db.executescript("BEGIN IMMEDIATE;" + VFP_ROLLUP_REBUILD_SQL + "COMMIT;")
+
+
+def vfp_rollup_outdated(db: sqlite3.Connection) -> bool:
+    """Сводка создана прежней версией схемы (замыкание без числа путей)."""
+    columns = {row[1] for row in db.execute("PRAGMA table_info(org_ancestors)")}
+    return "paths" not in columns
+
+
+def install_vfp_rollup(db: sqlite3.Connection):
+    """Создает (или пересоздает по текущей схеме) замыкание, триггеры сводки и заполняет сводку."""
+    triggers = LEGACY_ROLLUP_TRIGGERS + ["vfp_rollup_insert", "vfp_rollup_update", "vfp_rollup_delete"]
+    for table, _, _, (_, parent_column) in ORG_CLOSURE_EDGES:
+        triggers += [f"{table}_{parent_column}_closure_{event}" for event in ("insert", "delete", "unlink", "link")]
+    for name in triggers:
+        db.execute(f"DROP TRIGGER IF EXISTS {name}")
+    db.execute("DROP TABLE IF EXISTS vfp_rollup_state")
+    db.execute("DROP TABLE IF EXISTS org_ancestors")
+    db.commit()
+    db.executescript(VFP_ROLLUP_SCHEMA)
+    rebuild_vfp_rollup(db)
+
+
+def get_vfp_rollup(
+    db: sqlite3.Connection,
+    entity_type: Optional[str] = None,
+    entity_id: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Сводка по узлам (с учетом всех потомков), при необходимости отфильтрованная по узлу."""
+    query = f"SELECT entity_type, entity_id, vfp_count, progress_sum, {', '.join(VFP_STATUS_COLUMNS)} FROM vfp_rollup WHERE vfp_count > 0"
+    params: List[Any] = []
+    if entity_type:
+        query += " AND entity_type = ?"
+        params.append(entity_type)
+    if entity_id is not None:
+        query += " AND entity_id = ?"
+        params.append(entity_id)
+    query += " ORDER BY entity_type, entity_id"
+
+    result = []
+    for row in db.execute(query, params):
+        result.append({
+            "entity_type": row[0],
+            "entity_id": row[1],
+            "vfp_count": row[2],
+            "progress_avg": round(row[3] / row[2], 2),
+            "status_counts": dict(zip(VFP_STATUS_COLUMNS, row[4:])),
+        })
+    return result
@@ -56,6 +56,14 @@ class Config:
         self.USE_REDIS = os.getenv("USE_REDIS", "False").lower() == "true"
         self.REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
         
+        # Хранилище состояний FSM без Redis: sqlite (сохраняется между перезапусками) или memory
+        self.FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite").lower()
+        self.FSM_DB_PATH = os.getenv("FSM_DB_PATH", os.path.join(self.STORAGE_PATH, "fsm_states.db"))
+        # Период пакетной записи состояний в SQLite, секунд
+        self.FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "1.0"))
+        # Через сколько часов без действий брошенный сценарий удаляется
+        self.FSM_STATE_TTL_HOURS = float(os.getenv("FSM_STATE_TTL_HOURS", "24"))
+        
         # URL API основной системы
         self.API_URL = os.getenv("API_URL", "http://localhost:8000/api/v1")
         self.API_WEBHOOK_ENDPOINT = f"{self.API_URL}/telegram-bot/webhook"
@@ -0,0 +1,256 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from copy import copy
+from contextlib import suppress
+from dataclasses import astuple, dataclass, field
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+logger = logging.getLogger(__name__)
+
+FSM_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm_states (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL DEFAULT '{}',
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states(updated_at);
+"""
+
+
+@dataclass
+class _Record:
+    """Состояние и данные одного ключа FSM в памяти"""
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    updated_at: float = field(default_factory=time.time)
+
+
+def _encode_key(key: StorageKey) -> str:
+    """Ключ FSM в строку для первичного ключа таблицы (обратимо)"""
+    return json.dumps(astuple(key), ensure_ascii=False)
+
+
+def _decode_key(raw_key: str) -> StorageKey:
+    return StorageKey(*json.loads(raw_key))
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище состояний FSM без Redis для бота на одном узле.
+
+    Чтение и запись идут в словарь в памяти (как у MemoryStorage), изменения
+    сбрасываются в SQLite фоновой задачей пакетами: раз в flush_interval секунд
+    или сразу при накоплении flush_batch_size измененных ключей - одной
+    транзакцией в WAL-режиме. При запуске сохраненные состояния загружаются
+    обратно, поэтому перезапуск не прерывает регистрацию; при аварийном
+    завершении теряются изменения не больше чем за flush_interval секунд.
+
+    Ключи без изменений дольше state_ttl секунд (брошенные сценарии)
+    удаляются из памяти и из базы.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        *,
+        flush_interval: float = 1.0,
+        flush_batch_size: int = 500,
+        state_ttl: float = 24 * 60 * 60,
+        cleanup_interval: float = 10 * 60,
+    ):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+        self.state_ttl = state_ttl
+        self.cleanup_interval = cleanup_interval
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        # Запись идет из потока (asyncio.to_thread), по очереди под self._flush_lock
+        self._conn: Optional[sqlite3.Connection] = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(FSM_SCHEMA)
+
+        self._records: Dict[StorageKey, _Record] = {}
+        self._dirty: Set[StorageKey] = set()
+        self._last_cleanup = time.time()
+
+        # Создаются в цикле событий при первой записи
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+
+        self._load()
+
+    def _load(self):
+        """Загружает сохраненные состояния, просроченные удаляет"""
+        expire_before = time.time() - self.state_ttl
+        with self._conn:
+            expired = self._conn.execute(
+                "DELETE FROM fsm_states WHERE updated_at < ?", (expire_before,)
+            ).rowcount
+
+        for raw_key, state, data, updated_at in self._conn.execute(
+            "SELECT key, state, data, updated_at FROM fsm_states"
+        ):
+            try:
+                self._records[_decode_key(raw_key)] = _Record(state, json.loads(data), updated_at)
+            except (TypeError, ValueError) as e:
+                logger.warning(f"Пропущена поврежденная запись FSM {raw_key}: {e}")
+
+        logger.info(
+            f"Загружено состояний FSM из {self.db_path}: {len(self._records)} "
+            f"(удалено просроченных: {expired})"
+        )
+
+    def _expired(self, record: _Record, now: float) -> bool:
+        return now - record.updated_at > self.state_ttl
+
+    def _get_record(self, key: StorageKey) -> Optional[_Record]:
+        record = self._records.get(key)
+        if record is not None and self._expired(record, time.time()):
+            # Брошенный сценарий: удаляется из базы при следующем сбросе
+            del self._records[key]
+            self._dirty.add(key)
+            return None
+        return record
+
+    def _touch(self, key: StorageKey) -> _Record:
+        """Запись ключа для изменения; ключ попадает в следующий сброс"""
+        record = self._get_record(key)
+        if record is None:
+            record = self._records[key] = _Record()
+        record.updated_at = time.time()
+        self._dirty.add(key)
+        self._ensure_flusher()
+        if len(self._dirty) >= self.flush_batch_size:
+            self._wakeup.set()
+        return record
+
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            if self._wakeup is None:
+                self._flush_lock = asyncio.Lock()
+                self._wakeup = asyncio.Event()
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        """Фоновый сброс изменений: по таймеру или при заполнении пакета"""
+        while True:
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            self._wakeup.clear()
+
+            now = time.time()
+            if now - self._last_cleanup >= self.cleanup_interval:
+                self._expire(now)
+                self._last_cleanup = now
+
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка сброса состояний FSM в SQLite: {e}")
+
+    def _expire(self, now: float):
+        """Удаляет из памяти брошенные сценарии; из базы они удаляются при сбросе"""
+        expired = [key for key, record in self._records.items() if self._expired(record, now)]
+        for key in expired:
+            del self._records[key]
+            self._dirty.add(key)
+        if expired:
+            logger.info(f"Удалено просроченных состояний FSM: {len(expired)}")
+
+    async def flush(self):
+        """Записывает накопленные изменения в SQLite одной транзакцией"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._dirty or self._conn is None:
+                return
+            keys, self._dirty = self._dirty, set()
+
+            upserts: List[Tuple[str, Optional[str], str, float]] = []
+            deletes: List[Tuple[str]] = []
+            for key in keys:
+                record = self._records.get(key)
+                if record is None or (record.state is None and not record.data):
+                    # Пустое состояние (после state.clear()) не хранится
+                    self._records.pop(key, None)
+                    deletes.append((_encode_key(key),))
+                    continue
+                try:
+                    data = json.dumps(record.data, ensure_ascii=False)
+                except (TypeError, ValueError) as e:
+                    logger.error(f"Данные FSM для {key} не сериализуются в JSON и не сохранены: {e}")
+                    continue
+                upserts.append((_encode_key(key), record.state, data, record.updated_at))
+
+            try:
+                await asyncio.to_thread(self._write, upserts, deletes)
+            except sqlite3.Error:
+                # Ключи попадут в следующий сброс
+                self._dirty |= keys
+                raise
+
+    def _write(self, upserts, deletes):
+        with self._conn:
+            self._conn.executemany(
+                """
+                INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+                """,
+                upserts,
+            )
+            self._conn.executemany("DELETE FROM fsm_states WHERE key = ?", deletes)
+
+    async def close(self) -> None:
+        """Останавливает фоновый сброс и записывает оставшиеся изменения"""
+        if self._conn is None:
+            return
+        if self._flusher is not None:
+            self._flusher.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._flusher
+            self._flusher = None
+        try:
+            await self.flush()
+        finally:
+            self._conn.close()
+            self._conn = None
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self._touch(key).state = state.state if isinstance(state, State) else state
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = self._get_record(key)
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(
+                f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            )
+        self._touch(key).data = data.copy()
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = self._get_record(key)
+        return record.data.copy() if record else {}
+
+    async def get_value(self, storage_key: StorageKey, dict_key: str, default: Any = None) -> Any:
+        record = self._get_record(storage_key)
+        if record is None:
+            return default
+        return copy(record.data.get(dict_key, default))
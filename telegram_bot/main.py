@@ -7,6 +7,7 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.storage.redis import RedisStorage
 
 from config import Config
+from fsm_storage import SQLiteStorage
 from admin_handlers import register_admin_handlers
 from registration_handlers import register_registration_handlers
 from database import BotDatabase
@@ -38,10 +39,18 @@ async def main():
         # Используем Redis для хранения состояний, если настроено
         storage = RedisStorage.from_url(config.REDIS_URL)
         logger.info("Используется Redis для хранения состояний")
-    else:
-        # Используем память для хранения состояний
+    elif config.FSM_STORAGE == "memory":
+        # Используем память для хранения состояний (теряются при перезапуске)
         storage = MemoryStorage()
         logger.info("Используется MemoryStorage для хранения состояний")
+    else:
+        # Состояния в памяти с пакетной записью в SQLite (закрывается при остановке диспетчера)
+        storage = SQLiteStorage(
+            config.FSM_DB_PATH,
+            flush_interval=config.FSM_FLUSH_INTERVAL,
+            state_ttl=config.FSM_STATE_TTL_HOURS * 60 * 60,
+        )
+        logger.info(f"Используется SQLite для хранения состояний: {config.FSM_DB_PATH}")
 
     # Инициализация бота и диспетчера - совместимо с aiogram 3.x
     bot = Bot(token=config.BOT_TOKEN)
@@ -1,11 +1,15 @@
 import pytest
 import os
+import sys
 import json
 from typing import Dict, Any
 from unittest.mock import AsyncMock, MagicMock
 
-from ..database import Database
-from ..config import Config
+# Модули бота импортируются из каталога telegram_bot, как при запуске main.py
+# (каталог не пакет, относительный импорт из тестов невозможен)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
 
 @pytest.fixture
 def test_config():
@@ -19,6 +23,8 @@ def test_config():
 @pytest.fixture
 def test_database(tmp_path):
     """Фикстура для тестовой базы данных"""
+    from database import Database
+
     storage_path = tmp_path / "test_data"
     storage_path.mkdir()
     
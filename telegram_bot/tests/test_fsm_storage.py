@@ -0,0 +1,90 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+from fsm_storage import SQLiteStorage
+from states import RegistrationStates
+
+KEY = StorageKey(bot_id=1, chat_id=42, user_id=42)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "fsm_states.db")
+
+
+@pytest.mark.asyncio
+async def test_state_survives_restart(db_path):
+    """Состояние и данные загружаются после перезапуска"""
+    storage = SQLiteStorage(db_path)
+    await storage.set_state(KEY, RegistrationStates.waiting_for_name)
+    await storage.update_data(KEY, {"position_id": 7})
+    await storage.close()
+
+    restarted = SQLiteStorage(db_path)
+    assert await restarted.get_state(KEY) == RegistrationStates.waiting_for_name.state
+    assert await restarted.get_data(KEY) == {"position_id": 7}
+    await restarted.close()
+
+
+@pytest.mark.asyncio
+async def test_flushed_state_survives_crash(db_path):
+    """После фонового сброса состояние переживает аварийное завершение (без close)"""
+    storage = SQLiteStorage(db_path, flush_interval=0.05)
+    await storage.set_data(KEY, {"full_name": "Иван Иванов"})
+    await asyncio.sleep(0.2)
+
+    restarted = SQLiteStorage(db_path)
+    assert await restarted.get_data(KEY) == {"full_name": "Иван Иванов"}
+    await restarted.close()
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_writes_are_batched(db_path):
+    """Изменения пишутся в базу пакетом, а не при каждом вызове"""
+    storage = SQLiteStorage(db_path, flush_interval=60, flush_batch_size=10)
+    for user_id in range(9):
+        await storage.set_state(StorageKey(bot_id=1, chat_id=user_id, user_id=user_id), "state")
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM fsm_states").fetchone()[0] == 0
+
+    # Десятый ключ заполняет пакет
+    await storage.set_state(StorageKey(bot_id=1, chat_id=9, user_id=9), "state")
+    await asyncio.sleep(0.1)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM fsm_states").fetchone()[0] == 10
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_cleared_state_is_removed(db_path):
+    """После state.clear() запись удаляется из базы"""
+    storage = SQLiteStorage(db_path)
+    await storage.set_state(KEY, "state")
+    await storage.flush()
+    await storage.set_state(KEY, None)
+    await storage.set_data(KEY, {})
+    await storage.close()
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM fsm_states").fetchone()[0] == 0
+
+
+@pytest.mark.asyncio
+async def test_abandoned_state_expires(db_path):
+    """Брошенный сценарий удаляется по истечении TTL"""
+    storage = SQLiteStorage(db_path, state_ttl=60)
+    await storage.set_state(KEY, "state")
+    await storage.flush()
+    storage._records[KEY].updated_at = time.time() - 120
+
+    assert await storage.get_state(KEY) is None
+    await storage.close()
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM fsm_states").fetchone()[0] == 0